@@ -18,84 +18,250 @@ from builtins import range
 from builtins import object
 __all__ = ['PsiObject']
 
-import math
+import atexit
 import warnings
-import random
-import sys
-import time
-from numpy import *
+import numpy as np
+
+# the 4-D arrays kept by PsiObjects of earlier versions
+_OLD_ARRAYS = ('_r', '_alpha', '_beta', '_x', '_probResponseGivenLambdaX',
+               '_probResponseGivenX', '_probLambdaGivenXResponse',
+               '_entropyXResponse')
+
+# thread pools used for the expected entropy, by number of threads. These
+# are kept here rather than on the PsiObject so it can still be copied,
+# pickled and saved as JSON
+_threadPools = {}
+
+
+def _getThreadPool(nThreads):
+    if nThreads not in _threadPools:
+        from multiprocessing.pool import ThreadPool
+        _threadPools[nThreads] = ThreadPool(nThreads)
+    return _threadPools[nThreads]
+
+
+@atexit.register
+def _closeThreadPools():
+    for pool in _threadPools.values():
+        pool.close()
+        pool.join()
+    _threadPools.clear()
 
 
 class PsiObject(object):
 
-    """Special class to handle internal array and functions of Psi adaptive psychophysical method (Kontsevich & Tyler, 1999)."""
-    
-    def __init__(self, x, alpha, beta, xPrecision, aPrecision, bPrecision, delta=0, stepType='lin', TwoAFC=False, prior=None):
-        global stats
-        from scipy import stats  # takes a while to load so do it lazy
+    """Special class to handle internal array and functions of Psi adaptive psychophysical method (Kontsevich & Tyler, 1999).
+
+    The posterior over lambda = (alpha, beta) is kept as a 2-D array of log
+    probabilities. The expected entropy of the posterior after presenting
+    intensity x is
+
+        E[H(x)] = sum_r P(r|x) log P(r|x) - sum_l P(l) log P(l)
+                  - sum_l P(l) sum_r P(r|l,x) log P(r|l,x)
+
+    where the last term uses a fixed (x, lambda) array, so each update only
+    takes two matrix-vector products with arrays of one value per (x,
+    lambda), rather than building 4-D [r, alpha, beta, x] posterior and
+    entropy arrays. Entropies are in log10 units.
+
+    :Parameters:
 
+        dtype : the float type of the (x, lambda) arrays. 'float32' halves
+            their size. The expected entropies are not summed in the same
+            order as in the earlier 4-D implementation, so with either type
+            intensities whose expected entropies are equal, or almost equal,
+            can be chosen between differently (more often with float32).
+            Sessions resumed from, or re-run to compare with, earlier
+            versions can therefore diverge.
+
+        xCandidates : intensities that may be chosen as the next intensity
+            (snapped to the nearest value of the intensity grid). None
+            allows all of them. Restricting these reduces memory and time
+            in proportion.
+
+        nThreads : compute the expected entropy in this many threads, each
+            taking chunks of `chunkSize` candidate intensities. numpy
+            releases the GIL for the products, so this helps where numpy's
+            BLAS is single-threaded.
+    """
+
+    def __init__(self, x, alpha, beta, xPrecision, aPrecision, bPrecision, delta=0, stepType='lin', TwoAFC=False, prior=None,
+                 dtype='float32', xCandidates=None, nThreads=1, chunkSize=64):
         self._TwoAFC = TwoAFC
         #Save dimensions
         if stepType == 'lin':
-            self.x = linspace(x[0], x[1], int(round((x[1]-x[0])/xPrecision)+1), True)
+            self.x = np.linspace(x[0], x[1], int(round((x[1]-x[0])/xPrecision)+1), True)
         elif stepType == 'log':
-            self.x = logspace(log10(x[0]), log10(x[1]), xPrecision, True)
+            self.x = np.logspace(np.log10(x[0]), np.log10(x[1]), xPrecision, True)
         else:
             raise RuntimeError('Invalid step type. Unable to initialize PsiObject.')
-        self.alpha = linspace(alpha[0], alpha[1], int(round((alpha[1]-alpha[0])/aPrecision)+1), True)
-        self.beta = linspace(beta[0], beta[1], int(round((beta[1]-beta[0])/bPrecision)+1), True)
-        self.r = array(list(range(2)))
+        self.alpha = np.linspace(alpha[0], alpha[1], int(round((alpha[1]-alpha[0])/aPrecision)+1), True)
+        self.beta = np.linspace(beta[0], beta[1], int(round((beta[1]-beta[0])/bPrecision)+1), True)
+        self.r = np.array(list(range(2)))
         self.delta = delta
-        
-        # Change x,a,b,r arrays to matrix computation compatible orthogonal 4D arrays
-        # ALWAYS use the order for P(r|lambda,x); i.e. [r,a,b,x]
-        self._r = self.r.reshape((self.r.size,1,1,1))
-        self._alpha = self.alpha.reshape((1,self.alpha.size,1,1))
-        self._beta = self.beta.reshape((1,1,self.beta.size,1))
-        self._x = self.x.reshape((1,1,1,self.x.size))
-        
-        #Create P(lambda)
+        self.dtype = np.dtype(dtype).name
+        self.nThreads = max(1, int(nThreads))
+        self.chunkSize = max(1, int(chunkSize))
+
+        # indices (into self.x) of the intensities that may be chosen
+        if xCandidates is None:
+            self._xCandidates = np.arange(len(self.x))
+        else:
+            xCandidates = np.asarray(xCandidates, dtype=float).ravel()
+            nearest = np.abs(self.x[:, np.newaxis] - xCandidates).argmin(axis=0)
+            self._xCandidates = np.unique(nearest)
+
+        #Create log P(lambda), as [alpha, beta]
+        shape = (len(self.alpha), len(self.beta))
         if prior is None or prior.shape != (1, len(self.alpha),len(self.beta), 1):
             if prior is not None:
                 warnings.warn("Prior has incompatible dimensions. Using uniform (1/N) probabilities.")
-            self._probLambda = ndarray(shape=(1,len(self.alpha),len(self.beta),1))
-            self._probLambda.fill(1/(len(self.alpha)*len(self.beta)))
+            self._logProbLambda = np.full(shape, -np.log(shape[0] * shape[1]))
         else:
-            if prior.shape == (1, len(self.alpha), len(self.beta), 1):
-                self._probLambda = prior
-            else:
-                self._probLambda = prior.reshape(1, len(self.alpha), len(self.beta), 1)
-            
-        #Create P(r | lambda, x)
-        if TwoAFC:
-            self._probResponseGivenLambdaX = (1-self._r) + (2*self._r-1) * ((.5 + .5 * stats.norm.cdf(self._x, self._alpha, self._beta)) * (1 - self.delta) + self.delta / 2)
+            with np.errstate(divide='ignore'):
+                self._logProbLambda = np.log(np.asarray(prior, dtype=float).reshape(shape))
+            self._normalize()
+
+        self._makeLambdaXArrays()
+
+    def __setstate__(self, state):
+        # PsiObjects pickled by earlier versions have a 4-D P(lambda) and
+        # 4-D [r, alpha, beta, x] arrays instead of the attributes below.
+        # Their (x, lambda) arrays are rebuilt as float64, as their arrays
+        # were. (Ties in the expected entropy can still be broken
+        # differently, so the rest of the session can diverge from what
+        # those versions would have presented.)
+        state = dict(state)
+        probLambda = state.pop('_probLambda', None)
+        for name in _OLD_ARRAYS:
+            state.pop(name, None)
+        self.__dict__.update(state)
+        for name, value in (('dtype', 'float64'), ('nThreads', 1),
+                            ('chunkSize', 64)):
+            if name not in state:
+                setattr(self, name, value)
+        if '_xCandidates' not in state:
+            self._xCandidates = np.arange(len(self.x))
+        if '_logProbLambda' not in state:
+            shape = (len(self.alpha), len(self.beta))
+            with np.errstate(divide='ignore'):
+                self._logProbLambda = np.log(
+                    np.asarray(probLambda, dtype=float).reshape(shape))
+        if '_expectedEntropyX' in state:
+            self._expectedEntropyX = np.ravel(self._expectedEntropyX)
+        if '_probCorrect' not in state:
+            self._makeLambdaXArrays()
+
+    def _makeLambdaXArrays(self):
+        """Creates P(r=1 | lambda, x) and sum_r P(r|lambda,x) log P(r|lambda,x)
+        for the candidate intensities, as [x, lambda]"""
+        shape = (len(self.alpha), len(self.beta))
+        nCandidates = len(self._xCandidates)
+        self._probCorrect = np.empty((nCandidates, shape[0] * shape[1]), dtype=self.dtype)
+        self._responseEntropy = np.empty_like(self._probCorrect)
+        # (a few rows at a time, to keep float64 temporaries small)
+        nRows = max(1, 2 ** 17 // (shape[0] * shape[1]))
+        for start in range(0, nCandidates, nRows):
+            rows = slice(start, start + nRows)
+            p = self._probCorrectGivenLambda(self.x[self._xCandidates[rows]])
+            self._probCorrect[rows] = p
+            q = _xlogy(p)
+            np.subtract(1, p, out=p)
+            q += _xlogy(p)
+            self._responseEntropy[rows] = q
+
+    def _probCorrectGivenLambda(self, x):
+        """P(r=1 | lambda, x) for intensities x, as float64 [x, lambda]"""
+        from scipy.special import ndtr  # takes a while to load so do it lazy
+        # (the normal cdf, as stats.norm.cdf computes it, without its
+        # overhead of checking arguments)
+        x = np.asarray(x, dtype=float).reshape(-1, 1, 1)
+        p = ndtr((x - self.alpha.reshape(1, -1, 1)) / self.beta.reshape(1, 1, -1))
+        if self._TwoAFC:
+            p = (.5 + .5 * p) * (1 - self.delta) + self.delta / 2
         else: # Yes/No
-            self._probResponseGivenLambdaX = (1-self._r) + (2*self._r-1) * (stats.norm.cdf(self._x, self._alpha, self._beta)*(1-self.delta)+self.delta/2)
-        
+            p = p * (1 - self.delta) + self.delta / 2
+        return p.reshape(len(x), -1)
+
+    def _normalize(self):
+        self._logProbLambda -= np.logaddexp.reduce(self._logProbLambda, axis=None)
+
+    @property
+    def _probLambda(self):
+        """P(lambda), as [1, alpha, beta, 1]"""
+        return np.exp(self._logProbLambda).reshape((1, len(self.alpha), len(self.beta), 1))
+
     def update(self, response=None):
         if response is not None:    #response should only be None when Psi is first initialized
-            self._probLambda = self._probLambdaGivenXResponse[response,:,:,self.nextIntensityIndex].reshape((1,len(self.alpha),len(self.beta),1))
-            
-        #Create P(r | x)
-        self._probResponseGivenX = sum(self._probResponseGivenLambdaX * self._probLambda, axis=(1,2)).reshape((len(self.r),1,1,len(self.x)))
-        
-        #Create P(lambda | x, r)
-        self._probLambdaGivenXResponse = self._probLambda*self._probResponseGivenLambdaX/self._probResponseGivenX
-        
-        #Create H(x, r)
-        self._entropyXResponse = -1* sum(self._probLambdaGivenXResponse * log10(self._probLambdaGivenXResponse), axis=(1,2)).reshape((len(self.r),1,1,len(self.x)))
-        
+            p = self._probCorrectGivenLambda([self.nextIntensity])[0]
+            if not response:
+                p = 1 - p
+            with np.errstate(divide='ignore'):
+                self._logProbLambda += np.log(p).reshape(self._logProbLambda.shape)
+            self._normalize()
+
+        probLambda = np.exp(self._logProbLambda).ravel()
+        #Create sum_l P(l) sum_r P(r|l,x) log P(r|l,x) and P(r=1|x)
+        entropySum, probCorrect = self._lambdaSums(probLambda.astype(self.dtype))
+        probCorrect = np.clip(probCorrect, 0, 1)
+
         #Create E[H(x)]
-        self._expectedEntropyX = sum(self._entropyXResponse * self._probResponseGivenX, axis=0).reshape((1,1,1,len(self.x)))
-        
+        expectedEntropy = (_xlogy(probCorrect) + _xlogy(1 - probCorrect)
+                           - entropySum - _xlogy(probLambda).sum())
+        self._expectedEntropyX = expectedEntropy / np.log(10)
+
         #Generate next intensity
-        self.nextIntensityIndex = argmin(self._expectedEntropyX, axis=3)[0][0][0]
+        self.nextIntensityIndex = int(self._xCandidates[np.argmin(self._expectedEntropyX)])
         self.nextIntensity = self.x[self.nextIntensityIndex]
-        
+
+    def applyTrials(self, intensities, responses):
+        """Updates the posterior with many trials at once and chooses the
+        next intensity, as calling update() for each trial would (with the
+        intensities given rather than nextIntensity). The log likelihood of
+        each distinct intensity is computed once and weighted by its number
+        of correct and incorrect responses.
+        """
+        from scipy.special import xlogy
+        intensities = np.asarray(intensities, dtype=float).ravel()
+        responses = np.asarray(responses, dtype=float).ravel()
+        if len(intensities) != len(responses):
+            raise ValueError('intensities and responses must have the same length')
+        if len(intensities):
+            xs, inverse = np.unique(intensities, return_inverse=True)
+            nCorrect = np.bincount(inverse, weights=responses, minlength=len(xs))
+            nWrong = np.bincount(inverse, weights=1 - responses, minlength=len(xs))
+            p = self._probCorrectGivenLambda(xs)
+            logLikelihood = (xlogy(nCorrect[:, np.newaxis], p).sum(axis=0) +
+                             xlogy(nWrong[:, np.newaxis], 1 - p).sum(axis=0))
+            self._logProbLambda += logLikelihood.reshape(self._logProbLambda.shape)
+            self._normalize()
+        self.update(None)
+
+    def _lambdaSums(self, probLambda):
+        """Returns the products of the [x, lambda] arrays with probLambda,
+        for all candidate intensities"""
+        nCandidates = len(self._xCandidates)
+        if self.nThreads == 1 or nCandidates <= self.chunkSize:
+            return (np.dot(self._responseEntropy, probLambda).astype(float),
+                    np.dot(self._probCorrect, probLambda).astype(float))
+
+        entropySum = np.empty(nCandidates)
+        probCorrect = np.empty(nCandidates)
+
+        def chunkSums(start):
+            rows = slice(start, start + self.chunkSize)
+            entropySum[rows] = np.dot(self._responseEntropy[rows], probLambda)
+            probCorrect[rows] = np.dot(self._probCorrect[rows], probLambda)
+
+        _getThreadPool(self.nThreads).map(chunkSums, range(0, nCandidates, self.chunkSize))
+        return entropySum, probCorrect
+
     def estimateLambda(self):
-        return (sum(sum(self._alpha.reshape((len(self.alpha),1))*self._probLambda.squeeze(), axis=1)), sum(sum(self._beta.reshape((1,len(self.beta)))*self._probLambda.squeeze(), axis=1)))
-        
+        probLambda = np.exp(self._logProbLambda)
+        return (np.sum(self.alpha.reshape((len(self.alpha),1))*probLambda), np.sum(self.beta.reshape((1,len(self.beta)))*probLambda))
+
     def estimateThreshold(self, thresh, lam):
+        from scipy import stats
         if lam is None:
             lamb = self.estimateLambda()
         else:
@@ -104,6 +270,13 @@ class PsiObject(object):
             return stats.norm.ppf((2*thresh-1)/(1-self.delta), lamb[0], lamb[1])
         else:
             return stats.norm.ppf((thresh-self.delta/2)/(1-self.delta), lamb[0], lamb[1])
-        
+
     def savePosterior(self, file):
-        save(file, self._probLambda)
+        np.save(file, self._probLambda)
+
+
+def _xlogy(p):
+    """p * log(p), with 0 where p is 0"""
+    p = np.asarray(p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(p > 0, p * np.log(p), 0)
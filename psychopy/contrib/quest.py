@@ -337,24 +337,63 @@ class QuestObject(object):
             raise RuntimeError('prior pdf is not finite')
 
         # recompute the pdf from the historical record of trials
-        for intensity, response in zip(self.intensity,self.response):
-            inten = max(-1e10,min(1e10,intensity)) # make intensity finite
-            ii = len(self.pdf) + self.i-round((inten-self.tGuess)/self.grain)-1
-            if ii[0]<0:
-                ii = ii-ii[0]
-            if ii[-1]>=self.s2.shape[1]:
-                ii = ii+self.s2.shape[1]-ii[-1]-1
-            iii = ii.astype(num.int_)
-            if not num.allclose(ii,iii):
-                raise ValueError('truncation error')
-            self.pdf = self.pdf*self.s2[response,iii]
-            if self.normalizePdf and k%100==0:
-                self.pdf = self.pdf/num.sum(self.pdf) # avoid underflow; keep the pdf normalized
+        if len(self.intensity):
+            self.pdf = self.pdf*num.exp(self._logLikelihood(self.intensity,self.response))
         if self.normalizePdf:
             self.pdf = self.pdf/num.sum(self.pdf) # avoid underflow; keep the pdf normalized
         if len(getinf(self.pdf)[0]):
             raise RuntimeError('prior pdf is not finite')
 
+    def _firstColumns(self,intensities):
+        """Index into self.s2 of the value for self.x[0] on trials at the
+        given intensities, kept in range as by recompute(), and whether
+        each was in range."""
+        inten = num.clip(num.asarray(intensities,dtype=float),-1e10,1e10) # make intensities finite
+        first = len(self.pdf)+self.i[0]-1-num.round((inten-self.tGuess)/self.grain)
+        last = self.s2.shape[1]-len(self.pdf)
+        inRange = (first>=0) & (first<=last)
+        return num.clip(first,0,last).astype(num.int_), inRange
+
+    def _logLikelihood(self,intensities,responses):
+        """Log likelihood of the trials, for each value of self.x.
+
+        Trials with the same response and (quantized) intensity multiply
+        the pdf by the same values, so each distinct pair is counted and
+        its log likelihood added once, weighted by its count."""
+        responses = num.asarray(responses).astype(num.int_)
+        if len(responses) and (responses.min() < 0 or responses.max() >= self.s2.shape[0]):
+            raise RuntimeError('responses out of range 0 to %d'%(self.s2.shape[0]-1))
+        first, inRange = self._firstColumns(intensities)
+        nFirst = self.s2.shape[1]-len(self.pdf)+1
+        counts = num.bincount(responses*nFirst+first,minlength=self.s2.shape[0]*nFirst)
+        used = num.nonzero(counts)[0]
+        columns = (used%nFirst)[:,num.newaxis]+num.arange(len(self.pdf))
+        with num.errstate(divide='ignore'):
+            logS2 = num.log(self.s2[(used//nFirst)[:,num.newaxis],columns])
+        return num.dot(counts[used].astype(float),logS2)
+
+    def applyTrials(self,intensities,responses):
+        """Update Quest posterior pdf with many trials at once.
+
+        Gives the same pdf as calling update() for each trial, but sums
+        the log likelihood of all the trials in one step rather than
+        updating the pdf trial by trial. The trials are added to the
+        historical record."""
+        intensities = num.asarray(intensities,dtype=float).ravel()
+        responses = num.asarray(responses).ravel()
+        if len(intensities) != len(responses):
+            raise ValueError('intensities and responses must have the same length')
+        if self.updatePdf and len(intensities):
+            inRange = self._firstColumns(intensities)[1]
+            if self.warnPdf and not inRange.all():
+                warnings.warn('%d intensities out of range. Pdf will be inexact.'%num.sum(~inRange),
+                              RuntimeWarning,stacklevel=2)
+            self.pdf = self.pdf*num.exp(self._logLikelihood(intensities,responses))
+            if self.normalizePdf:
+                self.pdf=self.pdf/num.sum(self.pdf)
+        self.intensity.extend(intensities.tolist())
+        self.response.extend(responses.tolist())
+
     def update(self,intensity,response):
         """Update Quest posterior pdf.
 
@@ -371,7 +410,7 @@ class QuestObject(object):
         if self.updatePdf:
             inten = max(-1e10,min(1e10,intensity)) # make intensity finite
             ii = len(self.pdf) + self.i-round((inten-self.tGuess)/self.grain)-1
-            if ii[0]<0 or ii[-1] > self.s2.shape[1]:
+            if ii[0]<0 or ii[-1] >= self.s2.shape[1]:
                 if self.warnPdf:
                     low=(1-len(self.pdf)-self.i[0])*self.grain+self.tGuess
                     high=(self.s2.shape[1]-len(self.pdf)-self.i[-1])*self.grain+self.tGuess
@@ -20,8 +20,13 @@ from .utils import (checkValidFilePath, isValidVariableName, importTrialTypes,
                     createFactorialTrialList, bootStraps, functionFromStaircase,
                     getDateStr)
 
+from .simulation import (simulate, simulateMultiStair, SimulationResult,
+                         StairBatch, QuestBatch, PsiBatch)
+
+from .columnar import readColumnar, readColumnarGroup, readColumnarInfo
+
 from .fit import (FitFunction, FitCumNormal, FitLogistic, FitNakaRushton,
-                  FitWeibull)
+                  FitWeibull, BootstrapFit, bootstrapFit)
 
 try:
     # import openpyxl
@@ -0,0 +1,552 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Combining the data files of many sessions into one partitioned Parquet
+dataset.
+
+Each session of an experiment leaves a wide text file (.csv or .tsv) and/or
+a .psydat file. :func:`aggregate` scans a data folder for them, reads the
+sessions in parallel and writes one Parquet file per session into a
+Hive-style partitioned folder (e.g. `participant=p01/...`), which pandas,
+R (arrow), DuckDB, Spark etc. can all read as a single table.
+
+- Where a session has a .psydat file, that is read (it keeps the type of
+  every value) and the values of its `extraInfo` become typed columns;
+  otherwise its wide text file is read.
+- Columns missing from some sessions have missing values there. A column
+  with different types in different sessions is read as the wider type
+  (float for ints and floats, otherwise text).
+- An index of the processed files is kept in the output folder, so running
+  the aggregation again only reads sessions that are new or have changed,
+  and drops those whose files have been deleted or renamed.
+
+Load the result with :func:`readAggregate`. Requires pyarrow.
+
+command-line usage:
+    python -m psychopy.data.aggregate dataDir outDir [--partition-by NAME]
+        [--processes N] [--pattern GLOB] [--rebuild]
+"""
+
+from __future__ import absolute_import, division, print_function
+
+from builtins import str
+from past.builtins import basestring
+import os
+import sys
+import json
+import fnmatch
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from psychopy import logging
+from psychopy.data import columnar
+
+INDEX_FILENAME = '_aggregateIndex.json'
+# the extensions of the files of a session, by order of preference
+SESSION_EXTENSIONS = ('.psydat', '.csv', '.tsv')
+# the name of the folder of rows with no value for the partition column
+DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+_SAVE_INDEX_EVERY = 100
+
+
+def findSessions(dataDir, pattern='*', recursive=True, exclude=None):
+    """Returns an OrderedDict of the sessions in `dataDir`, as
+    {sessionKey: [fileNames]}. The key is the path of the session's files
+    relative to `dataDir`, without the extension (and with '/' as the
+    separator); the file names are in the order of SESSION_EXTENSIONS.
+
+    `pattern` is matched against the names of the files. Folders in
+    `exclude` (e.g. the output folder) are skipped.
+    """
+    exclude = set(os.path.abspath(path) for path in (exclude or []))
+    sessions = {}
+    for root, dirs, files in os.walk(dataDir):
+        dirs[:] = sorted(name for name in dirs
+                         if os.path.abspath(os.path.join(root, name))
+                         not in exclude)
+        for name in files:
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in SESSION_EXTENSIONS or \
+                    not fnmatch.fnmatch(name, pattern):
+                continue
+            key = _relativePath(os.path.join(root, stem), dataDir)
+            sessions.setdefault(key, []).append(os.path.join(root, name))
+        if not recursive:
+            break
+    order = dict((ext, n) for n, ext in enumerate(SESSION_EXTENSIONS))
+    return OrderedDict(
+        (key, sorted(sessions[key],
+                     key=lambda f: order[os.path.splitext(f)[1].lower()]))
+        for key in sorted(sessions))
+
+
+def _relativePath(fileName, dataDir):
+    return os.path.relpath(fileName, dataDir).replace(os.sep, '/')
+
+
+def _fileState(fileName):
+    """The size and modification time of a file, to tell if it changed"""
+    stat = os.stat(fileName)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _typedValue(value):
+    """Returns text (e.g. from the dialog of extraInfo) that is a number as
+    that number. Text that would change if converted (e.g. '007') is kept.
+    """
+    if not isinstance(value, basestring):
+        return value
+    for numType in (int, float):
+        try:
+            number = numType(value)
+        except ValueError:
+            continue
+        if str(number) == value.strip() and np.isfinite(number):
+            return number
+    return value
+
+
+def _readPsydat(fileName):
+    from psychopy.tools.filetools import fromFile
+    handler = fromFile(fileName)
+    if not hasattr(handler, '_getColumnarData'):
+        raise ValueError('%s does not contain a PsychoPy data handler'
+                         % fileName)
+    columnarData = handler._getColumnarData()
+    if columnarData is None:
+        raise ValueError('%s has no trials' % fileName)
+    names, columns, info = columnarData
+    names = [u'%s' % name for name in names]
+    columns = list(columns)
+    metadata = columnar.handlerMetadata(handler, **info)
+    extraInfo = metadata.get('extraInfo')
+    if isinstance(extraInfo, dict):
+        nRows = len(columns[0]) if columns else 0
+        for key, value in extraInfo.items():
+            key = u'%s' % key
+            if key in names:
+                n = names.index(key)
+                columns[n] = [_typedValue(entry) for entry in columns[n]]
+            else:
+                names.append(key)
+                columns.append([_typedValue(value)] * nRows)
+    return names, columns, metadata
+
+
+def _readWideText(fileName):
+    import csv
+    import io
+    import pandas as pd
+    delim = '\t' if fileName.lower().endswith('.tsv') else ','
+    with io.open(fileName, 'r', encoding='utf-8-sig', newline='') as f:
+        header = next(csv.reader(f, delimiter=delim), [])
+    # (read by position, as pandas would rename repeated names)
+    df = pd.read_csv(fileName, sep=delim, encoding='utf-8-sig', header=None,
+                     skiprows=1)
+    names = []
+    columns = []
+    for name, position in zip(header, df.columns):
+        values = df[position].values
+        # (the delimiter that ends each line of saveAsWideText adds an
+        # empty column)
+        if name in names or (name == '' and df[position].isnull().all()):
+            continue
+        names.append(name)
+        columns.append(values)
+    return names, columns, {}
+
+
+def _readSession(task):
+    """Reads the first of the files of a session that can be read.
+    Returns (sessionKey, fileName, (names, columns, metadata)), or
+    (sessionKey, None, error message) if none can. (Run in the worker
+    processes.)
+    """
+    key, fileNames = task
+    errors = []
+    for fileName in fileNames:
+        try:
+            if fileName.lower().endswith('.psydat'):
+                session = _readPsydat(fileName)
+            else:
+                session = _readWideText(fileName)
+        except Exception as err:
+            errors.append('%s: %s' % (os.path.basename(fileName), err))
+        else:
+            return key, fileName, session
+    return key, None, '; '.join(errors)
+
+
+def _sessionArray(values):
+    """Returns the values of a column as a pyarrow array of bool, int64,
+    double or string (or null, if all are missing)"""
+    pa = columnar.pa
+    if isinstance(values, np.ndarray) and values.ndim == 1 and \
+            not np.ma.isMaskedArray(values):
+        if values.dtype.kind == 'f':
+            # (NaN is how pandas reads missing numbers)
+            return pa.array(values.astype(np.float64), from_pandas=True)
+        elif values.dtype.kind in 'iu':
+            return pa.array(values.astype(np.int64))
+        elif values.dtype.kind == 'b':
+            return pa.array(values)
+        values = values.tolist()
+    array = columnar._columnArray(values)
+    if len(array) and array.null_count == len(array):
+        return pa.nulls(len(array))
+    return array
+
+
+def _mergeTypes(old, new):
+    """The type of a column that has values of types old and new"""
+    if old in (None, 'null') or old == new:
+        return new
+    if new == 'null':
+        return old
+    if set([old, new]) == set(['int64', 'double']):
+        return 'double'
+    return 'string'
+
+
+def _conform(array, typeName):
+    """Returns the array as type typeName, which is the same as its type or
+    wider (see _mergeTypes)"""
+    pa = columnar.pa
+    if str(array.type) == typeName:
+        return array
+    arrowType = pa.type_for_alias(typeName)
+    if array.null_count == len(array):
+        return pa.nulls(len(array), type=arrowType)
+    if typeName == 'string':
+        return pa.array([None if value is None else str(value)
+                         for value in array.to_pylist()], type=arrowType)
+    return array.cast(arrowType)
+
+
+def _partitionDir(name, value):
+    if columnar._isMissing(value):
+        value = DEFAULT_PARTITION
+    value = u'%s' % (value,)
+    for char in ('/', '\\', os.sep):
+        value = value.replace(char, '_')
+    return u'%s=%s' % (name, value)
+
+
+def _loadIndex(outDir):
+    fileName = os.path.join(outDir, INDEX_FILENAME)
+    if not os.path.isfile(fileName):
+        return None
+    with open(fileName, 'r') as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+def _saveIndex(outDir, index):
+    fileName = os.path.join(outDir, INDEX_FILENAME)
+    with open(fileName + '.tmp', 'w') as f:
+        json.dump(index, f, indent=1, default=columnar._jsonDefault)
+    os.replace(fileName + '.tmp', fileName)
+
+
+def _removeOutputs(outDir, entry):
+    """Deletes the files written for a session, and the partition folders
+    left empty"""
+    for output in entry.get('outputs', []):
+        fileName = os.path.join(outDir, *output['file'].split('/'))
+        if os.path.isfile(fileName):
+            os.remove(fileName)
+        folder = os.path.dirname(fileName)
+        if os.path.abspath(folder) != os.path.abspath(outDir) and \
+                os.path.isdir(folder) and not os.listdir(folder):
+            os.rmdir(folder)
+
+
+def _removeStaleSessions(outDir, index, dataDir, sessions):
+    """Drops the sessions of the index that were not found this time and
+    whose source file no longer exists (i.e. was deleted or renamed),
+    deleting their files. Returns their keys.
+
+    (Sessions that were only not found because of the pattern or
+    `recursive` are kept.)
+    """
+    removed = []
+    for key, entry in list(index['sessions'].items()):
+        sourceFile = os.path.join(dataDir, *entry['source'].split('/'))
+        if key in sessions or os.path.isfile(sourceFile):
+            continue
+        _removeOutputs(outDir, entry)
+        del index['sessions'][key]
+        removed.append(key)
+    entries = list(index['sessions'].values())
+    if removed and all('columns' in entry for entry in entries):
+        # forget the columns that only the removed sessions had
+        remaining = set(name for entry in entries
+                        for name in entry['columns'])
+        for name in list(index['columns']):
+            if name not in remaining:
+                del index['columns'][name]
+    return removed
+
+
+def _writeSession(outDir, index, key, fileName, session, dataDir,
+                  compression):
+    """Writes the data of a session into its partition(s), updating the
+    column types of the index. Returns the outputs and the column names of
+    the session for the index."""
+    pa = columnar.pa
+    pq = columnar.pq
+    names, columns, metadata = session
+    partitionBy = index['partitionBy']
+    types = index['columns']
+    arrays = OrderedDict()
+    for name, values in zip(names, columns):
+        if name not in arrays:  # (only the first of duplicate names)
+            arrays[name] = _sessionArray(values)
+            types[name] = _mergeTypes(types.get(name), str(arrays[name].type))
+    nRows = len(next(iter(arrays.values()))) if arrays else 0
+
+    metadata = dict(metadata, sourceFile=_relativePath(fileName, dataDir))
+    schemaMetadata = {columnar.METADATA_KEY: json.dumps(
+        metadata, default=columnar._jsonDefault).encode('utf-8')}
+    table = pa.Table.from_arrays(
+        [_conform(array, types[name]) for name, array in arrays.items()],
+        names=list(arrays), metadata=schemaMetadata)
+
+    # the rows of each value of the partition column, in order
+    if partitionBy is None:
+        groups = OrderedDict([(None, np.arange(nRows))])
+    else:
+        if partitionBy in arrays:
+            values = arrays[partitionBy].to_pylist()
+            table = table.drop([partitionBy])
+        else:
+            values = [None] * nRows
+        groups = OrderedDict()
+        for rowN, value in enumerate(values):
+            groups.setdefault(value, []).append(rowN)
+
+    outputs = []
+    baseName = key.replace('/', '__') + '.parquet'
+    for value, rows in groups.items():
+        if partitionBy is None:
+            output = baseName
+        else:
+            output = _partitionDir(partitionBy, value) + '/' + baseName
+        outFile = os.path.join(outDir, *output.split('/'))
+        if not os.path.isdir(os.path.dirname(outFile)):
+            os.makedirs(os.path.dirname(outFile))
+        if len(groups) > 1:
+            part = table.take(pa.array(rows, type=pa.int64()))
+        else:
+            part = table
+        pq.write_table(part, outFile, compression=compression)
+        outputs.append({'file': output, 'partition': value,
+                        'nRows': len(rows)})
+    return outputs, list(arrays)
+
+
+def aggregate(dataDir, outDir, partitionBy=None, pattern='*',
+              recursive=True, processes=None, rebuild=False,
+              compression='snappy'):
+    """Combines the data files of all the sessions in `dataDir` into a
+    partitioned Parquet dataset in `outDir`, reading only the sessions that
+    are new or have changed since the last time. Sessions whose files were
+    deleted or renamed since then are removed from the dataset. Returns a
+    dict with the keys of the sessions that were 'added', 'updated',
+    'unchanged' and 'removed', and the error of each session that could not
+    be read ('failed').
+
+    :Parameters:
+
+        partitionBy : the name of a column (e.g. 'participant') to split the
+            rows by, into folders named `partitionBy=value`. This column is
+            then not stored in the files. None for no partitions.
+
+        pattern : only files with names matching this (glob) pattern are
+            read, e.g. 'P*_stroop_*'
+
+        recursive : look in the subfolders of `dataDir` too
+
+        processes : read the files in this many processes. None uses one
+            per CPU.
+
+        rebuild : delete the files of the previous aggregation and read
+            all the sessions again. Needed to change `partitionBy`.
+
+        compression : the compression codec of the Parquet files
+    """
+    columnar._requirePyarrow()
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+    index = _loadIndex(outDir)
+    if index is not None and rebuild:
+        for entry in index['sessions'].values():
+            _removeOutputs(outDir, entry)
+        index = None
+    if index is None:
+        index = OrderedDict([('partitionBy', partitionBy),
+                             ('columns', OrderedDict()),
+                             ('sessions', OrderedDict())])
+    elif index['partitionBy'] != partitionBy:
+        raise ValueError('%s was partitioned by %r, not %r. Use rebuild=True '
+                         'to change the partitions.'
+                         % (outDir, index['partitionBy'], partitionBy))
+
+    summary = {'added': [], 'updated': [], 'unchanged': [], 'removed': [],
+               'failed': {}}
+    tasks = []
+    states = {}
+    sessions = findSessions(dataDir, pattern=pattern, recursive=recursive,
+                            exclude=[outDir])
+    summary['removed'] = _removeStaleSessions(outDir, index, dataDir,
+                                              sessions)
+    if summary['removed']:
+        _saveIndex(outDir, index)
+    for key, fileNames in sessions.items():
+        states[key] = dict((os.path.basename(fileName), _fileState(fileName))
+                           for fileName in fileNames)
+        entry = index['sessions'].get(key)
+        if entry is not None and entry['files'] == states[key]:
+            summary['unchanged'].append(key)
+        else:
+            tasks.append((key, fileNames))
+
+    if processes is None:
+        from multiprocessing import cpu_count
+        processes = cpu_count()
+    processes = max(1, min(int(processes), len(tasks)))
+    pool = None
+    if processes == 1:
+        results = (_readSession(task) for task in tasks)
+    else:
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        results = pool.imap(_readSession, tasks)
+    try:
+        for nDone, (key, fileName, session) in enumerate(results):
+            if fileName is None:
+                summary['failed'][key] = session
+                logging.warning('aggregate: could not read %s (%s)'
+                                % (key, session))
+                continue
+            entry = index['sessions'].pop(key, None)
+            if entry is not None:
+                _removeOutputs(outDir, entry)
+                summary['updated'].append(key)
+            else:
+                summary['added'].append(key)
+            outputs, columns = _writeSession(outDir, index, key, fileName,
+                                             session, dataDir, compression)
+            index['sessions'][key] = OrderedDict([
+                ('files', states[key]),
+                ('source', _relativePath(fileName, dataDir)),
+                ('outputs', outputs),
+                ('columns', columns)])
+            if (nDone + 1) % _SAVE_INDEX_EVERY == 0:
+                _saveIndex(outDir, index)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _saveIndex(outDir, index)
+    return summary
+
+
+def readAggregate(outDir, columns=None, sourceColumn='sourceFile'):
+    """Loads the dataset written by :func:`aggregate` as a pandas DataFrame.
+
+    The partition column is restored, every column has the type recorded
+    for it over all sessions, and the name of the file each row came from
+    (relative to the data folder) is added as `sourceColumn` (unless that
+    is None).
+
+    :Parameters:
+
+        columns : the names of the columns to load, or None for all
+    """
+    columnar._requirePyarrow()
+    pa = columnar.pa
+    pq = columnar.pq
+    index = _loadIndex(outDir)
+    if index is None:
+        raise IOError('%s does not contain an aggregated dataset (no %s)'
+                      % (outDir, INDEX_FILENAME))
+    partitionBy = index['partitionBy']
+    types = index['columns']
+    if columns is None:
+        columns = list(types)
+    schema = pa.schema([(name, pa.type_for_alias(types[name]))
+                        for name in columns])
+    tables = []
+    for entry in index['sessions'].values():
+        for output in entry['outputs']:
+            fileName = os.path.join(outDir, *output['file'].split('/'))
+            table = pq.read_table(fileName)
+            nRows = table.num_rows
+            arrays = []
+            for name in columns:
+                if name == partitionBy:
+                    array = pa.array([output['partition']] * nRows)
+                elif name in table.column_names:
+                    array = table.column(name).combine_chunks()
+                else:
+                    array = pa.nulls(nRows)
+                arrays.append(_conform(array, types[name]))
+            tables.append(pa.Table.from_arrays(arrays, schema=schema))
+    if tables:
+        df = pa.concat_tables(tables).to_pandas()
+    else:
+        df = schema.empty_table().to_pandas()
+    if sourceColumn is not None:
+        sources = [(entry['source'], output['nRows'])
+                   for entry in index['sessions'].values()
+                   for output in entry['outputs']]
+        df[sourceColumn] = np.repeat([source for source, n in sources],
+                                     [n for source, n in sources])
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m psychopy.data.aggregate',
+        description='Combine the data files (.psydat, .csv, .tsv) of the '
+                    'sessions in a folder into one partitioned Parquet '
+                    'dataset. Sessions already in the dataset are only '
+                    'read again if their files have changed, and are '
+                    'removed if their files have been deleted.')
+    parser.add_argument('dataDir', help='the folder of data files')
+    parser.add_argument('outDir', help='the folder of the dataset')
+    parser.add_argument('--partition-by', dest='partitionBy', default=None,
+                        help='a column (e.g. participant) to partition the '
+                             'rows by')
+    parser.add_argument('--pattern', default='*',
+                        help='only read files with names matching this glob '
+                             'pattern')
+    parser.add_argument('--no-recursive', dest='recursive',
+                        action='store_false',
+                        help="don't look in subfolders of dataDir")
+    parser.add_argument('--processes', '-j', type=int, default=None,
+                        help='the number of processes reading files '
+                             '(default: one per CPU)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='read all sessions again, e.g. to change '
+                             'the partitions')
+    args = parser.parse_args(argv)
+
+    summary = aggregate(args.dataDir, args.outDir,
+                        partitionBy=args.partitionBy, pattern=args.pattern,
+                        recursive=args.recursive, processes=args.processes,
+                        rebuild=args.rebuild)
+    print('%i sessions added, %i updated, %i unchanged, %i removed, '
+          '%i failed'
+          % (len(summary['added']), len(summary['updated']),
+             len(summary['unchanged']), len(summary['removed']),
+             len(summary['failed'])))
+    for key, error in summary['failed'].items():
+        print('  could not read %s: %s' % (key, error), file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -27,6 +27,7 @@ from psychopy.tools.filetools import (openOutputFile, genDelimiter,
 from psychopy.tools.fileerrortools import handleFileCollision
 from psychopy.tools.arraytools import extendArr
 from .utils import _getExcelCellName
+from .ragged import RaggedArray
 
 try:
     import openpyxl
@@ -43,6 +44,52 @@ except ImportError:
 _experiments = weakref.WeakValueDictionary()
 
 
+def _excelValue(entry):
+    """Returns the value of a cell as written by saveAsExcel: a float if
+    the entry converts to one, otherwise a string.
+    """
+    if entry is None:
+        entry = ''
+    try:
+        # if it can convert to a number (from numpy) then do it
+        return float(entry)
+    except Exception:
+        return u"{}".format(entry)
+
+
+def _saveExcelSheets(fileName, sheets, appendFile=True,
+                     fileCollisionMethod='rename'):
+    """Writes worksheets to an Excel (xlsx) file one row at a time, and
+    returns the name of the file.
+
+    `sheets` is a list of (sheetName, rows), where rows is an iterable of
+    lists of cell values, with None for a cell that is left empty. New
+    files are written by an openpyxl write-only workbook, which streams the
+    rows to disk, so memory use does not grow with the number of rows.
+    openpyxl cannot stream into an existing workbook, so when appending to
+    an existing file the rows are added to the loaded workbook instead.
+    """
+    if not fileName.endswith('.xlsx'):
+        fileName += '.xlsx'
+    # create or load the file
+    if appendFile and os.path.isfile(fileName):
+        wb = load_workbook(fileName)
+    else:
+        if not appendFile:
+            # the file exists but we're not appending, will be overwritten
+            fileName = handleFileCollision(fileName, fileCollisionMethod)
+        wb = Workbook(write_only=True)
+        wb.properties.creator = 'PsychoPy' + psychopy.__version__
+
+    for sheetName, rows in sheets:
+        ws = wb.create_sheet(title=sheetName)
+        for row in rows:
+            ws.append(row)
+
+    wb.save(filename=fileName)
+    return fileName
+
+
 class _ComparisonMixin(object):
     def __eq__(self, other):
         # NoneType and booleans, for example, don't have a .__dict__ attribute.
@@ -205,9 +252,9 @@ class _BaseTrialHandler(_ComparisonMixin):
                              ' completed. Nothing saved')
             return -1
 
-        dataArray = self._createOutputArray(stimOut=stimOut,
-                                            dataOut=dataOut,
-                                            matrixOnly=matrixOnly)
+        lines = self._iterOutputArray(stimOut=stimOut,
+                                      dataOut=dataOut,
+                                      matrixOnly=matrixOnly)
 
         # set default delimiter if none given
         if delim is None:
@@ -218,17 +265,16 @@ class _BaseTrialHandler(_ComparisonMixin):
         with openOutputFile(fileName=fileName, append=appendFile,
                             fileCollisionMethod=fileCollisionMethod,
                             encoding=encoding) as f:
-            # loop through lines in the data matrix
-            for line in dataArray:
-                for cellN, entry in enumerate(line):
+            # write the lines of the data matrix as they are made
+            for line in lines:
+                cells = []
+                for entry in line:
                     # surround in quotes to prevent effect of delimiter
                     if delim in str(entry):
-                        f.write(u'"%s"' % str(entry))
+                        cells.append(u'"%s"' % str(entry))
                     else:
-                        f.write(str(entry))
-                    if cellN < (len(line) - 1):
-                        f.write(delim)
-                f.write("\n")  # add an EOL at end of each line
+                        cells.append(str(entry))
+                f.write(delim.join(cells) + "\n")  # EOL at end of each line
 
         if (fileName is not None) and (fileName != 'stdout') and self.autoLog:
             logging.info('saved data to %s' % f.name)
@@ -324,48 +370,88 @@ class _BaseTrialHandler(_ComparisonMixin):
                               ' Excel (xlsx) format, but was not found.')
             # return -1
 
-        # create the data array to be sent to the Excel file
-        dataArray = self._createOutputArray(stimOut=stimOut,
-                                            dataOut=dataOut,
-                                            matrixOnly=matrixOnly)
-
-        if not fileName.endswith('.xlsx'):
-            fileName += '.xlsx'
-        # create or load the file
-        if appendFile and os.path.isfile(fileName):
-            wb = load_workbook(fileName)
-            newWorkbook = False
-        else:
-            if not appendFile:
-                # the file exists but we're not appending, will be overwritten
-                fileName = handleFileCollision(fileName,
-                                               fileCollisionMethod)
-            wb = Workbook()  # create new workbook
-            wb.properties.creator = 'PsychoPy' + psychopy.__version__
-            newWorkbook = True
-
-        if newWorkbook:
-            ws = wb.worksheets[0]
-            ws.title = sheetName
-        else:
-            ws = wb.create_sheet()
-            ws.title = sheetName
-
-        # loop through lines in the data matrix
-        for lineN, line in enumerate(dataArray):
-            if line is None:
-                continue
-            for colN, entry in enumerate(line):
-                if entry is None:
-                    entry = ''
-                try:
-                    # if it can convert to a number (from numpy) then do it
-                    val = float(entry)
-                except Exception:
-                    val = u"{}".format(entry)
-                ws.cell(column=colN+1, row=lineN+1, value=val)
-
-        wb.save(filename=fileName)
+        # the lines of the data array, written to the Excel file as they
+        # are made
+        lines = self._iterOutputArray(stimOut=stimOut,
+                                      dataOut=dataOut,
+                                      matrixOnly=matrixOnly)
+        rows = ([_excelValue(entry) for entry in line] for line in lines)
+        _saveExcelSheets(fileName, [(sheetName, rows)],
+                         appendFile=appendFile,
+                         fileCollisionMethod=fileCollisionMethod)
+
+    def saveAsParquet(self, fileName, compression='snappy',
+                      fileCollisionMethod='rename'):
+        """Save the data of each trial as typed columns in an Apache
+        Parquet file, which loads far faster than a text file or pickle,
+        e.g. for analyses of many sessions. The handler's name, `extraInfo`
+        and the `runtimeInfo` of its experiment are saved in the metadata
+        of the file. Requires pyarrow.
+
+        Load the file with :func:`~psychopy.data.readColumnar` (or
+        :func:`~psychopy.data.readColumnarGroup` for many files) or any
+        other software that reads Parquet.
+
+        Returns the name of the file saved, or -1 if no trials have been
+        run.
+
+        :Parameters:
+
+            fileName: string
+                the name of the file. The extension `.parquet` will be added
+                if not given already.
+
+            compression: string
+                the codec used to compress the columns, e.g. 'snappy',
+                'zstd', 'gzip' or 'none'
+
+            fileCollisionMethod: string
+                Collision method passed to
+                :func:`~psychopy.tools.fileerrortools.handleFileCollision`
+        """
+        return self._saveColumnar(fileName, 'parquet', compression,
+                                  fileCollisionMethod)
+
+    def saveAsArrow(self, fileName, fileCollisionMethod='rename'):
+        """Save the data of each trial as typed columns in an uncompressed
+        Apache Arrow IPC (Feather v2) file, which can be memory-mapped when
+        loaded. Otherwise as :meth:`saveAsParquet`. Requires pyarrow.
+
+        The extension `.arrow` will be added to `fileName` if not given
+        already.
+        """
+        return self._saveColumnar(fileName, 'arrow', None,
+                                  fileCollisionMethod)
+
+    def _saveColumnar(self, fileName, fileFormat, compression,
+                      fileCollisionMethod):
+        """Saves the data to a Parquet or Arrow file and returns the name
+        of the file, or -1 if no trials have been run.
+
+        Each handler class defines `_getColumnarData()`, which returns
+        (names, columns, info): the names of the columns, sequences of
+        their values (one per trial) and a dict of information about the
+        data to save as metadata along with `extraInfo`, or None if no
+        trials have been run.
+        """
+        from .columnar import saveColumnar, handlerMetadata
+        fileName = pathToString(fileName)
+        columnarData = self._getColumnarData()
+        if columnarData is None:
+            if self.autoLog:
+                logging.info('%s.saveAs%s called but no trials completed. '
+                             'Nothing saved' % (type(self).__name__,
+                                                fileFormat.capitalize()))
+            return -1
+        names, columns, info = columnarData
+        fileName = saveColumnar(fileName, names, columns,
+                                metadata=handlerMetadata(self, **info),
+                                fileFormat=fileFormat,
+                                compression=compression,
+                                fileCollisionMethod=fileCollisionMethod)
+        if self.autoLog:
+            logging.info('saved data to %s' % fileName)
+        return fileName
 
     def saveAsJson(self,
                    fileName=None,
@@ -455,6 +541,15 @@ class DataHandler(_ComparisonMixin, dict):
     to a standard (not masked) numpy array with dtype='O' and where missing
     entries have value = "--".
 
+    Data types whose values are all numeric vectors (numpy arrays, or lists
+    of bools, ints or floats) of any length, such as eye traces or mouse
+    paths, are stored as a :class:`~psychopy.data.ragged.RaggedArray`
+    instead: one typed array of all the values with the offset and length
+    of each trial's vector. Indexed or converted to a numpy array this
+    gives the same values as the object array would. It is only converted
+    to an object array if some other value is added. With `memmapDir` the
+    values are kept in memory-mapped files in that folder.
+
     Attributes:
         - ['key']=data arrays containing values for that key
             (e.g. data['accuracy']=...)
@@ -462,8 +557,10 @@ class DataHandler(_ComparisonMixin, dict):
         - dataTypes=list of keys as strings
 
     """
-    def __init__(self, dataTypes=None, trials=None, dataShape=None):
+    def __init__(self, dataTypes=None, trials=None, dataShape=None,
+                 memmapDir=None):
         self.trials = trials
+        self.memmapDir = memmapDir
         self.dataTypes = []  # names will be added during addDataType
         self.isNumeric = {}
         # if given dataShape use it - otherwise guess!
@@ -531,7 +628,7 @@ class DataHandler(_ComparisonMixin, dict):
             self.addDataType(thisType)
         if position is None:
             # 'ran' is always the first thing to update
-            repN = sum(self['ran'][self.trials.thisIndex])
+            repN = int(self['ran'][self.trials.thisIndex].sum())
             if thisType != 'ran':
                 # because it has already been updated
                 repN -= 1
@@ -545,13 +642,25 @@ class DataHandler(_ComparisonMixin, dict):
         if not np.alltrue(posArr < shapeArr):
             # array isn't big enough
             logging.warning('need a bigger array for: ' + thisType)
+            if isinstance(self[thisType], RaggedArray):
+                self._convertToObjectArray(thisType)
             # not implemented yet!
             self[thisType] = extendArr(self[thisType], posArr)
+        if isinstance(self[thisType], RaggedArray):
+            if not self[thisType].canStore(value):
+                self._convertToObjectArray(thisType)
         # check for ndarrays with more than one value and for non-numeric data
-        if (self.isNumeric[thisType] and
+        elif (self.isNumeric[thisType] and
                 ((type(value) == np.ndarray and len(value) > 1) or
                      (type(value) not in [float, int]))):
-            self._convertToObjectArray(thisType)
+            if np.ma.getmaskarray(self[thisType]).all() and \
+                    RaggedArray(()).canStore(value):
+                # no values yet, and this is a vector
+                self[thisType] = RaggedArray(self[thisType].shape,
+                                             memmapDir=self.memmapDir)
+                self.isNumeric[thisType] = False
+            else:
+                self._convertToObjectArray(thisType)
         # insert the value
         self[thisType][position[0], int(position[1])] = value
 
@@ -560,6 +669,10 @@ class DataHandler(_ComparisonMixin, dict):
         object array
         """
         dat = self[thisType]
+        if isinstance(dat, RaggedArray):
+            self[thisType] = np.asarray(dat)
+            self.isNumeric[thisType] = False
+            return
         # create an array of Object type
         self[thisType] = np.array(dat.data, dtype='O')
         # masked vals should be "--", others keep data
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Saving and loading data as typed columns, in Apache Parquet files or
+Arrow IPC (Feather v2) files.
+
+Unlike text, pickle and JSON files these keep the type of each column and
+load without being parsed; Arrow files can also be memory-mapped. The
+handler's name, `extraInfo` and `runtimeInfo` are stored as JSON in the
+metadata of the schema, so group analyses can read them without loading
+the data.
+
+Requires pyarrow.
+"""
+
+from __future__ import absolute_import, print_function
+
+from builtins import str
+from past.builtins import basestring
+import os
+import json
+import numbers
+
+import numpy as np
+
+import psychopy
+from psychopy.tools.fileerrortools import handleFileCollision
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    havePyarrow = True
+except ImportError:
+    havePyarrow = False
+
+METADATA_KEY = b'psychopy'
+# the extension added to file names, by file format
+fileExtensions = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+_PARQUET_MAGIC = b'PAR1'
+
+
+def _requirePyarrow():
+    if not havePyarrow:
+        raise ImportError('pyarrow is required for saving and loading '
+                          'files in Parquet or Arrow format, but was not '
+                          'found.')
+
+
+def _isMissing(value):
+    # (NaN is how pandas fills missing values in object columns)
+    return value is None or value is np.ma.masked or \
+        (isinstance(value, float) and value != value)
+
+
+def _columnArray(values):
+    """Returns a pyarrow array of the values of a column.
+
+    Typed numpy arrays are used as they are. Other columns get the type
+    shared by all their values: bool, int64, float64 (ints and floats
+    mixed) or string. None and masked values are nulls, as are empty
+    strings in columns that are otherwise numeric (the value of a
+    parameter missing from some conditions); a column of only empty
+    strings is a string column. Columns of other or mixed types are saved
+    as the text of each value, as in the wide text files.
+    """
+    if isinstance(values, np.ndarray) and values.dtype != object and \
+            not np.ma.isMaskedArray(values) and values.ndim == 1:
+        return pa.array(values)
+    values = list(values)
+    present = [value for value in values if not _isMissing(value)]
+    if all(isinstance(value, (bool, np.bool_)) for value in present):
+        arrowType = pa.bool_()
+    elif any(value != '' for value in present) and \
+            all(isinstance(value, numbers.Number) for value in present
+                if not (isinstance(value, basestring) and value == '')):
+        if all(isinstance(value, numbers.Integral) for value in present
+               if not isinstance(value, basestring)):
+            arrowType = pa.int64()
+        else:
+            arrowType = pa.float64()
+        values = [None if isinstance(value, basestring) else value
+                  for value in values]
+    elif all(isinstance(value, basestring) for value in present):
+        arrowType = pa.string()
+    else:
+        arrowType = pa.string()
+        values = [value if _isMissing(value) else str(value)
+                  for value in values]
+    values = [None if _isMissing(value) else value for value in values]
+    if arrowType in (pa.int64(), pa.float64(), pa.bool_()):
+        # (numpy scalars to python numbers)
+        values = [value.item() if hasattr(value, 'item') else value
+                  for value in values]
+    return pa.array(values, type=arrowType)
+
+
+def handlerMetadata(handler, **info):
+    """Returns the metadata saved with a handler's data: the handler's class
+    and name, its `extraInfo`, the `runtimeInfo` of the handler (or of its
+    ExperimentHandler), the PsychoPy version and any other `info`.
+    """
+    runtimeInfo = getattr(handler, 'runtimeInfo', None)
+    if runtimeInfo is None and hasattr(handler, 'getExp') and \
+            handler.getExp() is not None:
+        runtimeInfo = handler.getExp().runtimeInfo
+    metadata = {'handler': type(handler).__name__,
+                'name': getattr(handler, 'name', None),
+                'psychopyVersion': psychopy.__version__,
+                'extraInfo': getattr(handler, 'extraInfo', None),
+                'runtimeInfo': runtimeInfo}
+    metadata.update(info)
+    return metadata
+
+
+def _jsonDefault(value):
+    """Converts values that json can't serialize: numpy arrays and scalars
+    to lists and numbers, anything else to its text"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def _toTable(names, columns, metadata=None):
+    """Returns a pyarrow Table of the named columns, with metadata (a dict)
+    as JSON in the schema. Only the first of columns with the same name is
+    kept."""
+    arrays = []
+    uniqueNames = []
+    for name, values in zip(names, columns):
+        name = u'%s' % name
+        if name not in uniqueNames:
+            uniqueNames.append(name)
+            arrays.append(_columnArray(values))
+    schemaMetadata = None
+    if metadata is not None:
+        schemaMetadata = {METADATA_KEY: json.dumps(
+            metadata, default=_jsonDefault).encode('utf-8')}
+    return pa.Table.from_arrays(arrays, names=uniqueNames,
+                                metadata=schemaMetadata)
+
+
+def saveColumnar(fileName, names, columns, metadata=None,
+                 fileFormat='parquet', compression=None,
+                 fileCollisionMethod='rename'):
+    """Saves columns of data to a Parquet or Arrow file and returns the
+    name of the file.
+
+    :Parameters:
+
+        fileName : the extension of the format ('.parquet' or '.arrow')
+            will be added if not included.
+
+        names, columns : the names of the columns and sequences of their
+            values, all the same length.
+
+        metadata : a dict of information about the data (e.g. extraInfo),
+            saved as JSON in the schema.
+
+        fileFormat : 'parquet' or 'arrow'
+
+        compression : the compression codec. Parquet files default to
+            'snappy'. Arrow files default to no compression, so they can
+            be memory-mapped without copying.
+
+        fileCollisionMethod : Collision method passed to
+            :func:`~psychopy.tools.fileerrortools.handleFileCollision`
+    """
+    _requirePyarrow()
+    if fileFormat not in fileExtensions:
+        raise ValueError("fileFormat should be 'parquet' or 'arrow', not %r"
+                         % fileFormat)
+    if not fileName.endswith(fileExtensions[fileFormat]):
+        fileName += fileExtensions[fileFormat]
+    if os.path.exists(fileName):
+        fileName = handleFileCollision(fileName, fileCollisionMethod)
+
+    table = _toTable(names, columns, metadata)
+    if fileFormat == 'parquet':
+        pq.write_table(table, fileName, compression=compression or 'snappy')
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(fileName, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema,
+                                 options=options) as writer:
+                writer.write_table(table)
+    return fileName
+
+
+def _isParquet(fileName):
+    with open(fileName, 'rb') as f:
+        return f.read(len(_PARQUET_MAGIC)) == _PARQUET_MAGIC
+
+
+def _schemaMetadata(schema):
+    if schema.metadata and METADATA_KEY in schema.metadata:
+        return json.loads(schema.metadata[METADATA_KEY].decode('utf-8'))
+    return {}
+
+
+def readColumnarTable(fileName, columns=None, memoryMap=True):
+    """Loads a Parquet or Arrow file saved by a handler's `saveAsParquet()`
+    or `saveAsArrow()` as a pyarrow Table.
+
+    With `memoryMap=True` the file is memory-mapped rather than read. For
+    uncompressed Arrow files the columns of the table then refer to the
+    mapped file, so only the parts that are used are read from disk.
+    """
+    _requirePyarrow()
+    if _isParquet(fileName):
+        return pq.read_table(fileName, columns=columns,
+                             memory_map=memoryMap)
+    if memoryMap:
+        source = pa.memory_map(fileName)
+    else:
+        source = pa.OSFile(fileName, 'rb')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def readColumnarInfo(fileName):
+    """Returns the metadata saved with a Parquet or Arrow file (a dict
+    with the handler's class and name, `extraInfo`, `runtimeInfo` etc.),
+    reading only the schema.
+    """
+    _requirePyarrow()
+    if _isParquet(fileName):
+        schema = pq.read_schema(fileName)
+    else:
+        with pa.memory_map(fileName) as source:
+            schema = pa.ipc.open_file(source).schema
+    return _schemaMetadata(schema)
+
+
+def readColumnar(fileName, columns=None, memoryMap=True):
+    """Loads a Parquet or Arrow file saved by a handler's `saveAsParquet()`
+    or `saveAsArrow()` as a pandas DataFrame.
+
+    The saved metadata (see :func:`readColumnarInfo`) are in the `attrs`
+    of the DataFrame.
+
+    :Parameters:
+
+        columns : the names of the columns to load, or None for all
+
+        memoryMap : memory-map the file rather than reading it
+    """
+    table = readColumnarTable(fileName, columns=columns,
+                              memoryMap=memoryMap)
+    df = table.to_pandas()
+    df.attrs.update(_schemaMetadata(table.schema))
+    return df
+
+
+def readColumnarGroup(fileNames, columns=None, memoryMap=True,
+                      fileNameColumn='fileName'):
+    """Loads many Parquet or Arrow files (e.g. one per session) into one
+    pandas DataFrame for a group analysis.
+
+    The values of each file's `extraInfo` (e.g. participant) are added as
+    columns to the files that don't already have them as columns, and the
+    name of the file each row came from is added as `fileNameColumn`
+    (unless that is None). Columns missing from some files have missing
+    values in the rows of those files.
+    """
+    import pandas as pd
+    frames = []
+    for fileName in fileNames:
+        table = readColumnarTable(fileName, columns=columns,
+                                  memoryMap=memoryMap)
+        df = table.to_pandas()
+        extraInfo = _schemaMetadata(table.schema).get('extraInfo') or {}
+        if isinstance(extraInfo, dict):
+            for key, value in extraInfo.items():
+                if key not in df.columns and \
+                        (columns is None or key in columns):
+                    df[key] = [value] * len(df)
+        if fileNameColumn is not None:
+            df[fileNameColumn] = fileName
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True, sort=False)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Column-oriented storage of data entries (one entry per trial), used by
+:class:`~psychopy.data.ExperimentHandler` when created with
+`columnar=True`.
+"""
+
+from __future__ import absolute_import, print_function
+
+from builtins import str
+from builtins import object
+from collections import OrderedDict
+import sys
+
+import numpy as np
+
+if sys.version_info.major < 3:
+    _intTypes = (int, long, np.int64)  # noqa: F821
+else:
+    _intTypes = (int, np.int64)
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+# value used for rows that have no value in a column
+_fillValues = {np.dtype(bool): False,
+               np.dtype(np.int64): 0,
+               np.dtype(np.float64): np.nan,
+               np.dtype(object): None}
+
+
+def _dtypeForValue(value):
+    """Returns the numpy dtype of the column that would store value.
+    Only values that convert to and from numpy without changing their text
+    representation get a typed column; everything else is an object.
+    """
+    valueType = type(value)
+    if valueType in (bool, np.bool_):
+        return np.dtype(bool)
+    if valueType in _intTypes:
+        if _INT64_MIN <= value <= _INT64_MAX:
+            return np.dtype(np.int64)
+        return np.dtype(object)
+    if valueType in (float, np.float64):
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+
+class ColumnStore(object):
+    """A growable table of data entries, stored as one numpy array per
+    column rather than as one dict per entry.
+
+    Columns holding only bools, ints or floats use typed arrays, other
+    columns (and columns with mixed types) use object arrays. Columns can
+    be added at any time; entries appended before a column existed have no
+    value in it. Arrays grow geometrically, so appending an entry takes
+    constant amortized time.
+
+    A ColumnStore behaves like the list of entry dicts it replaces:
+    `len()`, indexing, iteration (yielding dicts) and `append(entry)` work
+    as they do for a list.
+    """
+
+    def __init__(self, capacity=64):
+        self._capacity = max(1, int(capacity))
+        self._size = 0
+        self._columns = OrderedDict()  # name: array of values
+        self._present = OrderedDict()  # name: bool array, True if has value
+
+    @property
+    def names(self):
+        """Column names, in the order the columns were added"""
+        return list(self._columns)
+
+    def __len__(self):
+        return self._size
+
+    def _newColumn(self, dtype):
+        column = np.empty(self._capacity, dtype=dtype)
+        column.fill(_fillValues[dtype])
+        return column
+
+    def _grow(self):
+        self._capacity *= 2
+        for name in self._columns:
+            column = self._newColumn(self._columns[name].dtype)
+            column[:self._size] = self._columns[name][:self._size]
+            self._columns[name] = column
+            present = np.zeros(self._capacity, dtype=bool)
+            present[:self._size] = self._present[name][:self._size]
+            self._present[name] = present
+
+    def append(self, entry):
+        """Adds an entry (a dict of column name: value) as a new row.
+        """
+        row = self._size
+        if row == self._capacity:
+            self._grow()
+        for name, value in entry.items():
+            column = self._columns.get(name)
+            dtype = _dtypeForValue(value)
+            if column is None:
+                column = self._columns[name] = self._newColumn(dtype)
+                self._present[name] = np.zeros(self._capacity, dtype=bool)
+            elif column.dtype != dtype and column.dtype != object:
+                # promote to an object column, which keeps existing values
+                # as they were given rather than converting them
+                column = column.astype(object)
+                column[~self._present[name]] = None
+                self._columns[name] = column
+            column[row] = value
+            self._present[name][row] = True
+        self._size += 1
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def getColumn(self, name):
+        """Returns a view of the values in a column. Rows without a value
+        are NaN for float columns, None for object columns, and 0 / False
+        for int / bool columns (see `getPresent()`).
+        """
+        return self._columns[name][:self._size]
+
+    def getPresent(self, name):
+        """Returns a bool array that is True for rows with a value in the
+        named column"""
+        return self._present[name][:self._size]
+
+    def _rowDict(self, row):
+        entry = {}
+        for name, column in self._columns.items():
+            if self._present[name][row]:
+                value = column[row]
+                if column.dtype != object:
+                    value = value.item()
+                entry[name] = value
+        return entry
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._rowDict(row)
+                    for row in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('ColumnStore index out of range')
+        return self._rowDict(index)
+
+    def __iter__(self):
+        # convert each column to a list of python values once, rather than
+        # converting one cell at a time
+        columns = [(name, self.getColumn(name).tolist(),
+                    self.getPresent(name)) for name in self._columns]
+        for row in range(self._size):
+            yield dict((name, values[row])
+                       for name, values, present in columns if present[row])
+
+    def __eq__(self, other):
+        if isinstance(other, (ColumnStore, list)):
+            return len(self) == len(other) and list(self) == list(other)
+        return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def copy(self):
+        """Returns a copy of the store, with arrays trimmed to its length"""
+        new = ColumnStore(self._size)
+        new._size = self._size
+        for name in self._columns:
+            new._columns[name] = self._columns[name][:new._capacity].copy()
+            new._present[name] = self._present[name][:new._capacity].copy()
+        return new
+
+    def __getstate__(self):
+        # only pickle the rows in use
+        state = self.__dict__.copy()
+        state['_capacity'] = max(1, self._size)
+        state['_columns'] = OrderedDict(
+            (name, self._columns[name][:state['_capacity']])
+            for name in self._columns)
+        state['_present'] = OrderedDict(
+            (name, self._present[name][:state['_capacity']])
+            for name in self._present)
+        return state
+
+    def getTextColumn(self, name):
+        """Returns the values of a column as a list of strings, formatted
+        as ExperimentHandler.saveAsWideText() does: '' for rows without a
+        value and values containing a comma or newline in double quotes.
+        """
+        if name not in self._columns:
+            return [u''] * self._size
+        column = self.getColumn(name)
+        present = self.getPresent(name)
+        cells = [str(value) for value in column.tolist()]
+        if column.dtype == object:
+            for row, cell in enumerate(cells):
+                if ',' in cell or '\n' in cell:
+                    cells[row] = u'"%s"' % cell
+        if not present.all():
+            for row in np.flatnonzero(~present):
+                cells[row] = u''
+        return cells
+
+    def iterTextRows(self, names, delim=','):
+        """Yields one line of text per row, with the values of the named
+        columns each followed by delim, in the layout used by
+        ExperimentHandler.saveAsWideText().
+        """
+        if not names:
+            for row in range(self._size):
+                yield u'\n'
+            return
+        columns = [self.getTextColumn(name) for name in names]
+        for cells in zip(*columns):
+            yield delim.join(cells) + delim + u'\n'
+
+    def toDataFrame(self):
+        """Returns the data as a pandas DataFrame, with a column for each
+        column of the store.
+
+        Columns where every row has a value are passed to pandas as array
+        views (with `copy=False`) rather than being rebuilt row by row. Int
+        and bool columns with missing values are converted to float (with
+        NaN) and object columns respectively.
+        """
+        import pandas as pd
+        data = OrderedDict()
+        for name in self._columns:
+            column = self.getColumn(name)
+            present = self.getPresent(name)
+            if column.dtype in (np.dtype(np.int64), np.dtype(bool)) and \
+                    not present.all():
+                if column.dtype == bool:
+                    column = column.astype(object)
+                    column[~present] = None
+                else:
+                    column = column.astype(np.float64)
+                    column[~present] = np.nan
+            data[name] = column
+        return pd.DataFrame(data, columns=list(data), copy=False)
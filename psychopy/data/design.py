@@ -0,0 +1,579 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Constrained and counterbalanced trial orders.
+
+A design can be given as the `method` of a
+:class:`~psychopy.data.TrialHandler` (or TrialHandlerExt, TrialHandler2)
+in place of 'random', 'sequential' or 'fullRandom', and the handler then
+runs the conditions in the order it makes, e.g.::
+
+    from psychopy import data
+    from psychopy.data import design
+
+    conditions = data.createFactorialTrialList(
+        {'side': ['left', 'right'], 'word': ['red', 'green', 'blue']})
+    order = design.ConstrainedRandom(maxRunLength={'side': 3},
+                                     noImmediateRepeats=True)
+    trials = data.TrialHandler(conditions, nReps=10, method=order, seed=1)
+
+- :class:`ConstrainedRandom` shuffles the trials with limits on how many
+  trials in a row can have the same condition, or the same value of some
+  parameters of the conditions.
+- :class:`LatinSquare` runs the conditions in the order of a row of a
+  (balanced) Latin square, for counterbalancing across participants.
+- :class:`CarryoverBalanced` makes a sequence in which each condition
+  follows each other condition equally often.
+- :class:`FixedOrder` runs a given order, e.g. one made in advance by
+  :func:`generateOrders`.
+
+:func:`generateOrders` makes the orders for many participants at once, in
+parallel, and can save them with the seed of each participant in a JSON
+manifest, which :func:`loadOrders` reads.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+from builtins import object, range
+import io
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+import psychopy
+
+# the most random orders tried at once, and the most trials in them
+_MAX_TRIES = 100
+_MAX_BATCH_TRIALS = 2 ** 17
+
+
+def _generator(seed=None):
+    """Returns a numpy random Generator for a seed (None, int or
+    SeedSequence), Generator or RandomState"""
+    if isinstance(seed, np.random.Generator):
+        return seed
+    if isinstance(seed, np.random.RandomState):
+        return np.random.default_rng(seed.randint(2 ** 31))
+    return np.random.default_rng(seed)
+
+
+def _hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def _conditionLabels(trialList, name):
+    """Returns an int array labelling each condition by its value of the
+    parameter `name` (conditions with equal values get the same label)"""
+    labels = []
+    valueLabels = {}
+    for condition in trialList:
+        if condition is None or name not in condition:
+            raise ValueError('%r is not a parameter of all the conditions'
+                             % name)
+        value = _hashable(condition[name])
+        labels.append(valueLabels.setdefault(value, len(valueLabels)))
+    return np.array(labels, dtype=int)
+
+
+def _constraints(nConds, trialList=None, maxRunLength=None,
+                 noImmediateRepeats=False):
+    """Returns the constraints on a sequence of condition indices as a list
+    of (labels, maxRun): no more than maxRun trials in a row may have
+    conditions with the same label.
+    """
+    constraints = []
+    conditionRun = None
+    if isinstance(maxRunLength, dict):
+        if trialList is None:
+            raise ValueError('the conditions are needed for limits on the '
+                             'runs of parameter values')
+        for name, maxRun in maxRunLength.items():
+            constraints.append((_conditionLabels(trialList, name),
+                                int(maxRun)))
+    elif maxRunLength is not None:
+        conditionRun = int(maxRunLength)
+    if noImmediateRepeats:
+        conditionRun = 1
+    if conditionRun is not None:
+        constraints.insert(0, (np.arange(nConds), conditionRun))
+    for labels, maxRun in constraints:
+        if maxRun < 1:
+            raise ValueError('maxRunLength should be at least 1, not %i'
+                             % maxRun)
+    return constraints
+
+
+def _validSequences(sequences, constraints):
+    """Returns a bool array with whether each row of sequences (a 2D array
+    of condition indices) meets all the constraints"""
+    sequences = np.asarray(sequences, dtype=int)
+    valid = np.ones(len(sequences), dtype=bool)
+    for labels, maxRun in constraints:
+        if maxRun >= sequences.shape[1]:
+            continue
+        values = labels[sequences]
+        same = values[:, 1:] == values[:, :-1]
+        # a run longer than maxRun has maxRun repeats in a row
+        nSame = np.zeros((len(sequences), same.shape[1] + 1), dtype=int)
+        np.cumsum(same, axis=1, out=nSame[:, 1:])
+        valid &= ~np.any(nSame[:, maxRun:] - nSame[:, :-maxRun] == maxRun,
+                         axis=1)
+    return valid
+
+
+def checkSequence(sequence, trialList=None, maxRunLength=None,
+                  noImmediateRepeats=False):
+    """Checks whether a sequence of condition indices meets the constraints
+    of :class:`ConstrainedRandom`.
+
+    `sequence` may also be a 2D array with one sequence per row, which are
+    all checked at once, and an array of bools is then returned.
+
+    :Parameters:
+
+        trialList : the conditions (needed if `maxRunLength` is a dict)
+
+        maxRunLength, noImmediateRepeats : as for
+            :class:`ConstrainedRandom`
+    """
+    sequence = np.asarray(sequence, dtype=int)
+    nConds = len(trialList) if trialList is not None else \
+        int(sequence.max()) + 1 if sequence.size else 0
+    constraints = _constraints(nConds, trialList, maxRunLength,
+                               noImmediateRepeats)
+    if sequence.ndim == 1:
+        return bool(_validSequences(sequence[np.newaxis], constraints)[0])
+    return _validSequences(sequence, constraints)
+
+
+def _allowedConditions(counts, constraints, lastLabels, runs):
+    """Returns which conditions can come next, given the number of each
+    still to be placed (in the current block), so that no run gets too long
+    and the rest can still be arranged without too long a run.
+
+    For each constraint, n trials of a label can only be arranged among s
+    trials of other labels if n <= maxRun * (s + 1), less the length of a
+    run of that label that the arrangement continues.
+    """
+    allowed = counts > 0
+    for (labels, maxRun), last, run in zip(constraints, lastLabels, runs):
+        nValues = np.bincount(labels, weights=counts,
+                              minlength=labels.max() + 1)
+        nAfter = nValues.sum() - 1  # to place after this trial
+        othersOK = nValues <= maxRun * (nAfter - nValues + 1)
+        newRun = np.ones(len(nValues))
+        if last >= 0:
+            newRun[last] = run + 1
+        ok = (nValues > 0) & (newRun <= maxRun) & \
+            (nValues - 1 <= maxRun * (nAfter - nValues + 2) - newRun)
+        nBad = np.count_nonzero(~othersOK)
+        # (only the label placed can have too many trials)
+        ok &= (nBad == 0) | ((nBad == 1) & ~othersOK)
+        allowed &= ok[labels]
+    return allowed
+
+
+def _searchSequence(blockCounts, constraints, rng, maxBacktracks):
+    """Builds a sequence trial by trial, choosing each condition at random
+    from those allowed (with the chance of each in proportion to its
+    trials still to place) and going back to try another when no condition
+    is allowed.
+
+    `blockCounts` has the number of each condition in each block (e.g.
+    repeat) of the sequence, in the order of the blocks.
+    """
+    remaining = np.array(blockCounts, dtype=float)
+    blockLengths = remaining.sum(axis=1).astype(int)
+    blockOf = np.repeat(np.arange(len(remaining)), blockLengths)
+    nTrials = len(blockOf)
+    sequence = np.empty(nTrials, dtype=int)
+    choices = [None] * nTrials  # the conditions still to try at each trial
+    states = [None] * nTrials  # the runs before each trial
+    lastLabels = [-1] * len(constraints)
+    runs = [0] * len(constraints)
+    trialN = 0
+    nBacktracks = 0
+    while trialN < nTrials:
+        counts = remaining[blockOf[trialN]]
+        if choices[trialN] is None:
+            choices[trialN] = counts * _allowedConditions(
+                counts, constraints, lastLabels, runs)
+        weights = choices[trialN]
+        total = weights.sum()
+        if total == 0:  # nothing allowed here: change the trial before
+            choices[trialN] = None
+            trialN -= 1
+            nBacktracks += 1
+            if trialN < 0 or nBacktracks > maxBacktracks:
+                raise ValueError('could not find a sequence that meets the '
+                                 'constraints')
+            condN = sequence[trialN]
+            remaining[blockOf[trialN], condN] += 1
+            lastLabels, runs = states[trialN]
+            choices[trialN][condN] = 0
+            continue
+        condN = int(np.searchsorted(np.cumsum(weights),
+                                    rng.random() * total, side='right'))
+        condN = min(condN, len(weights) - 1)
+        sequence[trialN] = condN
+        counts[condN] -= 1
+        states[trialN] = (lastLabels, runs)
+        lastLabels = [labels[condN] for labels, maxRun in constraints]
+        runs = [run + 1 if label == last else 1
+                for label, last, run in zip(lastLabels, states[trialN][0],
+                                            runs)]
+        trialN += 1
+    return sequence
+
+
+def _randomEulerianCircuit(nVertices, loops, root, rng):
+    """Returns the vertices of a random Eulerian circuit of the complete
+    directed graph (with or without loops) from `root`, without the
+    return to root at the end.
+
+    A random spanning tree directed to the root is made with Wilson's
+    algorithm, and then the circuit leaves each vertex by its edges in a
+    random order with the tree edge last (see the BEST theorem), so all
+    circuits are equally likely.
+    """
+    inTree = [False] * nVertices
+    inTree[root] = True
+    treeNext = [-1] * nVertices
+    for start in range(nVertices):
+        vertex = start
+        while not inTree[vertex]:  # a loop-erased random walk to the tree
+            nextVertex = int(rng.integers(nVertices - 1))
+            treeNext[vertex] = nextVertex + (nextVertex >= vertex)
+            vertex = treeNext[vertex]
+        vertex = start
+        while not inTree[vertex]:
+            inTree[vertex] = True
+            vertex = treeNext[vertex]
+    exits = []
+    for vertex in range(nVertices):
+        targets = [target for target in range(nVertices)
+                   if target != treeNext[vertex] and
+                   (loops or target != vertex)]
+        targets = [targets[n] for n in rng.permutation(len(targets))]
+        if vertex != root:
+            targets.append(treeNext[vertex])
+        exits.append(targets[::-1])  # (popped from the end)
+    circuit = []
+    vertex = root
+    while exits[vertex]:
+        circuit.append(vertex)
+        vertex = exits[vertex].pop()
+    return circuit
+
+
+def latinSquare(n, balanced=False):
+    """Returns a Latin square of the numbers 0 to n-1 as an int array, in
+    which each row is the order of the conditions for one participant (or
+    group) and each number comes once in every row and column.
+
+    With `balanced=True` this is a Williams design, in which each number
+    also follows every other number equally often. That needs 2n rows when
+    n is odd (the rows of a square and their reverse).
+    """
+    n = int(n)
+    if not balanced:
+        return (np.arange(n)[:, np.newaxis] + np.arange(n)) % n
+    # first row 0, 1, n-1, 2, n-2, ... and each row after adds 1
+    firstRow = np.empty(n, dtype=int)
+    firstRow[1::2] = np.arange(1, n // 2 + 1)
+    firstRow[2::2] = n - np.arange(1, (n - 1) // 2 + 1)
+    firstRow[:1] = 0
+    square = (firstRow + np.arange(n)[:, np.newaxis]) % n
+    if n % 2:
+        square = np.concatenate([square, square[:, ::-1]])
+    return square
+
+
+class SequenceDesign(object):
+    """Base class for the designs that can be a TrialHandler's `method`.
+
+    Subclasses make the order of the trials in `_createOrder()`.
+    """
+
+    def _createOrder(self, rowIndices, nReps, trialList, rng):
+        """Returns the condition index of each trial in the order they
+        will run (an int array of len(rowIndices) * nReps), where
+        rowIndices are the condition indices that make up one repeat.
+        """
+        raise NotImplementedError
+
+    def createSequenceIndices(self, rowIndices, nReps, trialList=None,
+                              seed=None):
+        """Returns the sequence as a TrialHandler's `sequenceIndices`: an
+        int array of shape (len(rowIndices), nReps), with
+        indices[stimN][repN].
+        """
+        rowIndices = np.asarray(rowIndices, dtype=int).ravel()
+        order = self._createOrder(rowIndices, int(nReps), trialList,
+                                  _generator(seed))
+        order = np.asarray(order, dtype=int)
+        return np.ascontiguousarray(
+            order.reshape(int(nReps), len(rowIndices)).T)
+
+    def createSequence(self, trialList, nReps, seed=None):
+        """Returns the condition index of each trial, in the order they
+        will run, as a list"""
+        order = self._createOrder(np.arange(len(trialList)), int(nReps),
+                                  trialList, _generator(seed))
+        return np.asarray(order, dtype=int).tolist()
+
+    def forParticipant(self, participantN):
+        """Returns the design for the participant with this number (from
+        0), for :func:`generateOrders`"""
+        return self
+
+    def __repr__(self):
+        params = ', '.join('%s=%r' % (name, value)
+                           for name, value in self.__dict__.items()
+                           if not name.startswith('_'))
+        return '%s(%s)' % (type(self).__name__, params)
+
+
+class ConstrainedRandom(SequenceDesign):
+    """Random orders of the trials, with limits on the runs of trials with
+    the same condition or the same value of some parameters.
+
+    A batch of random orders is drawn and checked at once, and the first
+    that meets the constraints is used, so all valid orders are equally
+    likely. When valid orders are too rare for that to find one (e.g. long
+    sequences with no immediate repeats) the order is built trial by trial
+    instead, choosing each condition at random from those that keep the
+    rest of the sequence possible and going back to change a choice if
+    needed. That is fast even when few orders are valid, but doesn't make
+    every valid order exactly equally likely.
+    """
+
+    def __init__(self, maxRunLength=None, noImmediateRepeats=False,
+                 method='fullRandom', maxBacktracks=100000):
+        """
+        :Parameters:
+
+            maxRunLength : int or dict
+                An int is the most trials in a row that can have the same
+                condition. A dict, e.g. {'side': 3}, gives the most trials
+                in a row that can have the same value of those parameters
+                of the conditions.
+
+            noImmediateRepeats : bool
+                No condition runs twice in a row (as maxRunLength=1).
+
+            method : 'fullRandom' or 'random'
+                Shuffle all the trials, or each repeat on its own (so
+                every condition runs once before any runs again). Runs are
+                limited across the repeats too.
+
+            maxBacktracks : int
+                Give up (with a ValueError) after changing this many
+                choices, when building an order trial by trial.
+        """
+        if method not in ('fullRandom', 'random'):
+            raise ValueError("ConstrainedRandom method should be "
+                             "'fullRandom' or 'random', not %r" % method)
+        self.maxRunLength = maxRunLength
+        self.noImmediateRepeats = noImmediateRepeats
+        self.method = method
+        self.maxBacktracks = maxBacktracks
+
+    def _createOrder(self, rowIndices, nReps, trialList, rng):
+        nConds = len(trialList) if trialList is not None else \
+            int(rowIndices.max()) + 1 if len(rowIndices) else 0
+        constraints = _constraints(nConds, trialList, self.maxRunLength,
+                                   self.noImmediateRepeats)
+        if self.method == 'random':
+            blocks = np.tile(rowIndices, (nReps, 1))
+        else:
+            blocks = np.repeat(rowIndices, nReps)[np.newaxis]
+        nTrials = blocks.size
+        if not constraints or nTrials == 0:
+            keys = rng.random(blocks.shape)
+            order = np.take_along_axis(blocks, np.argsort(keys, axis=-1), -1)
+            return order.ravel()
+
+        # try a batch of random orders, all checked at once
+        nTries = max(1, min(_MAX_TRIES, _MAX_BATCH_TRIALS // nTrials))
+        keys = rng.random((nTries,) + blocks.shape)
+        orders = np.take_along_axis(blocks[np.newaxis],
+                                    np.argsort(keys, axis=-1), -1)
+        orders = orders.reshape(nTries, nTrials)
+        valid = np.flatnonzero(_validSequences(orders, constraints))
+        if len(valid):
+            return orders[valid[0]]
+
+        blockCounts = [np.bincount(block, minlength=nConds)
+                       for block in blocks]
+        return _searchSequence(blockCounts, constraints, rng,
+                               self.maxBacktracks)
+
+
+class LatinSquare(SequenceDesign):
+    """Runs the conditions in the order of a row of a Latin square (see
+    :func:`latinSquare`), for counterbalancing the order across
+    participants: participant n (from 0) gets row n, wrapping around
+    after the last row. Each repeat uses the next row.
+    """
+
+    def __init__(self, row=0, balanced=True):
+        """
+        :Parameters:
+
+            row : int
+                The row of the square for the first repeat.
+
+            balanced : bool
+                Use a Williams design, in which each condition follows
+                every other equally often over the rows.
+        """
+        self.row = int(row)
+        self.balanced = balanced
+
+    def _createOrder(self, rowIndices, nReps, trialList, rng):
+        square = latinSquare(len(rowIndices), balanced=self.balanced)
+        rows = (self.row + np.arange(nReps)) % max(len(square), 1)
+        return rowIndices[square[rows]].ravel()
+
+    def forParticipant(self, participantN):
+        return LatinSquare(row=self.row + participantN,
+                           balanced=self.balanced)
+
+
+class CarryoverBalanced(SequenceDesign):
+    """A random sequence in which each condition follows each other
+    condition (and itself, unless `noImmediateRepeats`) equally often,
+    for first-order carry-over balance within a session.
+
+    The sequence is a random Eulerian circuit of the complete directed
+    graph of the conditions, which has each ordered pair once, so `nReps`
+    must be a multiple of the number of conditions (or of one less, with
+    `noImmediateRepeats`). A longer sequence goes round more circuits from
+    the same condition. Only the pair of the last trial and the first
+    trial is missing.
+    """
+
+    def __init__(self, noImmediateRepeats=False):
+        self.noImmediateRepeats = noImmediateRepeats
+
+    def _createOrder(self, rowIndices, nReps, trialList, rng):
+        nConds = len(rowIndices)
+        loops = not self.noImmediateRepeats
+        repsPerCircuit = nConds if loops else nConds - 1
+        if nConds < 2 or nReps % repsPerCircuit:
+            raise ValueError('CarryoverBalanced needs at least 2 conditions '
+                             'and nReps a multiple of %i (not %i)'
+                             % (repsPerCircuit, nReps))
+        root = int(rng.integers(nConds))
+        circuits = [_randomEulerianCircuit(nConds, loops, root, rng)
+                    for circuitN in range(nReps // repsPerCircuit)]
+        return rowIndices[np.concatenate(circuits).astype(int)]
+
+
+class FixedOrder(SequenceDesign):
+    """Runs the trials in a given order (the condition index of each trial)
+    e.g. for a participant's order from :func:`loadOrders`. The order must
+    have len(trialList) * nReps trials.
+    """
+
+    def __init__(self, sequence):
+        self.sequence = [int(condN) for condN in sequence]
+
+    def _createOrder(self, rowIndices, nReps, trialList, rng):
+        if len(self.sequence) != len(rowIndices) * nReps:
+            raise ValueError('FixedOrder has %i trials, not %i'
+                             % (len(self.sequence), len(rowIndices) * nReps))
+        return np.array(self.sequence, dtype=int)
+
+
+def _participantOrder(args):
+    """Returns one participant's order (for generateOrders)"""
+    design, trialList, nReps, seed = args
+    return design.createSequence(trialList, nReps, seed=seed)
+
+
+def generateOrders(design, trialList, nReps, participants, seed=None,
+                   processes=1, manifestFile=None):
+    """Makes the trial orders of many participants at once.
+
+    Each participant gets their own seed, spawned from `seed` with numpy's
+    SeedSequence, so the orders are the same whatever the number of
+    processes. The orders are made in parallel by `processes` processes.
+
+    :Parameters:
+
+        design : a :class:`SequenceDesign` (e.g. ConstrainedRandom)
+
+        trialList : the conditions
+
+        nReps : int
+
+        participants : the number of participants, or a list of their ids
+
+        seed : None, int or numpy.random.SeedSequence
+
+        processes : int
+
+        manifestFile : None or a file name
+            Save the orders in this JSON file, with the seed (entropy) and
+            each participant's spawn key, so that
+            `numpy.random.SeedSequence(entropy, spawn_key=spawnKey)` gives
+            a participant's seed again.
+
+    :Returns:
+
+        an OrderedDict of {participant: order}, where each order is a list
+        of the condition index of each trial (see :class:`FixedOrder`)
+    """
+    if isinstance(participants, int):
+        participants = list(range(participants))
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(participants))
+    tasks = [(design.forParticipant(participantN), trialList, nReps,
+              participantSeed)
+             for participantN, participantSeed in enumerate(seeds)]
+    processes = max(1, min(int(processes), len(tasks)))
+    if processes == 1:
+        sequences = [_participantOrder(task) for task in tasks]
+    else:
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        try:
+            sequences = pool.map(_participantOrder, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    orders = OrderedDict(zip(participants, sequences))
+
+    if manifestFile is not None:
+        manifest = OrderedDict([
+            ('psychopyVersion', psychopy.__version__),
+            ('design', repr(design)),
+            ('nConditions', len(trialList)),
+            ('nReps', int(nReps)),
+            ('entropy', seed.entropy),
+            ('participants', [
+                OrderedDict([('participant', participant),
+                             ('spawnKey', list(participantSeed.spawn_key)),
+                             ('sequence', sequence)])
+                for participant, participantSeed, sequence
+                in zip(participants, seeds, sequences)])])
+        with io.open(manifestFile, 'w', encoding='utf-8') as f:
+            f.write(u'%s' % json.dumps(manifest, indent=1))
+    return orders
+
+
+def loadOrders(manifestFile):
+    """Returns the orders saved by :func:`generateOrders` as an OrderedDict
+    of {participant: order}"""
+    with io.open(manifestFile, encoding='utf-8') as f:
+        manifest = json.load(f, object_pairs_hook=OrderedDict)
+    return OrderedDict((entry['participant'], entry['sequence'])
+                       for entry in manifest['participants'])
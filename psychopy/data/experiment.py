@@ -16,6 +16,8 @@ from psychopy.tools.filetools import (openOutputFile, genDelimiter,
                                       genFilenameFromDelimiter)
 from .utils import checkValidFilePath
 from .base import _ComparisonMixin
+from .columnstore import ColumnStore
+from .streaming import EntryStreamWriter, finalizeEntryStream
 
 
 class ExperimentHandler(_ComparisonMixin):
@@ -40,7 +42,10 @@ class ExperimentHandler(_ComparisonMixin):
                  saveWideText=True,
                  dataFileName='',
                  autoLog=True,
-                 appendFiles=False):
+                 appendFiles=False,
+                 columnar=False,
+                 streamEntries=False,
+                 fsyncInterval=1.0):
         """
         :parameters:
 
@@ -75,6 +80,27 @@ class ExperimentHandler(_ComparisonMixin):
             saveWideText : True (default) or False
 
             autoLog : True (default) or False
+
+            columnar : True or False (default)
+                If True, entries are stored in a
+                :class:`~psychopy.data.columnstore.ColumnStore`, with one
+                numpy array per data column, rather than as a list of
+                dicts. This uses much less memory and makes saving faster
+                for experiments with many thousands of entries.
+
+            streamEntries : True or False (default)
+                If True (and a dataFileName is given), each entry is
+                appended to a stream file (dataFileName + '_entries.jsonl')
+                when nextEntry() is called, so data are on disk as the
+                experiment runs. On close() the wide text file is created
+                from the stream (see :meth:`finalizeStream`). After a crash
+                the stream can be converted with
+                :func:`psychopy.data.streaming.finalizeEntryStream`.
+
+            fsyncInterval : float (default 1.0) or None
+                Seconds between forcing streamed entries to be written to
+                the disk, see
+                :class:`~psychopy.data.streaming.EntryStreamWriter`.
         """
         self.loops = []
         self.loopsUnfinished = []
@@ -90,11 +116,18 @@ class ExperimentHandler(_ComparisonMixin):
         self.saveWideText = saveWideText
         self.dataFileName = dataFileName
         self.thisEntry = {}
-        self.entries = []  # chronological list of entries
+        self.columnar = columnar
+        if columnar:
+            self.entries = ColumnStore()  # chronological table of entries
+        else:
+            self.entries = []  # chronological list of entries
         self._paramNamesSoFar = []
         self.dataNames = []  # names of all the data (eg. resp.keys)
         self.autoLog = autoLog
         self.appendFiles = appendFiles
+        self.streamEntries = streamEntries
+        self.fsyncInterval = fsyncInterval
+        self._streamWriter = None
 
         if dataFileName in ['', None]:
             logging.warning('ExperimentHandler created with no dataFileName'
@@ -234,8 +267,20 @@ class ExperimentHandler(_ComparisonMixin):
         if type(self.extraInfo) == dict:
             this.update(self.extraInfo)
         self.entries.append(this)
+        if self.streamEntries:
+            self._streamEntry(this)
         self.thisEntry = {}
 
+    def _streamEntry(self, entry):
+        """Appends an entry to the stream file, opening it if needed"""
+        if self._streamWriter is None:
+            if self.dataFileName in ['', None]:
+                return
+            self._streamWriter = EntryStreamWriter(
+                self.dataFileName + '_entries.jsonl',
+                fsyncInterval=self.fsyncInterval)
+        self._streamWriter.addEntry(entry)
+
     def getAllEntries(self):
         """Fetches a copy of all the entries including a final (orphan) entry
         if that exists. This allows entries to be saved even if nextEntry() is
@@ -244,11 +289,27 @@ class ExperimentHandler(_ComparisonMixin):
         :return: copy (not pointer) to entries
         """
         # check for orphan final data (not committed as a complete entry)
-        entries = copy.copy(self.entries)
+        entries = list(self.entries)
         if self.thisEntry:  # thisEntry is not empty
             entries.append(self.thisEntry)
         return entries
 
+    def toDataFrame(self):
+        """Returns all the entries (including a final orphan entry, if any)
+        as a pandas DataFrame with one column per data name.
+
+        If the handler was created with `columnar=True`, the columns are
+        built directly from the stored column arrays.
+        """
+        if isinstance(self.entries, ColumnStore):
+            entries = self.entries
+            if self.thisEntry:
+                entries = entries.copy()
+                entries.append(self.thisEntry)
+            return entries.toDataFrame()
+        import pandas as pd
+        return pd.DataFrame(self.getAllEntries())
+
     def saveAsWideText(self,
                        fileName,
                        delim='auto',
@@ -335,7 +396,14 @@ class ExperimentHandler(_ComparisonMixin):
             f.write('\n')
 
         # write the data for each entry
-        for entry in self.getAllEntries():
+        if isinstance(self.entries, ColumnStore):
+            # write the data a column at a time, then the orphan entry
+            for line in self.entries.iterTextRows(names, delim):
+                f.write(line)
+            entries = [self.thisEntry] if self.thisEntry else []
+        else:
+            entries = self.getAllEntries()
+        for entry in entries:
             for name in names:
                 if name in entry:
                     ename = str(entry[name])
@@ -351,6 +419,124 @@ class ExperimentHandler(_ComparisonMixin):
             f.close()
         logging.info('saved data to %r' % f.name)
 
+    def saveAsParquet(self, fileName, compression='snappy',
+                      fileCollisionMethod='rename'):
+        """Saves the entries as typed columns in an Apache Parquet file,
+        with the same columns as :meth:`saveAsWideText`. The name,
+        version, `extraInfo` and `runtimeInfo` of the experiment are saved
+        in the metadata of the file. Requires pyarrow.
+
+        Load the file with :func:`~psychopy.data.readColumnar` (or
+        :func:`~psychopy.data.readColumnarGroup` for many files) or any
+        other software that reads Parquet. Returns the name of the file
+        saved.
+
+        :Parameters:
+
+            fileName:
+                the extension `.parquet` will be added if not given
+                already. Can include path info.
+
+            compression:
+                the codec used to compress the columns, e.g. 'snappy',
+                'zstd', 'gzip' or 'none'
+
+            fileCollisionMethod:
+                Collision method passed to
+                :func:`~psychopy.tools.fileerrortools.handleFileCollision`
+        """
+        return self._saveColumnar(fileName, 'parquet', compression,
+                                  fileCollisionMethod)
+
+    def saveAsArrow(self, fileName, fileCollisionMethod='rename'):
+        """Saves the entries as typed columns in an uncompressed Apache
+        Arrow IPC (Feather v2) file, which can be memory-mapped when
+        loaded. Otherwise as :meth:`saveAsParquet`. Requires pyarrow.
+        """
+        return self._saveColumnar(fileName, 'arrow', None,
+                                  fileCollisionMethod)
+
+    def _saveColumnar(self, fileName, fileFormat, compression,
+                      fileCollisionMethod):
+        from .columnar import saveColumnar, handlerMetadata
+        names, columns, info = self._getColumnarData()
+        if len(names) < 1:
+            logging.error("No data was found, so data file may not look as expected.")
+        fileName = saveColumnar(
+            fileName, names, columns,
+            metadata=handlerMetadata(self, **info),
+            fileFormat=fileFormat, compression=compression,
+            fileCollisionMethod=fileCollisionMethod)
+        logging.info('saved data to %r' % fileName)
+        return fileName
+
+    def _getColumnarData(self):
+        """Returns (names, columns, info): the names of the columns of
+        saveAsWideText, sequences of their values (one per entry) and a dict
+        of information about the data to save as metadata along with
+        `extraInfo`.
+        """
+        names = self._getAllParamNames()
+        names.extend(self.dataNames)
+        # names from the extraInfo dictionary
+        names.extend(self._getExtraInfo()[0])
+        df = self.toDataFrame()
+        columns = []
+        for name in names:
+            if name in df:
+                columns.append(df[name].values)
+            else:
+                columns.append([None] * len(df))
+        return names, columns, {'version': self.version}
+
+    def finalizeStream(self,
+                       fileName,
+                       delim='auto',
+                       matrixOnly=False,
+                       appendFile=None,
+                       encoding='utf-8-sig',
+                       fileCollisionMethod='rename'):
+        """Creates a wide text file, in the same layout as
+        :meth:`saveAsWideText`, from the entries streamed to disk when
+        the handler was created with `streamEntries=True`. Any orphan entry
+        is streamed first. This ends streaming and deletes the stream
+        files. Called by close().
+
+        :Parameters: as for :meth:`saveAsWideText`
+        """
+        writer = self._streamWriter
+        if writer is None:
+            logging.warning('ExperimentHandler.finalizeStream called but no '
+                            'entries have been streamed. Nothing saved')
+            return
+        if self.thisEntry:
+            writer.addEntry(self.thisEntry)
+        writer.close()
+
+        delimOptions = {
+                'comma': ",",
+                'semicolon': ";",
+                'tab': "\t"
+            }
+        if delim == 'auto':
+            delim = genDelimiter(fileName)
+        elif delim in delimOptions:
+            delim = delimOptions[delim]
+        if appendFile is None:
+            appendFile = self.appendFiles
+
+        names = self._getAllParamNames()
+        names.extend(self.dataNames)
+        names.extend(self._getExtraInfo()[0])
+        finalizeEntryStream(writer.fileName,
+                            genFilenameFromDelimiter(fileName, delim),
+                            names=names, delim=delim, matrixOnly=matrixOnly,
+                            appendFile=appendFile, encoding=encoding,
+                            fileCollisionMethod=fileCollisionMethod)
+        writer.remove()
+        self._streamWriter = None
+        self.streamEntries = False
+
     def saveAsPickle(self, fileName, fileCollisionMethod='rename'):
         """Basically just saves a copy of self (with data) to a pickle file.
 
@@ -379,7 +565,12 @@ class ExperimentHandler(_ComparisonMixin):
         self.saveWideText = False
 
         origEntries = self.entries
-        self.entries = self.getAllEntries()
+        if isinstance(self.entries, ColumnStore):
+            self.entries = self.entries.copy()
+            if self.thisEntry:
+                self.entries.append(self.thisEntry)
+        else:
+            self.entries = self.getAllEntries()
 
         # otherwise use default location
         if not fileName.endswith('.psydat'):
@@ -404,7 +595,10 @@ class ExperimentHandler(_ComparisonMixin):
             if self.savePickle:
                 self.saveAsPickle(self.dataFileName)
             if self.saveWideText:
-                self.saveAsWideText(self.dataFileName + '.csv')
+                if getattr(self, '_streamWriter', None) is not None:
+                    self.finalizeStream(self.dataFileName + '.csv')
+                else:
+                    self.saveAsWideText(self.dataFileName + '.csv')
         self.abort()
         self.autoLog = False
 
@@ -419,3 +613,8 @@ class ExperimentHandler(_ComparisonMixin):
         """
         self.savePickle = False
         self.saveWideText = False
+        self.streamEntries = False
+        # handlers loaded from older psydat files have no _streamWriter
+        if getattr(self, '_streamWriter', None) is not None:
+            # entries streamed so far are kept on disk
+            self._streamWriter.close()
@@ -4,6 +4,7 @@
 from __future__ import absolute_import, division, print_function
 
 from builtins import object
+from builtins import range
 import numpy as np
 # from scipy import optimize  # DON'T. It's slow and crashes on some machines
 
@@ -91,6 +92,159 @@ class _baseFunctionFit(object):
         xx = self._inverse(yy, *params)
         return xx
 
+    @classmethod
+    def fitBatch(cls, xx, yy, sems=1.0, guess=None, expectedMin=0.5,
+                 processes=1, maxIter=200, tolerance=1e-12):
+        """Fits the function to many datasets at once.
+
+        Functions with a `_jacobian` (FitWeibull, FitLogistic and
+        FitCumNormal) are fitted to all the datasets together, by
+        Levenberg-Marquardt iterations with one batch of array operations
+        per iteration. Others are fitted one dataset at a time with
+        `scipy.optimize.curve_fit`. Either way the datasets can be split
+        between `processes` processes.
+
+        :Parameters:
+
+            xx : the x values, shared by all the datasets or as
+                [dataset, point]
+
+            yy : [dataset, point] array of y values
+
+            sems : the standard errors of yy, or 1.0 for an unweighted fit.
+                As for the fit classes, these are used as the `sigma` of
+                curve_fit.
+
+            guess : starting parameters for all the datasets, or as
+                [dataset, parameter]. These are required; for bootstrap
+                resamples the fit to the original data is a good start.
+
+        :Returns:
+
+            (params, converged): a [dataset, parameter] array, and a bool
+            array that is False for fits that did not converge (with NaN
+            params if they failed altogether).
+        """
+        yy = np.atleast_2d(np.asarray(yy, dtype=float))
+        nSets = len(yy)
+        xx = np.broadcast_to(np.asarray(xx, dtype=float), yy.shape)
+        sems = np.broadcast_to(np.asarray(sems, dtype=float), yy.shape)
+        if guess is None:
+            raise ValueError('%s.fitBatch needs a guess' % cls.__name__)
+        guess = np.asarray(guess, dtype=float)
+        guess = np.array(np.broadcast_to(guess, (nSets, guess.shape[-1])))
+        args = (cls, xx, yy, sems, guess, expectedMin, maxIter, tolerance)
+        processes = max(1, min(int(processes), nSets))
+        if processes == 1:
+            return _fitShard(args)
+
+        from multiprocessing import Pool
+        shards = np.array_split(np.arange(nSets), processes)
+        shardArgs = [(cls, xx[rows], yy[rows], sems[rows], guess[rows],
+                      expectedMin, maxIter, tolerance) for rows in shards]
+        pool = Pool(processes)
+        try:
+            results = pool.map(_fitShard, shardArgs)
+        finally:
+            pool.close()
+            pool.join()
+        return (np.concatenate([params for params, _ in results]),
+                np.concatenate([converged for _, converged in results]))
+
+
+def _fitShard(args):
+    """Fits a batch of datasets, for fitBatch() (or a process it starts)
+    """
+    cls, xx, yy, sems, guess, expectedMin, maxIter, tolerance = args
+    global _chance
+    _chance = expectedMin
+    if hasattr(cls, '_jacobian'):
+        return _levenbergMarquardt(cls, xx, yy, 1.0 / sems**2, guess,
+                                   maxIter, tolerance)
+    from scipy import optimize
+    params = np.full(guess.shape, np.nan)
+    converged = np.zeros(len(yy), dtype=bool)
+    sigma = None if np.all(sems == sems.flat[0]) else sems
+    for setN in range(len(yy)):
+        try:
+            params[setN] = optimize.curve_fit(
+                cls._eval, xx[setN], yy[setN], p0=guess[setN],
+                sigma=None if sigma is None else sigma[setN],
+                maxfev=maxIter * 100)[0]
+            converged[setN] = True
+        except (RuntimeError, ValueError):
+            pass
+    return params, converged
+
+
+def _levenbergMarquardt(cls, xx, yy, weights, guess, maxIter, tolerance):
+    """Minimizes sum(weights * (cls._eval(xx, *params) - yy)**2) for each
+    row, updating the rows that have not converged together"""
+    nSets, nParams = guess.shape
+    params = guess.copy()
+    damping = np.full(nSets, 1e-3)
+    converged = np.zeros(nSets, dtype=bool)
+    running = np.arange(nSets)
+
+    def cost(rows, theseParams):
+        with np.errstate(all='ignore'):
+            resid = cls._eval(xx[rows], *theseParams.T[:, :, np.newaxis]) - \
+                yy[rows]
+            return np.sum(weights[rows] * resid**2, axis=1), resid
+
+    costs, resid = cost(running, params)
+    for iterN in range(maxIter):
+        if not len(running):
+            break
+        theseParams = params[running]
+        with np.errstate(all='ignore'):
+            jac = np.stack(cls._jacobian(
+                xx[running], *theseParams.T[:, :, np.newaxis]), axis=2)
+        jacW = jac * weights[running][:, :, np.newaxis]
+        hessian = np.einsum('kni,knj->kij', jacW, jac)
+        gradient = np.einsum('kni,kn->ki', jacW, resid)
+        diagonal = np.maximum(np.diagonal(hessian, axis1=1, axis2=2), 1e-12)
+        damped = hessian + (damping[running][:, np.newaxis] *
+                            diagonal)[:, :, np.newaxis] * np.eye(nParams)
+        # (fits with a non-finite jacobian can't go on)
+        bad = ~np.isfinite(damped).all(axis=(1, 2))
+        damped[bad] = np.eye(nParams)
+        gradient[bad] = 0
+        try:
+            step = -np.linalg.solve(damped, gradient[:, :, np.newaxis])
+        except np.linalg.LinAlgError:
+            # (only when some fits are degenerate, e.g. all yy equal)
+            step = -np.matmul(np.linalg.pinv(damped),
+                              gradient[:, :, np.newaxis])
+        step = step[:, :, 0]
+        newCosts, newResid = cost(running, theseParams + step)
+        better = np.isfinite(newCosts) & (newCosts <= costs[running])
+
+        improved = running[better]
+        params[improved] += step[better]
+        small = (np.abs(step[better]) <= tolerance *
+                 (np.abs(params[improved]) + tolerance)).all(axis=1)
+        small |= (costs[improved] - newCosts[better] <=
+                  tolerance * costs[improved])
+        costs[improved] = newCosts[better]
+        resid[better] = newResid[better]
+        damping[improved] /= 10
+        damping[running[~better]] *= 10
+        # fits stop when they stop improving, or can't improve with even a
+        # tiny step (at a minimum)
+        done = np.zeros(len(running), dtype=bool)
+        done[better] = small
+        done |= damping[running] > 1e10
+        converged[running[done]] = True
+        converged[running[bad]] = False
+        done |= bad
+        running = running[~done]
+        resid = resid[~done]
+
+    params[~np.isfinite(costs)] = np.nan
+    converged &= np.isfinite(params).all(axis=1)
+    return params, converged
+
 
 class FitWeibull(_baseFunctionFit):
     """Fit a Weibull function (either 2AFC or YN)
@@ -123,6 +277,16 @@ class FitWeibull(_baseFunctionFit):
         xx = alpha * (-np.log((1.0 - yy)/(1 - _chance))) ** (1.0/beta)
         return xx
 
+    @staticmethod
+    def _jacobian(xx, alpha, beta):
+        global _chance
+        xx = np.asarray(xx)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            uu = (xx/alpha)**beta
+            logRatio = np.where(uu > 0, np.log(xx/alpha), 0)
+        dyduu = (1.0 - _chance) * np.exp(-uu)
+        return [-dyduu * uu * beta / alpha, dyduu * uu * logRatio]
+
 
 class FitNakaRushton(_baseFunctionFit):
     """Fit a Naka-Rushton function
@@ -195,6 +359,14 @@ class FitLogistic(_baseFunctionFit):
         xx = PSE - np.log((1 - _chance) / (yy - _chance) - 1) / JND
         return xx
 
+    @staticmethod
+    def _jacobian(xx, PSE, JND):
+        global _chance
+        xx = np.asarray(xx)
+        ss = 1 / (1 + np.exp((PSE - xx) * JND))
+        dydzz = -(1 - _chance) * ss * (1 - ss)
+        return [dydzz * JND, dydzz * (PSE - xx)]
+
 
 class FitCumNormal(_baseFunctionFit):
     """Fit a Cumulative Normal function (aka error function or erf)
@@ -242,6 +414,120 @@ class FitCumNormal(_baseFunctionFit):
               special.erfinv(((yy - _chance) / (1 - _chance) - 0.5) * 2))
         return xx
 
+    @staticmethod
+    def _jacobian(xx, xShift, sd):
+        global _chance
+        xx = np.asarray(xx)
+        zz = (xx - xShift) / sd
+        dydxShift = -(1 - _chance) * np.exp(-0.5 * zz**2) / (
+            np.sqrt(2 * np.pi) * sd)
+        return [dydxShift, dydxShift * zz]
+
+
+class BootstrapFit(object):
+    """The results of :func:`bootstrapFit`.
+
+    :Attributes:
+
+        fit : the fit (e.g. a FitWeibull) to the original data
+
+        params : [resample, parameter] array of the parameters fitted to
+            each resample (NaN where the fit failed)
+
+        converged : bool array, False for resamples whose fit did not
+            converge. These are left out of the confidence intervals.
+
+        levels, nTrials, nCorrect : the intensities and the numbers of
+            trials and correct responses at each, in the original data
+    """
+
+    def __init__(self, fit, params, converged, levels, nTrials, nCorrect):
+        self.fit = fit
+        self.params = params
+        self.converged = converged
+        self.levels = levels
+        self.nTrials = nTrials
+        self.nCorrect = nCorrect
+
+    def _percentiles(self, values, ci):
+        values = values[self.converged]
+        return np.nanpercentile(values, [50 - ci / 2.0, 50 + ci / 2.0],
+                                axis=0)
+
+    def paramCI(self, ci=95):
+        """Returns the [lower, upper] percentiles of each parameter over the
+        resamples, as a [2, parameter] array"""
+        return self._percentiles(self.params, ci)
+
+    def inverse(self, yy):
+        """Returns the x value giving yy for each resample's parameters"""
+        global _chance
+        _chance = self.fit.expectedMin
+        with np.errstate(all='ignore'):
+            return self.fit._inverse(yy, *self.params.T)
+
+    def thresholdCI(self, yy=0.75, ci=95):
+        """Returns the [lower, upper] percentiles of the x value giving yy
+        (e.g. a threshold) over the resamples"""
+        return self._percentiles(self.inverse(yy), ci)
+
+
+def bootstrapFit(fitClass, intensities, responses, nResamples=10000,
+                 expectedMin=0.5, guess=None, seed=None, processes=1,
+                 maxIter=200):
+    """Fits a psychometric function to trial data and to bootstrap
+    resamples of it, for confidence intervals of its parameters and
+    thresholds.
+
+    The trials at each intensity are resampled (with replacement) on
+    their own, so each resample has the same number of trials at each
+    intensity as the data. The fits to the resamples start from the fit
+    to the data and are done together by
+    :meth:`~psychopy.data.FitWeibull.fitBatch`.
+
+    usage::
+
+        boot = data.bootstrapFit(data.FitWeibull, intensities, responses)
+        print(boot.fit.params, boot.paramCI(95), boot.thresholdCI(0.75))
+
+    :Parameters:
+
+        fitClass : FitWeibull, FitLogistic, FitCumNormal (or another fit
+            class, which is then fitted with curve_fit one resample at a
+            time)
+
+        intensities, responses : the intensity and response (0 or 1) of
+            each trial, e.g. from a staircase
+
+        seed : seed for the resamples (passed to numpy.random.default_rng)
+
+        processes : number of processes to split the resamples between
+
+    :Returns:
+
+        a :class:`BootstrapFit`
+    """
+    intensities = np.asarray(intensities, dtype=float).ravel()
+    responses = np.asarray(responses, dtype=float).ravel()
+    if len(intensities) != len(responses):
+        raise ValueError('bootstrapFit needs one response per intensity')
+    levels, levelIndices, nTrials = np.unique(
+        intensities, return_inverse=True, return_counts=True)
+    nCorrect = np.bincount(levelIndices, weights=responses,
+                           minlength=len(levels))
+    sems = 1.0 / np.sqrt(nTrials)  # weights each level by its trials
+    fit = fitClass(levels, nCorrect / nTrials, sems=sems, guess=guess,
+                   expectedMin=expectedMin)
+
+    rng = np.random.default_rng(seed)
+    resampled = rng.binomial(nTrials, nCorrect / nTrials,
+                             size=(nResamples, len(levels)))
+    params, converged = fitClass.fitBatch(
+        levels, resampled / nTrials, sems=sems, guess=fit.params,
+        expectedMin=expectedMin, processes=processes, maxIter=maxIter)
+    return BootstrapFit(fit, params, converged, levels, nTrials, nCorrect)
+
+
 class FitFunction(object):
     """Deprecated: - use the specific functions; FitWeibull, FitLogistic...
     """
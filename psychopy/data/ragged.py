@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Storage of per-trial vectors (e.g. eye traces, mouse paths or lists of
+RTs) for :class:`~psychopy.data.DataHandler`, as typed arrays of values
+with the offset and length of each trial's values.
+"""
+
+from __future__ import absolute_import, print_function
+
+from builtins import object
+import os
+import tempfile
+
+import numpy as np
+
+# dtype of the values of lists, by the type of their items
+_listDtypes = {bool: np.dtype(bool), int: np.dtype(np.int64),
+               float: np.dtype(np.float64)}
+# value of cells that have no data, as in DataHandler object arrays
+_MISSING = '--'
+_MIN_CHUNK = 4096
+# ndarray methods that change the array in place, which would only change a
+# copy of the values of a RaggedArray
+_IN_PLACE = ('fill', 'sort', 'partition', 'put', 'itemset', 'resize',
+             'setfield', 'setflags', 'byteswap')
+
+
+def _valueArray(value):
+    """Returns (array, container) for a value that a RaggedArray can store
+    exactly (a numeric numpy array with at least one dimension, or a list or
+    tuple of bools, ints or floats all of the same type), else None.
+    """
+    if type(value) is np.ndarray:
+        if value.ndim < 1 or value.dtype.kind not in 'biuf':
+            return None
+        return value, np.ndarray
+    if type(value) in (list, tuple):
+        itemTypes = set(type(item) for item in value)
+        if len(itemTypes) > 1 or not itemTypes.issubset(_listDtypes):
+            return None
+        if itemTypes:
+            try:
+                array = np.array(value, dtype=_listDtypes[itemTypes.pop()])
+            except OverflowError:  # (ints too big for int64)
+                return None
+        else:
+            array = np.empty(0)
+        return array, type(value)
+    return None
+
+
+class RaggedArray(object):
+    """An array of vectors of different lengths (one per trial), in the
+    shape of the other arrays of a DataHandler (conditions x repeats).
+
+    The values of all the vectors are stored in typed arrays, in chunks
+    that are added as they fill (so growing never copies the values
+    already stored), with the chunk, offset and length of each cell's
+    values. This takes far less memory than an object array holding one
+    array or list per trial, and with `memmapDir` the chunks are kept in
+    memory-mapped temporary files in that folder rather than in memory.
+    `values` and `offsets` give all the values as one array and the
+    offset of each cell in it.
+
+    All the vectors have the dtype (and the shape after their first
+    dimension) of the first one, and the same container type (numpy
+    array, list or tuple), so each is returned exactly as it was added.
+    Indexing a single cell returns its vector (a view of the stored values
+    for numpy arrays) or '--' if it has no data. Any other indexing, or
+    converting to a numpy array, gives an object array of the selected
+    cells, as the DataHandler would have stored them. Other attributes and
+    methods of numpy arrays (e.g. `.T`, `.ravel()`, `.reshape()`,
+    `.copy()`) are those of that object array, apart from methods that
+    change the array in place; the values can only be changed by setting
+    cells.
+    """
+
+    def __init__(self, shape, memmapDir=None):
+        self.shape = tuple(shape)
+        self.memmapDir = memmapDir
+        self.lengths = np.full(self.shape, -1, dtype=np.int64)  # -1: no data
+        self.valueDtype = None
+        self.cellShape = None  # the shape of each value after the first dim
+        self.container = None
+        self._chunks = []
+        self._chunkUsed = []  # the number of values used in each chunk
+        self._cellChunks = np.zeros(self.shape, dtype=np.int64)
+        self._cellOffsets = np.zeros(self.shape, dtype=np.int64)
+
+    dtype = np.dtype(object)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nValues(self):
+        return int(sum(self._chunkUsed))
+
+    @property
+    def values(self):
+        """All the values stored, in the order they were added (values of
+        cells that were set more than once included)"""
+        used = [chunk[:nUsed]
+                for chunk, nUsed in zip(self._chunks, self._chunkUsed)]
+        if len(used) == 1:
+            return used[0]
+        elif used:
+            return np.concatenate(used)
+        return np.empty((0,) + (self.cellShape or ()),
+                        dtype=self.valueDtype or np.float64)
+
+    @property
+    def offsets(self):
+        """The offset of each cell's values in `values` (-1 for no data)"""
+        chunkStarts = np.concatenate([[0], np.cumsum(self._chunkUsed)])
+        offsets = chunkStarts[self._cellChunks] + self._cellOffsets
+        offsets[self.lengths < 0] = -1
+        return offsets
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        for rowN in range(self.shape[0]):
+            yield self[rowN]
+
+    def __repr__(self):
+        return 'RaggedArray(%r, valueDtype=%s, nValues=%i)' % (
+            self.shape, self.valueDtype, self.nValues)
+
+    def canStore(self, value):
+        """Returns True if value can be added without changing the type of
+        the values already stored"""
+        converted = _valueArray(value)
+        if converted is None:
+            return False
+        array, container = converted
+        if self.container is not None and container is not self.container:
+            return False
+        if container is not np.ndarray and len(array) == 0:
+            return True  # (an empty list has no dtype)
+        if self.valueDtype is not None and array.dtype != self.valueDtype:
+            return False
+        if self.cellShape is not None and array.shape[1:] != self.cellShape:
+            return False
+        return True
+
+    def __setitem__(self, index, value):
+        index = self._cellIndex(index)
+        if index is None:
+            raise IndexError('RaggedArray values can only be set one cell '
+                             'at a time')
+        if not self.canStore(value):
+            raise TypeError('RaggedArray of %s %s values cannot store %r'
+                            % (self.container, self.valueDtype, value))
+        array, self.container = _valueArray(value)
+        if self.valueDtype is None and \
+                (self.container is np.ndarray or len(array)):
+            self.valueDtype = array.dtype
+            self.cellShape = array.shape[1:]
+        # (values of a cell that is set again are left unused)
+        self._cellChunks[index], self._cellOffsets[index] = \
+            self._append(array)
+        self.lengths[index] = len(array)
+
+    def __getitem__(self, index):
+        cellIndex = self._cellIndex(index)
+        if cellIndex is not None:
+            return self._cell(cellIndex)
+        cells = np.arange(self.size).reshape(self.shape)[index]
+        out = np.empty(np.shape(cells), dtype=object)
+        for outIndex, flatIndex in np.ndenumerate(cells):
+            out[outIndex] = self._cell(np.unravel_index(flatIndex,
+                                                        self.shape))
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[...]
+        if dtype is not None:
+            out = out.astype(dtype)
+        return out
+
+    def tolist(self):
+        return np.asarray(self).tolist()
+
+    def __getattr__(self, name):
+        # (only called for attributes not found otherwise; private names
+        # are not forwarded, e.g. when unpickling before __dict__ is set)
+        if name.startswith('_') or name in _IN_PLACE or \
+                not hasattr(np.ndarray, name):
+            raise AttributeError('%r object has no attribute %r'
+                                 % (type(self).__name__, name))
+        return getattr(np.asarray(self), name)
+
+    def _cellIndex(self, index):
+        """Returns index as a tuple of ints if it selects a single cell"""
+        if not isinstance(index, tuple):
+            index = (index,)
+        if len(index) != len(self.shape) or \
+                not all(isinstance(n, (int, np.integer)) for n in index):
+            return None
+        return tuple(int(n) for n in index)
+
+    def _cell(self, index):
+        length = self.lengths[index]
+        if length < 0:
+            return _MISSING
+        if length == 0:
+            array = np.empty((0,) + (self.cellShape or ()),
+                             dtype=self.valueDtype or np.float64)
+        else:
+            offset = self._cellOffsets[index]
+            array = self._chunks[self._cellChunks[index]][
+                offset:offset + length]
+        if self.container is np.ndarray:
+            return array
+        return self.container(array.tolist())
+
+    def _append(self, array):
+        """Stores the values of array and returns (chunk, offset)"""
+        nNew = len(array)
+        if nNew == 0:
+            return 0, 0
+        if not self._chunks or \
+                self._chunkUsed[-1] + nNew > len(self._chunks[-1]):
+            # each chunk holds at least a quarter of the values so far, so
+            # there are few chunks and at most a quarter is unused
+            self._addChunk(max(nNew, _MIN_CHUNK, self.nValues // 4))
+        chunkN = len(self._chunks) - 1
+        offset = self._chunkUsed[chunkN]
+        self._chunks[chunkN][offset:offset + nNew] = array
+        self._chunkUsed[chunkN] += nNew
+        return chunkN, offset
+
+    def _addChunk(self, size):
+        shape = (size,) + self.cellShape
+        if self.memmapDir is not None and os.path.isdir(self.memmapDir):
+            # (the file is deleted when the last map of it is closed)
+            with tempfile.TemporaryFile(dir=self.memmapDir) as f:
+                chunk = np.memmap(f, dtype=self.valueDtype, mode='w+',
+                                  shape=shape)
+        else:
+            chunk = np.empty(shape, dtype=self.valueDtype)
+        self._chunks.append(chunk)
+        self._chunkUsed.append(0)
+
+    def __getstate__(self):
+        # the values in use as one chunk, in memory rather than
+        # memory-mapped
+        state = self.__dict__.copy()
+        if self._chunks:
+            state['_chunks'] = [np.array(self.values)]
+            state['_chunkUsed'] = [self.nValues]
+            state['_cellOffsets'] = np.maximum(self.offsets, 0)
+            state['_cellChunks'] = np.zeros(self.shape, dtype=np.int64)
+        return state
@@ -0,0 +1,733 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Monte-Carlo simulation of adaptive staircases, running many simulated
+observers at once.
+
+Each batch class keeps the state of one staircase for every observer in
+arrays, so a trial for all observers is a handful of array operations
+rather than one call of the handler per observer:
+
+    - :class:`StairBatch` applies the up/down rules of
+      :class:`~psychopy.data.StairHandler`
+    - :class:`QuestBatch` keeps a matrix of QUEST posterior pdfs (one row
+      per observer) as :class:`~psychopy.data.QuestHandler` does
+    - :class:`PsiBatch` keeps a matrix of Psi posteriors, as
+      :class:`~psychopy.data.PsiHandler` does, so choosing the next
+      intensities takes two matrix products for all observers
+
+Given the same responses, :class:`StairBatch` and :class:`QuestBatch`
+present the same intensities as the handlers they mirror. :class:`PsiBatch`
+does not sum the products for all observers in the same order as
+PsiHandler sums those of one, so where two intensities have (almost) the
+same expected entropy an observer's staircase can take a different path
+from the handler's. With float64 arrays this takes an exact tie; with
+float32 arrays (the default, as for PsiHandler) it is more common: 7 of 30
+observers, over 30 trials, in the tests. :func:`simulate` runs a batch to the end with simulated
+responses and returns a :class:`SimulationResult` with the bias, spread and
+convergence of the estimates; :func:`simulateMultiStair` does this for each
+of the staircases of a :class:`~psychopy.data.MultiStairHandler` design.
+
+Example::
+
+    result = data.simulate('quest', nObservers=5000, thresholds=-1.0,
+                           startVal=-0.5, startValSd=0.5, nTrials=40)
+    print(result.summary())
+"""
+
+from __future__ import absolute_import, division, print_function
+
+from builtins import object
+from collections import OrderedDict
+
+import numpy as np
+
+from psychopy.contrib.quest import QuestObject
+from psychopy.contrib.psi import PsiObject, _xlogy
+
+# the direction of a staircase, as StairHandler.currentDirection
+_START, _UP, _DOWN = 0, 1, -1
+
+
+def weibull(intensities, thresholds, beta=3.5, gamma=0.5, delta=0.01):
+    """The probability of a correct response at the given intensities, for
+    observers with Weibull psychometric functions::
+
+        delta*gamma + (1-delta)*(1 - (1-gamma)*exp(-(x/threshold)**beta))
+
+    This is the function used by QUEST, in linear rather than log units
+    (with `threshold` at the 'alpha' point of the function, where about
+    82% of 2AFC responses are correct). Intensities below 0 are treated as
+    0. It is the default observer for :class:`StairBatch`.
+    """
+    x = np.maximum(np.asarray(intensities, dtype=float), 0)
+    return delta * gamma + (1 - delta) * (
+        1 - (1 - gamma) * np.exp(-(x / thresholds) ** beta))
+
+
+class _BaseBatch(object):
+    """Shared bookkeeping of the batch classes: the intensities presented
+    and the responses given on each trial, as arrays with one value per
+    observer (NaN for observers whose staircase had already finished).
+
+    Each batch class defines `_update(rows, responses)`, which applies the
+    responses of the observers at `rows` (those still running) and sets
+    their `nextIntensity` and `finished`.
+    """
+
+    def __init__(self, nObservers, nTrials):
+        self.nObservers = int(nObservers)
+        self.nTrials = nTrials
+        self.thisTrialN = -1
+        self.intensities = []
+        self.data = []
+        self.nTrialsRun = np.zeros(self.nObservers, dtype=int)
+        self.finished = np.zeros(self.nObservers, dtype=bool)
+        self.nextIntensity = np.zeros(self.nObservers)
+
+    def addResponses(self, responses):
+        """Adds the responses (1 or True for correct / detected) of all
+        observers to the trial at `nextIntensity`, and updates
+        `nextIntensity` and `finished`. Responses of observers whose
+        staircases had already finished are ignored.
+        """
+        responses = np.asarray(responses).astype(bool)
+        active = ~self.finished
+        self.thisTrialN += 1
+        self.intensities.append(
+            np.where(active, self.nextIntensity, np.nan))
+        self.data.append(np.where(active, responses, np.nan))
+        self.nTrialsRun[active] += 1
+        self._update(np.flatnonzero(active), responses[active])
+
+    def getIntensities(self):
+        """Returns the intensities presented, as [trial, observer]"""
+        return np.array(self.intensities).reshape(-1, self.nObservers)
+
+    def getData(self):
+        """Returns the responses given, as [trial, observer]"""
+        return np.array(self.data).reshape(-1, self.nObservers)
+
+
+class StairBatch(_BaseBatch):
+    """The state of a :class:`~psychopy.data.StairHandler` for each of
+    `nObservers` observers, updated for all of them at once.
+
+    The arguments are those of StairHandler (other keyword arguments, such
+    as the `label` of a MultiStairHandler condition, are ignored).
+    """
+
+    def __init__(self, nObservers, startVal, nReversals=None, stepSizes=4,
+                 nTrials=0, nUp=1, nDown=3, applyInitialRule=True,
+                 stepType='db', minVal=None, maxVal=None, **kwargs):
+        _BaseBatch.__init__(self, nObservers, nTrials)
+        self.startVal = startVal
+        self.nUp = nUp
+        self.nDown = nDown
+        self.applyInitialRule = applyInitialRule
+        self.stepType = stepType
+        self.minVal = minVal
+        self.maxVal = maxVal
+        try:
+            self.stepSizes = np.array(list(stepSizes), dtype=float)
+        except TypeError:
+            self.stepSizes = np.array([stepSizes], dtype=float)
+        if nReversals is None or len(self.stepSizes) > nReversals:
+            self.nReversals = len(self.stepSizes)
+        else:
+            self.nReversals = nReversals
+
+        n = self.nObservers
+        self.nextIntensity = np.full(n, startVal, dtype=float)
+        self.stepSizeCurrent = np.full(n, self.stepSizes[0])
+        self.correctCounter = np.zeros(n, dtype=int)
+        self.currentDirection = np.full(n, _START, dtype=np.int8)
+        self.nReversalsRun = np.zeros(n, dtype=int)
+        self.initialRule = np.zeros(n, dtype=bool)
+        self.lastResponse = np.zeros(n, dtype=bool)
+        # [trial] of bool arrays, True where the trial was a reversal
+        self.reversals = []
+
+    def _update(self, rows, responses):
+        """The rules of StairHandler.addResponse() and
+        calculateNextIntensity(), applied to the given observers"""
+        # runs of correct (positive) or incorrect (negative) responses
+        counter = self.correctCounter[rows]
+        onRun = (responses == self.lastResponse[rows]) & (
+            self.nTrialsRun[rows] > 1)
+        step = np.where(responses, 1, -1)
+        counter = np.where(onRun, counter + step, step)
+        self.lastResponse[rows] = responses
+
+        direction = self.currentDirection[rows]
+        nReversals = self.nReversalsRun[rows]
+        initial = (nReversals == 0) & self.applyInitialRule
+        goDown = np.where(initial, responses, counter >= self.nDown)
+        goUp = np.where(initial, ~responses,
+                        (counter < self.nDown) & (counter <= -self.nUp))
+        reversal = ((goDown & (direction == _UP)) |
+                    (goUp & (direction == _DOWN)))
+        direction[goDown] = _DOWN
+        direction[goUp] = _UP
+        self.currentDirection[rows] = direction
+
+        # after a reversal the step size moves on to the next in the list
+        initialRule = self.initialRule[rows] | (reversal & initial)
+        nReversals = nReversals + reversal
+        self.nReversalsRun[rows] = nReversals
+        isReversal = np.zeros(self.nObservers, dtype=bool)
+        isReversal[rows] = reversal
+        self.reversals.append(isReversal)
+        stepSize = self.stepSizeCurrent[rows]
+        if len(self.stepSizes) > 1:
+            sizeIndex = np.minimum(nReversals, len(self.stepSizes) - 1)
+            stepSize = np.where(reversal, self.stepSizes[sizeIndex],
+                                stepSize)
+            self.stepSizeCurrent[rows] = stepSize
+
+        self.finished[rows] = ((nReversals >= self.nReversals) &
+                               (self.nTrialsRun[rows] >= self.nTrials))
+
+        # the step, which is taken by response until the first reversal
+        # and on the trial of the first reversal
+        byResponse = ((nReversals == 0) | initialRule) & \
+            self.applyInitialRule
+        self.initialRule[rows] = initialRule & ~byResponse
+        dec = np.where(byResponse, responses, counter >= self.nDown)
+        inc = np.where(byResponse, ~responses,
+                       (counter < self.nDown) & (counter <= -self.nUp))
+        intensity = self.nextIntensity[rows]
+        if self.stepType == 'db':
+            factor = 10.0 ** (stepSize / 20.0)
+        elif self.stepType == 'log':
+            factor = 10.0 ** stepSize
+        if self.stepType in ('db', 'log'):
+            intensity = np.where(dec, intensity / factor, intensity)
+            intensity = np.where(inc, intensity * factor, intensity)
+        elif self.stepType == 'lin':
+            intensity = intensity - dec * stepSize + inc * stepSize
+        # (as StairHandler, maxVal only limits steps up and minVal steps
+        # down)
+        if self.maxVal is not None:
+            intensity = np.where(inc & (intensity > self.maxVal),
+                                 self.maxVal, intensity)
+        if self.minVal is not None:
+            intensity = np.where(dec & (intensity < self.minVal),
+                                 self.minVal, intensity)
+        self.nextIntensity[rows] = intensity
+        self.correctCounter[rows] = np.where(dec | inc, 0, counter)
+
+    def getReversals(self):
+        """Returns a bool array [trial, observer] that is True for trials
+        that were reversals"""
+        return np.array(self.reversals).reshape(-1, self.nObservers)
+
+    def estimate(self, nReversals=6):
+        """Returns the mean intensity of the last `nReversals` reversals of
+        each observer (or of all reversals, for observers with fewer), or
+        NaN for observers without any.
+        """
+        reversals = self.getReversals()
+        intensities = self.getIntensities()
+        # count reversals backwards from the last one
+        fromLast = np.cumsum(reversals[::-1], axis=0)[::-1]
+        use = reversals & (fromLast <= nReversals)
+        nUsed = use.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(use, intensities, 0).sum(axis=0) / nUsed
+
+    def probCorrect(self, intensities, thresholds):
+        """The default simulated observer: see :func:`weibull`"""
+        return weibull(intensities, thresholds)
+
+
+class QuestBatch(_BaseBatch):
+    """The state of a :class:`~psychopy.data.QuestHandler` for each of
+    `nObservers` observers, with the posterior pdfs as the rows of a
+    [observer, threshold] array that is updated for all of them at once.
+
+    The arguments are those of QuestHandler (other keyword arguments are
+    ignored). The pdfs are normalized after every trial, which does not
+    change the estimates but means they can not underflow.
+    """
+
+    def __init__(self, nObservers, startVal, startValSd, pThreshold=0.82,
+                 nTrials=None, stopInterval=None, method='quantile',
+                 beta=3.5, delta=0.01, gamma=0.5, grain=0.01, range=None,
+                 minVal=None, maxVal=None, **kwargs):
+        if nTrials is None and stopInterval is None:
+            raise ValueError('QuestBatch needs `nTrials` or `stopInterval` '
+                             'so that its staircases finish')
+        _BaseBatch.__init__(self, nObservers, nTrials)
+        if method not in ('quantile', 'mean', 'mode'):
+            raise ValueError("QuestBatch `method` should be 'quantile', "
+                             "'mean' or 'mode', not %r" % method)
+        self.startVal = startVal
+        self.stopInterval = stopInterval
+        self.method = method
+        self.minVal = minVal
+        self.maxVal = maxVal
+        # the tables of the psychometric function, shared by all observers
+        self._quest = QuestObject(startVal, startValSd, pThreshold, beta,
+                                  delta, gamma, grain=grain, range=range)
+        self.pdf = np.tile(self._quest.pdf, (self.nObservers, 1))
+        self.nextIntensity = np.full(self.nObservers, startVal, dtype=float)
+
+    def _update(self, rows, responses):
+        q = self._quest
+        nX = self.pdf.shape[1]
+        # the column of s2 for the first value of x, as QuestObject.update()
+        # finds it, but kept in range for all intensities
+        intensity = np.clip(self.nextIntensity[rows], -1e10, 1e10)
+        first = (nX + q.i[0] - 1 -
+                 np.round((intensity - q.tGuess) / q.grain))
+        first = np.clip(first, 0, q.s2.shape[1] - nX).astype(int)
+        # s2 as [response, first, x], a view of all its windows of nX
+        s2 = np.ascontiguousarray(q.s2)
+        windows = np.lib.stride_tricks.as_strided(
+            s2, (2, s2.shape[1] - nX + 1, nX),
+            (s2.strides[0], s2.strides[1], s2.strides[1]), writeable=False)
+        pdf = self.pdf[rows] * windows[responses.astype(int), first]
+        pdf /= pdf.sum(axis=1, keepdims=True)
+        self.pdf[rows] = pdf
+
+        done = np.zeros(len(rows), dtype=bool)
+        if self.nTrials is not None:
+            done |= self.nTrialsRun[rows] >= self.nTrials
+        if self.stopInterval is not None:
+            interval = (self._quantile(pdf, 0.95) -
+                        self._quantile(pdf, 0.05))
+            done |= np.abs(interval) < self.stopInterval
+        self.finished[rows] = done
+
+        running = rows[~done]
+        pdf = pdf[~done]
+        if self.method == 'quantile':
+            intensity = self._quantile(pdf)
+        elif self.method == 'mean':
+            intensity = self._mean(pdf)
+        else:
+            intensity = self._mode(pdf)
+        if self.maxVal is not None:
+            intensity = np.minimum(intensity, self.maxVal)
+        if self.minVal is not None:
+            intensity = np.maximum(intensity, self.minVal)
+        self.nextIntensity[running] = intensity
+
+    def _quantile(self, pdf, quantileOrder=None):
+        """QuestObject.quantile() for each row of pdf"""
+        q = self._quest
+        if quantileOrder is None:
+            quantileOrder = q.quantileOrder
+        cdf = np.cumsum(pdf, axis=1)
+        target = quantileOrder * cdf[:, -1]
+        # interpolate between the points of the cdf with nonzero pdf, on
+        # either side of target
+        upper = (cdf < target[:, np.newaxis]).sum(axis=1)
+        upper = np.minimum(upper, pdf.shape[1] - 1)
+        rowN = np.arange(len(pdf))
+        lower = np.maximum(upper - 1, 0)
+        if not (pdf > 0).all():
+            # the last point with nonzero pdf before upper
+            nonzero = np.where(pdf > 0, np.arange(pdf.shape[1]), 0)
+            lower = np.maximum.accumulate(nonzero, axis=1)[rowN, lower]
+        cdfLower = cdf[rowN, np.maximum(upper - 1, 0)]
+        cdfUpper = cdf[rowN, upper]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = (target - cdfLower) / (cdfUpper - cdfLower)
+        x = q.x[lower] + fraction * (q.x[upper] - q.x[lower])
+        x = np.where(upper == 0, q.x[0], x)
+        return q.tGuess + x
+
+    def _mean(self, pdf):
+        q = self._quest
+        return q.tGuess + np.dot(pdf, q.x) / pdf.sum(axis=1)
+
+    def _mode(self, pdf):
+        q = self._quest
+        return q.tGuess + q.x[np.argmax(pdf, axis=1)]
+
+    def quantile(self, p=None):
+        """Quantile of the posterior pdf of each observer"""
+        return self._quantile(self.pdf, p)
+
+    def mean(self):
+        """Mean of the posterior pdf of each observer"""
+        return self._mean(self.pdf)
+
+    def mode(self):
+        """Mode of the posterior pdf of each observer"""
+        return self._mode(self.pdf)
+
+    def sd(self):
+        """Standard deviation of the posterior pdf of each observer"""
+        x = self._quest.x
+        mean = np.dot(self.pdf, x) / self.pdf.sum(axis=1)
+        meanSq = np.dot(self.pdf, x ** 2) / self.pdf.sum(axis=1)
+        return np.sqrt(meanSq - mean ** 2)
+
+    def estimate(self):
+        """Returns the threshold estimate of each observer: the mean of
+        its posterior pdf, as recommended by King-Smith et al. (1994)"""
+        return self.mean()
+
+    def probCorrect(self, intensities, thresholds):
+        """The default simulated observer, whose responses follow the
+        psychometric function of the QUEST model, as for
+        QuestHandler.simulate()"""
+        q = self._quest
+        t = np.clip(np.asarray(intensities) - thresholds, q.x2[0], q.x2[-1])
+        return np.interp(t, q.x2, q.p2)
+
+
+class PsiBatch(_BaseBatch):
+    """The state of a :class:`~psychopy.data.PsiHandler` for each of
+    `nObservers` observers, with the log posteriors as the rows of a
+    [observer, lambda] array that is updated for all of them at once.
+
+    The arguments are those of PsiHandler, except that the prior can only
+    be an array. Use `dtype='float64'` for the same intensities as
+    PsiHandler, except at exact ties (see the module docstring).
+    """
+
+    def __init__(self, nObservers, nTrials, intensRange, alphaRange,
+                 betaRange, intensPrecision, alphaPrecision, betaPrecision,
+                 delta, stepType='lin', expectedMin=0.5, prior=None,
+                 dtype='float32', xCandidates=None, **kwargs):
+        if expectedMin not in [0, 0.5]:
+            raise NotImplementedError(
+                'Currently, only Yes/No and 2-AFC designs are '
+                'supported. Please specify either `expectedMin=0` '
+                '(Yes/No) or `expectedMin=0.5` (2-AFC).')
+        _BaseBatch.__init__(self, nObservers, nTrials)
+        self._psi = PsiObject(
+            intensRange, alphaRange, betaRange, intensPrecision,
+            alphaPrecision, betaPrecision, delta=delta, stepType=stepType,
+            TwoAFC=expectedMin == 0.5, prior=prior, dtype=dtype,
+            xCandidates=xCandidates)
+        self._psi.update(None)
+        self.logPosterior = np.tile(self._psi._logProbLambda.ravel(),
+                                    (self.nObservers, 1))
+        self.nextIntensityIndex = np.full(
+            self.nObservers, self._psi.nextIntensityIndex, dtype=int)
+        self.nextIntensity = self._psi.x[self.nextIntensityIndex]
+        self.finished[:] = self.nTrials <= 0
+
+    def _update(self, rows, responses):
+        psi = self._psi
+        p = psi._probCorrectGivenLambda(
+            psi.x[self.nextIntensityIndex[rows]])
+        p[~responses] = 1 - p[~responses]
+        with np.errstate(divide='ignore'):
+            logPosterior = self.logPosterior[rows] + np.log(p)
+        # (normalized as PsiObject._normalize() does)
+        logPosterior -= np.logaddexp.reduce(logPosterior, axis=1,
+                                            keepdims=True)
+        self.logPosterior[rows] = logPosterior
+
+        done = self.nTrialsRun[rows] >= self.nTrials
+        self.finished[rows] = done
+        running = rows[~done]
+        if not len(running):
+            return
+        # as PsiObject.update(), with the products for all observers in
+        # one matrix product
+        probLambda = np.exp(logPosterior[~done])
+        weights = probLambda.astype(psi.dtype)
+        entropySum = np.dot(weights, psi._responseEntropy.T).astype(float)
+        probCorrect = np.dot(weights, psi._probCorrect.T).astype(float)
+        probCorrect = np.clip(probCorrect, 0, 1)
+        expectedEntropy = (_xlogy(probCorrect) + _xlogy(1 - probCorrect) -
+                           entropySum -
+                           _xlogy(probLambda).sum(axis=1, keepdims=True))
+        index = psi._xCandidates[np.argmin(expectedEntropy, axis=1)]
+        self.nextIntensityIndex[running] = index
+        self.nextIntensity[running] = psi.x[index]
+
+    def estimateLambda(self):
+        """Returns arrays of the (location, slope) estimates of each
+        observer"""
+        psi = self._psi
+        probLambda = np.exp(self.logPosterior).reshape(
+            self.nObservers, len(psi.alpha), len(psi.beta))
+        return (np.dot(probLambda.sum(axis=2), psi.alpha),
+                np.dot(probLambda.sum(axis=1), psi.beta))
+
+    def estimate(self):
+        """Returns the location (alpha) estimate of each observer"""
+        return self.estimateLambda()[0]
+
+    def probCorrect(self, intensities, thresholds):
+        """The default simulated observer, whose responses follow the
+        psychometric function of the Psi model. `thresholds` are the
+        locations (alpha) of the observers, or a [observer, 2] array of
+        their (alpha, beta); by default beta is the middle of the beta
+        range.
+        """
+        from scipy.special import ndtr
+        psi = self._psi
+        thresholds = np.asarray(thresholds, dtype=float)
+        if thresholds.ndim == 2:
+            alpha, beta = thresholds[:, 0], thresholds[:, 1]
+        else:
+            alpha, beta = thresholds, np.mean(psi.beta[[0, -1]])
+        p = ndtr((np.asarray(intensities) - alpha) / beta)
+        if psi._TwoAFC:
+            return (.5 + .5 * p) * (1 - psi.delta) + psi.delta / 2
+        return p * (1 - psi.delta) + psi.delta / 2
+
+
+_batchTypes = {'simple': StairBatch, 'quest': QuestBatch,
+               'QUEST': QuestBatch, 'psi': PsiBatch}
+
+
+class SimulationResult(object):
+    """The outcome of :func:`simulate`, for `nObservers` observers.
+
+    :Attributes:
+
+        thresholds : the true threshold of each observer (for Psi, the
+            location, alpha).
+
+        estimates : the final threshold estimate of each observer.
+
+        intensities, data : the intensities presented and the responses
+            given, as [trial, observer] arrays with NaN after an observer's
+            staircase finished.
+
+        nTrialsRun : the number of trials each observer ran.
+
+        finished : False for observers that were stopped at `maxTrials`.
+
+        rmsError : for each trial, the root mean square difference between
+            the intensities presented and the thresholds, over the observers
+            still running; how the staircases converge on average.
+
+        trialsToConverge : for each observer, the number of trials after
+            which the intensities presented stayed within `tolerance` of its
+            threshold (NaN if they did not). None if no tolerance was given.
+    """
+
+    def __init__(self, thresholds, estimates, intensities, data, nTrialsRun,
+                 finished, tolerance=None):
+        self.thresholds = thresholds
+        self.estimates = estimates
+        self.intensities = intensities
+        self.data = data
+        self.nTrialsRun = nTrialsRun
+        self.finished = finished
+        self.tolerance = tolerance
+        errors = intensities - thresholds
+        running = ~np.isnan(errors)
+        self.rmsError = np.sqrt(np.nansum(errors ** 2, axis=1) /
+                                np.maximum(running.sum(axis=1), 1))
+        self.trialsToConverge = None
+        if tolerance is not None:
+            # trials are outside tolerance, or not run (NaN); count back
+            # from the last trial run to the last one outside
+            outside = ~(np.abs(errors) <= tolerance)
+            outside[np.isnan(errors)] = False
+            nTrials = len(intensities)
+            lastOutside = np.where(
+                outside.any(axis=0),
+                nTrials - np.argmax(outside[::-1], axis=0), 0)
+            self.trialsToConverge = np.where(
+                lastOutside < nTrialsRun, lastOutside, np.nan)
+
+    @property
+    def nObservers(self):
+        return len(self.estimates)
+
+    @property
+    def errors(self):
+        """The estimate minus the threshold, for each observer"""
+        return self.estimates - self.thresholds
+
+    @property
+    def bias(self):
+        """The mean error of the estimates"""
+        return np.nanmean(self.errors)
+
+    @property
+    def sd(self):
+        """The standard deviation of the estimates about their mean"""
+        return np.nanstd(self.errors)
+
+    @property
+    def rmse(self):
+        """The root mean square error of the estimates"""
+        return np.sqrt(np.nanmean(self.errors ** 2))
+
+    def summary(self):
+        """Returns a dict of summary statistics"""
+        summary = OrderedDict()
+        summary['nObservers'] = self.nObservers
+        summary['bias'] = self.bias
+        summary['sd'] = self.sd
+        summary['rmse'] = self.rmse
+        summary['meanTrials'] = np.mean(self.nTrialsRun)
+        summary['maxTrials'] = np.max(self.nTrialsRun)
+        summary['propFinished'] = np.mean(self.finished)
+        if self.trialsToConverge is not None:
+            converged = ~np.isnan(self.trialsToConverge)
+            summary['propConverged'] = np.mean(converged)
+            summary['medianTrialsToConverge'] = (
+                np.median(self.trialsToConverge[converged])
+                if converged.any() else np.nan)
+        return summary
+
+    @classmethod
+    def concatenate(cls, results):
+        """Joins results for different observers into one"""
+        nTrials = max(len(result.intensities) for result in results)
+
+        def padded(array):
+            pad = np.full((nTrials - len(array),) + array.shape[1:], np.nan)
+            return np.concatenate([array, pad])
+
+        return cls(
+            np.concatenate([r.thresholds for r in results]),
+            np.concatenate([r.estimates for r in results]),
+            np.concatenate([padded(r.intensities) for r in results], axis=1),
+            np.concatenate([padded(r.data) for r in results], axis=1),
+            np.concatenate([r.nTrialsRun for r in results]),
+            np.concatenate([r.finished for r in results]),
+            tolerance=results[0].tolerance)
+
+
+def _runBatch(stairType, nObservers, thresholds, probCorrect, seed,
+              maxTrials, tolerance, stairArgs):
+    """Runs one batch to the end and returns its SimulationResult"""
+    batch = _batchTypes[stairType](nObservers, **stairArgs)
+    if probCorrect is None:
+        probCorrect = batch.probCorrect
+    rng = np.random.default_rng(seed)
+    responses = np.zeros(nObservers, dtype=bool)
+    while not batch.finished.all() and batch.thisTrialN + 1 < maxTrials:
+        active = np.flatnonzero(~batch.finished)
+        p = probCorrect(batch.nextIntensity[active], thresholds[active])
+        responses[:] = False
+        responses[active] = rng.random(len(active)) < p
+        batch.addResponses(responses)
+    if thresholds.ndim == 2:
+        # Psi (alpha, beta) pairs
+        thresholds = thresholds[:, 0]
+    return SimulationResult(
+        np.array(thresholds), batch.estimate(), batch.getIntensities(),
+        batch.getData(), batch.nTrialsRun.copy(), batch.finished.copy(),
+        tolerance=tolerance)
+
+
+def _runShard(args):
+    return _runBatch(*args)
+
+
+def simulate(stairType='simple', nObservers=1000, thresholds=0.0,
+             probCorrect=None, seed=None, processes=1, maxTrials=10000,
+             tolerance=None, **stairArgs):
+    """Simulates `nObservers` observers running a staircase, all at once.
+
+    :Parameters:
+
+        stairType : 'simple', 'quest' or 'psi'
+            Simulate a :class:`StairHandler`, :class:`QuestHandler` or
+            :class:`PsiHandler`, created with `stairArgs`.
+
+        thresholds : a number, or an array with one value per observer
+            The true thresholds of the observers. For 'psi' these may also
+            be an [observer, 2] array of (alpha, beta).
+
+        probCorrect : None or function(intensities, thresholds)
+            The probability of a correct (or 1) response for observers with
+            the given thresholds at the given intensities (both arrays).
+            The default is the psychometric function of the staircase's own
+            model (see :func:`weibull` for 'simple'). It must be a module
+            level function if `processes` > 1.
+
+        seed : None, int or numpy SeedSequence
+            Seeds the random responses. The same seed and number of
+            processes give the same result.
+
+        processes : int
+            Split the observers between this many processes. Each runs a
+            batch for its share of the observers.
+
+        maxTrials : int
+            Stop after this many trials even if some staircases have not
+            finished (see `SimulationResult.finished`).
+
+        tolerance : None or number
+            Distance from threshold used for `trialsToConverge`.
+
+    :Returns:
+
+        a :class:`SimulationResult`
+    """
+    if stairType not in _batchTypes:
+        raise ValueError("simulate `stairType` should be 'simple', 'quest' "
+                         "or 'psi', not %r" % stairType)
+    thresholds = np.asarray(thresholds, dtype=float)
+    if thresholds.ndim == 0:
+        thresholds = np.full(nObservers, thresholds)
+    if len(thresholds) != nObservers:
+        raise ValueError('simulate needs one threshold per observer (%i), '
+                         'got %i' % (nObservers, len(thresholds)))
+    processes = max(1, min(int(processes), nObservers))
+    if processes == 1:
+        return _runBatch(stairType, nObservers, thresholds, probCorrect,
+                         seed, maxTrials, tolerance, stairArgs)
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    shards = np.array_split(np.arange(nObservers), processes)
+    args = [(stairType, len(shard), thresholds[shard], probCorrect,
+             shardSeed, maxTrials, tolerance, stairArgs)
+            for shard, shardSeed in zip(shards, seed.spawn(processes))]
+    from multiprocessing import Pool
+    pool = Pool(processes)
+    try:
+        results = pool.map(_runShard, args)
+    finally:
+        pool.close()
+        pool.join()
+    return SimulationResult.concatenate(results)
+
+
+def simulateMultiStair(conditions, stairType='simple', nObservers=1000,
+                       thresholds=None, nTrials=50, seed=None, **kwargs):
+    """Simulates `nObservers` observers running the staircases of a
+    :class:`~psychopy.data.MultiStairHandler` design.
+
+    `conditions` and `nTrials` are as for MultiStairHandler. The true
+    thresholds are taken from `thresholds`, which may be a dict of
+    {label: thresholds} or thresholds for all the staircases, or else from
+    a 'threshold' entry of each condition. Simulated observers respond to
+    each trial independently of the ones before, so the order in which the
+    staircases are interleaved does not change their outcome and each
+    staircase is simulated on its own. Other arguments are passed to
+    :func:`simulate`.
+
+    :Returns:
+
+        an OrderedDict of {label: :class:`SimulationResult`}
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    results = OrderedDict()
+    for condition, stairSeed in zip(conditions, seed.spawn(len(conditions))):
+        args = dict(condition)
+        label = args.pop('label')
+        args.setdefault('nTrials', nTrials)
+        stairThresholds = args.pop('threshold', None)
+        if isinstance(thresholds, dict):
+            stairThresholds = thresholds[label]
+        elif thresholds is not None:
+            stairThresholds = thresholds
+        if stairThresholds is None:
+            raise ValueError('simulateMultiStair needs `thresholds` or a '
+                             "'threshold' in each condition")
+        args.update(kwargs)
+        results[label] = simulate(stairType, nObservers=nObservers,
+                                  thresholds=stairThresholds,
+                                  seed=stairSeed, **args)
+    return results
@@ -15,6 +15,7 @@ import sys
 import os
 import pickle
 import copy
+import hashlib
 import warnings
 import numpy as np
 from pkg_resources import parse_version
@@ -25,7 +26,7 @@ from psychopy.tools.filetools import openOutputFile, genDelimiter
 from psychopy.tools.fileerrortools import handleFileCollision
 from psychopy.contrib.quest import QuestObject
 from psychopy.contrib.psi import PsiObject
-from .base import _BaseTrialHandler, _ComparisonMixin
+from .base import _BaseTrialHandler, _ComparisonMixin, _saveExcelSheets
 from .utils import _getExcelCellName
 
 try:
@@ -47,6 +48,44 @@ except ImportError:
     haveOpenpyxl = False
 
 
+def _checkpointDigest(*arrays):
+    """Returns a sha1 hex digest of the values of the arrays, identifying
+    the grid, parameters and trial history a posterior was computed from
+    """
+    sha = hashlib.sha1()
+    for values in arrays:
+        values = np.ascontiguousarray(values, dtype=float)
+        sha.update(repr(values.shape).encode('utf-8'))
+        sha.update(values.tobytes())
+    return sha.hexdigest()
+
+
+def _saveCheckpointFile(fileName, state, fileCollisionMethod='rename'):
+    """Saves a dict of arrays to a compressed .npz file"""
+    if not fileName.endswith('.npz'):
+        fileName += '.npz'
+    with openOutputFile(fileName=fileName, append=False,
+                        fileCollisionMethod=fileCollisionMethod) as f:
+        np.savez_compressed(f, **state)
+    logging.info('saved checkpoint to %s' % f.name)
+
+
+def _loadCheckpointFile(fileName):
+    """Returns the dict of arrays in a checkpoint file"""
+    with np.load(fileName, allow_pickle=False) as npz:
+        return dict((key, npz[key]) for key in npz.files)
+
+
+def _optionalValue(value):
+    """None as a NaN array, for saving in a checkpoint"""
+    return np.array(np.nan if value is None else value)
+
+
+def _fromOptionalValue(array):
+    value = array.item()
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
 class StairHandler(_BaseTrialHandler):
     """Class to handle smoothly the selection of the next trial
     and report current values etc.
@@ -469,25 +508,25 @@ class StairHandler(_BaseTrialHandler):
             fileCollisionMethod=fileCollisionMethod, encoding=encoding)
 
         # write the data
-        reversalStr = str(self.reversalIntensities)
+        reversalStr = u'%s' % (self.reversalIntensities,)
         reversalStr = reversalStr.replace(',', delim)
         reversalStr = reversalStr.replace('[', '')
         reversalStr = reversalStr.replace(']', '')
         f.write('\nreversalIntensities=\t%s\n' % reversalStr)
 
-        reversalPts = str(self.reversalPoints)
+        reversalPts = u'%s' % (self.reversalPoints,)
         reversalPts = reversalPts.replace(',', delim)
         reversalPts = reversalPts.replace('[', '')
         reversalPts = reversalPts.replace(']', '')
         f.write('reversalIndices=\t%s\n' % reversalPts)
 
-        rawIntens = str(self.intensities)
+        rawIntens = u'%s' % (self.intensities,)
         rawIntens = rawIntens.replace(',', delim)
         rawIntens = rawIntens.replace('[', '')
         rawIntens = rawIntens.replace(']', '')
         f.write('\nintensities=\t%s\n' % rawIntens)
 
-        responses = str(self.data)
+        responses = u'%s' % (self.data,)
         responses = responses.replace(',', delim)
         responses = responses.replace('[', '')
         responses = responses.replace(']', '')
@@ -495,13 +534,13 @@ class StairHandler(_BaseTrialHandler):
 
         # add self.extraInfo
         if self.extraInfo is not None and not matrixOnly:
-            strInfo = str(self.extraInfo)
+            strInfo = u'%s' % (self.extraInfo,)
             # dict begins and ends with {} - remove
             # strInfo.replace('{','')
             # strInfo = strInfo.replace('}','')
             strInfo = strInfo[1:-1]
             # separate value from keyname
-            strInfo = strInfo.replace(strInfo, ': ', ':\n')
+            strInfo = strInfo.replace(': ', ':\n')
             # separate values from each other
             strInfo = strInfo.replace(',', '\n')
             strInfo = strInfo.replace('array([ ', '')
@@ -575,81 +614,57 @@ class StairHandler(_BaseTrialHandler):
                               'Excel (xlsx) format, but was not found.')
             # return -1
 
-        # import necessary subpackages - they are small so won't matter to do
-        # it here
-        from openpyxl.workbook import Workbook
-        from openpyxl.reader.excel import load_workbook
-
-        if not fileName.endswith('.xlsx'):
-            fileName += '.xlsx'
-        # create or load the file
-        if appendFile and os.path.isfile(fileName):
-            wb = load_workbook(fileName)
-            newWorkbook = False
-        else:
-            if not appendFile:
-                # the file exists but we're not appending, will be overwritten
-                fileName = handleFileCollision(fileName,
-                                               fileCollisionMethod)
-            wb = Workbook()
-            wb.properties.creator = 'PsychoPy' + psychopy.__version__
-            newWorkbook = True
-
-        if newWorkbook:
-            ws = wb.worksheets[0]
-            ws.title = sheetName
-        else:
-            ws = wb.create_sheet()
-            ws.title = sheetName
-
-        # write the data
-        # reversals data
-        ws['A1'] = 'Reversal Intensities'
-        ws['B1'] = 'Reversal Indices'
-        for revN, revIntens in enumerate(self.reversalIntensities):
-            ws.cell(column=1, row=revN+2,
-                    value=u"{}".format(revIntens))
-            ws.cell(column=2, row=revN+2,
-                    value=u"{}".format(self.reversalPoints[revN]))
-
-        # trials data
-        ws['C1'] = 'All Intensities'
-        ws['D1'] = 'All Responses'
-        for intenN, intensity in enumerate(self.intensities):
-            ws.cell(column=3, row=intenN+2,
-                    value=u"{}".format(intensity))
-            ws.cell(column=4, row=intenN+2,
-                    value=u"{}".format(self.data[intenN]))
+        fileName = _saveExcelSheets(
+            fileName, [(sheetName, self._excelRows(matrixOnly))],
+            appendFile=appendFile, fileCollisionMethod=fileCollisionMethod)
+        if self.autoLog:
+            logging.info('saved data to %s' % fileName)
 
+    def _getColumnarData(self):
+        nTrials = len(self.data)
+        if nTrials < 1:
+            return None
+        reversals = np.zeros(nTrials, dtype=bool)
+        reversalPoints = [point for point in self.reversalPoints
+                          if point < nTrials]
+        reversals[reversalPoints] = True
+        names = ['trialN', 'intensity', 'response', 'reversal']
+        columns = [np.arange(nTrials), list(self.intensities[:nTrials]),
+                   list(self.data), reversals]
+        if self.otherData is not None:
+            for key, values in self.otherData.items():
+                # (values that weren't added on some trials are missing)
+                values = list(values[:nTrials])
+                names.append(key)
+                columns.append(values + [None] * (nTrials - len(values)))
+        info = {'reversalIntensities': self.reversalIntensities,
+                'reversalPoints': self.reversalPoints}
+        return names, columns, info
+
+    def _excelRows(self, matrixOnly=False):
+        """Yields the rows of the worksheet written by saveAsExcel, with
+        None for the cells that are left empty.
+        """
+        # the columns of the sheet as (heading, values)
+        columns = [('Reversal Intensities', self.reversalIntensities),
+                   ('Reversal Indices', self.reversalPoints),
+                   ('All Intensities', self.intensities),
+                   ('All Responses', self.data)]
         # add other data
-        col = 5
         if self.otherData is not None:
-            # for varName in self.otherData:
             for key, val in list(self.otherData.items()):
-                ws.cell(column=col, row=1,
-                        value=u"{}".format(key))
-                for oDatN in range(len(self.otherData[key])):
-                    ws.cell(column=col, row=oDatN+2,
-                            value=u"{}".format(self.otherData[key][oDatN]))
-                col += 1
-
+                columns.append((u"{}".format(key), val))
         # add self.extraInfo
         if self.extraInfo is not None and not matrixOnly:
-            ws.cell(column=startingCol, row=1,
-                    value='extraInfo')
-            rowN = 2
-            for key, val in list(self.extraInfo.items()):
-                ws.cell(column=col, row=rowN,
-                        value=u"{}:".format(key))
-                _cell = _getExcelCellName(col=col+1, row=rowN)
-                ws.cell(column=col+2, row=rowN+1,
-                        value=u"{}".format(val))
-                rowN += 1
-
-
-        wb.save(filename=fileName)
-        if self.autoLog:
-            logging.info('saved data to %s' % fileName)
+            columns.append(('extraInfo', [u"{}:".format(key)
+                                          for key in self.extraInfo]))
+            columns.append(('', list(self.extraInfo.values())))
+
+        yield [heading for heading, values in columns]
+        nRows = max(len(values) for heading, values in columns)
+        for rowN in range(nRows):
+            yield [u"{}".format(values[rowN]) if rowN < len(values) else None
+                   for heading, values in columns]
 
     def saveAsPickle(self, fileName, fileCollisionMethod='rename'):
         """Basically just saves a copy of self (with data) to a pickle file.
@@ -679,6 +694,73 @@ class StairHandler(_BaseTrialHandler):
         if (fileName is not None) and (fileName != 'stdout'):
             logging.info('saved data to %s' % f.name)
 
+    def saveCheckpoint(self, fileName, fileCollisionMethod='rename'):
+        """Saves the state of the staircase (its intensities, responses
+        and, for QUEST and Psi, posterior) to a compressed numpy `.npz`
+        file, from which :meth:`loadCheckpoint` can resume it.
+
+        Unlike :meth:`saveAsPickle`, the file only holds arrays, so it is
+        small and can be read without unpickling. Other data (from
+        :meth:`addOtherData`) are not saved.
+
+        :Parameters:
+
+            fileCollisionMethod: Collision method passed to
+            :func:`~psychopy.tools.fileerrortools.handleFileCollision`
+
+        """
+        _saveCheckpointFile(fileName, self._getCheckpointState(),
+                            fileCollisionMethod)
+
+    def loadCheckpoint(self, fileName):
+        """Resumes the staircase from a file saved by
+        :meth:`saveCheckpoint`. This should be called on a new staircase
+        created with the same arguments as the saved one.
+
+        QUEST and Psi posteriors are restored as saved, without replaying
+        the trials, if they were computed on the same grid and with the
+        same parameters as this staircase's; otherwise the posterior is
+        recomputed from the saved trials. QUEST+ posteriors are always
+        recomputed from the saved trials.
+        """
+        self._setCheckpointState(_loadCheckpointFile(fileName))
+
+    def _getCheckpointState(self):
+        """Returns the state saved by saveCheckpoint(), as a dict of arrays
+        """
+        return {
+            'type': np.array(type(self).__name__),
+            'intensities': np.asarray(self.intensities, dtype=float),
+            'data': np.asarray(self.data),
+            'reversalPoints': np.asarray(self.reversalPoints, dtype=int),
+            'reversalIntensities': np.asarray(self.reversalIntensities,
+                                              dtype=float),
+            'thisTrialN': np.array(self.thisTrialN),
+            'nTrials': _optionalValue(self.nTrials),
+            'finished': np.array(self.finished),
+            'currentDirection': _optionalValue(self.currentDirection),
+            'correctCounter': np.array(self.correctCounter),
+            'stepSizeCurrent': _optionalValue(self.stepSizeCurrent),
+            'initialRule': np.array(self.initialRule),
+            'nextIntensity': _optionalValue(self._nextIntensity)}
+
+    def _setCheckpointState(self, state):
+        if state['type'].item() != type(self).__name__:
+            raise ValueError('The checkpoint is of a %s, not a %s' %
+                             (state['type'], type(self).__name__))
+        self.intensities = state['intensities'].tolist()
+        self.data = state['data'].tolist()
+        self.reversalPoints = state['reversalPoints'].tolist()
+        self.reversalIntensities = state['reversalIntensities'].tolist()
+        self.thisTrialN = state['thisTrialN'].item()
+        self.nTrials = _fromOptionalValue(state['nTrials'])
+        self.finished = state['finished'].item()
+        self.currentDirection = _fromOptionalValue(state['currentDirection'])
+        self.correctCounter = state['correctCounter'].item()
+        self.stepSizeCurrent = _fromOptionalValue(state['stepSizeCurrent'])
+        self.initialRule = state['initialRule'].item()
+        self._nextIntensity = _fromOptionalValue(state['nextIntensity'])
+
 
 class QuestObject_(QuestObject, _ComparisonMixin):
     """A QuestObject that implements the == and != operators.
@@ -945,6 +1027,18 @@ class QuestHandler(StairHandler):
             raise AttributeError("length of intensities and results input "
                                  "must be the same")
         self.incTrials(len(intensities))
+        if (not self.finished and self.stopInterval is None and
+                self.getExp() is None):
+            # the trials can't stop the staircase part way through, so they
+            # can all be added to the posterior at once
+            self._quest.applyTrials(intensities, results)
+            self.intensities.extend(intensities)
+            self.data.extend(results)
+            self.thisTrialN += len(intensities)
+            self._checkFinished()
+            if not self.finished:
+                self.calculateNextIntensity()
+            return
         for intensity, result in zip(intensities, results):
             try:
                 next(self)
@@ -1022,6 +1116,40 @@ class QuestHandler(StairHandler):
         """
         self.nTrials += nNewTrials
 
+    def _getCheckpointState(self):
+        state = StairHandler._getCheckpointState(self)
+        quest = self._quest
+        state.update({
+            'questNextIntensity': np.array(self._questNextIntensity),
+            'quest.pdf': quest.pdf,
+            'quest.intensity': np.asarray(quest.intensity, dtype=float),
+            'quest.response': np.asarray(quest.response, dtype=int),
+            'quest.digest': np.array(self._questDigest())})
+        return state
+
+    def _setCheckpointState(self, state):
+        StairHandler._setCheckpointState(self, state)
+        self._questNextIntensity = state['questNextIntensity'].item()
+        quest = self._quest
+        quest.intensity = state['quest.intensity'].tolist()
+        quest.response = state['quest.response'].tolist()
+        if state['quest.digest'].item() == self._questDigest():
+            quest.pdf = state['quest.pdf'].copy()
+        else:
+            logging.warning('QuestHandler checkpoint was saved with '
+                            'different parameters; recomputing the '
+                            'posterior from its trials')
+            quest.recompute()
+
+    def _questDigest(self):
+        """Digest of the QUEST parameters and trials the pdf depends on"""
+        quest = self._quest
+        return _checkpointDigest(
+            [quest.tGuess, quest.tGuessSd, quest.pThreshold, quest.beta,
+             quest.delta, quest.gamma, quest.grain, quest.dim,
+             quest.normalizePdf],
+            quest.intensity, quest.response)
+
     def simulate(self, tActual):
         """returns a simulated user response to the next intensity level
         presented by Quest, need to supply the actual threshold level
@@ -1095,9 +1223,12 @@ class PsiHandler(StairHandler):
     of the psychometric function, the location (alpha) and slope (beta),
     using Bayes' rule and grid approximation of the posterior distribution.
     It chooses stimuli to present by minimizing the entropy of this grid.
-    Because this grid is represented internally as a 4-D array, one must
-    choose the intensity, alpha, and beta ranges carefully so as to avoid
-    a Memory Error. Maximum likelihood is used to estimate Lambda, the most
+    The posterior over the grid is kept as log probabilities, and the
+    expected entropy for each intensity is computed from two arrays with
+    one value per (intensity, alpha, beta) combination, so the memory used
+    and the time per trial grow with the product of the three grid sizes.
+    For fine grids these can be limited with the `dtype`, `xCandidates`
+    and `nThreads` arguments. Maximum likelihood is used to estimate Lambda, the most
     likely location/slope pair. Because Psi estimates the entire
     psychometric function, any threshold defined on the function may be
     estimated once Lambda is determined.
@@ -1134,7 +1265,10 @@ class PsiHandler(StairHandler):
                  prior=None,
                  fromFile=False,
                  extraInfo=None,
-                 name=''):
+                 name='',
+                 dtype='float32',
+                 xCandidates=None,
+                 nThreads=1):
         """Initializes the handler and creates an internal Psi Object for
         grid approximation.
 
@@ -1207,6 +1341,25 @@ class PsiHandler(StairHandler):
                 Optional name for the PsiHandler used in PsychoPy's built-in
                 logging system.
 
+            dtype   (str)
+                The float type of the internal (intensity, alpha, beta)
+                arrays. 'float32' (the default) halves the memory used.
+                With either type, intensities whose expected entropies are
+                equal or almost equal may be chosen between differently
+                than in earlier versions (more often with 'float32'), so
+                sessions resumed from, or compared with, those versions can
+                diverge.
+
+            xCandidates (list)
+                Optional list of the intensities that may be presented
+                (each is snapped to the nearest value of the intensity
+                range). The memory and time used per trial are in proportion
+                to the number of candidates. Defaults to all intensities.
+
+            nThreads    (int)
+                The number of threads used to compute the expected entropy
+                of the candidate intensities on each trial. Defaults to 1.
+
         :Raises:
 
             NotImplementedError
@@ -1239,7 +1392,8 @@ class PsiHandler(StairHandler):
         self._psi = PsiObject_(
             intensRange, alphaRange, betaRange, intensPrecision,
             alphaPrecision, betaPrecision, delta=delta,
-            stepType=stepType, TwoAFC=twoAFC, prior=prior)
+            stepType=stepType, TwoAFC=twoAFC, prior=prior, dtype=dtype,
+            xCandidates=xCandidates, nThreads=nThreads)
 
         self._psi.update(None)
 
@@ -1310,6 +1464,34 @@ class PsiHandler(StairHandler):
                 lamb = None
         return self._psi.estimateThreshold(thresh, lamb)
 
+    def _getCheckpointState(self):
+        state = StairHandler._getCheckpointState(self)
+        state.update({
+            'psi.logProbLambda': self._psi._logProbLambda,
+            'psi.digest': np.array(self._psiDigest())})
+        return state
+
+    def _setCheckpointState(self, state):
+        StairHandler._setCheckpointState(self, state)
+        if state['psi.digest'].item() == self._psiDigest():
+            self._psi._logProbLambda = state['psi.logProbLambda'].copy()
+            self._psi.update(None)
+        else:
+            # replay the trials onto this staircase's prior
+            logging.warning('PsiHandler checkpoint was saved with a '
+                            'different grid; recomputing the posterior '
+                            'from its trials')
+            nResponses = len(self.data)
+            self._psi.applyTrials(self.intensities[:nResponses], self.data)
+
+    def _psiDigest(self):
+        """Digest of the grid and trials the posterior depends on"""
+        psi = self._psi
+        nResponses = len(self.data)
+        return _checkpointDigest(
+            psi.x, psi.alpha, psi.beta, [psi.delta, psi._TwoAFC],
+            self.intensities[:nResponses], self.data)
+
     def savePosterior(self, fileName, fileCollisionMethod='rename'):
         """Saves the posterior array over probLambda as a pickle file
         with the specified name.
@@ -1638,6 +1820,35 @@ class QuestPlusHandler(StairHandler):
         else:
             self.finished = False
 
+    def _getCheckpointState(self):
+        # The posterior is not saved: it is the product of the prior and
+        # the likelihood of each response, so it is recomputed from the
+        # trials when loading
+        state = StairHandler._getCheckpointState(self)
+        rng = self._qp._rng
+        if rng is not None:
+            rngState = rng.get_state()
+            state.update({
+                'qp.rngKeys': rngState[1],
+                'qp.rngPos': np.array(rngState[2]),
+                'qp.rngHasGauss': np.array(rngState[3]),
+                'qp.rngCachedGaussian': np.array(rngState[4])})
+        return state
+
+    def _setCheckpointState(self, state):
+        StairHandler._setCheckpointState(self, state)
+        qp = self._qp
+        qp.posterior = copy.deepcopy(qp.prior)
+        qp.stim_history = []
+        qp.resp_history = []
+        for intensity, response in zip(self.intensities, self.data):
+            qp.update(intensity=intensity, response=response)
+        if qp._rng is not None and 'qp.rngKeys' in state:
+            qp._rng.set_state(
+                ('MT19937', state['qp.rngKeys'], state['qp.rngPos'].item(),
+                 state['qp.rngHasGauss'].item(),
+                 state['qp.rngCachedGaussian'].item()))
+
     @property
     def paramEstimate(self):
         """
@@ -2053,6 +2264,71 @@ class MultiStairHandler(_BaseTrialHandler):
         if (fileName is not None) and (fileName != 'stdout'):
             logging.info('saved data to %s' % f.name)
 
+    def saveCheckpoint(self, fileName, fileCollisionMethod='rename'):
+        """Saves the state of all the staircases, and of the order they
+        are run in, to a compressed numpy `.npz` file, from which
+        :meth:`loadCheckpoint` can resume them.
+
+        See :meth:`StairHandler.saveCheckpoint`.
+        """
+        rngState = self._rng.get_state()
+        state = {
+            'labels': np.array([u'%s' % condition['label']
+                                for condition in self.conditions]),
+            'totalTrials': np.array(self.totalTrials),
+            'finished': np.array(self.finished),
+            'running': np.array([self.staircases.index(stair)
+                                 for stair in self.runningStaircases],
+                                dtype=int),
+            'thisPassRemaining': np.array(
+                [self.staircases.index(stair)
+                 for stair in self.thisPassRemaining], dtype=int),
+            'currentStaircase': np.array(
+                self.staircases.index(self.currentStaircase)),
+            'nextIntensity': _optionalValue(self._nextIntensity),
+            'rngKeys': rngState[1],
+            'rngPos': np.array(rngState[2]),
+            'rngHasGauss': np.array(rngState[3]),
+            'rngCachedGaussian': np.array(rngState[4])}
+        for stairN, stair in enumerate(self.staircases):
+            for key, value in stair._getCheckpointState().items():
+                state['stair%i.%s' % (stairN, key)] = value
+        _saveCheckpointFile(fileName, state, fileCollisionMethod)
+
+    def loadCheckpoint(self, fileName):
+        """Resumes the staircases from a file saved by
+        :meth:`saveCheckpoint`. This should be called on a new
+        MultiStairHandler created with the same arguments as the saved
+        one.
+
+        See :meth:`StairHandler.loadCheckpoint`.
+        """
+        state = _loadCheckpointFile(fileName)
+        labels = [u'%s' % condition['label']
+                  for condition in self.conditions]
+        if state['labels'].tolist() != labels:
+            raise ValueError('The checkpoint is of staircases %s, not %s' %
+                             (state['labels'].tolist(), labels))
+        for stairN, stair in enumerate(self.staircases):
+            prefix = 'stair%i.' % stairN
+            stair._setCheckpointState(
+                dict((key[len(prefix):], value)
+                     for key, value in state.items()
+                     if key.startswith(prefix)))
+        self.totalTrials = state['totalTrials'].item()
+        self.finished = state['finished'].item()
+        self.runningStaircases = [self.staircases[stairN]
+                                  for stairN in state['running']]
+        self.thisPassRemaining = [self.staircases[stairN]
+                                  for stairN in state['thisPassRemaining']]
+        self.currentStaircase = self.staircases[
+            state['currentStaircase'].item()]
+        self._nextIntensity = _fromOptionalValue(state['nextIntensity'])
+        self._rng.set_state(('MT19937', state['rngKeys'],
+                             state['rngPos'].item(),
+                             state['rngHasGauss'].item(),
+                             state['rngCachedGaussian'].item()))
+
     def saveAsExcel(self, fileName, matrixOnly=False, appendFile=False,
                     fileCollisionMethod='rename'):
         """Save a summary data file in Excel OpenXML format workbook
@@ -2101,14 +2377,47 @@ class MultiStairHandler(_BaseTrialHandler):
                               ' trials completed. Nothing saved')
             return -1
 
-        append = appendFile
+        if not haveOpenpyxl:
+            raise ImportError('openpyxl is required for saving files in '
+                              'Excel (xlsx) format, but was not found.')
+
+        # one sheet for each staircase, named by its label, all written to
+        # the file in one go
+        sheets = [(u"{}".format(thisStair.condition['label']),
+                   thisStair._excelRows(matrixOnly))
+                  for thisStair in self.staircases]
+        fileName = _saveExcelSheets(fileName, sheets, appendFile=appendFile,
+                                    fileCollisionMethod=fileCollisionMethod)
+        if self.autoLog:
+            logging.info('saved data to %s' % fileName)
+
+    def _getColumnarData(self):
+        """The columns of all the staircases, one after another, with the
+        label of each staircase in a 'label' column"""
+        names = ['label']
+        columns = {'label': []}
+        nRows = 0
         for thisStair in self.staircases:
-            # make a filename
-            label = thisStair.condition['label']
-            thisStair.saveAsExcel(
-                fileName, sheetName=label, matrixOnly=matrixOnly,
-                appendFile=append, fileCollisionMethod=fileCollisionMethod)
-            append = True
+            stairData = thisStair._getColumnarData()
+            if stairData is None:
+                continue
+            stairNames, stairColumns, stairInfo = stairData
+            nTrials = len(stairColumns[0])
+            columns['label'].extend([thisStair.condition['label']] * nTrials)
+            for name, values in zip(stairNames, stairColumns):
+                if name not in columns:
+                    # (missing from the staircases before this one)
+                    names.append(name)
+                    columns[name] = [None] * nRows
+                columns[name].extend(list(values))
+            nRows += nTrials
+            for name in names:
+                # (missing from this staircase)
+                columns[name].extend([None] * (nRows - len(columns[name])))
+        if nRows < 1:
+            return None
+        info = {'conditions': self.conditions}
+        return names, [columns[name] for name in names], info
 
     def saveAsText(self, fileName,
                    delim=None,
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Append-only saving of data entries as they are completed, so that data
+are on disk even if an experiment crashes, and so saving does not get
+slower as an experiment goes on.
+
+Entries are written to a JSON Lines stream file, one JSON list of cell
+values per line, in the order the columns were first seen. A sidecar
+header file (the stream file name + '.header') gets a record each time
+entries start to include new columns. :func:`finalizeEntryStream` turns
+the two files into a normal wide-format text file.
+"""
+
+from __future__ import absolute_import, print_function
+
+from builtins import str
+from builtins import object
+import io
+import os
+import sys
+import json
+import time
+
+from psychopy import logging
+from psychopy.tools.filetools import openOutputFile
+
+HEADER_EXT = '.header'
+
+
+class EntryStreamWriter(object):
+    """Appends data entries (dicts of column name: value) to a stream file.
+
+    Values are converted with `str()` when they are added, as they would be
+    when saving a wide text file, so later changes to mutable values are not
+    saved. The files are opened (and any existing files replaced) when the
+    first entry is added.
+
+    :Parameters:
+
+        fileName : the stream file to write.
+
+        fsyncInterval : seconds between calls to `os.fsync()`, which makes
+            the operating system write the data to the disk. The file
+            buffer is flushed after every entry regardless, so entries are
+            safe if the experiment process crashes; fsync protects against
+            a power cut or system crash too. 0 syncs after every entry and
+            None never syncs.
+    """
+
+    def __init__(self, fileName, fsyncInterval=1.0, encoding='utf-8'):
+        self.fileName = fileName
+        self.headerFileName = fileName + HEADER_EXT
+        self.fsyncInterval = fsyncInterval
+        self.encoding = encoding
+        self.names = []
+        self.nEntries = 0
+        self._nameIndex = {}
+        self._file = None
+        self._headerFile = None
+        self._lastSync = 0.0
+        self.closed = False
+
+    def _open(self):
+        self._file = io.open(self.fileName, 'w', encoding=self.encoding)
+        self._headerFile = io.open(self.headerFileName, 'w',
+                                   encoding=self.encoding)
+        self._lastSync = time.time()
+
+    def addEntry(self, entry):
+        """Appends one entry to the stream file"""
+        if self.closed:
+            raise ValueError('EntryStreamWriter for %r is closed'
+                             % self.fileName)
+        if self._file is None:
+            self._open()
+        newNames = [name for name in entry if name not in self._nameIndex]
+        if newNames:
+            # record the new columns before any entry that uses them
+            for name in newNames:
+                self._nameIndex[name] = len(self.names)
+                self.names.append(name)
+            record = {'entry': self.nEntries, 'names': newNames}
+            self._headerFile.write(str(json.dumps(record)) + u'\n')
+            self._headerFile.flush()
+        row = [None] * len(self.names)
+        for name, value in entry.items():
+            row[self._nameIndex[name]] = str(value)
+        self._file.write(str(json.dumps(row)) + u'\n')
+        self._file.flush()
+        self.nEntries += 1
+        if (self.fsyncInterval is not None and
+                time.time() - self._lastSync >= self.fsyncInterval):
+            self.sync()
+
+    def sync(self):
+        """Forces the operating system to write the files to disk"""
+        if self._file is not None:
+            os.fsync(self._headerFile.fileno())
+            os.fsync(self._file.fileno())
+            self._lastSync = time.time()
+
+    def close(self):
+        if self._file is not None:
+            if self.fsyncInterval is not None:
+                self.sync()
+            self._file.close()
+            self._headerFile.close()
+            self._file = None
+            self._headerFile = None
+        self.closed = True
+
+    def remove(self):
+        """Closes and deletes the stream files"""
+        self.close()
+        for fileName in (self.fileName, self.headerFileName):
+            if os.path.isfile(fileName):
+                os.remove(fileName)
+
+    def __getstate__(self):
+        # open files can't be pickled (e.g. as part of a .psydat file)
+        state = self.__dict__.copy()
+        state['_file'] = None
+        state['_headerFile'] = None
+        state['closed'] = True
+        return state
+
+
+def readEntryStream(fileName, encoding='utf-8'):
+    """Reads a stream file written by :class:`EntryStreamWriter`.
+
+    A final line that was only partly written (e.g. because of a crash) is
+    ignored.
+
+    :return: (names, rows) where rows is a list of lists of cell strings,
+        with None for cells without a value. Rows may be shorter than names
+        if columns were added after they were written.
+    """
+    names = []
+    with io.open(fileName + HEADER_EXT, 'r', encoding=encoding) as f:
+        for line in f:
+            try:
+                names.extend(json.loads(line)['names'])
+            except ValueError:
+                break
+    rows = []
+    with io.open(fileName, 'r', encoding=encoding) as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                break
+    return names, rows
+
+
+def finalizeEntryStream(streamFileName, fileName, names=None, delim=',',
+                        matrixOnly=False, appendFile=False,
+                        encoding='utf-8-sig', fileCollisionMethod='rename',
+                        trailingDelim=True, quoteCells=True,
+                        missingValue=u''):
+    """Writes the entries in a stream file as a wide-format text file, with
+    one line per entry.
+
+    :Parameters:
+
+        names : the columns to write, in order. Defaults to all columns of
+            the stream, in the order they were first seen.
+
+        trailingDelim : if True, every cell (including the last one on a
+            line) is followed by delim, as in
+            :meth:`ExperimentHandler.saveAsWideText`.
+
+        quoteCells : if True, cells that contain a comma or a newline are
+            put in double quotes.
+
+        missingValue : text written for columns an entry has no value for.
+
+    :return: the name of the file written
+    """
+    streamNames, rows = readEntryStream(streamFileName)
+    if names is None:
+        names = streamNames
+    nameIndex = dict((name, i) for i, name in enumerate(streamNames))
+    columns = [nameIndex.get(name, -1) for name in names]
+    lineEnd = (delim if trailingDelim and names else u'') + u'\n'
+
+    f = openOutputFile(fileName, append=appendFile,
+                       fileCollisionMethod=fileCollisionMethod,
+                       encoding=encoding)
+    if not matrixOnly:
+        f.write(delim.join(names) + lineEnd)
+    for row in rows:
+        nCells = len(row)
+        cells = []
+        for col in columns:
+            cell = row[col] if 0 <= col < nCells else None
+            if cell is None:
+                cell = missingValue
+            elif quoteCells and (',' in cell or '\n' in cell):
+                cell = u'"%s"' % cell
+            cells.append(cell)
+        f.write(delim.join(cells) + lineEnd)
+    if f != sys.stdout:
+        f.close()
+        logging.info('saved data to %r' % f.name)
+    return f.name
@@ -17,11 +17,140 @@ import pandas as pd
 
 from psychopy import logging
 from psychopy.constants import PY3
-from psychopy.tools.arraytools import shuffleArray
 from psychopy.tools.filetools import (openOutputFile, genDelimiter,
                                       genFilenameFromDelimiter)
 from .utils import importConditions
 from .base import _BaseTrialHandler, DataHandler
+from .design import SequenceDesign
+from .streaming import EntryStreamWriter, finalizeEntryStream
+
+# the number of rows of wide text output converted to text at a time
+_ROWS_PER_CHUNK = 10000
+
+
+def _randomKeys(shape, seed=None):
+    """Returns an array of uniform random numbers, which can be argsorted
+    to shuffle an array.
+
+    An int `seed` reseeds numpy's global random number generator first, as
+    :func:`~psychopy.tools.arraytools.shuffleArray` does, so a seeded
+    sequence is the same as made by earlier versions. A
+    `numpy.random.Generator` (or `RandomState`) is used as it is, without
+    changing the global generator.
+    """
+    if isinstance(seed, np.random.RandomState):
+        return seed.random_sample(shape)
+    if hasattr(np.random, 'Generator') and \
+            isinstance(seed, np.random.Generator):
+        return seed.random(shape)
+    if seed is not None:
+        np.random.seed(seed)
+    return np.random.random(shape)
+
+
+def _isSequenceMethod(method):
+    """Returns True for the methods that create the trial sequence in
+    advance (a name or a :class:`~psychopy.data.design.SequenceDesign`)
+    """
+    return isinstance(method, SequenceDesign) or \
+        method in ('random', 'sequential', 'fullRandom')
+
+
+def _createSequenceIndices(rowIndices, nReps, method, seed=None,
+                           trialList=None):
+    """Returns the trial sequence for a non-adaptive method as an int array
+    of shape (len(rowIndices), nReps), with indices[stimN][repN].
+
+    `rowIndices` are the condition indices making up one repeat (with an
+    index repeated for weighted conditions). All the random numbers needed
+    are drawn at once and argsorted along the rows, which shuffles each
+    repeat ('random') or the whole sequence ('fullRandom') in the same way
+    as shuffling them one at a time. A design from
+    :mod:`psychopy.data.design` makes the sequence itself.
+    """
+    if isinstance(method, SequenceDesign):
+        return method.createSequenceIndices(rowIndices, nReps,
+                                            trialList=trialList, seed=seed)
+    rowIndices = np.asarray(rowIndices, dtype=int).ravel()
+    nRows = len(rowIndices)
+    if method == 'random':
+        keys = _randomKeys((nReps, nRows), seed=seed)
+        order = np.argsort(keys, axis=-1)
+        return np.ascontiguousarray(rowIndices[order].T)
+    elif method == 'sequential':
+        return np.repeat(rowIndices[:, np.newaxis], nReps, axis=1)
+    elif method == 'fullRandom':
+        # indices*nReps, flatten, shuffle, unflatten
+        sequential = np.repeat(rowIndices, nReps)
+        keys = _randomKeys(sequential.shape, seed=seed)
+        randomFlat = sequential[np.argsort(keys)]
+        return np.reshape(randomFlat, (nRows, nReps))
+    raise ValueError('Unknown sequence method: %r' % method)
+
+
+def _repeatNumbers(indices):
+    """Returns, for each element of indices, the number of times the same
+    value occurred earlier in the array (0 for its first occurrence).
+    """
+    indices = np.asarray(indices).ravel()
+    order = np.argsort(indices, kind='mergesort')  # stable
+    sortedVals = indices[order]
+    starts = np.ones(len(indices), dtype=bool)
+    starts[1:] = sortedVals[1:] != sortedVals[:-1]
+    groupStart = np.maximum.accumulate(
+        np.where(starts, np.arange(len(indices)), 0))
+    repeats = np.empty(len(indices), dtype=int)
+    repeats[order] = np.arange(len(indices)) - groupStart
+    return repeats
+
+
+def _conditionValues(trialList, prmName, condIndices):
+    """Returns (values, found) for the trials with the given condition
+    indices: an object array of each trial's value of a condition
+    parameter, and a bool array that is True where the trial's condition
+    has that parameter.
+    """
+    nConds = len(trialList)
+    condValues = np.empty(nConds, 'O')
+    condFound = np.zeros(nConds, dtype=bool)
+    for n, cond in enumerate(trialList):
+        if cond and prmName in cond:
+            condValues[n] = cond[prmName]
+            condFound[n] = True
+    return condValues[condIndices], condFound[condIndices]
+
+
+def _dataValues(dataArray, rows, cols):
+    """Returns an object array of the values of a DataHandler array at
+    (rows, cols), as they would be indexed one at a time: numpy scalars for
+    numeric data and `np.ma.masked` for values that were never added.
+    """
+    selected = dataArray[rows, cols]
+    values = np.empty(len(rows), 'O')
+    if selected.dtype == object:
+        values[:] = np.ma.getdata(selected)
+    else:
+        values[:] = list(np.ma.getdata(selected))
+    masked = np.empty(1, 'O')
+    masked[0] = np.ma.masked  # (assigned directly this would become 0.0)
+    values[np.ma.getmaskarray(selected)] = masked
+    return values
+
+
+def _writeDelimitedRows(f, columns, delim, chunkSize=None):
+    """Writes the rows made by a list of columns (sequences of values of
+    the same length) to a text file. Values are converted to text
+    `chunkSize` rows at a time, so the text of the whole table is never in
+    memory at once.
+    """
+    if chunkSize is None:
+        chunkSize = _ROWS_PER_CHUNK
+    nRows = len(columns[0]) if len(columns) else 0
+    for start in range(0, nRows, chunkSize):
+        strColumns = [[str(value) for value in values[start:start + chunkSize]]
+                      for values in columns]
+        f.write(u''.join(delim.join(cells) + '\n'
+                         for cells in zip(*strColumns)))
 
 
 class TrialType(dict):
@@ -65,7 +194,10 @@ class TrialHandler(_BaseTrialHandler):
                  seed=None,
                  originPath=None,
                  name='',
-                 autoLog=True):
+                 autoLog=True,
+                 streamFileName=None,
+                 fsyncInterval=1.0,
+                 memmapDir=None):
         """
 
         :Parameters:
@@ -85,6 +217,9 @@ class TrialHandler(_BaseTrialHandler):
                 which means you could potentially run all trials of
                 one condition before any trial of another.
 
+                Or a design from :mod:`psychopy.data.design` (e.g.
+                ConstrainedRandom or LatinSquare), which makes the order.
+
             dataTypes: (optional) list of names for data storage.
                 e.g. ['corr','rt','resp']. If not provided then these
                 will be created as needed during calls to
@@ -96,7 +231,9 @@ class TrialHandler(_BaseTrialHandler):
 
             seed: an integer
                 If provided then this fixes the random number generator to
-                use the same pattern of trials, by seeding its startpoint
+                use the same pattern of trials, by seeding its startpoint.
+                A `numpy.random.Generator` can be given instead, to make
+                the sequence without reseeding numpy's global generator.
 
             originPath: a string describing the location of the
                 script / experiment file path. The psydat file format will
@@ -105,6 +242,23 @@ class TrialHandler(_BaseTrialHandler):
                 will still store a copy of the script where it was
                 created. If `OriginPath==-1` then nothing will be stored.
 
+            streamFileName: a string (optional)
+                If given, the values of each trial are appended to this
+                file as soon as the trial ends, so they are saved even if
+                the experiment crashes. Use
+                :func:`~psychopy.data.TrialHandler.finalizeStream` to
+                create a wide text file from it.
+
+            fsyncInterval: seconds between forcing the stream file to
+                be written to disk (see
+                :class:`~psychopy.data.streaming.EntryStreamWriter`)
+
+            memmapDir: a folder (optional)
+                If given, data that are vectors of numbers (e.g. eye
+                traces) are kept in memory-mapped files in this folder
+                rather than in memory (see
+                :class:`~psychopy.data.ragged.RaggedArray`).
+
         :Attributes (after creation):
 
             .data - a dictionary (or more strictly, a `DataHandler` sub-
@@ -167,14 +321,14 @@ class TrialHandler(_BaseTrialHandler):
         self.extraInfo = extraInfo
         self.seed = seed
         # create dataHandler
-        self.data = DataHandler(trials=self)
+        self.data = DataHandler(trials=self, memmapDir=memmapDir)
         if dataTypes != None:
             self.data.addDataType(dataTypes)
         self.data.addDataType('ran')
         self.data['ran'].mask = False  # this is a bool; all entries are valid
         self.data.addDataType('order')
         # generate stimulus sequence
-        if self.method in ['random', 'sequential', 'fullRandom']:
+        if _isSequenceMethod(self.method):
             self.sequenceIndices = self._createSequence()
         else:
             self.sequenceIndices = []
@@ -182,6 +336,11 @@ class TrialHandler(_BaseTrialHandler):
         self.originPath, self.origin = self.getOriginPathAndFile(originPath)
         self._exp = None  # the experiment handler that owns me!
 
+        self.streamFileName = streamFileName
+        self.fsyncInterval = fsyncInterval
+        self._streamWriter = None
+        self._streamedN = -1  # thisN of the last trial streamed
+
     def __iter__(self):
         return self
 
@@ -252,30 +411,16 @@ class TrialHandler(_BaseTrialHandler):
 
         To add a new type of sequence (as of v1.65.02):
         - add the sequence generation code here
-        - adjust "if self.method in [ ...]:" in both __init__ and .next()
+        - add it to _isSequenceMethod (used by __init__ and .next())
         - adjust allowedVals in experiment.py -> shows up in DlgLoopProperties
         Note that users can make any sequence whatsoever outside of PsychoPy,
         and specify sequential order; any order is possible this way.
         """
         # create indices for a single rep
         indices = np.asarray(self._makeIndices(self.trialList), dtype=int)
-
-        if self.method == 'random':
-            sequenceIndices = []
-            seed = self.seed
-            for thisRep in range(self.nReps):
-                thisRepSeq = shuffleArray(indices.flat, seed=seed).tolist()
-                seed = None  # so that we only seed the first pass through!
-                sequenceIndices.append(thisRepSeq)
-            sequenceIndices = np.transpose(sequenceIndices)
-        elif self.method == 'sequential':
-            sequenceIndices = np.repeat(indices, self.nReps, 1)
-        elif self.method == 'fullRandom':
-            # indices*nReps, flatten, shuffle, unflatten; only use seed once
-            sequential = np.repeat(indices, self.nReps, 1)  # = sequential
-            randomFlat = shuffleArray(sequential.flat, seed=self.seed)
-            sequenceIndices = np.reshape(
-                randomFlat, (len(indices), self.nReps))
+        sequenceIndices = _createSequenceIndices(indices, self.nReps,
+                                                 self.method, seed=self.seed,
+                                                 trialList=self.trialList)
         if self.autoLog:
             msg = 'Created sequence: %s, trialTypes=%d, nReps=%i, seed=%s'
             vals = (self.method, len(indices), self.nReps, str(self.seed))
@@ -291,26 +436,11 @@ class TrialHandler(_BaseTrialHandler):
         """
         # make sure its an array of objects (can be strings etc)
         inputArray = np.asarray(inputArray, 'O')
-        # get some simple variables for later
         dims = inputArray.shape
-        dimsProd = np.product(dims)
-        dimsN = len(dims)
-        dimsList = list(range(dimsN))
-        listOfLists = []
-        # this creates space for an array of any objects
-        arrayOfTuples = np.ones(dimsProd, 'O')
-
-        # for each dimension create list of its indices (using modulo)
-        for thisDim in dimsList:
-            prevDimsProd = np.product(dims[:thisDim])
-            # NB this means modulus in python
-            thisDimVals = np.arange(dimsProd) / prevDimsProd % dims[thisDim]
-            listOfLists.append(thisDimVals)
-
-        # convert to array
-        indexArr = np.asarray(listOfLists)
-        for n in range(dimsProd):
-            arrayOfTuples[n] = tuple((indexArr[:, n]))
+        # one row of indices (for each dimension) per element
+        indexArr = np.indices(dims).reshape(len(dims), -1).T
+        arrayOfTuples = np.empty(len(indexArr), 'O')
+        arrayOfTuples[:] = [tuple(row) for row in indexArr.tolist()]
         return (np.reshape(arrayOfTuples, dims)).tolist()
 
     def __next__(self):
@@ -333,6 +463,9 @@ class TrialHandler(_BaseTrialHandler):
                     break #break out of the forever loop
                 # do stuff here for the trial
         """
+        # save the trial that has just ended
+        if getattr(self, 'streamFileName', None):
+            self._streamTrial()
         # update pointer for next trials
         self.thisTrialN += 1  # number of trial this pass
         self.thisN += 1  # number of trial in total
@@ -350,7 +483,7 @@ class TrialHandler(_BaseTrialHandler):
             self._terminate()
 
         # fetch the trial info
-        if self.method in ('random', 'sequential', 'fullRandom'):
+        if _isSequenceMethod(self.method):
             self.thisIndex = self.sequenceIndices[
                 self.thisTrialN][self.thisRepN]
             self.thisTrial = self.trialList[self.thisIndex]
@@ -389,6 +522,13 @@ class TrialHandler(_BaseTrialHandler):
         """Does the leg-work for saveAsText and saveAsExcel.
         Combines stimOut with ._parseDataOutput()
         """
+        return list(self._iterOutputArray(stimOut, dataOut,
+                                          matrixOnly=matrixOnly))
+
+    def _iterOutputArray(self, stimOut, dataOut, matrixOnly=False):
+        """Yields the lines of :meth:`_createOutputArray` one at a time, so
+        they can be written as they are made.
+        """
         if (stimOut == [] and
                 len(self.trialList) and
                 hasattr(self.trialList[0], 'keys')):
@@ -399,12 +539,10 @@ class TrialHandler(_BaseTrialHandler):
             if 'float' in stimOut:
                 stimOut.remove('float')
 
-        lines = []
         # parse the dataout section of the output
         dataOut, dataAnal, dataHead = self._createOutputArrayData(dataOut)
         if not matrixOnly:
             thisLine = []
-            lines.append(thisLine)
             # write a header line
             for heading in list(stimOut) + dataHead:
                 if heading == 'ran_sum':
@@ -412,11 +550,11 @@ class TrialHandler(_BaseTrialHandler):
                 elif heading == 'order_raw':
                     heading = 'order'
                 thisLine.append(heading)
+            yield thisLine
 
         # loop through stimuli, writing data
         for stimN in range(len(self.trialList)):
             thisLine = []
-            lines.append(thisLine)
             # first the params for this stim (from self.trialList)
             for heading in stimOut:
                 thisLine.append(self.trialList[stimN][heading])
@@ -454,15 +592,15 @@ class TrialHandler(_BaseTrialHandler):
                         thisLine.append(str(entry))
                 else:
                     thisLine.extend(strVersion.split(','))
+            yield thisLine
 
         # add self.extraInfo
         if (self.extraInfo != None) and not matrixOnly:
-            lines.append([])
+            yield []
             # give a single line of space and then a heading
-            lines.append(['extraInfo'])
+            yield ['extraInfo']
             for key, value in list(self.extraInfo.items()):
-                lines.append([key, value])
-        return lines
+                yield [key, value]
 
     def _createOutputArrayData(self, dataOut):
         """This just creates the dataOut part of the output matrix.
@@ -634,6 +772,74 @@ class TrialHandler(_BaseTrialHandler):
                            fileCollisionMethod=fileCollisionMethod,
                            encoding=encoding)
 
+        header, columns = self._wideTextColumns()
+
+        if not matrixOnly:
+            # write the header row:
+            f.write(delim.join(header) + '\n')
+
+        # write the data matrix:
+        _writeDelimitedRows(f, columns, delim)
+        df = pd.DataFrame(dict(enumerate(columns)),
+                          columns=list(range(len(header))))
+        df.columns = header
+
+        if f != sys.stdout:
+            f.close()
+            logging.info('saved wide-format data to %s' % f.name)
+
+        # Converts numbers to numeric, such as float64, boolean to bool.
+        # Otherwise they all are "object" type, i.e. strings
+        # df = df.convert_objects()
+        return df
+
+    def _wideTextColumns(self):
+        """Returns the header and the columns (object arrays of the values
+        of every trial) of saveAsWideText"""
+        header = self._wideTextHeader()
+
+        # the condition index and the repeat number of that condition for
+        # each trial (in the order they were run); one column of values is
+        # gathered at a time for all the trials
+        condIndices = self.sequenceIndices.T.ravel()
+        condReps = _repeatNumbers(condIndices)
+        nTrials = len(condIndices)
+        columns = []
+        for prmName in header:
+            # the header includes both trial and data variables, so
+            # need to check before accessing:
+            values, found = _conditionValues(self.trialList, prmName,
+                                             condIndices)
+            if not found.all():
+                if prmName in self.data:
+                    other = _dataValues(self.data[prmName],
+                                        condIndices[~found],
+                                        condReps[~found])
+                elif self.extraInfo != None and prmName in self.extraInfo:
+                    # (in an array, so a list value isn't split up)
+                    other = np.empty(1, 'O')
+                    other[0] = self.extraInfo[prmName]
+                elif prmName == "TrialNumber":
+                    # a trial number so the original order of the data can
+                    # always be recovered if sorted during analysis:
+                    other = np.arange(1, nTrials + 1)[~found]
+                else:
+                    # allow a null value if this parameter wasn't
+                    # explicitly stored on this trial:
+                    other = ''
+                values[~found] = other
+            columns.append(values)
+
+        return header, columns
+
+    def _getColumnarData(self):
+        if self.thisTrialN < 1 and self.thisRepN < 1:
+            return None
+        header, columns = self._wideTextColumns()
+        return header, columns, {}
+
+    def _wideTextHeader(self):
+        """Returns the column names used by saveAsWideText"""
         # collect parameter names related to the stimuli:
         if self.trialList[0]:
             header = list(self.trialList[0].keys())
@@ -648,82 +854,75 @@ class TrialHandler(_BaseTrialHandler):
         if self.extraInfo is not None:
             for key in self.extraInfo:
                 header.insert(0, key)
-        df = pd.DataFrame(columns=header)
-
-        # loop through each trial, gathering the actual values:
-        dataOut = []
-        trialCount = 0
-        # total number of trials = number of trialtypes * number of
-        # repetitions:
-
-        repsPerType = {}
-        for rep in range(self.nReps):
-            for trialN in range(len(self.trialList)):
-                # find out what trial type was on this trial
-                trialTypeIndex = self.sequenceIndices[trialN, rep]
-                # determine which repeat it is for this trial
-                if trialTypeIndex not in repsPerType:
-                    repsPerType[trialTypeIndex] = 0
-                else:
-                    repsPerType[trialTypeIndex] += 1
-                # what repeat are we on for this trial type?
-                trep = repsPerType[trialTypeIndex]
-
-                # create a dictionary representing each trial:
-                nextEntry = {}
-
-                # add a trial number so the original order of the data can
-                # always be recovered if sorted during analysis:
-                trialCount += 1
-
-                # now collect the value from each trial of vars in header:
-                for prmName in header:
-                    # the header includes both trial and data variables, so
-                    # need to check before accessing:
-                    tti = trialTypeIndex
-                    if self.trialList[tti] and prmName in self.trialList[tti]:
-                        nextEntry[prmName] = self.trialList[tti][prmName]
-                    elif prmName in self.data:
-                        nextEntry[prmName] = self.data[prmName][tti][trep]
-                    elif self.extraInfo != None and prmName in self.extraInfo:
-                        nextEntry[prmName] = self.extraInfo[prmName]
-                    else:
-                        # allow a null value if this parameter wasn't
-                        # explicitly stored on this trial:
-                        if prmName == "TrialNumber":
-                            nextEntry[prmName] = trialCount
-                        else:
-                            nextEntry[prmName] = ''
+        return header
 
-                # store this trial's data
-                dataOut.append(nextEntry)
-                df = df.append(nextEntry, ignore_index=True)
-
-        if not matrixOnly:
-            # write the header row:
-            nextLine = ''
-            for prmName in header:
-                nextLine = nextLine + prmName + delim
-            # remove the final orphaned tab character
-            f.write(nextLine[:-1] + '\n')
-
-        # write the data matrix:
-        for trial in dataOut:
-            nextLine = ''
-            for prmName in header:
-                nextLine = nextLine + str(trial[prmName]) + delim
-            # remove the final orphaned tab character
-            nextLine = nextLine[:-1]
-            f.write(nextLine + '\n')
+    def _streamTrial(self):
+        """Appends the values of the current trial to the stream file, in
+        the form used by saveAsWideText, if that has not been done yet.
+        """
+        if self.thisN < 0 or self.thisN == self._streamedN or \
+                not _isSequenceMethod(self.method):
+            return
+        if self._streamWriter is None:
+            self._streamWriter = EntryStreamWriter(
+                self.streamFileName, fsyncInterval=self.fsyncInterval)
+        entry = {}
+        if self.extraInfo is not None:
+            entry.update(self.extraInfo)
+        entry['TrialNumber'] = self.thisN + 1
+        thisTrial = self.trialList[self.thisIndex]
+        if self.trialList[0]:
+            for prmName in self.trialList[0]:
+                if thisTrial and prmName in thisTrial:
+                    entry[prmName] = thisTrial[prmName]
+                else:
+                    entry[prmName] = ''
+        # the repeat of this trial type that has just been run
+        repN = int(self.data['ran'][self.thisIndex].sum()) - 1
+        for dataType in self.data.dataTypes:
+            entry[dataType] = self.data[dataType][self.thisIndex][repN]
+        self._streamWriter.addEntry(entry)
+        self._streamedN = self.thisN
+
+    def finalizeStream(self, fileName,
+                       delim=None,
+                       matrixOnly=False,
+                       appendFile=True,
+                       encoding='utf-8-sig',
+                       fileCollisionMethod='rename'):
+        """Write a wide text file, in the layout of
+        :meth:`saveAsWideText` but with trials in the order they were run,
+        from the trials streamed to `streamFileName`. If the loop has not
+        finished, the current trial is streamed first. This ends streaming
+        and deletes the stream files.
 
-        if f != sys.stdout:
-            f.close()
-            logging.info('saved wide-format data to %s' % f.name)
+        :Parameters: as for :meth:`saveAsWideText`
+        """
+        if self._streamWriter is None and self.thisN < 0:
+            logging.info('TrialHandler.finalizeStream called but no '
+                         'trials completed. Nothing saved')
+            return -1
+        if not self.finished:
+            # otherwise the last trial was streamed by the final next()
+            self._streamTrial()
+        writer = self._streamWriter
+        writer.close()
 
-        # Converts numbers to numeric, such as float64, boolean to bool.
-        # Otherwise they all are "object" type, i.e. strings
-        # df = df.convert_objects()
-        return df
+        # set default delimiter if none given
+        if delim is None:
+            delim = genDelimiter(fileName)
+        fileName = genFilenameFromDelimiter(fileName, delim)
+        # data values that were not stored are masked in saveAsWideText
+        finalizeEntryStream(writer.fileName, fileName,
+                            names=self._wideTextHeader(), delim=delim,
+                            matrixOnly=matrixOnly, appendFile=appendFile,
+                            encoding=encoding,
+                            fileCollisionMethod=fileCollisionMethod,
+                            trailingDelim=False, quoteCells=False,
+                            missingValue=u'--')
+        writer.remove()
+        self._streamWriter = None
+        self.streamFileName = None
 
     def saveAsJson(self,
                    fileName=None,
@@ -785,6 +984,9 @@ class TrialHandler2(_BaseTrialHandler):
                 you could potentially run all trials of one condition
                 before any trial of another.
 
+                Or a design from :mod:`psychopy.data.design` (e.g.
+                ConstrainedRandom or LatinSquare), which makes the order.
+
             dataTypes: (optional) list of names for data storage.
                 e.g. ['corr','rt','resp']. If not provided then these
                 will be created as needed during calls to
@@ -860,8 +1062,6 @@ class TrialHandler2(_BaseTrialHandler):
         self.nReps = int(nReps)
         self.nTotal = self.nReps * len(self.trialList)
         self.nRemaining = self.nTotal  # subtract 1 each trial
-        self.remainingIndices = []
-        self.prevIndices = []
         self.method = method
         self.thisRepN = 0  # records which repetition or pass we are on
         self.thisTrialN = -1  # records trial number within this repetition
@@ -872,6 +1072,10 @@ class TrialHandler2(_BaseTrialHandler):
         self.extraInfo = extraInfo
         self.seed = seed
         self._rng = np.random.RandomState(seed=seed)
+        # the conditions index of every trial, in the order they will run
+        self._sequence = self._createSequence()
+        # for fullRandom, the number of times each condition has been run
+        self._condRepNs = [0] * len(self.trialList)
 
         # store a list of dicts, convert to pandas DataFrame on access
         self._data = []
@@ -879,6 +1083,55 @@ class TrialHandler2(_BaseTrialHandler):
         self.originPath, self.origin = self.getOriginPathAndFile(originPath)
         self._exp = None  # the experiment handler that owns me!
 
+    def _createSequence(self):
+        """Returns the conditions index of every trial, for all repeats,
+        as a list.
+
+        The shuffles are the same (and in the same order) as those of a
+        sequence created one repeat at a time, so a seed gives the same
+        trials as before.
+        """
+        nConds = len(self.trialList)
+        if self.method == 'fullRandom':
+            sequence = np.tile(np.arange(nConds), self.nReps)
+            self._rng.shuffle(sequence)
+        elif self.method in ('sequential', 'random'):
+            reps = []
+            for repN in range(self.nReps):
+                rep = np.arange(nConds)
+                if self.method == 'random':
+                    self._rng.shuffle(rep)  # shuffle in-place
+                reps.append(rep)
+            sequence = np.concatenate(reps) if reps else np.arange(0)
+        elif isinstance(self.method, SequenceDesign):
+            sequence = self.method.createSequenceIndices(
+                np.arange(nConds), self.nReps, trialList=self.trialList,
+                seed=self._rng).T.ravel()
+        else:
+            raise ValueError('Unknown sequence method: %r' % self.method)
+        return sequence.tolist()
+
+    @property
+    def remainingIndices(self):
+        """The conditions indices of the trials still to come in this
+        repeat (or in the whole run, for fullRandom)
+        """
+        if self.thisN < 0:
+            return []
+        if self.method == 'fullRandom':
+            return self._sequence[self.thisN + 1:]
+        nConds = len(self.trialList)
+        repEnd = (self.thisN // nConds + 1) * nConds
+        return self._sequence[self.thisN + 1:repEnd]
+
+    @property
+    def prevIndices(self):
+        """The conditions indices of the trials before the current one
+        """
+        if self.thisN < 0:
+            return []
+        return self._sequence[:self.thisN]
+
     def __iter__(self):
         return self
 
@@ -972,44 +1225,24 @@ class TrialHandler2(_BaseTrialHandler):
         self.thisTrialN += 1  # number of trial this pass
         self.thisN += 1  # number of trial in total
         self.nRemaining -= 1
-        if self.thisIndex is not None:
-            self.prevIndices.append(self.thisIndex)
-
-        # thisRepN has exceeded nReps
-        if self.remainingIndices == []:
-            # we've just started, or just starting a new repeat
-            sequence = list(range(len(self.trialList)))
-            if (self.method == 'fullRandom' and
-                        self.thisN < (self.nReps * len(self.trialList))):
-                # we've only just started on a fullRandom sequence
-                sequence *= self.nReps
-                self._rng.shuffle(sequence)
-                self.remainingIndices = sequence
-            elif (self.method in ('sequential', 'random') and
-                          self.thisRepN < self.nReps):
-                # start a new repetition
-                self.thisTrialN = 0
-                self.thisRepN += 1
-                if self.method == 'random':
-                    self._rng.shuffle(sequence)  # shuffle in-place
-                self.remainingIndices = sequence
-            else:
-                # we've finished
-                self.finished = True
-                self._terminate()  # raises Stop (code won't go beyond here)
+        if self.thisN >= len(self._sequence):
+            # we've finished
+            self.finished = True
+            self._terminate()  # raises Stop (code won't go beyond here)
 
         # fetch the trial info
-        if len(self.trialList) == 0:
-            self.thisIndex = 0
-            self.thisTrial = {}
-        else:
-            self.thisIndex = self.remainingIndices.pop(0)
-            # if None then use empty dict
-            thisTrial = self.trialList[self.thisIndex] or {}
-            self.thisTrial = copy.copy(thisTrial)
-        # for fullRandom check how many times this has come up before
+        self.thisIndex = self._sequence[self.thisN]
+        # if None then use empty dict
+        thisTrial = self.trialList[self.thisIndex] or {}
+        self.thisTrial = copy.copy(thisTrial)
         if self.method == 'fullRandom':
-            self.thisRepN = self.prevIndices.count(self.thisIndex)
+            # how many times this has come up before
+            self.thisRepN = self._condRepNs[self.thisIndex]
+            self._condRepNs[self.thisIndex] += 1
+        elif self.thisN % len(self.trialList) == 0:
+            # starting a new repetition
+            self.thisTrialN = 0
+            self.thisRepN += 1
 
         # update data structure with new info
         self._data.append(self.thisTrial)  # update the data list of dicts
@@ -1033,9 +1266,7 @@ class TrialHandler2(_BaseTrialHandler):
         # offsets:
         if n > self.nRemaining or self.thisN + n < 0:
             return None
-        seqs = np.array(self.sequenceIndices).transpose().flat
-        condIndex = seqs[self.thisN + n]
-        return self.trialList[condIndex]
+        return self.trialList[self._sequence[self.thisN + n]]
 
     def getEarlierTrial(self, n=-1):
         """Returns the condition information from n trials previously.
@@ -1128,6 +1359,15 @@ class TrialHandler2(_BaseTrialHandler):
         if (fileName is not None) and (fileName != 'stdout'):
             logging.info('saved wide-format data to %s' % f.name)
 
+    def _getColumnarData(self):
+        if not self._data:
+            return None
+        # the values of each column, by trial, in the order of the
+        # wide text file
+        columns = [[trial.get(name) for trial in self._data]
+                   for name in self.columns]
+        return list(self.columns), columns, {}
+
     def saveAsJson(self,
                    fileName=None,
                    encoding='utf-8',
@@ -1223,7 +1463,8 @@ class TrialHandlerExt(TrialHandler):
                  seed=None,
                  originPath=None,
                  name='',
-                 autoLog=True):
+                 autoLog=True,
+                 memmapDir=None):
         """
 
         :Parameters:
@@ -1255,6 +1496,8 @@ class TrialHandlerExt(TrialHandler):
                 'fulLRandom' shuffles trial order across weights an nRep,
                 that is, a full shuffling.
 
+                Or a design from :mod:`psychopy.data.design`, which makes
+                the order of the trials (with the weights).
 
             dataTypes: (optional) list of names for data storage. e.g.
                 ['corr','rt','resp']. If not provided then these will be
@@ -1268,7 +1511,9 @@ class TrialHandlerExt(TrialHandler):
             seed: an integer
                 If provided then this fixes the random number generator
                 to use the same pattern
-                of trials, by seeding its startpoint
+                of trials, by seeding its startpoint. A
+                `numpy.random.Generator` can be given instead, to make
+                the sequence without reseeding numpy's global generator.
 
             originPath: a string describing the location of the script /
                 experiment file path. The psydat file format will store a
@@ -1277,6 +1522,11 @@ class TrialHandlerExt(TrialHandler):
                 copy of the script where it was created. If `OriginPath==-1`
                 then nothing will be stored.
 
+            memmapDir: a folder (optional)
+                If given, data that are vectors of numbers (e.g. eye
+                traces) are kept in memory-mapped files in this folder
+                rather than in memory, as for TrialHandler.
+
         :Attributes (after creation):
 
             .data - a dictionary of numpy arrays, one for each data type
@@ -1350,17 +1600,18 @@ class TrialHandlerExt(TrialHandler):
         self.seed = seed
         # create dataHandler
         if self.trialWeights is None:
-            self.data = DataHandler(trials=self)
+            self.data = DataHandler(trials=self, memmapDir=memmapDir)
         else:
             self.data = DataHandler(trials=self,
-                                    dataShape=[sum(self.trialWeights), nReps])
+                                    dataShape=[sum(self.trialWeights), nReps],
+                                    memmapDir=memmapDir)
         if dataTypes is not None:
             self.data.addDataType(dataTypes)
         self.data.addDataType('ran')
         self.data['ran'].mask = False  # bool - all entries are valid
         self.data.addDataType('order')
         # generate stimulus sequence
-        if self.method in ('random', 'sequential', 'fullRandom'):
+        if _isSequenceMethod(self.method):
             self.sequenceIndices = self._createSequence()
         else:
             self.sequenceIndices = []
@@ -1401,7 +1652,7 @@ class TrialHandlerExt(TrialHandler):
 
         To add a new type of sequence (as of v1.65.02):
         - add the sequence generation code here
-        - adjust "if self.method in [ ...]:" in both __init__ and .next()
+        - add it to _isSequenceMethod (used by __init__ and .next())
         - adjust allowedVals in experiment.py -> shows up in DlgLoopProperties
         Note that users can make any sequence whatsoever outside of PsychoPy,
         and specify sequential order; any order is possible this way.
@@ -1409,45 +1660,17 @@ class TrialHandlerExt(TrialHandler):
         # create indices for a single rep
         indices = np.asarray(self._makeIndices(self.trialList), dtype=int)
 
-        repeat = np.repeat
-        reshape = np.reshape
-        if self.method == 'random':
-            seqIndices = []
-            seed = self.seed
-            for thisRep in range(self.nReps):
-                if self.trialWeights is None:
-                    idx = indices.flat
-                else:
-                    idx = repeat(indices, self.trialWeights)
-                thisRepSeq = shuffleArray(idx, seed=seed).tolist()
-                seed = None  # so that we only seed the first pass through!
-                seqIndices.append(thisRepSeq)
-            seqIndices = np.transpose(seqIndices)
-        elif self.method == 'sequential':
-            if self.trialWeights is None:
-                seqIndices = repeat(indices, self.nReps, 1)
-            else:
-                _base = repeat(indices, self.trialWeights, 0)
-                seqIndices = repeat(_base, self.nReps, 1)
-        elif self.method == 'fullRandom':
-            if self.trialWeights is None:
-                # indices * nReps, flatten, shuffle, unflatten;
-                # only use seed once
-                sequential = repeat(indices, self.nReps, 1)
-                randomFlat = shuffleArray(sequential.flat, seed=self.seed)
-                seqIndices = reshape(randomFlat,
-                                     (len(indices), self.nReps))
-            else:
-                _base = repeat(indices, self.trialWeights, 0)
-                sequential = repeat(_base, self.nReps, 1)
-                randomFlat = shuffleArray(sequential.flat, seed=self.seed)
-                seqIndices = reshape(randomFlat,
-                                     (sum(self.trialWeights), self.nReps))
+        if self.trialWeights is not None:
+            indices = np.repeat(indices, self.trialWeights)
+        seqIndices = _createSequenceIndices(indices, self.nReps,
+                                            self.method, seed=self.seed,
+                                            trialList=self.trialList)
 
         if self.autoLog:
             # Change
             msg = 'Created sequence: %s, trialTypes=%d, nReps=%d, seed=%s'
-            vals = (self.method, len(indices), self.nReps, str(self.seed))
+            vals = (self.method, len(self.trialList), self.nReps,
+                    str(self.seed))
             logging.exp(msg % vals)
         return seqIndices
 
@@ -1496,7 +1719,7 @@ class TrialHandlerExt(TrialHandler):
             self._terminate()
 
         # fetch the trial info
-        if self.method in ('random', 'sequential', 'fullRandom'):
+        if _isSequenceMethod(self.method):
             if self.trialWeights is None:
                 idx = self.sequenceIndices[self.thisTrialN]
                 self.thisIndex = idx[self.thisRepN]
@@ -1550,8 +1773,8 @@ class TrialHandlerExt(TrialHandler):
 
             # get the number of the trial presented by summing in ran for the
             # rows above and all columns
-            nThisTrialPresented = np.sum(
-                self.data['ran'][firstRowIndex:lastRowIndex, :])
+            nThisTrialPresented = int(np.sum(
+                self.data['ran'][firstRowIndex:lastRowIndex, :]))
 
             _tw = self.trialWeights[self.thisIndex]
             dataRowThisTrial = firstRowIndex + (nThisTrialPresented - 1) % _tw
@@ -1580,8 +1803,8 @@ class TrialHandlerExt(TrialHandler):
 
             # get the number of the trial presented by summing in ran for the
             # rows above and all columns
-            nThisTrialPresented = np.sum(
-                self.data['ran'][firstRowIndex:lastRowIndex, :])
+            nThisTrialPresented = int(np.sum(
+                self.data['ran'][firstRowIndex:lastRowIndex, :]))
 
             _tw = self.trialWeights[self.thisIndex]
             dataRowThisTrial = firstRowIndex + nThisTrialPresented % _tw
@@ -1612,9 +1835,18 @@ class TrialHandlerExt(TrialHandler):
         """
 
         if self.trialWeights is not None:
-            # remember to use other array instead of self.data
-            _vals = np.arange(len(self.trialList))
-            idx_data = np.repeat(_vals, self.trialWeights)
+            # remember to use other array instead of self.data, with one row
+            # per condition holding its values repeat by repeat. Find where
+            # each value of self.data goes in that array:
+            weights = np.asarray(self.trialWeights, dtype=int)
+            nResizedCols = max(self.trialWeights) * self.nReps
+            idx_data = np.repeat(np.arange(len(self.trialList)), weights)
+            rowInCond = (np.arange(len(idx_data)) -
+                         (np.cumsum(weights) - weights)[idx_data])
+            resizedRows = idx_data[:, np.newaxis]
+            resizedCols = (np.arange(self.nReps)[np.newaxis, :] *
+                           weights[idx_data][:, np.newaxis] +
+                           rowInCond[:, np.newaxis])
 
         # list of data headers
         dataHead = []
@@ -1672,35 +1904,17 @@ class TrialHandlerExt(TrialHandler):
                 dataOutInvalid.append(thisDataOut)
                 continue
 
-            if self.trialWeights is None:
-                thisData = self.data[dataType]
-            else:
-                resizedData = np.ma.masked_array(
-                    np.zeros((len(self.trialList),
-                                 max(self.trialWeights) * self.nReps)),
-                    np.ones((len(self.trialList),
-                                max(self.trialWeights) * self.nReps),
-                               dtype=bool))
-                for curTrialIndex in range(len(self.trialList)):
-                    thisDataChunk = self.data[dataType][
-                                    idx_data == curTrialIndex, :]
-                    padWidth = (max(self.trialWeights) * self.nReps -
-                                np.prod(thisDataChunk.shape))
-                    thisDataChunkRowPadded = np.pad(
-                        thisDataChunk.transpose().flatten().data,
-                        (0, padWidth), mode='constant',
-                        constant_values=(0, 0))
-                    thisDataChunkRowPaddedMask = np.pad(
-                        thisDataChunk.transpose().flatten().mask,
-                        (0, padWidth), mode='constant',
-                        constant_values=(0, True))
-
-                    thisDataChunkRow = np.ma.masked_array(
-                        thisDataChunkRowPadded,
-                        mask=thisDataChunkRowPaddedMask)
-                    resizedData[curTrialIndex, :] = thisDataChunkRow
-
-                thisData = resizedData
+            thisData = self.data[dataType]
+            if self.trialWeights is not None:
+                values = np.ma.getdata(thisData)
+                shape = (len(self.trialList), nResizedCols)
+                resizedValues = np.zeros(
+                    shape, dtype=np.result_type(float, values.dtype))
+                resizedMask = np.ones(shape, dtype=bool)
+                resizedValues[resizedRows, resizedCols] = values
+                resizedMask[resizedRows, resizedCols] = \
+                    np.ma.getmaskarray(thisData)
+                thisData = np.ma.masked_array(resizedValues, resizedMask)
 
             # set the header
             dataHead.append(dataType + '_' + analType)
@@ -1812,93 +2026,98 @@ class TrialHandlerExt(TrialHandler):
                            fileCollisionMethod=fileCollisionMethod,
                            encoding=encoding)
 
-        # collect parameter names related to the stimuli:
-        if self.trialList[0]:
-            header = list(self.trialList[0].keys())
-        else:
-            header = []
-        # and then add parameter names related to data (e.g. RT)
-        header.extend(self.data.dataTypes)
-
-        # loop through each trial, gathering the actual values:
-        dataOut = []
-        trialCount = 0
-        # total number of trials = number of trialtypes * number of
-        # repetitions:
-
-        repsPerType = {}
-        for rep in range(self.nReps):
-            if self.trialWeights is None:
-                nRows = len(self.trialList)
-            else:
-                nRows = sum(self.trialWeights)
-
-            for trialN in range(nRows):
-                # find out what trial type was on this trial
-                trialTypeIndex = self.sequenceIndices[trialN, rep]
-                # determine which repeat it is for this trial
-                if trialTypeIndex not in repsPerType:
-                    repsPerType[trialTypeIndex] = 0
-                else:
-                    repsPerType[trialTypeIndex] += 1
-
-                # create a dictionary representing each trial:
-                # this is wide format, so we want fixed information (e.g.
-                # subject ID, date, etc) repeated every line if it exists:
-                if self.extraInfo != None:
-                    nextEntry = self.extraInfo.copy()
-                else:
-                    nextEntry = {}
-
-                # add a trial number so the original order of the data can
-                # always be recovered if sorted during analysis:
-                trialCount += 1
-                nextEntry["TrialNumber"] = trialCount
-
-                # what repeat are we on for this trial type?
-                trep = repsPerType[trialTypeIndex]
-                # collect the value from each trial of the vars in the header:
-                tti = trialTypeIndex
-                for prmName in header:
-                    # the header includes both trial and data variables, so
-                    # need to check before accessing:
-                    if self.trialList[tti] and prmName in self.trialList[tti]:
-                        nextEntry[prmName] = self.trialList[tti][prmName]
-                    elif prmName in self.data:
-                        if self.trialWeights is None:
-                            nextEntry[prmName] = self.data[prmName][tti][trep]
-                        else:
-                            firstRowIndex = sum(self.trialWeights[:tti])
-                            _tw = self.trialWeights[tti]
-                            row = firstRowIndex + rep % _tw
-                            col = int(old_div(rep, _tw))
-                            nextEntry[prmName] = self.data[prmName][row][col]
-                    else:
-                        # allow a null value if this parameter wasn't
-                        # explicitly stored on this trial:
-                        nextEntry[prmName] = ''
-
-                # store this trial's data
-                dataOut.append(nextEntry)
-
-        # get the extra 'wide' parameter names into the header line:
-        header.insert(0, "TrialNumber")
-        if self.extraInfo is not None:
-            for key in self.extraInfo:
-                header.insert(0, key)
+        header = self._wideTextHeader()
+        condIndices, dataRows, dataCols = self._wideTextIndices()
+        nTrials = len(condIndices)
 
         # write a header row:
         if not matrixOnly:
             f.write(delim.join(header) + '\n')
-        # write the data matrix:
-        for trial in dataOut:
-            line = delim.join([str(trial[prm]) for prm in header])
-            f.write(line + '\n')
+        # write the data matrix, gathering one column of values at a time
+        # for a chunk of trials, so memory use doesn't grow with the
+        # number of trials:
+        for start in range(0, nTrials, _ROWS_PER_CHUNK):
+            chunk = slice(start, start + _ROWS_PER_CHUNK)
+            columns = self._wideTextChunkColumns(
+                header, condIndices[chunk], dataRows[chunk], dataCols[chunk],
+                np.arange(nTrials)[chunk] + 1)
+            _writeDelimitedRows(f, columns, delim)
 
         if (fileName is not None) and (fileName != 'stdout'):
             f.close()
             logging.info('saved wide-format data to %s' % f.name)
 
+    def _wideTextIndices(self):
+        """Returns the condition index of each trial (in the order they
+        were run) and the row and column of its values in the data arrays.
+        """
+        nRows, nReps = self.sequenceIndices.shape
+        condIndices = self.sequenceIndices.T.ravel()
+        if self.trialWeights is None:
+            dataRows = condIndices
+            dataCols = _repeatNumbers(condIndices)
+        else:
+            weights = np.asarray(self.trialWeights, dtype=int)
+            firstRowIndices = np.cumsum(weights) - weights
+            reps = np.repeat(np.arange(nReps), nRows)
+            trialWeights = weights[condIndices]
+            dataRows = firstRowIndices[condIndices] + reps % trialWeights
+            dataCols = reps // trialWeights
+        return condIndices, dataRows, dataCols
+
+    def _getColumnarData(self):
+        if self.thisTrialN < 1 and self.thisRepN < 1:
+            return None
+        header = self._wideTextHeader()
+        condIndices, dataRows, dataCols = self._wideTextIndices()
+        columns = self._wideTextChunkColumns(
+            header, condIndices, dataRows, dataCols,
+            np.arange(1, len(condIndices) + 1))
+        return header, columns, {'trialWeights': self.trialWeights}
+
+    def _wideTextChunkColumns(self, header, condIndices, dataRows,
+                              dataCols, trialNumbers):
+        """Returns the columns of saveAsWideText, in the order of `header`,
+        for the trials with the given condition indices, positions in the
+        data arrays and trial numbers.
+        """
+        nTrials = len(condIndices)
+        # this is wide format, so we want fixed information (e.g.
+        # subject ID, date, etc) repeated every line if it exists:
+        columns = {}
+        if self.extraInfo != None:
+            for key, value in self.extraInfo.items():
+                # (in an array, so a list value isn't split up)
+                constant = np.empty(1, 'O')
+                constant[0] = value
+                columns[key] = np.repeat(constant, nTrials)
+        # add a trial number so the original order of the data can
+        # always be recovered if sorted during analysis:
+        columns["TrialNumber"] = trialNumbers
+
+        # collect the value from each trial of the parameters related to the
+        # stimuli and to the data (e.g. RT):
+        if self.trialList[0]:
+            prmNames = list(self.trialList[0].keys())
+        else:
+            prmNames = []
+        for prmName in prmNames + list(self.data.dataTypes):
+            # the header includes both trial and data variables, so
+            # need to check before accessing:
+            values, found = _conditionValues(self.trialList, prmName,
+                                             condIndices)
+            if not found.all():
+                if prmName in self.data:
+                    values[~found] = _dataValues(self.data[prmName],
+                                                 dataRows[~found],
+                                                 dataCols[~found])
+                else:
+                    # allow a null value if this parameter wasn't
+                    # explicitly stored on this trial:
+                    values[~found] = ''
+            columns[prmName] = values
+        return [columns[prmName] for prmName in header]
+
     def saveAsJson(self,
                    fileName=None,
                    encoding='utf-8',
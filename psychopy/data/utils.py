@@ -11,7 +11,10 @@ from past.builtins import basestring
 import os
 import re
 import ast
+import copy
+import itertools
 import pickle
+import hashlib
 import time
 import codecs
 import numpy as np
@@ -192,7 +195,148 @@ def listFromString(val):
     return asList
 
 
-def importConditions(fileName, returnFieldNames=False, selection=""):
+# parsed conditions files, keyed by absolute file path
+_conditionsCache = {}
+_CONDITIONS_CACHE_VERSION = 1
+
+
+def _strToFloat(cell):
+    """Converts a string that is a number, with either a decimal point or a
+    decimal comma, to a float. Other values are returned unchanged.
+    """
+    if isinstance(cell, str):
+        try:
+            return float(cell.replace(",", "."))
+        except ValueError:
+            pass
+    return cell
+
+
+def _convertCell(cell):
+    """Converts a cell of a text (object) column read by pandas to the value
+    used in a trialList
+    """
+    if isinstance(cell, np.string_):
+        cell = str(cell.decode('utf-8-sig'))
+    if isinstance(cell, basestring):
+        # replace escaped new line characters
+        cell = cell.replace('\\n', '\n')
+        # if it looks like a list, convert it:
+        if cell.startswith('[') and cell.endswith(']'):
+            cell = eval(cell)
+    elif isinstance(cell, float) and np.isnan(cell):
+        cell = None
+    return cell
+
+
+def _mapUnique(values, func):
+    """Returns `[func(v) for v in values]`, calling func only once for each
+    distinct value. Mutable results (e.g. lists from a cell like '[1, 2]')
+    are copied so that trials do not share them.
+    """
+    converted = {}
+    result = []
+    for value in values:
+        try:
+            key = (type(value), value)
+            newValue = converted[key]
+        except TypeError:  # unhashable
+            newValue = func(value)
+        except KeyError:
+            newValue = converted[key] = func(value)
+        if isinstance(newValue, (list, dict)):
+            newValue = copy.deepcopy(newValue)
+        result.append(newValue)
+    return result
+
+
+def _fileStamp(fileName):
+    stat = os.stat(fileName)
+    return stat.st_mtime, stat.st_size
+
+
+def _fileDigest(fileName):
+    digest = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _conditionsCachePath(fileName):
+    from psychopy import prefs
+    key = hashlib.sha1(os.path.abspath(fileName).encode('utf-8'))
+    return os.path.join(prefs.paths['userPrefsDir'], 'cache', 'conditions',
+                        key.hexdigest()[:16] + '.pkl')
+
+
+def _loadCachedConditions(fileName):
+    """Returns (trialList, fieldNames) from the conditions cache, or None if
+    the file has not been cached or has changed since it was.
+
+    A cached entry is valid if the file's modification time and size are
+    unchanged. Otherwise its contents are compared with the cached ones (so
+    e.g. copying the file again doesn't mean it has to be parsed again).
+    """
+    absPath = os.path.abspath(fileName)
+    stamp = _fileStamp(fileName)
+    entry = _conditionsCache.get(absPath)
+    if entry is None:
+        try:
+            with open(_conditionsCachePath(fileName), 'rb') as f:
+                entry = pickle.load(f)
+            if entry.get('version') != _CONDITIONS_CACHE_VERSION:
+                entry = None
+        except Exception:
+            entry = None  # no cache file, or it can't be read
+        if entry is None:
+            return None
+    if entry['stamp'] != stamp:
+        if entry['digest'] != _fileDigest(fileName):
+            return None
+        entry['stamp'] = stamp
+        _writeConditionsCache(fileName, entry)
+    _conditionsCache[absPath] = entry
+    # unpickle a new copy each time, so changes to the trialList returned
+    # don't change the cached one
+    return pickle.loads(entry['data'])
+
+
+def _saveCachedConditions(fileName, trialList, fieldNames):
+    """Adds the parsed conditions of fileName to the conditions cache"""
+    try:
+        data = pickle.dumps((trialList, fieldNames),
+                            protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return  # e.g. a cell of an Excel file with an unpicklable value
+    entry = {'version': _CONDITIONS_CACHE_VERSION,
+             'stamp': _fileStamp(fileName),
+             'digest': _fileDigest(fileName),
+             'data': data}
+    _conditionsCache[os.path.abspath(fileName)] = entry
+    _writeConditionsCache(fileName, entry)
+
+
+def _writeConditionsCache(fileName, entry):
+    cachePath = _conditionsCachePath(fileName)
+    try:
+        if not os.path.isdir(os.path.dirname(cachePath)):
+            os.makedirs(os.path.dirname(cachePath))
+        # write to a temporary file first so a partly written cache file
+        # is never read
+        tmpPath = cachePath + '.%i.tmp' % os.getpid()
+        with open(tmpPath, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if os.path.isfile(cachePath):
+            os.remove(cachePath)
+        os.rename(tmpPath, cachePath)
+    except (IOError, OSError) as err:
+        logging.debug(u"Could not write conditions cache {}: {}".format(
+            cachePath, err))
+
+
+def importConditions(fileName, returnFieldNames=False, selection="",
+                     cache=True):
     """Imports a list of conditions from an .xlsx, .csv, or .pkl file
 
     The output is suitable as an input to :class:`TrialHandler`
@@ -227,28 +371,29 @@ def importConditions(fileName, returnFieldNames=False, selection=""):
         - slice(-10, 2, None)  # the same as above
         - random(5) * 8  # five random vals 0-7
 
+    If `cache` is True (default), the parsed conditions of .csv, .tsv and
+    Excel files are kept in memory and in a cache folder of the user's
+    PsychoPy preferences folder, so importing the same (unchanged) file
+    again, e.g. at the start of each block, does not parse it again. A
+    cached copy is used while the file's modification time and size, or
+    failing that its contents, are unchanged. If `cache` is False, only the
+    selected rows of the file are converted.
+
     """
 
-    def _attemptImport(fileName, sep=',', dec='.'):
+    def _attemptImport(fileName, sep=',', dec='.', selection=None):
         """Attempts to import file with specified settings and raises
         ConditionsImportError if fails due to invalid format
 
         :param filename: str
         :param sep: str indicating the separator for cells (',', ';' etc)
         :param dec: str indicating the decimal point ('.', '.')
+        :param selection: slice or list of row indices to convert
         :return: trialList, fieldNames
         """
         if fileName.endswith(('.csv', '.tsv')):
             trialsArr = pd.read_csv(fileName, encoding='utf-8-sig',
                                     sep=sep, decimal=dec)
-            for col in trialsArr.columns:
-                for row, cell in enumerate(trialsArr[col]):
-                    if isinstance(cell, str):
-                        tryVal = cell.replace(",", ".")
-                        try:
-                            trialsArr[col][row] = float(tryVal)
-                        except ValueError:
-                            pass
             logging.debug(u"Read csv file with pandas: {}".format(fileName))
         elif fileName.endswith(('.xlsx', '.xlsm')):
             trialsArr = pd.read_excel(fileName, engine='openpyxl')
@@ -260,6 +405,16 @@ def importConditions(fileName, returnFieldNames=False, selection=""):
         unnamed = trialsArr.columns.to_series().str.contains('^Unnamed: ')
         trialsArr = trialsArr.loc[:, ~unnamed]  # clear unnamed cols
         logging.debug(u"Clearing unnamed columns from {}".format(fileName))
+        if isinstance(selection, slice):
+            trialsArr = trialsArr.iloc[selection]
+        elif selection is not None and len(selection) > 0:
+            trialsArr = trialsArr.iloc[[int(ii) for ii in selection]]
+        if fileName.endswith(('.csv', '.tsv')):
+            # convert strings that are numbers with a decimal comma
+            for col in trialsArr.columns:
+                if trialsArr[col].dtype == object:
+                    trialsArr[col] = _mapUnique(trialsArr[col].values,
+                                                _strToFloat)
         trialList, fieldNames = pandasToDictList(trialsArr)
 
         return trialList, fieldNames
@@ -294,55 +449,63 @@ def importConditions(fileName, returnFieldNames=False, selection=""):
         """Convert a pandas dataframe to a list of dicts.
         This helper function is used by csv or excel imports via pandas
         """
-        # convert the resulting dataframe to a numpy recarray
-        trialsArr = dataframe.to_records(index=False)
-        # Check for new line characters in strings, and replace escaped characters
-        for record in trialsArr:
-            for idx, element in enumerate(record):
-                if isinstance(element, str):
-                    record[idx] = element.replace('\\n', '\n')
-        if trialsArr.shape == ():
-            # convert 0-D to 1-D with one element:
-            trialsArr = trialsArr[np.newaxis]
-        fieldNames = list(trialsArr.dtype.names)
+        fieldNames = list(dataframe.columns)
         _assertValidVarNames(fieldNames, fileName)
 
-        # convert the record array into a list of dicts
-        trialList = []
-        for trialN, trialType in enumerate(trialsArr):
-            thisTrial = OrderedDict()
-            for fieldN, fieldName in enumerate(fieldNames):
-                val = trialsArr[trialN][fieldN]
+        # convert the values a column at a time
+        columns = []
+        for fieldName in fieldNames:
+            values = dataframe[fieldName].values
+            if values.dtype == object:
+                values = _mapUnique(values, _convertCell)
+            else:
+                isNan = np.isnan(values) if values.dtype.kind == 'f' else []
+                values = list(values)
+                for ii in np.flatnonzero(isNan):
+                    values[ii] = None
+            columns.append(values)
 
-                if isinstance(val, basestring):
-                    if val.startswith('[') and val.endswith(']'):
-                        # val = eval('%s' %unicode(val.decode('utf8')))
-                        val = eval(val)
-                elif type(val) == np.string_:
-                    val = str(val.decode('utf-8-sig'))
-                    # if it looks like a list, convert it:
-                    if val.startswith('[') and val.endswith(']'):
-                        # val = eval('%s' %unicode(val.decode('utf8')))
-                        val = eval(val)
-                elif np.isnan(val):
-                    val = None
-                thisTrial[fieldName] = val
-            trialList.append(thisTrial)
+        # then combine the columns into a list of dicts
+        trialList = []
+        for row in zip(*columns):
+            trialList.append(OrderedDict(zip(fieldNames, row)))
         return trialList, fieldNames
 
-    if (fileName.endswith(('.csv', '.tsv'))
+    # if we have a selection then try to parse it
+    if isinstance(selection, basestring) and len(selection) > 0:
+        selection = indicesFromString(selection)
+        if not isinstance(selection, slice):
+            for n in selection:
+                try:
+                    assert n == int(n)
+                except AssertionError:
+                    raise TypeError("importConditions() was given some "
+                                    "`indices` but could not parse them")
+
+    # rows are only selected while parsing if the whole file isn't cached
+    cache = cache and not fileName.endswith('.pkl')
+    parseSelection = None if cache else selection
+    cached = _loadCachedConditions(fileName) if cache else None
+
+    if cached is not None:
+        trialList, fieldNames = cached
+        logging.debug(u"Read cached conditions for {}".format(fileName))
+
+    elif (fileName.endswith(('.csv', '.tsv'))
             or (fileName.endswith(('.xlsx', '.xls', '.xlsm')) and haveXlrd)):
         if fileName.endswith(('.csv', '.tsv', '.dlm')):  # delimited text file
             for sep, dec in [ (',', '.'), (';', ','),  # most common in US, EU
                               ('\t', '.'), ('\t', ','), (';', '.')]:
                 try:
-                    trialList, fieldNames = _attemptImport(fileName=fileName,
-                                                           sep=sep, dec=dec)
+                    trialList, fieldNames = _attemptImport(
+                        fileName=fileName, sep=sep, dec=dec,
+                        selection=parseSelection)
                     break  # seems to have worked
                 except exceptions.ConditionsImportError as e:
                     continue  # try a different format
         else:
-            trialList, fieldNames = _attemptImport(fileName=fileName)
+            trialList, fieldNames = _attemptImport(fileName=fileName,
+                                                   selection=parseSelection)
 
     elif fileName.endswith(('.xlsx','.xlsm')):  # no xlsread so use openpyxl
         if not haveOpenpyxl:
@@ -385,7 +548,12 @@ def importConditions(fileName, returnFieldNames=False, selection=""):
 
         # loop trialTypes
         trialList = []
-        for rowN in range(1, nRows):  # skip header first row
+        rowNs = list(range(1, nRows))  # skip header first row
+        if isinstance(parseSelection, slice):
+            rowNs = rowNs[parseSelection]
+        elif parseSelection is not None and len(parseSelection) > 0:
+            rowNs = [rowNs[int(ii)] for ii in parseSelection]
+        for rowN in rowNs:
             thisTrial = {}
             for colN in rangeCols:
                 if parse_version(openpyxl.__version__) < parse_version('2.0'):
@@ -441,19 +609,13 @@ def importConditions(fileName, returnFieldNames=False, selection=""):
         raise IOError('Your conditions file should be an '
                       'xlsx, csv, dlm, tsv or pkl file')
 
-    # if we have a selection then try to parse it
-    if isinstance(selection, basestring) and len(selection) > 0:
-        selection = indicesFromString(selection)
-        if not isinstance(selection, slice):
-            for n in selection:
-                try:
-                    assert n == int(n)
-                except AssertionError:
-                    raise TypeError("importConditions() was given some "
-                                    "`indices` but could not parse them")
+    if cache and cached is None:
+        _saveCachedConditions(fileName, trialList, fieldNames)
 
     # the selection might now be a slice or a series of indices
-    if isinstance(selection, slice):
+    if parseSelection is not None:
+        pass  # already applied while parsing
+    elif isinstance(selection, slice):
         trialList = trialList[selection]
     elif len(selection) > 0:
         allConds = trialList
@@ -495,41 +657,18 @@ def createFactorialTrialList(factors):
         mytrials = createFactorialTrialList(factors)
     """
 
-    # the first step is to place all the factorial combinations in a list of
-    # lists
-    tempListOfLists = [[]]
-    for key in factors:
-        # this takes the levels of each factor as a set of values
-        # (a list) at a time
-        alist = factors[key]
-        tempList = []
-        for value in alist:
-            # now we loop over the values in a given list,
-            # and add each value of the other lists
-            for iterList in tempListOfLists:
-                tempList.append(iterList + [key, value])
-        tempListOfLists = tempList
-
-    # this second step is so we can return a list in the format of trialList
+    # every combination of levels, with the first factor varying fastest
+    names = list(factors)
+    levels = [factors[name] for name in reversed(names)]
     trialList = []
-    for atrial in tempListOfLists:
-        keys = atrial[0::2]  # the even elements are keys
-        values = atrial[1::2]  # the odd elements are values
-        atrialDict = {}
-        for i in range(len(keys)):
-            # this combines the key with the value
-            atrialDict[keys[i]] = values[i]
-        # append one trial at a time to the final trialList
-        trialList.append(atrialDict)
-
+    for values in itertools.product(*levels):
+        trialList.append(dict(zip(names, reversed(values))))
     return trialList
 
 
 def bootStraps(dat, n=1):
     """Create a list of n bootstrapped resamples of the data
 
-    SLOW IMPLEMENTATION (Python for-loop)
-
     Usage:
         ``out = bootStraps(dat, n=1)``
 
@@ -544,6 +683,9 @@ def bootStraps(dat, n=1):
             - dim[0]=conditions
             - dim[1]=trials
             - dim[2]=resamples
+
+    To fit a psychometric function to each resample, see
+    :func:`~psychopy.data.bootstrapFit`.
     """
     dat = np.asarray(dat)
     if len(dat.shape) == 1:
@@ -552,15 +694,23 @@ def bootStraps(dat, n=1):
         dat = np.array([dat])
 
     nTrials = dat.shape[1]
-    # initialise a matrix to store output
-    resamples = np.zeros(dat.shape + (n,), dat.dtype)
-    rand = np.random.rand
-    for stimulusN in range(dat.shape[0]):
-        thisStim = dat[stimulusN, :]  # fetch data for this stimulus
-        for sampleN in range(n):
-            indices = np.floor(nTrials * rand(nTrials)).astype('i')
-            resamples[stimulusN, :, sampleN] = np.take(thisStim, indices)
-    return resamples
+    # random numbers in the order the per-trial loop used to draw them,
+    # so a seeded numpy.random gives the same resamples as before
+    rand = np.random.rand(dat.shape[0], n, nTrials)
+    indices = np.floor(nTrials * rand).astype('i')
+    resamples = np.take_along_axis(dat[:, np.newaxis, :], indices, axis=2)
+    return resamples.transpose(0, 2, 1).copy()
+
+
+def _binMeans(values, starts, nPoints):
+    """The means of the runs of `nPoints` values from each of `starts` (NaN
+    for empty runs)"""
+    values = np.asarray(values, dtype=float)
+    means = np.full(len(starts), np.nan)
+    full = nPoints > 0
+    if full.any():
+        means[full] = np.add.reduceat(values, starts[full]) / nPoints[full]
+    return means
 
 
 def functionFromStaircase(intensities, responses, bins=10):
@@ -591,7 +741,9 @@ def functionFromStaircase(intensities, responses, bins=10):
                 of an intensity bin)
 
             meanCorrect
-                a numpy array of mean % correct in each bin
+                a numpy array of mean % correct in each bin (NaN for empty
+                bins). The means of large bins can differ in the last digit
+                from those of versions that used np.mean for each bin.
 
             n
                 a numpy array of number of responses contributing to each mean
@@ -605,34 +757,36 @@ def functionFromStaircase(intensities, responses, bins=10):
         intensities = np.array(intensities)
         responses = np.array(responses)
 
-    # sort the responses
-    sort_ii = np.argsort(intensities)
+    if len(intensities) != len(responses):
+        raise ValueError('functionFromStaircase needs one response per '
+                         'intensity')
+
+    if bins == 'unique':
+        # (a stable sort keeps the responses to each intensity in order)
+        intensities = np.round(intensities, decimals=8)
+        sort_ii = np.argsort(intensities, kind='mergesort')
+    else:
+        sort_ii = np.argsort(intensities)
     sortedInten = np.take(intensities, sort_ii)
     sortedResp = np.take(responses, sort_ii)
 
-    binnedResp = []
-    binnedInten = []
-    nPoints = []
     if bins == 'unique':
-        intensities = np.round(intensities, decimals=8)
-        uniqueIntens = np.unique(intensities)
-        for thisInten in uniqueIntens:
-            theseResps = responses[intensities == thisInten]
-            binnedInten.append(thisInten)
-            binnedResp.append(np.mean(theseResps))
-            nPoints.append(len(theseResps))
+        binnedInten, starts, nPoints = np.unique(
+            sortedInten, return_index=True, return_counts=True)
     else:
         pointsPerBin = len(intensities)/bins
-        for binN in range(bins):
-            start = int(round(binN * pointsPerBin))
-            stop = int(round((binN + 1) * pointsPerBin))
-            thisResp = sortedResp[start:stop]
-            thisInten = sortedInten[start:stop]
-            binnedResp.append(np.mean(thisResp))
-            binnedInten.append(np.mean(thisInten))
-            nPoints.append(len(thisInten))
-
-    return binnedInten, binnedResp, nPoints
+        edges = np.array([int(round(binN * pointsPerBin))
+                          for binN in range(bins + 1)])
+        starts = edges[:-1]
+        nPoints = edges[1:] - starts
+    # the mean of each bin, from the sums of its points. (np.add.reduceat
+    # sums sequentially, not pairwise as np.mean does, so the means of bins
+    # of 8 or more points can differ from np.mean's in the last digit)
+    binnedResp = _binMeans(sortedResp, starts, nPoints)
+    if bins != 'unique':
+        binnedInten = _binMeans(sortedInten, starts, nPoints)
+
+    return list(binnedInten), list(binnedResp), nPoints.tolist()
 
 
 def getDateStr(format="%Y_%b_%d_%H%M"):
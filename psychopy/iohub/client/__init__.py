@@ -14,6 +14,10 @@ import json
 import signal
 from weakref import proxy
 
+from collections import OrderedDict
+from operator import itemgetter
+
+import numpy as np
 import psutil
 
 try:
@@ -26,6 +30,7 @@ from .. import _pkgroot, IOHUB_DIRECTORY
 from ..util import yload, yLoader
 from ..errors import print2err, ioHubError, printExceptionDetailsToStdErr
 from ..util import isIterable, updateDict, win32MessagePump
+from ..util.sharedmem import SharedEventRingBuffer, SHARED_MEMORY_AVAILABLE
 from ..devices import DeviceEvent, import_device
 from ..devices.computer import Computer
 from ..devices.experiment import MessageEvent, LogEvent
@@ -91,6 +96,8 @@ class DeviceRPC(object):
             conversionMethod = ioHubConnection.eventListToNamedTuple
 
         if self.device_class != 'Experiment':
+            if asType == 'numpy':
+                return ioHubConnection.eventListToNumpy(r)
             return [conversionMethod(el) for el in r]
 
         EVT_TYPE_IX = DeviceEvent.EVENT_TYPE_ID_INDEX
@@ -103,9 +110,24 @@ class DeviceRPC(object):
                 ltext = l[self._log_text_index]
                 llevel = l[self._log_level_index]
                 psycho_logging.log(ltext, llevel, ltime)
+        if asType == 'numpy':
+            return ioHubConnection.eventListToNumpy(r)
         return [conversionMethod(el) for el in r]
 
 
+def _structuredArrayToEventLists(np_events):
+    """Convert a structured array of events into a list of events in list
+    form, decoding bytes fields so events match those received over UDP."""
+    bytes_fields = [i for i, n in enumerate(np_events.dtype.names)
+                    if np_events.dtype[n].kind == 'S']
+    events = []
+    for evt in np_events.tolist():
+        evt = list(evt)
+        for i in bytes_fields:
+            evt[i] = evt[i].decode('utf-8')
+        events.append(evt)
+    return events
+
 # pylint: disable=protected-access
 
 class ioHubDeviceView(object):
@@ -135,6 +157,17 @@ class ioHubDeviceView(object):
         r = self.hubClient._sendToHubServer(rpc_request)
         self._methods = r[1]
 
+        # Shared memory event buffers, if the ioHub Server is writing this
+        # device's events to any (see 'shared_memory_event_buffer' config).
+        self._shared_event_buffers = OrderedDict()
+        if SHARED_MEMORY_AVAILABLE:
+            r = self.hubClient._sendToHubServer(('RPC', 'getSharedEventBuffers',
+                                                 [device_class_name, ]))
+            for etype, shm_name in r[2] or ():
+                eclass = EventConstants.getClass(etype)
+                self._shared_event_buffers[etype] = \
+                    SharedEventRingBuffer.attach(shm_name, eclass.NUMPY_DTYPE)
+
     def __getattr__(self, name):
         if name in self._methods:
             #if name in self._preRemoteMethodCallFunctions:
@@ -148,6 +181,74 @@ class ioHubDeviceView(object):
             return r
         raise AttributeError(self, name)
 
+    def getEvents(self, *args, **kwargs):
+        """Retrieve any DeviceEvents that have occurred since the last call
+        to the device's getEvents() or clearEvents() methods. See the ioHub
+        Device.getEvents() documentation for supported arguments.
+
+        If the ioHub Server writes this device's events to shared memory,
+        events are read from the shared memory buffers directly, without
+        a request being sent to the ioHub Server. Otherwise the call is
+        forwarded to the ioHub Server.
+        """
+        if not self._shared_event_buffers:
+            return self.__getattr__('getEvents')(*args, **kwargs)
+
+        event_type_id = kwargs.get('event_type_id',
+                                   kwargs.get('event_type', None))
+        clear_events = kwargs.get('clearEvents', True)
+        if len(args) > 0:
+            event_type_id = args[0]
+        if len(args) > 1:
+            clear_events = args[1]
+        filter_id = kwargs.get('filter_id', None)
+        as_type = kwargs.get('asType', kwargs.get('as_type', 'namedtuple'))
+
+        np_events = OrderedDict()
+        for etype, ring in self._shared_event_buffers.items():
+            if event_type_id and etype != event_type_id:
+                continue
+            etype_events = ring.read(clear_events)
+            if filter_id:
+                etype_events = etype_events[
+                    etype_events['filter_id'] == filter_id]
+            if len(etype_events):
+                np_events[etype] = etype_events
+
+        if as_type == 'numpy':
+            return dict(np_events)
+
+        events = []
+        for etype_events in np_events.values():
+            events.extend(_structuredArrayToEventLists(etype_events))
+        events.sort(key=itemgetter(DeviceEvent.EVENT_HUB_TIME_INDEX))
+
+        if as_type == 'list':
+            return events
+        elif as_type == 'dict':
+            return [ioHubConnection.eventListToDict(e) for e in events]
+        elif as_type == 'object':
+            return [ioHubConnection.eventListToObject(e) for e in events]
+        return [ioHubConnection.eventListToNamedTuple(e) for e in events]
+
+    def clearEvents(self, *args, **kwargs):
+        """Clears any DeviceEvents that have occurred since the last call
+        to the device's getEvents(), or clearEvents() methods, including
+        events waiting in shared memory event buffers.
+        """
+        self._clearSharedEvents(kwargs.get('event_type',
+                                           args[0] if args else None))
+        return self.__getattr__('clearEvents')(*args, **kwargs)
+
+    def _clearSharedEvents(self, event_type=None):
+        for etype, ring in self._shared_event_buffers.items():
+            if event_type is None or etype == event_type:
+                ring.clear()
+
+    def _closeSharedEventBuffers(self):
+        while self._shared_event_buffers:
+            self._shared_event_buffers.popitem()[1].close()
+
 #    def setPreRemoteMethodCallFunction(self, methodName, funcCall, **kwargs):
 #        self._preRemoteMethodCallFunctions[methodName] = (funcCall, kwargs)
 
@@ -353,6 +454,12 @@ class ioHubConnection(object):
             * 'dict': Each event converted to a dict object.
             * 'object': Each event is converted to a DeviceEvent subclass
                         based on the event's type.
+            * 'numpy': Events are returned as a dict of numpy structured
+                       arrays, keyed by event type id (see EventConstants).
+                       Each array uses the event class's NUMPY_DTYPE and is
+                       sorted by event time. When device_label is None the
+                       ioHub Server sends one packed block per event type,
+                       so no per event Python objects are created.
 
         Args:
             device_label (str): Name of device to retrieve events for.
@@ -366,6 +473,8 @@ class ioHubConnection(object):
         """
         r = None
         if device_label is None:
+            if as_type == 'numpy':
+                return self._getEventsColumnar()
             events = self._sendToHubServer(('GET_EVENTS',))[1]
             if events is None:
                 r = self.allEvents
@@ -376,6 +485,9 @@ class ioHubConnection(object):
         else:
             r = self.devices.getDevice(device_label).getEvents()
 
+        if as_type == 'numpy':
+            return self.eventListToNumpy(r)
+
         if r:
             if as_type == 'list':
                 return r
@@ -394,6 +506,25 @@ class ioHubConnection(object):
 
         return []
 
+    def _getEventsColumnar(self):
+        """Retrieve the ioHub Server's global event buffer as packed
+        per event type blocks and convert them into a dict of numpy
+        structured arrays. Any events buffered locally by wait() are
+        merged in ahead of the newly received events."""
+        blocks = self._sendToHubServer(('GET_EVENTS', 'numpy'))[1]
+        r = self.eventListToNumpy(self.allEvents)
+        self.allEvents = []
+        if blocks:
+            for etype, ecount, edata in blocks:
+                eclass = EventConstants.getClass(etype)
+                np_events = np.frombuffer(edata, dtype=eclass.NUMPY_DTYPE,
+                                          count=ecount)
+                if etype in r:
+                    r[etype] = np.concatenate((r[etype], np_events))
+                else:
+                    r[etype] = np_events.copy()
+        return r
+
     def clearEvents(self, device_label='all'):
         """Clears unread events from the ioHub Server's Event Buffer(s)
         so that unneeded events are not discarded.
@@ -419,6 +550,8 @@ class ioHubConnection(object):
         """
         if device_label.lower() == 'all':
             self.allEvents = []
+            for d in self.devices.getAll():
+                d._clearSharedEvents()
             self._sendToHubServer(('RPC', 'clearEventBuffer', [True, ]))
             try:
                 self.getDevice('keyboard')._clearLocalEvents()
@@ -797,6 +930,22 @@ class ioHubConnection(object):
         r = self._sendToHubServer(('RPC', 'flushIODataStoreFile'))
         return r
 
+    def getDataStoreWriterStats(self):
+        """Get statistics on how the ioDataStore is buffering and writing
+        events, useful for checking that saving events keeps up with high
+        sample rate devices. See DataStoreFile.getWriterStats() for the
+        returned keys.
+
+        Args:
+            None
+
+        Returns:
+            dict: writer statistics, or None if the ioDataStore is not
+            enabled.
+
+        """
+        return self._sendToHubServer(('RPC', 'getDataStoreWriterStats'))[2]
+
     def startCustomTasklet(self, task_name, task_class_path, **class_kwargs):
         """
         Instruct the iohub server to start running a custom tasklet given
@@ -1171,6 +1320,11 @@ class ioHubConnection(object):
             raise ioHubError(result)
         # Otherwise return the result
         
+        if isIterable(result) and len(result) > 0 and \
+                result[0] == 'GET_EVENTS_COLUMNAR_RESULT':
+            # Event blocks hold raw numpy bytes, so must not be decoded.
+            return result
+
         if constants.PY3 and result is not None:
             # Use recursive conversion funcs                     
             if isinstance(result, list) or  isinstance(result, tuple):
@@ -1264,6 +1418,22 @@ class ioHubConnection(object):
         etype = evt_data[DeviceEvent.EVENT_TYPE_ID_INDEX]
         return EventConstants.getClass(etype).createEventAsNamedTuple(evt_data)
 
+    @staticmethod
+    def eventListToNumpy(evt_list):
+        """Convert a list of ioHub events (in list or namedtuple format)
+        into a dict of numpy structured arrays, keyed by event type id. Each
+        array uses the NUMPY_DTYPE of the event type's class and keeps the
+        order events had in evt_list."""
+        etype_index = DeviceEvent.EVENT_TYPE_ID_INDEX
+        grouped = {}
+        for evt in evt_list or ():
+            grouped.setdefault(evt[etype_index], []).append(tuple(evt))
+        r = {}
+        for etype, etype_events in grouped.items():
+            eclass = EventConstants.getClass(etype)
+            r[etype] = np.array(etype_events, dtype=eclass.NUMPY_DTYPE)
+        return r
+
     # client utility methods.
     def _getDeviceList(self):
         r = self._sendToHubServer(('EXP_DEVICE', 'GET_DEVICE_LIST'))
@@ -1280,6 +1450,8 @@ class ioHubConnection(object):
             self._shutdown_attempted = True
             TimeoutError = psutil.TimeoutExpired
             try:
+                for d in self.devices.getAll():
+                    d._closeSharedEventBuffers()
                 if self.udp_client:  # if it isn't already garbage-collected
                     self.udp_client.sendTo(('STOP_IOHUB_SERVER',))
                     self.udp_client.close()
@@ -293,6 +293,7 @@ class Keyboard(ioHubDeviceView):
 
     def clearEvents(self, event_type=None, filter_id=None):
         self._clearLocalEvents(event_type)
+        self._clearSharedEvents(event_type)
         return self._clearEventsRPC(event_type=event_type,
                                       filter_id=filter_id)
 
@@ -8,15 +8,23 @@ from __future__ import division, absolute_import, print_function
 
 import os
 import atexit
+import threading
+from functools import wraps
 import numpy as np
 from builtins import str
 from builtins import object
 from pkg_resources import parse_version
 from ..server import DeviceEvent
+from ..devices import Computer
 from ..constants import EventConstants
 from ..errors import ioHubError, printExceptionDetailsToStdErr, print2err
 
 
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full  # python 2.x
+
 import tables
 from tables import parameters, IsDescription, Filters, StringCol, UInt32Col, UInt16Col, NodeError, NoSuchNodeError, ClosedFileError
 if parse_version(tables.__version__) < parse_version('3'):
@@ -24,11 +32,17 @@ if parse_version(tables.__version__) < parse_version('3'):
     create_table = "createTable"
     create_group = "createGroup"
     f_get_child = "_f_getChild"
+    walk_nodes = "walkNodes"
+    create_csindex = "createCSIndex"
+    reindex_dirty = "reIndexDirty"
 else:
     from tables import open_file
     create_table = "create_table"
     create_group = "create_group"
     _f_get_child = "_f_get_child"
+    walk_nodes = "walk_nodes"
+    create_csindex = "create_csindex"
+    reindex_dirty = "reindex_dirty"
 
 
 """
@@ -61,11 +75,25 @@ perhaps one less than this.  < S. Simpson Note: These are 'not' GIL bound
 threads and therefore actually improve performance > """
 
 DATA_FILE_TITLE = "ioHub DataStore - Experiment Data File."
+INDEXED_EVENT_COLUMNS = ('session_id', 'time')
 FILE_VERSION = '0.8.1.1'
 SCHEMA_AUTHORS = 'Sol Simpson'
 SCHEMA_MODIFIED_DATE = 'November 24th, 2016'
 
 
+def _fileLocked(method):
+    """Run a DataStoreFile method while holding the file lock, since the
+    hdf5 file may also be written to by the DataStoreWriterThread.
+
+    Such methods must only call _flushFile(), not flush(): waiting for the
+    writer thread while holding the lock it needs would deadlock."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._fileLock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class DataStoreFile(object):
     def __init__(self, fileName, folderPath, fmode='a', iohub_settings=None):
         self.fileName = fileName
@@ -83,6 +111,18 @@ class DataStoreFile(object):
         self.flushCounter = self.settings.get('flush_interval', 32)
         self._eventCounter = 0
 
+        # Events are buffered per event table and appended in chunks of
+        # chunkSize rows; maxLatency sec. is the longest an event is held
+        # in memory before its chunk is written.
+        self.chunkSize = max(1, self.settings.get('event_chunk_size', 256))
+        self.maxLatency = self.settings.get('event_chunk_max_latency', 0.25)
+        self._eventChunks = dict()
+
+        # Serializes all access to the hdf5 file, which is shared with the
+        # background writer thread when it is enabled.
+        self._fileLock = threading.RLock()
+        self._writer = None
+
         self.TABLES = dict()
         self._eventGroupMappings = dict()
         self.emrtFile = open_file(self.filePath, mode=fmode)
@@ -95,6 +135,11 @@ class DataStoreFile(object):
         else:
             self.loadTableMappings()
 
+        if self.settings.get('writer_thread', True):
+            self._writer = DataStoreWriterThread(
+                self, self.settings.get('writer_queue_size', 64))
+            self._writer.start()
+
     def loadTableMappings(self):
         # create meta-data tables
         self.TABLES['EXPERIMENT_METADETA']=self.emrtFile.root.data_collection.experiment_meta_data
@@ -184,6 +229,7 @@ class DataStoreFile(object):
                                       title=egtitle)
             return datevts_node._f_get_child(evt_group_label)
 
+    @_fileLocked
     def updateDataStoreStructure(self, device_instance, event_class_dict):
         dfilter = tables.Filters(
             complevel=0,
@@ -204,7 +250,7 @@ class DataStoreFile(object):
                             (device_instance.__class__.__name__,
                              ),
                             filters=dfilter.copy())
-                        self.flush()
+                        self._flushFile()
                     except tables.NodeError:
                         self.TABLES[event_table_label] = self.groupNodeForEvent(event_cls)._f_get_child(self.eventTableLabel2ClassName(event_table_label))
                     except Exception as e:
@@ -242,6 +288,7 @@ class DataStoreFile(object):
                             self.eventTableLabel2ClassName(event_table_label)))
                     print2err('----------------------------------------------')
 
+    @_fileLocked
     def addClassMapping(self,ioClass,ctable):
         names = [
             x['class_id'] for x in self.TABLES['CLASS_TABLE_MAPPINGS'].where(
@@ -254,8 +301,9 @@ class DataStoreFile(object):
             trow['class_name'] = ioClass.__name__
             trow['table_path']  = ctable._v_pathname
             trow.append()
-            self.flush()
+            self._flushFile()
 
+    @_fileLocked
     def createOrUpdateExperimentEntry(self,experimentInfoList):
         experiment_metadata = self.TABLES['EXPERIMENT_METADETA']
         result = [row for row in experiment_metadata.iterrows() if row[
@@ -271,9 +319,10 @@ class DataStoreFile(object):
         self.active_experiment_id = max_id + 1
         experimentInfoList[0] = self.active_experiment_id
         experiment_metadata.append([tuple(experimentInfoList), ])
-        self.flush()
+        self._flushFile()
         return self.active_experiment_id
 
+    @_fileLocked
     def createExperimentSessionEntry(self, sessionInfoDict):
         session_metadata = self.TABLES['SESSION_METADETA']
         max_id = 0
@@ -291,9 +340,10 @@ class DataStoreFile(object):
             sessionInfoDict['user_variables']
         )
         session_metadata.append([values, ])
-        self.flush()
+        self._flushFile()
         return self.active_session_id
 
+    @_fileLocked
     def initConditionVariableTable(
             self, experiment_id, session_id, np_dtype):
         expcv_table = None
@@ -340,6 +390,7 @@ class DataStoreFile(object):
         return True
 
 
+    @_fileLocked
     def extendConditionVariableTable(self, experiment_id, session_id, data):
         if self._EXP_COND_DTYPE is None:
             return False
@@ -375,6 +426,7 @@ class DataStoreFile(object):
             return False
         return True
 
+    @_fileLocked
     def checkIfSessionCodeExists(self, sessionCode):
         if self.emrtFile:
             sessionsForExperiment = self.emrtFile.root.data_collection.session_meta_data.where(
@@ -391,13 +443,12 @@ class DataStoreFile(object):
                 return False
             etype = event[DeviceEvent.EVENT_TYPE_ID_INDEX]
             eventClass = EventConstants.getClass(etype)
-            etable = self.TABLES[eventClass.IOHUB_DATA_TABLE]
             event[DeviceEvent.EVENT_EXPERIMENT_ID_INDEX] = self.active_experiment_id
             event[DeviceEvent.EVENT_SESSION_ID_INDEX] = self.active_session_id
 
-            np_array = np.array([tuple(event), ], dtype=eventClass.NUMPY_DTYPE)
-            etable.append(np_array)
-            self.bufferedFlush()
+            chunk = self._getEventChunk(eventClass)
+            if chunk.add(event):
+                self._writeEventChunk(chunk)
         except Exception:
             print2err("Error saving event: ", event)
             printExceptionDetailsToStdErr()
@@ -411,22 +462,82 @@ class DataStoreFile(object):
 
             etype = event[DeviceEvent.EVENT_TYPE_ID_INDEX]
             eventClass = EventConstants.getClass(etype)
-            etable = self.TABLES[eventClass.IOHUB_DATA_TABLE]
+            chunk = self._getEventChunk(eventClass)
 
-            np_events = []
             for event in events:
                 event[DeviceEvent.EVENT_EXPERIMENT_ID_INDEX] = self.active_experiment_id
                 event[DeviceEvent.EVENT_SESSION_ID_INDEX] = self.active_session_id
-                np_events.append(tuple(event))
-
-            np_array = np.array(np_events, dtype=eventClass.NUMPY_DTYPE)
-            etable.append(np_array)
-            self.bufferedFlush(len(np_events))
+                if chunk.add(event):
+                    self._writeEventChunk(chunk)
         except ioHubError as e:
             print2err(e)
         except Exception:
             printExceptionDetailsToStdErr()
 
+    def _getEventChunk(self, eventClass):
+        table_label = eventClass.IOHUB_DATA_TABLE
+        chunk = self._eventChunks.get(table_label)
+        if chunk is None:
+            chunk = EventTableChunk(self.TABLES[table_label],
+                                    eventClass.NUMPY_DTYPE, self.chunkSize)
+            self._eventChunks[table_label] = chunk
+        return chunk
+
+    def _writeEventChunk(self, chunk):
+        """Hand the rows buffered in chunk to the writer thread, or append
+        them to the event table directly if the writer thread is disabled."""
+        rows = chunk.take()
+        if len(rows) == 0:
+            return
+        if self._writer is not None:
+            self._writer.put(chunk.table, rows)
+        else:
+            self._appendRows(chunk.table, rows)
+
+    def _appendRows(self, etable, rows):
+        with self._fileLock:
+            etable.append(rows)
+            self.bufferedFlush(len(rows))
+
+    def checkPendingEvents(self):
+        """Write any buffered event chunk that has held an event for longer
+        than maxLatency sec. Called periodically by the ioHub Server so
+        events are saved even if a chunk is slow to fill."""
+        now = Computer.getTime()
+        for chunk in self._eventChunks.values():
+            if chunk.count and now - chunk.firstEventTime >= self.maxLatency:
+                self._writeEventChunk(chunk)
+
+    def flushPendingEvents(self):
+        """Write all buffered event chunks and wait until the writer thread
+        has appended them to the event tables. Must not be called while
+        holding the file lock."""
+        for chunk in self._eventChunks.values():
+            self._writeEventChunk(chunk)
+        if self._writer is not None:
+            self._writer.waitUntilWritten()
+
+    def getWriterStats(self):
+        """Return a dict of event buffering and writer statistics, which can
+        be used to check that hdf5 writes keep up with incoming events:
+
+            * chunk_size, max_latency: current chunking settings.
+            * pending_events: events buffered in memory, not yet queued.
+            * queued_chunks / max_queued_chunks: chunks waiting for the
+              writer thread, now and at most.
+            * chunks_written, events_written: totals appended to the file.
+            * write_time, max_write_time: sec. spent in table appends.
+            * blocked_puts, blocked_time: number of times, and total sec.,
+              event handling had to wait because the writer queue was full.
+        """
+        stats = dict(chunk_size=self.chunkSize,
+                     max_latency=self.maxLatency,
+                     pending_events=sum(c.count for c in
+                                        self._eventChunks.values()))
+        if self._writer is not None:
+            stats.update(self._writer.getStats())
+        return stats
+
     def bufferedFlush(self,eventCount=1):
         """
         If flushCounter threshold is >=0 then do some checks. If it is < 0,
@@ -435,28 +546,66 @@ class DataStoreFile(object):
         """
         if self.flushCounter >= 0:
             if self.flushCounter == 0:
-                self.flush()
+                self._flushFile()
                 return True
             if self.flushCounter <= self._eventCounter:
-                self.flush()
+                self._flushFile()
                 self._eventCounter = 0
                 return True
             self._eventCounter += eventCount
             return False
 
     def flush(self):
+        self.flushPendingEvents()
+        self._flushFile()
+
+    def _flushFile(self):
         try:
             if self.emrtFile:
-                self.emrtFile.flush()
+                with self._fileLock:
+                    self.emrtFile.flush()
         except tables.ClosedFileError:
             pass
         except Exception:
             printExceptionDetailsToStdErr()
 
+    @_fileLocked
+    def indexEventTables(self):
+        """Create completely sorted indexes on the session_id and time
+        columns of every event table, so session and time range queries
+        (see ExperimentDataAccessUtility.getEventChunks) only read the
+        matching rows. Columns that are already indexed have their index
+        brought up to date."""
+        events_node = self.emrtFile.root.data_collection.events
+        for etable in getattr(self.emrtFile, walk_nodes)(events_node,
+                                                         classname='Table'):
+            if etable.nrows == 0:
+                continue
+            for cname in INDEXED_EVENT_COLUMNS:
+                if cname not in etable.colnames:
+                    continue
+                column = etable.cols._f_col(cname)
+                try:
+                    if column.is_indexed:
+                        getattr(column, reindex_dirty)()
+                    else:
+                        getattr(column, create_csindex)()
+                except Exception:
+                    print2err('Error indexing {0} column of {1}'.format(
+                        cname, etable._v_pathname))
+                    printExceptionDetailsToStdErr()
+
     def close(self):
         self.flush()
+        if self._writer is not None:
+            self._writer.stop()
+            self._writer = None
+        if self.settings.get('index_event_tables', True) and \
+                self.emrtFile.isopen:
+            self.indexEventTables()
         self._activeRunTimeConditionVariableTable = None
-        self.emrtFile.close()
+        with self._fileLock:
+            self.emrtFile.close()
 
     def __del__(self):
         try:
@@ -464,6 +613,113 @@ class DataStoreFile(object):
         except Exception:
             pass
 
+class EventTableChunk(object):
+    """Preallocated structured array that buffers the rows for one event
+    table until chunkSize events have been added."""
+    def __init__(self, table, dtype, size):
+        self.table = table
+        self.dtype = dtype
+        self.size = size
+        self.rows = np.empty(size, dtype=dtype)
+        self.count = 0
+        self.firstEventTime = None
+
+    def add(self, event):
+        """Copy event into the next free row. Returns True when the chunk
+        is full and should be written."""
+        if self.count == 0:
+            self.firstEventTime = Computer.getTime()
+        self.rows[self.count] = tuple(event)
+        self.count += 1
+        return self.count >= self.size
+
+    def take(self):
+        """Return the buffered rows and start a new chunk. The returned
+        array is no longer used by the chunk."""
+        if self.count == 0:
+            return self.rows[:0]
+        if self.count == self.size:
+            rows = self.rows
+            self.rows = np.empty(self.size, dtype=self.dtype)
+        else:
+            rows = self.rows[:self.count].copy()
+        self.count = 0
+        self.firstEventTime = None
+        return rows
+
+
+class DataStoreWriterThread(threading.Thread):
+    """Appends event chunks to their hdf5 tables in a background thread,
+    so table appends and file flushes do not delay device polling in the
+    ioHub Server's gevent loop.
+
+    Chunks are passed to the thread through a bounded queue. If the queue
+    is full, put() blocks until the writer catches up; how often and how
+    long this happens is reported by getStats().
+    """
+    def __init__(self, dsfile, queue_size=64):
+        threading.Thread.__init__(self, name='ioHubDataStoreWriter')
+        self.daemon = True
+        self._dsfile = dsfile
+        self._queue = Queue(maxsize=max(1, queue_size))
+        self._maxQueued = 0
+        self._chunksWritten = 0
+        self._eventsWritten = 0
+        self._writeTime = 0.0
+        self._maxWriteTime = 0.0
+        self._blockedPuts = 0
+        self._blockedTime = 0.0
+
+    def put(self, etable, rows):
+        try:
+            self._queue.put_nowait((etable, rows))
+        except Full:
+            stime = Computer.getTime()
+            self._queue.put((etable, rows))
+            self._blockedPuts += 1
+            self._blockedTime += Computer.getTime() - stime
+        self._maxQueued = max(self._maxQueued, self._queue.qsize())
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                etable, rows = item
+                stime = Computer.getTime()
+                self._dsfile._appendRows(etable, rows)
+                dur = Computer.getTime() - stime
+                self._writeTime += dur
+                self._maxWriteTime = max(self._maxWriteTime, dur)
+                self._chunksWritten += 1
+                self._eventsWritten += len(rows)
+            except Exception:
+                print2err('Error writing events to ioDataStore:')
+                printExceptionDetailsToStdErr()
+            finally:
+                self._queue.task_done()
+
+    def waitUntilWritten(self):
+        """Block until all queued chunks have been written."""
+        if self.is_alive():
+            self._queue.join()
+
+    def stop(self):
+        if self.is_alive():
+            self._queue.put(None)
+            self.join()
+
+    def getStats(self):
+        return dict(queued_chunks=self._queue.qsize(),
+                    max_queued_chunks=self._maxQueued,
+                    chunks_written=self._chunksWritten,
+                    events_written=self._eventsWritten,
+                    write_time=self._writeTime,
+                    max_write_time=self._maxWriteTime,
+                    blocked_puts=self._blockedPuts,
+                    blocked_time=self._blockedTime)
+
 ## -------------------- Utility Functions ------------------------ ##
 
 
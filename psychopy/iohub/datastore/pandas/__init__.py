@@ -14,6 +14,7 @@ except ImportError:
 import numpy as np
 import pandas as pd
 from ...constants import EventConstants
+from .aggregate import ioHubAggregateDataView
 
 
 class ioHubPandasDataView(object):
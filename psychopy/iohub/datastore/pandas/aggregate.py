@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+# ioHub DataStore to Pandas DataFrames - Multiple File Aggregation
+# Part of the psychopy.iohub library.
+# Copyright (C) 2012-2016 iSolver Software Solutions
+# Distributed under the terms of the GNU General Public License (GPL).
+from __future__ import division, absolute_import, print_function
+
+import os
+import glob
+import json
+import hashlib
+import multiprocessing
+from past.builtins import basestring
+
+import numpy as np
+import pandas as pd
+import tables
+
+from ...constants import EventConstants
+from ..util import readTableChunks
+
+#: Supported cache_format values of ioHubAggregateDataView.
+CACHE_FORMATS = ('parquet', 'feather', 'pickle')
+
+EXPERIMENT_META_DATA = 'experiment_meta_data'
+SESSION_META_DATA = 'session_meta_data'
+CONDITION_VARIABLES = 'condition_variables'
+_CACHE_INDEX = 'tables.json'
+
+
+class ioHubAggregateDataView(object):
+    """Combined pandas view of the events, condition variables and meta data
+    saved in many ioDataStore files, for example the one .hdf5 file saved
+    for each participant of an experiment.
+
+    Each file is read by a separate worker process, so the files of a group
+    are processed in parallel. The DataFrames from each file are
+    concatenated, with a 'file' column giving the name of the source file
+    and, for event and condition variable data, 'experiment_code' and
+    'session_code' columns taken from the file's meta data. Since
+    experiment_id and session_id values are only unique within one file,
+    data is not indexed by them as in ioHubPandasDataView.
+
+    If cache_dir is given, the DataFrames read from each file are saved
+    there, keyed on the file's path, size and modification time. When the
+    view is created again only new or changed files are read.
+
+    Example::
+
+        from psychopy.iohub.datastore.pandas.aggregate import \\
+            ioHubAggregateDataView
+
+        group = ioHubAggregateDataView('results/*.hdf5',
+                                       event_types=['KEYBOARD_PRESS'],
+                                       cache_dir='results/.cache')
+        presses = group.KEYBOARD_PRESS
+        trials = group.condition_variables
+
+    Args:
+        datastore_files (str or list): glob pattern, or list of ioDataStore
+            file paths.
+        event_types (list): EventConstants names of the event types to load.
+            None loads every event type saved in each file.
+        processes (int): Number of worker processes. None uses one process
+            per cpu; 1 reads files in the calling process.
+        cache_dir (str): Folder used to cache the data read from each file.
+            None disables caching.
+        cache_format (str): 'parquet' or 'feather' (both need pyarrow), or
+            'pickle'.
+
+    """
+
+    def __init__(self, datastore_files, event_types=None, processes=None,
+                 cache_dir=None, cache_format='parquet'):
+        if isinstance(datastore_files, basestring):
+            self._files = sorted(glob.glob(datastore_files))
+        else:
+            self._files = list(datastore_files)
+        if not self._files:
+            raise ValueError('No ioDataStore files found for {0}'.format(
+                datastore_files))
+
+        if cache_format not in CACHE_FORMATS:
+            raise ValueError('cache_format must be one of {0}, not {1}'.format(
+                CACHE_FORMATS, cache_format))
+        if cache_dir and cache_format in ('parquet', 'feather'):
+            # fail now rather than in each worker process
+            try:
+                import pyarrow  # pylint: disable=unused-import
+            except ImportError:
+                raise ImportError("cache_format '{0}' requires the pyarrow "
+                                  "package".format(cache_format))
+
+        if event_types is not None:
+            event_types = sorted(event_types)
+            for etype in event_types:
+                if EventConstants.getID(etype) is None:
+                    raise ValueError('Unknown event type: {0}'.format(etype))
+
+        self._event_types = event_types
+        self._processes = processes
+        self._cache_dir = cache_dir
+        self._cache_format = cache_format
+
+        self._experiment_meta_data = None
+        self._session_meta_data = None
+        self._condition_variables = None
+        self._event_data_by_type = None
+
+    @property
+    def files(self):
+        """List of the ioDataStore file paths included in the view.
+
+        Read-only.
+
+        """
+        return self._files[:]
+
+    @property
+    def experiment_meta_data(self):
+        """A DataFrame containing the experiment meta data of every file.
+
+        Read-only.
+
+        """
+        self.load()
+        return self._experiment_meta_data
+
+    @property
+    def session_meta_data(self):
+        """A DataFrame containing the session meta data of every file.
+
+        Read-only.
+
+        """
+        self.load()
+        return self._session_meta_data
+
+    @property
+    def condition_variables(self):
+        """A DataFrame containing the condition variable rows of every
+        file, or None if no file has condition variables.
+
+        Read-only.
+
+        """
+        self.load()
+        return self._condition_variables
+
+    @property
+    def event_types(self):
+        """List of the names of event types loaded from at least one file.
+
+        Read-only.
+
+        """
+        self.load()
+        return sorted(self._event_data_by_type.keys())
+
+    def getEvents(self, event_type):
+        """Return a DataFrame containing the events of the given type
+        (an EventConstants name, like 'KEYBOARD_PRESS') from every file,
+        sorted by file, session_id and time.
+        """
+        self.load()
+        try:
+            return self._event_data_by_type[event_type]
+        except KeyError:
+            raise KeyError('No {0} events were loaded'.format(event_type))
+
+    def __getattr__(self, n):
+        if n.startswith('_'):
+            raise AttributeError(n)
+        try:
+            return self.getEvents(n)
+        except KeyError:
+            raise AttributeError(
+                self.__class__.__name__ +
+                ' does not have a data frame for ' +
+                n)
+
+    def load(self):
+        """Read all files, using a pool of worker processes, and merge the
+        results. Called the first time data is accessed; calling it again
+        does nothing.
+        """
+        if self._event_data_by_type is not None:
+            return
+
+        jobs = [(fpath, self._event_types, self._cache_dir,
+                 self._cache_format) for fpath in self._files]
+        processes = self._processes
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        processes = max(1, min(processes, len(jobs)))
+        if processes == 1:
+            results = [_loadDataStoreFileJob(job) for job in jobs]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_loadDataStoreFileJob, jobs, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+        merged = dict()
+        for fpath, file_data in zip(self._files, results):
+            fname = os.path.basename(fpath)
+            for name, df in file_data.items():
+                df.insert(0, 'file', fname)
+                merged.setdefault(name, []).append(df)
+        merged = dict((name, pd.concat(dfs, ignore_index=True))
+                      for name, dfs in merged.items())
+
+        self._experiment_meta_data = merged.pop(EXPERIMENT_META_DATA)
+        self._session_meta_data = merged.pop(SESSION_META_DATA)
+        self._condition_variables = merged.pop(CONDITION_VARIABLES, None)
+        if self._condition_variables is not None:
+            self._condition_variables = self._addCodes(
+                self._condition_variables)
+
+        self._event_data_by_type = dict()
+        for name, df in merged.items():
+            df = self._addCodes(df)
+            df.sort_values(['file', 'session_id', 'time'], kind='mergesort',
+                           inplace=True)
+            df.reset_index(drop=True, inplace=True)
+            self._event_data_by_type[name] = df
+
+    def _addCodes(self, df):
+        """Add experiment_code and session_code columns to df, matched on
+        file, experiment_id and session_id."""
+        exp_codes = self._experiment_meta_data[
+            ['file', 'experiment_id', 'code']].rename(
+            columns={'code': 'experiment_code'})
+        sess_codes = self._session_meta_data[
+            ['file', 'experiment_id', 'session_id', 'code']].rename(
+            columns={'code': 'session_code'})
+        df = df.merge(exp_codes, how='left', on=['file', 'experiment_id'])
+        if 'session_id' in df.columns:
+            df = df.merge(sess_codes, how='left',
+                          on=['file', 'experiment_id', 'session_id'])
+        return df
+
+    def close(self):
+        self._experiment_meta_data = None
+        self._session_meta_data = None
+        self._condition_variables = None
+        self._event_data_by_type = None
+
+
+def _tableToDataFrame(rows):
+    """Convert a numpy structured array read from a DataStore table to a
+    DataFrame, decoding byte string columns."""
+    columns = dict()
+    for name in rows.dtype.names:
+        values = rows[name]
+        if values.dtype.kind == 'S':
+            if len(values):
+                values = np.char.decode(values, 'utf-8')
+            else:
+                # np.char.decode gives an empty float64 array
+                values = np.empty(0, dtype=object)
+        elif values.ndim > 1:
+            values = list(values)
+        columns[name] = values
+    return pd.DataFrame(columns, columns=list(rows.dtype.names))
+
+
+def _readTable(table, condition=None):
+    """Read the rows of a DataStore table that match condition into a
+    DataFrame, a chunk at a time, so only the matching rows of the table
+    are ever held in memory. A table without matching rows gives an empty
+    DataFrame with the table's columns."""
+    dfs = [_tableToDataFrame(rows)
+           for rows in readTableChunks(table, condition)]
+    if not dfs:
+        return _tableToDataFrame(np.empty(0, dtype=table.dtype))
+    if len(dfs) == 1:
+        return dfs[0]
+    return pd.concat(dfs, ignore_index=True)
+
+
+def readDataStoreFile(file_path, event_types=None):
+    """Read the meta data, condition variables and events of one ioDataStore
+    file into DataFrames.
+
+    Tables are read with readTableChunks, and only the rows of the
+    requested event types are read from each event table.
+
+    Returns:
+        dict: DataFrames keyed by 'experiment_meta_data',
+        'session_meta_data', 'condition_variables' (only if the file has
+        condition variables) and the EventConstants name of each event type
+        that has events in the file.
+    """
+    data = dict()
+    hub_file = tables.open_file(file_path, mode='r')
+    try:
+        data_collection = hub_file.root.data_collection
+        data[EXPERIMENT_META_DATA] = _readTable(
+            data_collection.experiment_meta_data)
+        data[SESSION_META_DATA] = _readTable(
+            data_collection.session_meta_data)
+
+        cv_dfs = []
+        for cv_table in hub_file.list_nodes(
+                data_collection.condition_variables, classname='Table'):
+            cv_df = _readTable(cv_table)
+            # cv tables use EXPERIMENT_ID and SESSION_ID columns; use the
+            # same column names as the meta data and event tables.
+            cv_df.rename(columns=dict((c, c.lower()) for c in cv_df.columns
+                                      if c.lower() in ('experiment_id',
+                                                       'session_id')),
+                         inplace=True)
+            cv_dfs.append(cv_df)
+        if cv_dfs:
+            data[CONDITION_VARIABLES] = pd.concat(cv_dfs, ignore_index=True)
+
+        for mapping in hub_file.root.class_table_mapping.read():
+            type_id = int(mapping['class_id'])
+            type_name = EventConstants.getName(type_id)
+            if event_types is not None and type_name not in event_types:
+                continue
+            table_path = mapping['table_path'].decode('utf-8')
+            try:
+                table = hub_file.get_node(table_path)
+            except tables.NoSuchNodeError:
+                continue
+            df = _readTable(table, '(type == {0})'.format(type_id))
+            if len(df):
+                df['type'] = type_name
+                data[type_name] = df
+    finally:
+        hub_file.close()
+    return data
+
+
+def _getCacheFolder(cache_dir, file_path, event_types):
+    fstat = os.stat(file_path)
+    key = json.dumps([os.path.abspath(file_path), fstat.st_size,
+                      fstat.st_mtime, event_types])
+    key = hashlib.md5(key.encode('utf-8')).hexdigest()[:16]
+    fname = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_dir, '{0}_{1}'.format(fname, key))
+
+
+def _readCache(folder, cache_format):
+    index_path = os.path.join(folder, _CACHE_INDEX)
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path, 'r') as f:
+        names = json.load(f)
+    data = dict()
+    for name in names:
+        path = os.path.join(folder, '{0}.{1}'.format(name, cache_format))
+        if cache_format == 'parquet':
+            data[name] = pd.read_parquet(path)
+        elif cache_format == 'feather':
+            data[name] = pd.read_feather(path)
+        else:
+            data[name] = pd.read_pickle(path)
+    return data
+
+
+def _writeCache(folder, cache_format, data):
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    for name, df in data.items():
+        path = os.path.join(folder, '{0}.{1}'.format(name, cache_format))
+        if cache_format == 'parquet':
+            df.to_parquet(path)
+        elif cache_format == 'feather':
+            df.to_feather(path)
+        else:
+            df.to_pickle(path)
+    # The index is written last, so a partly written cache is not used.
+    with open(os.path.join(folder, _CACHE_INDEX), 'w') as f:
+        json.dump(sorted(data.keys()), f)
+
+
+def _loadDataStoreFileJob(job):
+    """Worker process function: read one file, using the cache if possible.
+    """
+    file_path, event_types, cache_dir, cache_format = job
+    if not cache_dir:
+        return readDataStoreFile(file_path, event_types)
+    folder = _getCacheFolder(cache_dir, file_path, event_types)
+    data = _readCache(folder, cache_format)
+    if data is None:
+        data = readDataStoreFile(file_path, event_types)
+        _writeCache(folder, cache_format, data)
+    return data
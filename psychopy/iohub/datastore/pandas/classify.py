@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+# ioHub DataStore to Pandas DataFrames - Vectorized Sample Classification
+# Part of the psychopy.iohub library.
+# Copyright (C) 2012-2016 iSolver Software Solutions
+# Distributed under the terms of the GNU General Public License (GPL).
+"""NumPy implementations of interest area and interest period matching,
+for classifying large numbers of gaze or mouse samples at once.
+
+Unlike interestarea.py, this module does not need shapely. Interest areas
+can be given as interestarea.Polygon (or any shapely polygon) objects, or as
+(name, vertices) pairs.
+
+Example::
+
+    from psychopy.iohub.datastore.pandas.classify import (classifySamples,
+                                                          dwellTimeSummary)
+
+    areas = [('left', [(-400, -100), (-200, -100), (-200, 100), (-400, 100)]),
+             ('right', [(200, -100), (400, -100), (400, 100), (200, 100)])]
+    samples = classifySamples(exp_data.BINOCULAR_EYE_SAMPLE, areas,
+                              periods=trial_ip,
+                              x_col='left_gaze_x', y_col='left_gaze_y')
+    dwell = dwellTimeSummary(samples)
+
+"""
+from __future__ import division, absolute_import, print_function
+
+import numpy as np
+import pandas as pd
+
+from past.builtins import basestring
+
+
+def _polygonRings(area):
+    """Return the list of (N, 2) vertex arrays making up an interest area:
+    the exterior and any interior rings (holes) of a shapely polygon, or
+    the given vertex list."""
+    if hasattr(area, 'exterior'):
+        rings = [area.exterior.coords]
+        rings.extend(r.coords for r in area.interiors)
+    else:
+        rings = [area]
+    return [np.asarray(r, dtype=np.float64).reshape(-1, 2) for r in rings]
+
+
+def _areaNames(areas):
+    """Split areas (a dict, or list of polygons or (name, vertices) pairs)
+    into lists of names and polygons."""
+    if isinstance(areas, dict):
+        areas = list(areas.items())
+    names = []
+    polygons = []
+    for i, area in enumerate(areas):
+        if isinstance(area, (tuple, list)) and len(area) == 2 and \
+                isinstance(area[0], basestring):
+            names.append(area[0])
+            polygons.append(area[1])
+        else:
+            names.append(getattr(area, 'name', 'IA_{0}'.format(i + 1)))
+            polygons.append(area)
+    return names, polygons
+
+
+def pointsInPolygon(x, y, polygon):
+    """Return a bool array that is True for each point (x[i], y[i]) inside
+    polygon, using the even-odd (ray crossing) rule.
+
+    polygon is a list of (x, y) vertices or a shapely polygon, in which case
+    points inside a hole are not in the polygon. Points outside the
+    polygon's bounding box are rejected first; for the rest, each polygon
+    edge is only tested against the points whose y value is within the
+    edge's y range, found by a binary search of the points sorted by y.
+    Points exactly on an edge may be classified either way.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    shape = x.shape
+    x = x.ravel()
+    y = y.ravel()
+    inside = np.zeros(x.size, dtype=bool)
+
+    rings = _polygonRings(polygon)
+    minx, miny = rings[0].min(axis=0)
+    maxx, maxy = rings[0].max(axis=0)
+    candidates = np.flatnonzero((x >= minx) & (x <= maxx) &
+                                (y >= miny) & (y <= maxy))
+    if candidates.size == 0:
+        return inside.reshape(shape)
+
+    order = np.argsort(y[candidates], kind='mergesort')
+    candidates = candidates[order]
+    px = x[candidates]
+    py = y[candidates]
+    crossings = np.zeros(candidates.size, dtype=bool)
+
+    for ring in rings:
+        if len(ring) < 3:
+            continue
+        x1 = ring[:, 0]
+        y1 = ring[:, 1]
+        x2 = np.roll(x1, -1)
+        y2 = np.roll(y1, -1)
+        # an edge is crossed by a ray from a point towards +x if the point
+        # is in [min(y1, y2), max(y1, y2)) and left of the edge.
+        lo = np.searchsorted(py, np.minimum(y1, y2), side='left')
+        hi = np.searchsorted(py, np.maximum(y1, y2), side='left')
+        for e in np.flatnonzero(hi > lo):
+            s = slice(lo[e], hi[e])
+            xint = x1[e] + (py[s] - y1[e]) * (x2[e] - x1[e]) / (y2[e] - y1[e])
+            crossings[s] ^= px[s] < xint
+
+    inside[candidates] = crossings
+    return inside.reshape(shape)
+
+
+def interestAreaMask(x, y, areas):
+    """Return a bool array of shape (len(areas), len(x)) that is True where
+    sample i is inside area j.
+
+    Args:
+        x, y (array): Sample positions.
+        areas (list or dict): interestarea.Polygon objects, (name, vertices)
+            pairs, or a dict of name: vertices.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    names, polygons = _areaNames(areas)
+    mask = np.zeros((len(polygons), x.size), dtype=bool)
+    for i, polygon in enumerate(polygons):
+        mask[i] = pointsInPolygon(x, y, polygon).ravel()
+    return mask
+
+
+def interestAreaIndex(x, y, areas):
+    """Return an int array giving, for each sample, the index of the first
+    area in areas that contains it, or -1 if no area contains the sample.
+    """
+    mask = interestAreaMask(x, y, areas)
+    if mask.shape[0] == 0:
+        return np.full(mask.shape[1], -1, dtype=np.intp)
+    return np.where(mask.any(axis=0), mask.argmax(axis=0), -1)
+
+
+def interestPeriodIndex(times, start_times, end_times):
+    """Return an int array giving, for each time, the index of the interest
+    period with start_time <= time <= end_time, or -1 if time is not in any
+    period.
+
+    Periods must not overlap, but do not need to be sorted. Each time is
+    matched with a binary search of the period start times, so the cost is
+    O(n log p) for n times and p periods.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    start_times = np.asarray(start_times, dtype=np.float64)
+    end_times = np.asarray(end_times, dtype=np.float64)
+    if start_times.size == 0:
+        return np.full(times.shape, -1, dtype=np.intp)
+
+    order = np.argsort(start_times, kind='mergesort')
+    sorted_starts = start_times[order]
+    pos = np.searchsorted(sorted_starts, times, side='right') - 1
+    valid = pos >= 0
+    pos[~valid] = 0
+    valid &= times <= end_times[order][pos]
+    return np.where(valid, order[pos], -1)
+
+
+def _groupPositions(df, nlevels):
+    """Return a dict of index key: sample row positions for the first
+    nlevels index levels of df, or {None: all rows} if df is not indexed
+    that way."""
+    if nlevels and isinstance(df.index, pd.MultiIndex) and \
+            df.index.nlevels >= nlevels:
+        return df.groupby(level=list(range(nlevels)), sort=False).indices
+    return {None: np.arange(len(df))}
+
+
+def classifySamples(samples, areas=None, periods=None, x_col='x_position',
+                    y_col='y_position', time_col='time', group_levels=2):
+    """Return a copy of the samples DataFrame with columns giving the
+    interest area and interest period of each sample.
+
+    If areas are given, an 'ia_name' column holds the name of the first
+    area containing the sample. If periods are given, an 'ip_id_num'
+    column holds the ip_id_num of the period containing the sample time.
+    Samples that are not in any area or period have NaN values.
+
+    Args:
+        samples (DataFrame): Events with x_col, y_col and time_col columns,
+            as returned by ioHubPandasDataView.
+        areas (list or dict): See interestAreaMask().
+        periods: An InterestPeriodDefinition, or a DataFrame with
+            start_time, end_time and ip_id_num columns, like its ip_df.
+        group_levels (int): If samples and periods are both indexed by
+            (experiment_id, session_id), periods are matched within each
+            session. Set to 0 to match all samples against all periods.
+    """
+    result = samples.copy()
+
+    if areas is not None:
+        names, polygons = _areaNames(areas)
+        ia_index = interestAreaIndex(samples[x_col].values,
+                                     samples[y_col].values, polygons)
+        ia_names = np.array(names + [np.nan], dtype=object)
+        result['ia_name'] = ia_names[ia_index]
+
+    if periods is not None:
+        ip_df = getattr(periods, 'ip_df', periods)
+        ip_id_num = np.full(len(samples), np.nan)
+        times = samples[time_col].values
+        if not (isinstance(ip_df.index, pd.MultiIndex) and
+                ip_df.index.nlevels >= group_levels):
+            group_levels = 0
+        ip_groups = _groupPositions(ip_df, group_levels)
+        for key, rows in _groupPositions(samples, group_levels).items():
+            ip_rows = ip_groups.get(key)
+            if ip_rows is None:
+                continue
+            group_ips = ip_df.iloc[ip_rows]
+            ip_index = interestPeriodIndex(times[rows],
+                                           group_ips['start_time'].values,
+                                           group_ips['end_time'].values)
+            found = ip_index >= 0
+            ip_id_num[rows[found]] = \
+                group_ips['ip_id_num'].values[ip_index[found]]
+        result['ip_id_num'] = ip_id_num
+
+    return result
+
+
+def dwellTimeSummary(samples, time_col='time', group_levels=2):
+    """Summarize the samples returned by classifySamples() for each
+    (session, interest period, interest area) combination.
+
+    The duration of each sample is the time until the next sample of the
+    same session; the last sample of a session is given the median sample
+    duration. Samples must be sorted by time within each session.
+
+    Returns:
+        DataFrame with sample_count, dwell_time, entry_count (number of
+        separate visits to the area), first_time and last_time columns.
+    """
+    label_cols = [c for c in ('ip_id_num', 'ia_name') if c in samples.columns]
+    if not label_cols:
+        raise ValueError('samples have no ip_id_num or ia_name column; '
+                         'use classifySamples() first.')
+
+    n = len(samples)
+    times = samples[time_col].values.astype(np.float64)
+    group = np.zeros(n, dtype=np.intp)
+    summary = dict()
+    if group_levels and isinstance(samples.index, pd.MultiIndex) and \
+            samples.index.nlevels >= group_levels:
+        group = samples.groupby(level=list(range(group_levels)),
+                                sort=False).ngroup().values
+        for i in range(group_levels):
+            name = samples.index.names[i] or 'level_{0}'.format(i)
+            summary[name] = samples.index.get_level_values(i)
+    index_cols = list(summary.keys())
+
+    same_group_next = np.zeros(n, dtype=bool)
+    same_group_next[:-1] = group[1:] == group[:-1]
+    durations = np.full(n, np.nan)
+    durations[:-1] = np.diff(times)
+    durations[~same_group_next] = np.nan
+    if np.isfinite(durations).any():
+        durations[~same_group_next] = np.nanmedian(durations)
+    else:
+        durations[:] = 0.0
+
+    # a new entry starts when the sample's labels differ from the previous
+    # sample's, or at the start of a session.
+    label_codes = np.zeros(n, dtype=np.int64)
+    for col in label_cols:
+        codes, uniques = pd.factorize(samples[col])
+        label_codes = label_codes * (len(uniques) + 1) + codes + 1
+    new_entry = np.ones(n, dtype=bool)
+    new_entry[1:] = (label_codes[1:] != label_codes[:-1]) | \
+        (group[1:] != group[:-1])
+
+    for col in label_cols:
+        summary[col] = samples[col].values
+    summary['_duration'] = durations
+    summary['_entry'] = new_entry
+    summary['_time'] = times
+    summary = pd.DataFrame(summary, columns=list(summary.keys()))
+    summary = summary.groupby(index_cols + label_cols).agg(
+        sample_count=('_time', 'size'),
+        dwell_time=('_duration', 'sum'),
+        entry_count=('_entry', 'sum'),
+        first_time=('_time', 'min'),
+        last_time=('_time', 'max'))
+    summary['entry_count'] = summary['entry_count'].astype(np.int64)
+    return summary
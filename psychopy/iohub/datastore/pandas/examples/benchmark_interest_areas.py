@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Compares the time taken to classify gaze samples by interest area and
+interest period using the NumPy functions in
+psychopy.iohub.datastore.pandas.classify with the per sample shapely
+containment test previously used by interestarea.Polygon.filter().
+
+Synthetic samples are used, so no ioDataStore file is needed. The shapely
+test is run on a subset of the samples since it is very slow; its time is
+scaled up for comparison. Requires the 'shapely' package.
+"""
+from __future__ import division, print_function
+
+import timeit
+
+import numpy as np
+import pandas as pd
+import shapely.geometry
+
+from psychopy.iohub.datastore.pandas.classify import (classifySamples,
+                                                      dwellTimeSummary,
+                                                      interestAreaIndex)
+
+SAMPLE_COUNT = 1000000
+SHAPELY_SAMPLE_COUNT = 20000
+SAMPLE_RATE = 1000.0
+TRIAL_COUNT = 100
+
+rand = np.random.RandomState(0)
+times = np.arange(SAMPLE_COUNT) / SAMPLE_RATE
+samples = pd.DataFrame(dict(time=times,
+                            x_position=rand.normal(0, 300, SAMPLE_COUNT),
+                            y_position=rand.normal(0, 200, SAMPLE_COUNT)),
+                       index=pd.MultiIndex.from_arrays(
+                           [np.ones(SAMPLE_COUNT, int),
+                            np.ones(SAMPLE_COUNT, int)],
+                           names=['experiment_id', 'session_id']))
+
+trial_starts = np.linspace(0, times[-1], TRIAL_COUNT, endpoint=False)
+trials = pd.DataFrame(dict(start_time=trial_starts + 0.5,
+                           end_time=trial_starts + 8.0,
+                           ip_id_num=np.arange(1, TRIAL_COUNT + 1)),
+                      index=pd.MultiIndex.from_arrays(
+                          [np.ones(TRIAL_COUNT, int),
+                           np.ones(TRIAL_COUNT, int)],
+                          names=['experiment_id', 'session_id']))
+
+shapes = [('Circle IA', shapely.geometry.Point(0, 0).buffer(250,
+                                                            resolution=16)),
+          ('Rect IA', shapely.geometry.box(-400, -100, -200, 100)),
+          ('Spot IA', shapely.geometry.Point(300, 300).buffer(10,
+                                                              resolution=16))]
+
+
+def shapelyAreaIndex(df):
+    index = np.full(len(df), -1)
+    for i, (name, shape) in reversed(list(enumerate(shapes))):
+        contains = df[['x_position', 'y_position']].apply(
+            lambda v: shape.contains(shapely.geometry.Point(v[0], v[1])),
+            axis=1).values
+        index[contains] = i
+    return index
+
+
+subset = samples.iloc[:SHAPELY_SAMPLE_COUNT]
+assert np.array_equal(shapelyAreaIndex(subset),
+                      interestAreaIndex(subset['x_position'].values,
+                                        subset['y_position'].values, shapes))
+
+shapely_time = min(timeit.repeat(lambda: shapelyAreaIndex(subset),
+                                 number=1, repeat=3))
+numpy_time = min(timeit.repeat(
+    lambda: classifySamples(samples, shapes, trials), number=1, repeat=3))
+shapely_time *= SAMPLE_COUNT / SHAPELY_SAMPLE_COUNT
+
+print('Classifying {0} samples, {1} areas, {2} periods:'.format(
+    SAMPLE_COUNT, len(shapes), TRIAL_COUNT))
+print('  shapely, areas only (est.): {0:10.3f} sec'.format(shapely_time))
+print('  numpy, areas and periods:   {0:10.3f} sec'.format(numpy_time))
+print('  speedup: {0:.0f}x'.format(shapely_time / numpy_time))
+print()
+print(dwellTimeSummary(classifySamples(samples, shapes, trials)).head(10))
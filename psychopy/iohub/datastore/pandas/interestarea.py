@@ -18,6 +18,8 @@ except ImportError:
 
 from weakref import proxy
 
+from .classify import pointsInPolygon
+
 
 class Polygon(shapely.geometry.Polygon):
     _next_id = 1
@@ -47,8 +49,8 @@ class Polygon(shapely.geometry.Polygon):
         if self._last_target_df is not target_df:
             self._last_target_df = proxy(target_df)
             self._ia_df = None
-            self._ia_df = target_df[
-                target_df[[x_col, y_col]].apply(self.contains, axis=1)]
+            self._ia_df = target_df[pointsInPolygon(
+                target_df[x_col].values, target_df[y_col].values, self)]
             self._ia_df['ia_name'] = self.name
             self._ia_df['ia_id'] = self.ia_id
             self._ia_df['ia_name'] = self.name
@@ -10,12 +10,14 @@ from builtins import next
 from past.builtins import basestring
 from builtins import object
 import numbers  # numbers.Integral is like (int, long) but supports Py3
+import numpy as np
 from tables import *
 import os
 from collections import namedtuple
 import json
 
 from ..errors import print2err
+from ..constants import EventConstants
 
 from pkg_resources import parse_version
 import tables
@@ -25,16 +27,25 @@ if parse_version(tables.__version__) < parse_version('3'):
     list_nodes = "listNodes"
     get_node = "getNode"
     read_where = "readWhere"
+    get_where_list = "getWhereList"
+    read_coordinates = "readCoordinates"
+    will_query_use_indexing = "willQueryUseIndexing"
 else:
     from tables import open_file
     walk_groups = "walk_groups"
     list_nodes = "list_nodes"
     get_node = "get_node"
     read_where = "read_where"
+    get_where_list = "get_where_list"
+    read_coordinates = "read_coordinates"
+    will_query_use_indexing = "will_query_use_indexing"
 
 
 _hubFiles = []
 
+#: Default maximum number of table rows read per chunk by readTableChunks.
+DEFAULT_CHUNK_SIZE = 100000
+
 def openHubFile(filepath, filename, mode):
     """
     Open an HDF5 DataStore file and register it so that it is closed even on interpreter crash.
@@ -45,6 +56,77 @@ def openHubFile(filepath, filename, mode):
     return hubFile
 
 
+def readTableChunks(table, condition=None, columns=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, as_type='numpy'):
+    """Generator that reads the rows of a DataStore table that match
+    condition, chunk_size table rows at a time, so memory use does not
+    depend on the size of the table.
+
+    The condition is a PyTables / numexpr condition string (for example
+    '(session_id == 2) & (time >= 10.0)') and is evaluated inside PyTables;
+    rows are only ever read as numpy arrays, never one at a time in Python.
+    If a condition column has an index (see DataStoreFile.close()), the
+    index gives the numbers of the matching rows, which are then read
+    chunk_size at a time; otherwise the table is scanned chunk_size rows at
+    a time.
+
+    Args:
+        table (tables.Table): DataStore table to read.
+        condition (str): Row selection condition. None reads all rows.
+        columns (list): Column names to include. None includes all columns.
+        chunk_size (int): Number of table rows read at a time. Chunks
+            contain at most this many (matching) rows; chunks with no
+            matching rows are skipped.
+        as_type (str): 'numpy' yields numpy structured arrays; 'dataframe'
+            yields pandas DataFrames.
+
+    Yields:
+        numpy.ndarray or pandas.DataFrame: the matching rows of each chunk.
+    """
+    if as_type not in ('numpy', 'dataframe'):
+        raise ValueError("as_type must be 'numpy' or 'dataframe', "
+                         "not {}".format(as_type))
+    if as_type == 'dataframe':
+        import pandas as pd
+    if columns is not None:
+        for cname in columns:
+            if cname not in table.colnames:
+                raise ExperimentDataAccessException(
+                    '{0} does not have a column named {1}'.format(
+                        table._v_pathname, cname))
+        out_dtype = np.dtype([(c, table.coldtypes[c]) for c in columns])
+
+    def _chunks():
+        if condition and getattr(table, will_query_use_indexing)(condition):
+            coords = getattr(table, get_where_list)(condition, sort=True)
+            for start in range(0, len(coords), chunk_size):
+                yield getattr(table, read_coordinates)(
+                    coords[start:start + chunk_size])
+            return
+
+        nrows = table.nrows
+        for start in range(0, nrows, chunk_size):
+            stop = min(start + chunk_size, nrows)
+            if condition:
+                yield getattr(table, read_where)(condition, start=start,
+                                                 stop=stop)
+            else:
+                yield table.read(start, stop)
+
+    for rows in _chunks():
+        if len(rows) == 0:
+            continue
+        if columns is not None:
+            selected = np.empty(len(rows), dtype=out_dtype)
+            for cname in columns:
+                selected[cname] = rows[cname]
+            rows = selected
+        if as_type == 'dataframe':
+            yield pd.DataFrame.from_records(rows)
+        else:
+            yield rows
+
+
 def displayDataFileSelectionDialog(starting_dir=None):
     """Shows a FileDialog and lets you select a .hdf5 file to open for
     processing."""
@@ -485,14 +567,8 @@ class ExperimentDataAccessUtility(object):
                 if startConditions is None and endConditions is None:
                     for cv in filteredConditionVariableList:
 
-                        wclause = '( experiment_id == {0} ) & ( session_id == {1} )'.format(
-                            self._experimentID, cv.session_id)
-
-                        wclause += ' & ( type == {0} ) '.format(event_type_id)
-
-                        if filter_id is not None:
-                            wclause += '& ( filter_id == {0} ) '.format(
-                                filter_id)
+                        wclause = self._getTrialWhereClause(
+                            event_type_id, cv, cvNames, filter_id)
 
                         resultSetList.append([])
 
@@ -511,37 +587,9 @@ class ExperimentDataAccessUtility(object):
                 for cv in filteredConditionVariableList:
                     resultSetList.append([])
 
-                    wclause = '( experiment_id == {0} ) & ( session_id == {1} )'.format(
-                        self._experimentID, cv.session_id)
-
-                    wclause += ' & ( type == {0} ) '.format(event_type_id)
-
-                    if filter_id is not None:
-                        wclause += '& ( filter_id == {0} ) '.format(filter_id)
-
-                    # start Conditions need to be added to where clause
-                    if startConditions is not None:
-                        wclause += '& ('
-                        for conditionAttributeName, conditionAttributeComparitor in startConditions.items():
-                            avComparison,value=conditionAttributeComparitor
-                            value = self.getValuesForVariables(
-                                cv, value, cvNames)
-                            wclause += ' ( {0} {1} {2} ) & '.format(
-                                conditionAttributeName, avComparison, value)
-                        wclause=wclause[:-3]
-                        wclause += ' ) '
-
-                    # end Conditions need to be added to where clause
-                    if endConditions is not None:
-                        wclause += ' & ('
-                        for conditionAttributeName, conditionAttributeComparitor in endConditions.items():
-                            avComparison,value=conditionAttributeComparitor
-                            value = self.getValuesForVariables(
-                                cv, value, cvNames)
-                            wclause += ' ( {0} {1} {2} ) & '.format(
-                                conditionAttributeName, avComparison, value)
-                        wclause=wclause[:-3]
-                        wclause += ' ) '
+                    wclause = self._getTrialWhereClause(
+                        event_type_id, cv, cvNames, filter_id,
+                        startConditions, endConditions)
 
                     for ename in event_attribute_names:
                         resultSetList[-1].append(getattr(deviceEventTable, read_where)(wclause, field=ename))
@@ -556,6 +604,156 @@ class ExperimentDataAccessUtility(object):
 
             return None
 
+    def _getTrialWhereClause(self, event_type_id, cv, cvNames,
+                             filter_id=None, startConditions=None,
+                             endConditions=None):
+        """Build the event table where clause selecting the events of one
+        condition variable row (trial), as used by getEventAttributeValues.
+        """
+        wclause = '( experiment_id == {0} ) & ( session_id == {1} )'.format(
+            self._experimentID, cv.session_id)
+
+        wclause += ' & ( type == {0} ) '.format(event_type_id)
+
+        if filter_id is not None:
+            wclause += '& ( filter_id == {0} ) '.format(filter_id)
+
+        # start Conditions need to be added to where clause
+        if startConditions is not None:
+            wclause += '& ('
+            for conditionAttributeName, conditionAttributeComparitor in startConditions.items():
+                avComparison,value=conditionAttributeComparitor
+                value = self.getValuesForVariables(
+                    cv, value, cvNames)
+                wclause += ' ( {0} {1} {2} ) & '.format(
+                    conditionAttributeName, avComparison, value)
+            wclause=wclause[:-3]
+            wclause += ' ) '
+
+        # end Conditions need to be added to where clause
+        if endConditions is not None:
+            wclause += ' & ('
+            for conditionAttributeName, conditionAttributeComparitor in endConditions.items():
+                avComparison,value=conditionAttributeComparitor
+                value = self.getValuesForVariables(
+                    cv, value, cvNames)
+                wclause += ' ( {0} {1} {2} ) & '.format(
+                    conditionAttributeName, avComparison, value)
+            wclause=wclause[:-3]
+            wclause += ' ) '
+        return wclause
+
+    def _getEventTypeTable(self, event_type):
+        """Return (event_type_id, table) for an event type given as an
+        EventConstants id, an EventConstants name ('KEYBOARD_PRESS') or an
+        event class name ('KeyboardPressEvent')."""
+        if isinstance(event_type, basestring) and event_type.find('Event') < 0:
+            event_type = getattr(EventConstants, event_type.upper(), event_type)
+        mappings = self.getEventMappingInformation() or {}
+        for event_type_id, mapping in mappings.items():
+            class_name = mapping.class_name
+            if isinstance(class_name, bytes):
+                class_name = class_name.decode('utf-8')
+            if event_type in (event_type_id, class_name):
+                table_path = mapping.table_path
+                if isinstance(table_path, bytes):
+                    table_path = table_path.decode('utf-8')
+                return event_type_id, getattr(self.hdfFile, get_node)(table_path)
+        raise ExperimentDataAccessException(
+            'No DataStore table found for event type {0}'.format(event_type))
+
+    def getEventChunks(
+            self,
+            event_type,
+            event_attribute_names=None,
+            sessions=None,
+            start_time=None,
+            end_time=None,
+            condition_str=None,
+            chunk_size=DEFAULT_CHUNK_SIZE,
+            as_type='numpy'):
+        """Generator returning the events of one type in chunks, so event
+        tables that do not fit in memory can be processed. Session, time
+        range and condition_str filtering is done by PyTables as the table is
+        read; see readTableChunks().
+
+        Args:
+            event_type (int or str): EventConstants id or name, or event class
+                name, of the events to read.
+            event_attribute_names (list): Event fields to return. None
+                returns all fields.
+            sessions (list): session_id's to include. If None, the sessions
+                matching the sessionCodes given on init are used.
+            start_time (float): Only events with time >= start_time.
+            end_time (float): Only events with time < end_time.
+            condition_str (str): Extra PyTables condition, for example
+                '(filter_id == 0)'.
+            chunk_size (int): Number of table rows read per chunk.
+            as_type (str): 'numpy' or 'dataframe'.
+
+        Yields:
+            numpy structured array or pandas DataFrame of matching events.
+        """
+        event_type_id, table = self._getEventTypeTable(event_type)
+
+        if sessions is None and self._sessionCodes:
+            sessions = [s.session_id for s in self.getSessionMetaData()]
+
+        wclause = '( experiment_id == {0} ) & ( type == {1} )'.format(
+            self._experimentID, event_type_id)
+        if sessions is not None:
+            if len(sessions) == 0:
+                return
+            wclause += ' & ( {0} )'.format(' | '.join(
+                '( session_id == {0} )'.format(sid) for sid in sessions))
+        if start_time is not None:
+            wclause += ' & ( time >= {0!r} )'.format(float(start_time))
+        if end_time is not None:
+            wclause += ' & ( time < {0!r} )'.format(float(end_time))
+        if condition_str:
+            wclause += ' & ( {0} )'.format(condition_str)
+
+        for chunk in readTableChunks(table, wclause, event_attribute_names,
+                                     chunk_size, as_type):
+            yield chunk
+
+    def getTrialEventChunks(
+            self,
+            event_type,
+            event_attribute_names=None,
+            filter_id=None,
+            conditionVariablesFilter=None,
+            startConditions=None,
+            endConditions=None,
+            chunk_size=DEFAULT_CHUNK_SIZE,
+            as_type='numpy'):
+        """Generator returning the events of one type for each condition
+        variable row (trial) in chunks. Trials are selected and bounded in
+        the same way as in getEventAttributeValues(), but event values are
+        not all loaded at once.
+
+        Yields:
+            (condition_set, chunk) tuples, where condition_set is the trial's
+            condition variable row and chunk a numpy structured array or
+            pandas DataFrame of matching events. A long trial may give
+            several chunks.
+        """
+        event_type_id, table = self._getEventTypeTable(event_type)
+        cvNames = self.getConditionVariableNames()
+        if conditionVariablesFilter is None:
+            cvs = self.getConditionVariables()
+        else:
+            cvs = self.getConditionVariables(conditionVariablesFilter)
+
+        for cv in cvs:
+            wclause = self._getTrialWhereClause(
+                event_type_id, cv, cvNames, filter_id, startConditions,
+                endConditions)
+            for chunk in readTableChunks(table, wclause,
+                                         event_attribute_names, chunk_size,
+                                         as_type):
+                yield cv, chunk
+
     def getEventIterator(self, event_type):
         """
         **Docstr TBC.**
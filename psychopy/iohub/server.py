@@ -11,6 +11,7 @@ import sys
 from operator import itemgetter
 from collections import deque, OrderedDict
 
+import numpy as np
 import msgpack
 import gevent
 from gevent.server import DatagramServer
@@ -30,6 +31,7 @@ from .errors import print2err, printExceptionDetailsToStdErr, ioHubError
 from .net import MAX_PACKET_SIZE
 from .util import convertCamelToSnake, win32MessagePump
 from .util import yload, yLoader
+from .util.sharedmem import SharedEventRingBuffer, SHARED_MEMORY_AVAILABLE
 from .constants import DeviceConstants, EventConstants
 from .devices import DeviceEvent, import_device
 from .devices import Computer
@@ -53,6 +55,35 @@ def convertByteStrings(rdict):
         result[k] = i
     return result
 
+def eventsToColumnarBlocks(events):
+    """Group a list of iohub events (in list form) by event type and pack
+    each group into a structured numpy array using the event class's
+    NUMPY_DTYPE.
+
+    Returns a list of [event_type_id, event_count, data] blocks, where data
+    is the raw bytes of the array, which is sorted by event hub time.
+    """
+    etype_index = DeviceEvent.EVENT_TYPE_ID_INDEX
+    time_index = DeviceEvent.EVENT_HUB_TIME_INDEX
+    grouped = OrderedDict()
+    for evt in events:
+        etype = evt[etype_index]
+        etype_events = grouped.get(etype)
+        if etype_events is None:
+            grouped[etype] = etype_events = []
+        etype_events.append(tuple(evt))
+
+    blocks = []
+    for etype, etype_events in grouped.items():
+        eclass = EventConstants.getClass(etype)
+        np_events = np.array(etype_events, dtype=eclass.NUMPY_DTYPE)
+        time_field = eclass.CLASS_ATTRIBUTE_NAMES[time_index]
+        np_events = np_events[np.argsort(np_events[time_field],
+                                         kind='mergesort')]
+        blocks.append([etype, len(np_events), np_events.tobytes()])
+    return blocks
+
+
 class udpServer(DatagramServer):
     client_proc_init_req = None
     def __init__(self, ioHubServer, address):
@@ -90,6 +121,13 @@ class udpServer(DatagramServer):
                                payload, replyTo], replyTo)
             return True
         elif request_type == 'GET_EVENTS':
+            as_type = None
+            if request:
+                as_type = request.pop(0)
+                if isinstance(as_type, bytes):
+                    as_type = as_type.decode('utf-8')
+            if as_type == 'numpy':
+                return self.handleGetEventsColumnar(replyTo)
             return self.handleGetEvents(replyTo)
         elif request_type == 'EXP_DEVICE':
             return self.handleExperimentDeviceRequest(request, replyTo)
@@ -223,6 +261,32 @@ class udpServer(DatagramServer):
             self.sendResponse('IOHUB_GET_EVENTS_ERROR', replyTo)
             return False
 
+    def handleGetEventsColumnar(self, replyTo):
+        """Reply with the global event buffer packed as one block per
+        event type. Each block is [event_type_id, event_count, data], where
+        data holds the raw bytes of a structured array using the event
+        class's NUMPY_DTYPE, sorted by event time. The client rebuilds each
+        block with numpy.frombuffer; no per event objects are created.
+        """
+        try:
+            self.iohub.processDeviceEvents()
+            currentEvents = list(self.iohub.eventBuffer)
+            self.iohub.eventBuffer.clear()
+
+            if len(currentEvents) > 0:
+                self.sendResponse(('GET_EVENTS_COLUMNAR_RESULT',
+                                   eventsToColumnarBlocks(currentEvents)),
+                                  replyTo)
+            else:
+                self.sendResponse(('GET_EVENTS_COLUMNAR_RESULT', None),
+                                  replyTo)
+            return True
+        except Exception:
+            print2err('IOHUB_GET_EVENTS_ERROR')
+            printExceptionDetailsToStdErr()
+            self.sendResponse('IOHUB_GET_EVENTS_ERROR', replyTo)
+            return False
+
     def handleExperimentDeviceRequest(self, request, replyTo):
         request_type = request.pop(0)
         if not isinstance(request_type, unicode):
@@ -446,6 +510,14 @@ class udpServer(DatagramServer):
             return dsfile.extendConditionVariableTable(exp_id, sess_id, data)
         return False
 
+    def getSharedEventBuffers(self, device_class_name):
+        """Return a list of [event_type_id, shared_memory_name] for each
+        shared memory event ring buffer the given device is writing to.
+        The list is empty if shared memory event buffers are disabled.
+        """
+        dev_buffers = self.iohub.sharedEventBuffers.get(device_class_name, {})
+        return [[etype, ring.name] for etype, ring in dev_buffers.items()]
+
     def clearEventBuffer(self, clear_device_level_buffers=False):
         """
 
@@ -489,10 +561,16 @@ class udpServer(DatagramServer):
     def flushIODataStoreFile(self):
         dsfile = self.iohub.dsfile
         if dsfile:
-            dsfile.emrtFile.flush()
+            dsfile.flush()
             return True
         return False
 
+    def getDataStoreWriterStats(self):
+        dsfile = self.iohub.dsfile
+        if dsfile:
+            return dsfile.getWriterStats()
+        return None
+
     def shutDown(self):
         try:
             self.setPriority('normal')
@@ -556,6 +634,13 @@ class ioServer(object):
         self._all_dev_conf_errors = []
         ebuf_sz = config.get('global_event_buffer', 2048)
         ioServer.eventBuffer = deque(maxlen=ebuf_sz)
+        # device class name -> {event type id: SharedEventRingBuffer}
+        self.sharedEventBuffers = OrderedDict()
+        self._shared_ebuf_sz = config.get('shared_memory_event_buffer', 0)
+        if self._shared_ebuf_sz and not SHARED_MEMORY_AVAILABLE:
+            self.log('shared_memory_event_buffer requires Python 3.8+; '
+                     'events will be sent over UDP.')
+            self._shared_ebuf_sz = 0
 
         self._running = True
         # start UDP service
@@ -707,6 +792,10 @@ class ioServer(object):
         else:
             self.log('DataStore Not Enabled. No events will be saved.')
 
+        # add shared memory event buffers for the experiment process
+        if self._shared_ebuf_sz and dconf.get('stream_events') is True:
+            self._addSharedEventBuffers(dinstance, devt_ids, devt_classes)
+
         # Add Device Monitor for Keyboard or Mouse device type
         deviceDict = ioServer.deviceDict
         iohub = self
@@ -778,6 +867,29 @@ class ioServer(object):
 
             return [dev_cls_name, dconf['name'], dinstance._getRPCInterface()]
 
+    def _addSharedEventBuffers(self, dinstance, devt_ids, devt_classes):
+        dcls_name = dinstance.__class__.__name__
+        if dcls_name == 'Experiment':
+            # Experiment events come from the experiment process itself.
+            return
+        dev_buffers = self.sharedEventBuffers.setdefault(dcls_name,
+                                                         OrderedDict())
+        for evt_cls in devt_classes.values():
+            etype = evt_cls.EVENT_TYPE_ID
+            if etype not in devt_ids or etype in dev_buffers:
+                continue
+            try:
+                ring = SharedEventRingBuffer.create(evt_cls.NUMPY_DTYPE,
+                                                    self._shared_ebuf_sz)
+                dinstance._addEventListener(ring, [etype, ])
+                dev_buffers[etype] = ring
+            except Exception:
+                print2err('Error creating shared memory event buffer: ',
+                          dcls_name, etype)
+                printExceptionDetailsToStdErr()
+        self.log('Added Shared Memory Event Buffers: {}, {}'.format(
+            dcls_name, list(dev_buffers.keys())))
+
     def addDeviceToMonitor(self, dev_cls_name, dev_conf):
         dev_cls_name = str(dev_cls_name)
         self.log('Handling Device: %s' % (dev_cls_name,))
@@ -901,6 +1013,8 @@ class ioServer(object):
         while self._running:
             stime = Computer.getTime()
             self.processDeviceEvents()
+            if self.dsfile:
+                self.dsfile.checkPendingEvents()
             dur = sleep_interval - (Computer.getTime() - stime)
             gevent.sleep(max(0.001, dur))
 
@@ -987,6 +1101,11 @@ class ioServer(object):
 
             while self.devices:
                 self.devices.pop(0)._close()
+
+            while self.sharedEventBuffers:
+                _, dev_buffers = self.sharedEventBuffers.popitem()
+                for ring in dev_buffers.values():
+                    ring.close()
         except Exception:
             print2err('Error in ioSever.shutdown():')
             printExceptionDetailsToStdErr()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Part of the psychopy.iohub library.
+# Copyright (C) 2012-2016 iSolver Software Solutions
+# Distributed under the terms of the GNU General Public License (GPL).
+from __future__ import division, absolute_import
+
+from builtins import object
+import numpy
+
+from ..errors import print2err, printExceptionDetailsToStdErr
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8: events are only available through the UDP interface.
+    shared_memory = None
+
+SHARED_MEMORY_AVAILABLE = shared_memory is not None
+
+# Header fields, stored as uint64 values at the start of the shared block.
+_WRITE_COUNT = 0
+_READ_COUNT = 1
+_DROPPED_COUNT = 2
+_CAPACITY = 3
+_HEADER_SIZE = 64
+
+
+class SharedEventRingBuffer(object):
+    """A single producer / single consumer ring buffer of iohub events held
+    in a multiprocessing.shared_memory block.
+
+    The ioHub Server creates one SharedEventRingBuffer for each event type
+    that a device streams and registers it as an event listener of the
+    device, so ioServer.processDeviceEvents() writes events straight into
+    shared memory. The experiment process attaches to the same block by name
+    and reads events without a UDP request / reply round trip.
+
+    Each event is stored as one record of the event class's NUMPY_DTYPE.
+    The block starts with a small header holding monotonically increasing
+    write and read counters; only the ioHub Server changes the write counter
+    and only the experiment process changes the read counter, so no locking
+    is needed. When the buffer is full, new events are dropped and counted
+    in getDroppedCount() rather than overwriting unread events.
+
+    Example::
+
+        # ioHub Server process
+        ring = SharedEventRingBuffer.create(MessageEvent.NUMPY_DTYPE, 1024)
+        device._addEventListener(ring, [MessageEvent.EVENT_TYPE_ID, ])
+
+        # experiment process
+        ring = SharedEventRingBuffer.attach(ring_name, MessageEvent.NUMPY_DTYPE)
+        new_events = ring.read()
+
+    """
+
+    def __init__(self, shm, dtype, owner=False):
+        self._shm = shm
+        self._owner = owner
+        self.dtype = numpy.dtype(dtype)
+        self._header = numpy.ndarray((4,), dtype=numpy.uint64, buffer=shm.buf)
+        self.capacity = int(self._header[_CAPACITY])
+        self._data = numpy.ndarray((self.capacity,), dtype=self.dtype,
+                                   buffer=shm.buf, offset=_HEADER_SIZE)
+
+    @classmethod
+    def create(cls, dtype, capacity):
+        """Create a new shared memory ring buffer able to hold capacity
+        events of the given numpy dtype. Called by the ioHub Server, which
+        owns the shared memory block and unlinks it when close() is called.
+        """
+        dtype = numpy.dtype(dtype)
+        size = _HEADER_SIZE + dtype.itemsize * capacity
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        header = numpy.ndarray((4,), dtype=numpy.uint64, buffer=shm.buf)
+        header[:] = 0
+        header[_CAPACITY] = capacity
+        del header
+        return cls(shm, dtype, owner=True)
+
+    @classmethod
+    def attach(cls, name, dtype):
+        """Attach to a ring buffer created by the ioHub Server, given the
+        name of its shared memory block."""
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            # The ioHub Server owns the block; stop this process's resource
+            # tracker from unlinking it when the experiment process exits.
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:  # pylint: disable=broad-except
+            pass
+        return cls(shm, dtype)
+
+    @property
+    def name(self):
+        """Name of the shared memory block, used by attach()."""
+        return self._shm.name
+
+    def __len__(self):
+        return int(self._header[_WRITE_COUNT] - self._header[_READ_COUNT])
+
+    def getDroppedCount(self):
+        """Number of events dropped because the ring buffer was full."""
+        return int(self._header[_DROPPED_COUNT])
+
+    def _handleEvent(self, event):
+        """Event listener interface used by ioHub Devices. Copies the event
+        (in list form) into the next free record of the ring buffer."""
+        header = self._header
+        wcount = int(header[_WRITE_COUNT])
+        if wcount - int(header[_READ_COUNT]) >= self.capacity:
+            header[_DROPPED_COUNT] += 1
+            return False
+        try:
+            self._data[wcount % self.capacity] = tuple(event)
+        except Exception:  # pylint: disable=broad-except
+            print2err('Error writing event to shared memory buffer: ', event)
+            printExceptionDetailsToStdErr()
+            return False
+        # Publish the record only once it has been fully written.
+        header[_WRITE_COUNT] = wcount + 1
+        return True
+
+    def read(self, clear=True):
+        """Return the unread events as a structured numpy array, oldest event
+        first. If clear is True, the events are removed from the buffer.
+        """
+        header = self._header
+        rcount = int(header[_READ_COUNT])
+        wcount = int(header[_WRITE_COUNT])
+        count = wcount - rcount
+        if count <= 0:
+            return numpy.empty(0, dtype=self.dtype)
+        start = rcount % self.capacity
+        end = start + count
+        if end <= self.capacity:
+            events = self._data[start:end].copy()
+        else:
+            events = numpy.concatenate((self._data[start:],
+                                        self._data[:end - self.capacity]))
+        if clear:
+            header[_READ_COUNT] = wcount
+        return events
+
+    def clear(self):
+        """Discard all unread events."""
+        self._header[_READ_COUNT] = self._header[_WRITE_COUNT]
+
+    def close(self):
+        """Release this process's view of the shared memory block. If this
+        process created the block, it is also unlinked."""
+        if self._shm is None:
+            return
+        self._header = None
+        self._data = None
+        try:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+        except Exception:  # pylint: disable=broad-except
+            pass
+        self._shm = None
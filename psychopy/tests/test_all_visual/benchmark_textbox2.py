@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Times the layout of TextBox2 for texts of 10^4 characters: setting the
+whole text, and typing or deleting a character in the middle of it (which
+only lays out the lines around the edit again).
+
+Not run as part of the test suite (it needs a window).
+
+command-line usage:
+    python psychopy/tests/test_all_visual/benchmark_textbox2.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import random
+import timeit
+
+from psychopy import visual, logging
+
+N_CHARS = 10000
+WORDS = ('the of and to in is that for it as with was on be by participants '
+         'stimulus response trial experiment press key when you see red '
+         'blue').split()
+
+logging.console.setLevel(logging.ERROR)
+
+
+def makeText(nChars, newlineEvery=None, seed=1):
+    """Returns nChars of random words (with a newline every so many)"""
+    rng = random.Random(seed)
+    words = []
+    while sum(len(word) + 1 for word in words) < nChars:
+        words.append(rng.choice(WORDS))
+        if newlineEvery and len(words) % newlineEvery == 0:
+            words[-1] += '\n'
+    return ' '.join(words)[:nChars]
+
+
+def timeIt(label, func, number=10):
+    secs = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print('  {0:<44}{1:8.2f} msec'.format(label, secs * 1000))
+
+
+if __name__ == '__main__':
+    win = visual.Window([800, 600], units='height', autoLog=False)
+    try:
+        for label, text in (('wrapped paragraphs', makeText(N_CHARS, 50)),
+                            ('one paragraph', makeText(N_CHARS))):
+            textbox = visual.TextBox2(win, '', 'Arial', letterHeight=0.03,
+                                      size=(1.2, None), editable=True,
+                                      autoLog=False)
+            print('{0} chars, {1}:'.format(N_CHARS, label))
+
+            def setText():
+                textbox.text = text
+
+            timeIt('set .text', setText)
+            print('  ({0} lines)'.format(len(textbox._lineLenChars)))
+
+            def typeAndDelete():
+                textbox.caret.index = N_CHARS // 2
+                textbox.addCharAtCaret('x')
+                textbox.deleteCaretLeft()
+
+            timeIt('addCharAtCaret + deleteCaretLeft', typeAndDelete)
+    finally:
+        win.close()
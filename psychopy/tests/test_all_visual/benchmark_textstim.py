@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Times setting the text of a TextStim 10^5 times (drawing it each time,
+as an RSVP or countdown display would), and how much memory that takes,
+with its text rendered as a pyglet Label and from glyph atlases.
+
+Not run as part of the test suite (it needs a window).
+
+command-line usage:
+    python psychopy/tests/test_all_visual/benchmark_textstim.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import gc
+import time
+import tracemalloc
+
+import psutil
+
+from psychopy import visual, logging
+
+N_CALLS = 100000
+N_PER_FLIP = 100
+
+logging.console.setLevel(logging.ERROR)
+
+
+def run(win, renderMode):
+    stim = visual.TextStim(win, text='', height=0.1, renderMode=renderMode,
+                           autoLog=False)
+    process = psutil.Process()
+    gc.collect()
+    rssBefore = process.memory_info().rss
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for n in range(N_CALLS):
+        stim.setText(str(n), log=False)
+        stim.draw()
+        if n % N_PER_FLIP == 0:
+            win.flip()
+    secs = time.perf_counter() - t0
+    pyBytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    gc.collect()
+    rssGrowth = process.memory_info().rss - rssBefore
+    print('{0}:'.format(renderMode))
+    print('  setText + draw{0:>26.1f} usec'.format(secs / N_CALLS * 1e6))
+    print('  python memory still held{0:>16.2f} MB'.format(pyBytes / 2**20))
+    print('  process memory growth{0:>19.2f} MB'.format(rssGrowth / 2**20))
+
+
+if __name__ == '__main__':
+    win = visual.Window([800, 600], units='height', autoLog=False)
+    try:
+        print('{0} calls (a flip every {1}):'.format(N_CALLS, N_PER_FLIP))
+        for renderMode in ('atlas', 'label'):
+            run(win, renderMode)
+    finally:
+        win.close()
@@ -464,6 +464,31 @@ class _baseVisualTest(object):
             utils.compareScreenshot('text2_%s.png' %self.contextName,
                                     win, crit=20)
 
+    def test_text_atlas(self):
+        win = self.win
+        fontFile = os.path.join(prefs.paths['resources'], 'DejaVuSerif.ttf')
+        label = visual.TextStim(win, text='Hello', height=0.3*self.scaleFactor,
+                                font='DejaVu Serif', fontFiles=[fontFile],
+                                autoLog=False)
+        stim = visual.TextStim(win, text='Hello', height=0.3*self.scaleFactor,
+                               font='DejaVu Serif', fontFiles=[fontFile],
+                               renderMode='atlas', autoLog=False)
+        # laid out to about the same size as the pyglet label
+        labelW, labelH = label.boundingBox
+        w, h = stim.boundingBox
+        assert abs(w - labelW) < 0.2 * labelW
+        assert abs(h - labelH) < 0.3 * labelH
+        stim.draw()
+        vbo = stim._glyphVBO
+        for n in range(100):
+            stim.text = str(n)
+            stim.draw()
+        # only the vertex data was updated
+        assert stim._glyphVBO is vbo
+        win.flip()
+        with pytest.raises(ValueError):
+            visual.TextStim(win, renderMode='bitmap', autoLog=False)
+
     def test_text_with_add(self):
         # pyglet text will reset the blendMode to 'avg' so check that we are
         # getting back to 'add' if we want it
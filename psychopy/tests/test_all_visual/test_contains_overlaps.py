@@ -219,9 +219,61 @@ def test_line_contains():
     assert line.contains(point_2) is False
 
 
+@pytest.mark.polygon
+def test_many_points(monkeypatch):
+    poly = [(1,1), (1,-1), (-1,-1), (-1,1)]
+    pts = array([(0,0), (12,12), (0.5,-0.5), (2,0)])
+    expected = [True, False, True, False]
+    assert list(helpers.pointInPolygon(pts, None, poly)) == expected
+    assert list(helpers.pointInPolygon(pts[:, 0], pts[:, 1], poly)) == expected
+    with monkeypatch.context() as patch:
+        patch.setattr(matplotlib, '__version__', '0.0')  # numpy
+        assert list(helpers.pointInPolygon(pts, None, poly)) == expected
+
+    win.units = 'height'
+    shape = visual.Rect(win, width=0.2, height=0.2, autoLog=False)
+    inside = shape.contains(pts * 0.1)
+    assert list(inside) == expected
+    assert list(shape.contains(pts[:, 0] * 0.1, pts[:, 1] * 0.1)) == expected
+    # the cached polygon changes with the stimulus
+    shape.pos = (0.2, 0)
+    assert list(shape.contains(pts * 0.1)) == [False, False, False, True]
+
+
+@pytest.mark.polygon
+def test_spatial_index():
+    win.units = 'height'
+    left = visual.Rect(win, width=0.2, height=0.2, pos=(-0.2, 0),
+                       autoLog=False)
+    right = visual.Circle(win, radius=0.1, pos=(0.2, 0), autoLog=False)
+    big = visual.Rect(win, width=1, height=0.5, autoLog=False)
+    line = visual.Line(win, start=(-1, -1), end=(1, 1), autoLog=False)
+    index = visual.SpatialIndex(win, [left, right, big, line])
+    assert index.stimuliAt(-0.2, 0) == [left, big]
+    assert index.stimuliAt((0, 0.2)) == [big]
+    assert index.stimuliAt((0, 0.4)) == []
+
+    pts = array([(-0.2, 0), (0.2, 0), (0, 0.4)])
+    hits = index.contains(pts)
+    assert hits.shape == (3, 4)
+    for stimN, stim in enumerate(index.stimuli[:3]):
+        assert list(hits[:, stimN]) == list(stim.contains(pts))
+    assert not hits[:, 3].any()  # lines contain nothing
+
+    # moved stimuli are indexed again
+    right.pos = (0.2, 0.2)
+    assert index.stimuliAt((0.2, 0.2)) == [right, big]
+    index.remove(big)
+    assert index.stimuliAt((0.2, 0.2)) == [right]
+    with pytest.raises(ValueError):
+        index.remove(big)
+
+
 if __name__ == '__main__':
     test_overlaps()
     test_contains()
     test_border_contains()
     test_line_overlaps()
     test_line_contains()
+    test_many_points()
+    test_spatial_index()
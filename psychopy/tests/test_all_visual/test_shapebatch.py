@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import division
+
+import numpy as np
+import pytest
+from psychopy import visual
+
+
+class Test_ShapeBatch(object):
+    """Test suite for drawing shapes in a batch"""
+    def setup_class(self):
+        self.win = visual.Window([128,128],
+                                 pos=[50,50],
+                                 allowGUI=False,
+                                 autoLog=False)
+
+    def teardown_class(self):
+        self.win.close()
+
+    def _shapes(self):
+        return [
+            visual.Rect(self.win, width=0.5, height=0.3, pos=(-0.4, 0.4),
+                        fillColor='red', lineColor='white', autoLog=False),
+            visual.Circle(self.win, radius=0.2, pos=(0.4, 0.4),
+                          fillColor='blue', lineColor=None, autoLog=False),
+            visual.Polygon(self.win, edges=5, radius=0.3, pos=(0, -0.3),
+                           fillColor=None, lineColor='green', lineWidth=3,
+                           autoLog=False),
+            visual.ShapeStim(self.win, vertices=[(-0.9, -0.9), (-0.5, -0.5),
+                                                 (-0.9, -0.5)],
+                             fillColor='yellow', lineColor='black',
+                             lineWidth=2, autoLog=False)]
+
+    def test_drawMatchesShapes(self):
+        shapes = self._shapes()
+        # (the shapes do not overlap, so drawing all the fills before the
+        # outlines looks the same)
+        self.win.clearBuffer()
+        for shape in shapes:
+            shape.draw()
+        individual = np.asarray(self.win.getMovieFrame(buffer='back'),
+                                dtype=float)
+        self.win.movieFrames = []
+
+        batch = visual.ShapeBatch(self.win, shapes, autoLog=False)
+        self.win.clearBuffer()
+        batch.draw()
+        batched = np.asarray(self.win.getMovieFrame(buffer='back'),
+                             dtype=float)
+        self.win.movieFrames = []
+        # (edge pixels may differ)
+        assert np.mean(np.abs(individual - batched) > 32) < 0.02
+
+    def test_updates(self):
+        shapes = self._shapes()
+        batch = visual.ShapeBatch(self.win, shapes, autoLog=False)
+        assert len(batch) == 4 and shapes[2] in batch
+        assert batch._updateData() is None  # (all new)
+        batch.draw()
+        assert batch._updateData() == []
+
+        # only the data of a shape that moved is updated
+        shapes[1].pos = (0.3, 0.3)
+        shapes[1].verticesPix  # (the vertices are updated when needed)
+        spans = batch._updateData()
+        nRows = len(batch._data)
+        assert spans and sum(stop - start for start, stop in spans) < nRows
+        shapes[0].fillColor = 'green'
+        assert batch._updateData()
+
+        batch.remove(shapes[0])
+        assert shapes[0] not in batch
+        assert batch._updateData() is None
+        batch.draw()
+        with pytest.raises(ValueError):
+            batch.remove(shapes[0])
+        with pytest.raises(TypeError):
+            batch.add(visual.TextStim(self.win, autoLog=False))
@@ -4,8 +4,13 @@ from pathlib import Path
 from psychopy import visual, event
 from psychopy.visual import Window
 from psychopy.visual import TextBox2
+from psychopy.visual.textbox2 import fontmanager
 from psychopy.visual.textbox2.fontmanager import FontManager
+from psychopy.visual.textbox2.textbox2 import _wrapLines
+import os
+import numpy as np
 import pytest
+from psychopy import prefs
 from psychopy.tests import utils
 
 # cd psychopy/psychopy
@@ -118,9 +123,93 @@ class Test_textbox(object):
                 utils.compareScreenshot(Path(utils.TESTS_DATA_PATH) / case['screenshot'], self.win)
 
 
+    def test_edit_layout(self):
+        text = ("Press the left key when the word is red and the right key "
+                "when it is blue.\nRespond as quickly as you can.")
+        textbox = TextBox2(self.win, text, "Arial", pos=(0, 0), size=(0.6, None),
+                           letterHeight=0.05, units='height', editable=True)
+        # typing and deleting lay out only the lines around the caret, so
+        # should match laying out the whole text
+        textbox.caret.index = 20
+        for char in "supercalifragilistic ":
+            textbox.addCharAtCaret(char)
+        textbox.caret.index = 70
+        for n in range(10):
+            textbox.deleteCaretLeft()
+        textbox.deleteCaretRight()
+        whole = TextBox2(self.win, textbox.text, "Arial", pos=(0, 0),
+                         size=(0.6, None), letterHeight=0.05, units='height')
+        assert textbox._lineLenChars == whole._lineLenChars
+        assert list(textbox._lineNs) == list(whole._lineNs)
+        assert np.allclose(textbox._rawVerts, whole._rawVerts)
+        assert np.allclose(textbox.size, whole.size)
+
     def test_basic(self):
         pass
 
     def test_something(self):
         # to-do: test visual display, char position, etc
         pass
+
+
+@pytest.mark.textbox
+def test_wrapLines():
+    # chars 10 pix wide, in lines of at most 75 pix
+    text = "aaa bbb ccc\nd"
+    cumAdvance = np.arange(len(text) + 1) * 10.0
+    offsetX = np.zeros(len(text))
+    isNewline = np.array([c == '\n' for c in text])
+    isBreak = np.array([c in ' -' for c in text])
+    lines = _wrapLines(cumAdvance, offsetX, isNewline, isBreak, 75)
+    assert lines['starts'] == [0, 8, 12]
+    assert lines['lengths'] == [8, 4, 1]
+    assert lines['widths'] == [80, 40, 10]
+
+    # and from the lines before an edit (deleting the 2nd char)
+    text = "aa bbb ccc\nd"
+    cumAdvance = np.arange(len(text) + 1) * 10.0
+    isNewline = np.array([c == '\n' for c in text])
+    isBreak = np.array([c in ' -' for c in text])
+    lines = _wrapLines(cumAdvance, offsetX[1:], isNewline, isBreak, 75,
+                       lastLines=lines, edit=(1, 1, 0))
+    assert lines['starts'] == [0, 7, 11]
+    assert lines['lengths'] == [7, 4, 1]
+    assert lines['widths'] == [70, 40, 10]
+
+
+@pytest.mark.textbox
+def test_fontCache(tmpdir, monkeypatch):
+    monkeypatch.setattr(fontmanager, 'fontCacheDir', str(tmpdir))
+    fontFile = os.path.join(prefs.paths['resources'], 'DejaVuSerif.ttf')
+    font = fontmanager.GLFont(fontFile, 24)
+    metrics = font.getGlyphMetrics('The quick brown fox')
+    font.saveToCache()
+
+    # the glyphs (and the atlas) are restored, and only new ones are made
+    cached = fontmanager.GLFont(fontFile, 24)
+    assert cached._nMetrics == font._nMetrics
+    assert (cached.getGlyphMetrics('The quick brown fox') == metrics).all()
+    assert cached._nMetrics == font._nMetrics
+    assert (cached.atlas.data == font.atlas.data).all()
+    assert cached.atlas.nodes == font.atlas.nodes
+    assert cached['q'].size == font['q'].size
+    cached.getGlyphMetrics('jumps')
+    assert cached._nMetrics == font._nMetrics + 4  # 'j', 'm', 'p' and 's'
+    cached.saveToCache()
+    assert fontmanager.GLFont(fontFile, 24)._nMetrics == cached._nMetrics
+    assert fontmanager.GLFont(fontFile, 12)._nMetrics == 0
+
+    # the font files are only opened again once they've changed
+    monkeypatch.setattr(FontManager, '_fontIndex', None)
+    manager = FontManager.__new__(FontManager)
+    entry = manager._fontIndexEntry(fontFile)
+    manager._saveFontIndex()
+    assert os.path.isfile(str(tmpdir.join('fontIndex.json')))
+    monkeypatch.setattr(FontManager, '_fontIndex', None)
+
+    def noFace(*args):
+        raise AssertionError("font file was opened")
+    monkeypatch.setattr(fontmanager.ft, 'Face', noFace)
+    assert manager._fontIndexEntry(fontFile) == entry
+    info = fontmanager.FontInfo.fromdict(entry['info'], fontFile)
+    assert str(info) == str(font.info)
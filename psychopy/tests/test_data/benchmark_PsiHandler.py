@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Times the per-trial update of the PsiHandler posterior, and measures the
+peak memory allocated by numpy while creating and updating it, against the
+size of the (intensity, alpha, beta) grid.
+
+The previous engine, which built 4-D [r, alpha, beta, x] float64 arrays on
+every update, is included for comparison; it is skipped for grids where it
+would need more than MAX_REFERENCE_MB.
+
+Not run as part of the test suite.
+
+command-line usage:
+    python psychopy/tests/test_data/benchmark_PsiHandler.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import stats
+
+from psychopy.contrib.psi import PsiObject
+
+N_TRIALS = 20
+MAX_REFERENCE_MB = 2000
+# (intensities, alphas, betas)
+GRIDS = [(50, 50, 20), (100, 100, 50), (200, 100, 100), (300, 200, 100)]
+
+
+class ReferencePsiObject(object):
+    """The 4-D float64 computation used by earlier versions (2AFC only)"""
+
+    def __init__(self, x, alpha, beta, delta):
+        self.x = x
+        self._probLambda = np.full((1, len(alpha), len(beta), 1),
+                                   1 / (len(alpha) * len(beta)))
+        r = np.arange(2).reshape(2, 1, 1, 1)
+        cdf = stats.norm.cdf(x.reshape(1, 1, 1, -1),
+                             alpha.reshape(1, -1, 1, 1),
+                             beta.reshape(1, 1, -1, 1))
+        self._probResponseGivenLambdaX = (1 - r) + (2 * r - 1) * (
+            (.5 + .5 * cdf) * (1 - delta) + delta / 2)
+
+    def update(self, response=None):
+        if response is not None:
+            self._probLambda = self._probLambdaGivenXResponse[
+                response, :, :, self.nextIntensityIndex][
+                np.newaxis, :, :, np.newaxis]
+        probResponseGivenX = np.sum(
+            self._probResponseGivenLambdaX * self._probLambda,
+            axis=(1, 2), keepdims=True)
+        self._probLambdaGivenXResponse = (
+            self._probLambda * self._probResponseGivenLambdaX /
+            probResponseGivenX)
+        entropyXResponse = -np.sum(
+            self._probLambdaGivenXResponse *
+            np.log10(self._probLambdaGivenXResponse),
+            axis=(1, 2), keepdims=True)
+        expectedEntropyX = np.sum(entropyXResponse * probResponseGivenX,
+                                  axis=0).ravel()
+        self.nextIntensityIndex = np.argmin(expectedEntropyX)
+        self.nextIntensity = self.x[self.nextIntensityIndex]
+
+
+def makeGrid(nX, nAlpha, nBeta):
+    """Returns the PsiObject arguments for a grid of the given size"""
+    return ([0.1, 10.], [0.1, 10.], [0.1, 3.],
+            9.9 / (nX - 1), 9.9 / (nAlpha - 1), 2.9 / (nBeta - 1))
+
+
+def runTrials(makePsi):
+    """Returns (mean seconds per update, peak MB) for N_TRIALS trials with
+    simulated responses"""
+    rng = np.random.RandomState(0)
+    tracemalloc.start()
+    psi = makePsi()
+    psi.update(None)
+    times = []
+    for trialN in range(N_TRIALS):
+        pCorrect = .5 + .5 * stats.norm.cdf(psi.nextIntensity, 4., 1.)
+        response = int(rng.rand() < pCorrect)
+        t0 = time.perf_counter()
+        psi.update(response)
+        times.append(time.perf_counter() - t0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return np.mean(times), peak / 2.0 ** 20
+
+
+if __name__ == '__main__':
+    print('{0:>16} {1:>26} {2:>12} {3:>12}'.format(
+        'grid', 'engine', 'ms/trial', 'peak MB'))
+    for nX, nAlpha, nBeta in GRIDS:
+        args = makeGrid(nX, nAlpha, nBeta)
+        grid = '{0}x{1}x{2}'.format(nX, nAlpha, nBeta)
+        engines = [
+            ('float64', lambda: PsiObject(*args, delta=0.01, TwoAFC=True,
+                                          dtype='float64')),
+            ('float32', lambda: PsiObject(*args, delta=0.01, TwoAFC=True)),
+            ('float32, 4 threads',
+             lambda: PsiObject(*args, delta=0.01, TwoAFC=True,
+                               nThreads=4)),
+            ('float32, 1/4 of x',
+             lambda: PsiObject(*args, delta=0.01, TwoAFC=True,
+                               xCandidates=np.linspace(0.1, 10., nX // 4))),
+        ]
+        referenceMB = 2 * nX * nAlpha * nBeta * 8 * 4 / 2.0 ** 20
+        if referenceMB < MAX_REFERENCE_MB:
+            psi = PsiObject(*args)
+            engines.insert(0, ('previous (4-D float64)',
+                               lambda: ReferencePsiObject(
+                                   psi.x, psi.alpha, psi.beta, 0.01)))
+        for name, makePsi in engines:
+            secs, peakMB = runTrials(makePsi)
+            print('{0:>16} {1:>26} {2:12.2f} {3:12.1f}'.format(
+                grid, name, secs * 1000, peakMB))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Times building the trial sequence and saving the wide text output of
+TrialHandler and TrialHandlerExt for a design with 10^6 trials, and the
+time per trial of TrialHandler2.next() early and late in a long run.
+
+Not run as part of the test suite. The data of a completed run are filled
+in directly, since running 10^6 trials through next() mostly times
+DataHandler.add().
+
+command-line usage:
+    python psychopy/tests/test_data/benchmark_TrialHandler.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import shutil
+import timeit
+from tempfile import mkdtemp
+
+import numpy as np
+
+from psychopy import data, logging
+from psychopy.tools.arraytools import shuffleArray
+
+N_CONDITIONS = 1000
+N_REPS = 1000
+SEED = 100
+
+logging.console.setLevel(logging.ERROR)
+conditions = [{'condN': n, 'ori': n % 180, 'word': 'w%i' % (n % 7)}
+              for n in range(N_CONDITIONS)]
+weighted = [dict(cond, weight=1 + n % 3) for n, cond in enumerate(conditions)]
+
+
+def legacyRandomSequence(nConds, nReps, seed):
+    """The previous per-repeat shuffle, for comparison"""
+    indices = np.arange(nConds).reshape(-1, 1)
+    sequenceIndices = []
+    for thisRep in range(nReps):
+        sequenceIndices.append(shuffleArray(indices.flat, seed=seed).tolist())
+        seed = None
+    return np.transpose(sequenceIndices)
+
+
+def completedHandler(cls, trialList, method):
+    """Returns a handler with data for all trials, as at the end of a run"""
+    trials = cls(trialList, N_REPS, method=method, seed=SEED, autoLog=False)
+    shape = trials.data['ran'].shape
+    trials.data['ran'][:] = 1
+    trials.data['order'][:] = np.arange(np.prod(shape)).reshape(shape)
+    trials.data.addDataType('rt')
+    trials.data['rt'][:] = np.random.random(shape)
+    trials.thisRepN = N_REPS
+    trials.thisTrialN = 0
+    trials.finished = True
+    return trials
+
+
+def timeTrialHandler2(method, nTrials=100000, nTimed=1000):
+    """Prints the time per trial of the first and last nTimed trials"""
+    nConds = 100
+    trials = data.TrialHandler2(conditions[:nConds], nTrials // nConds,
+                                method=method, seed=SEED, autoLog=False)
+    times = []
+    for trialN in range(trials.nTotal):
+        if trialN < nTimed or trialN >= trials.nTotal - nTimed:
+            t0 = timeit.default_timer()
+            next(trials)
+            trials.getFutureTrial(1)
+            times.append(timeit.default_timer() - t0)
+        else:
+            next(trials)
+    print('  TrialHandler2 ({0:<10}) first {1} trials {2:8.1f} usec, '
+          'last {1} trials {3:8.1f} usec'.format(
+              method, nTimed, np.mean(times[:nTimed]) * 1e6,
+              np.mean(times[nTimed:]) * 1e6))
+
+
+def timeIt(label, func, repeat=3):
+    secs = min(timeit.repeat(func, number=1, repeat=repeat))
+    print('  {0:<44}{1:8.3f} sec'.format(label, secs))
+
+
+if __name__ == '__main__':
+    tmpDir = mkdtemp(prefix='psychopy-benchmark')
+    fileName = os.path.join(tmpDir, 'wide.csv')
+    print('{0} conditions x {1} reps = {2} trials'.format(
+        N_CONDITIONS, N_REPS, N_CONDITIONS * N_REPS))
+    assert np.array_equal(
+        legacyRandomSequence(N_CONDITIONS, 10, SEED),
+        data.TrialHandler(conditions, 10, seed=SEED,
+                          autoLog=False).sequenceIndices)
+    try:
+        print('sequence generation:')
+        timeIt('legacy per-repeat shuffle (random)',
+               lambda: legacyRandomSequence(N_CONDITIONS, N_REPS, SEED),
+               repeat=1)
+        for method in ('random', 'sequential', 'fullRandom'):
+            timeIt('TrialHandler ({0})'.format(method),
+                   lambda: data.TrialHandler(conditions, N_REPS,
+                                             method=method, seed=SEED,
+                                             autoLog=False))
+            timeIt('TrialHandlerExt, weighted ({0})'.format(method),
+                   lambda: data.TrialHandlerExt(weighted, N_REPS,
+                                                method=method, seed=SEED,
+                                                autoLog=False))
+        timeIt('TrialHandler (random, numpy Generator)',
+               lambda: data.TrialHandler(
+                   conditions, N_REPS, seed=np.random.default_rng(SEED),
+                   autoLog=False))
+
+        print('TrialHandler2 per trial, 10^5 trials:')
+        for method in ('random', 'sequential', 'fullRandom'):
+            timeTrialHandler2(method)
+
+        print('saveAsWideText:')
+        for cls, trialList in ((data.TrialHandler, conditions),
+                               (data.TrialHandlerExt, weighted)):
+            trials = completedHandler(cls, trialList, 'fullRandom')
+            timeIt(cls.__name__,
+                   lambda: trials.saveAsWideText(
+                       fileName, delim=',', appendFile=False,
+                       fileCollisionMethod='overwrite'),
+                   repeat=1)
+    finally:
+        shutil.rmtree(tmpDir)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Times fitting psychometric functions to many bootstrap resamples of one
+dataset: a loop of single fits with scipy.optimize.curve_fit (as a
+bootstrap in an experiment script would do it), against fitBatch in one
+and in several processes.
+
+Not run as part of the test suite.
+
+command-line usage:
+    python psychopy/tests/test_data/benchmark_fit.py
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import timeit
+
+import numpy as np
+
+from psychopy import data
+
+N_RESAMPLES = 2000
+N_PER_LEVEL = 40
+LEVELS = np.array([0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8])
+TRUE_THRESH = 0.4
+
+
+def makeResamples(fitClass):
+    """Returns (fit to the data, resampled proportions correct)"""
+    rng = np.random.RandomState(0)
+    pTrue = 0.5 + 0.5 / (1 + np.exp(-(LEVELS - TRUE_THRESH) / 0.08))
+    pData = rng.binomial(N_PER_LEVEL, pTrue) / N_PER_LEVEL
+    fit = fitClass(LEVELS, pData, sems=1 / np.sqrt(N_PER_LEVEL),
+                   expectedMin=0.5)
+    yy = rng.binomial(N_PER_LEVEL, np.clip(fit.eval(LEVELS), 0, 1),
+                      size=(N_RESAMPLES, len(LEVELS))) / N_PER_LEVEL
+    return fit, yy
+
+
+def serialFits(fitClass, fit, yy):
+    params = []
+    for resample in yy:
+        try:
+            params.append(fitClass(LEVELS, resample, guess=fit.params,
+                                   sems=1 / np.sqrt(N_PER_LEVEL),
+                                   expectedMin=0.5).params)
+        except (RuntimeError, ValueError):
+            params.append([np.nan] * len(fit.params))
+    return np.array(params)
+
+
+def timeIt(label, func):
+    secs = min(timeit.repeat(func, number=1, repeat=1))
+    print('  {0:<36}{1:8.3f} sec'.format(label, secs))
+
+
+if __name__ == '__main__':
+    print('{0} resamples of {1} levels'.format(N_RESAMPLES, len(LEVELS)))
+    for fitClass in (data.FitWeibull, data.FitLogistic, data.FitCumNormal,
+                     data.FitNakaRushton):
+        print(fitClass.__name__ + ':')
+        fit, yy = makeResamples(fitClass)
+        args = dict(sems=1 / np.sqrt(N_PER_LEVEL), guess=fit.params,
+                    expectedMin=0.5)
+        timeIt('curve_fit loop', lambda: serialFits(fitClass, fit, yy))
+        timeIt('fitBatch', lambda: fitClass.fitBatch(LEVELS, yy, **args))
+        timeIt('fitBatch, 4 processes',
+               lambda: fitClass.fitBatch(LEVELS, yy, processes=4, **args))
+        reference = serialFits(fitClass, fit, yy)
+        params, converged = fitClass.fitBatch(LEVELS, yy, **args)
+        relDiff = np.abs(params - reference) / np.abs(reference)
+        print('  median relative difference from curve_fit: {0:.2g}'.format(
+            np.nanmedian(relDiff)))
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from builtins import object
-from psychopy import data, logging
+from psychopy import data, logging, tools
+from psychopy.data.columnstore import ColumnStore
 import numpy as np
 import os, glob, shutil
 import io
@@ -127,6 +128,111 @@ class TestExperimentHandler(object):
         exp.saveAsWideText(fileName)
         exp.saveAsPickle(fileName)
 
+    def test_columnar_matches_default(self):
+        # columnar storage must give the same data files as a list of dicts
+        contents = []
+        for columnar in (False, True):
+            exp = data.ExperimentHandler(
+                name='testExp',
+                extraInfo={'participant': 'jwp'},
+                savePickle=False,
+                saveWideText=False,
+                dataFileName=self.tmpDir + 'columnar%s' % columnar,
+                columnar=columnar
+            )
+            trials = data.TrialHandler(
+                trialList=[{'ori': 0}, {'ori': 90}], nReps=40,
+                method='sequential', name='trials')
+            exp.addLoop(trials)
+            for n, trial in enumerate(trials):
+                exp.addData('resp.rt', n * 0.1)
+                exp.addData('resp.keys', ['a', 'b'] if n % 3 else 'c')
+                if n % 2:
+                    exp.addData('resp.corr', n % 4 == 1)
+                if n > 50:
+                    # column added part way through the run, mixed types
+                    exp.addData('extra', 'x,y' if n % 5 else n)
+                exp.nextEntry()
+            exp.addData('orphan', 1)
+
+            exp.saveAsWideText(exp.dataFileName + '.csv', delim=',')
+            with io.open(exp.dataFileName + '.csv', 'r',
+                         encoding='utf-8-sig') as f:
+                contents.append(f.read())
+            exp.saveAsPickle(exp.dataFileName)
+            df = exp.toDataFrame()
+            assert len(df) == 81
+            assert len(exp.getAllEntries()) == 81
+
+        assert contents[0] == contents[1]
+        assert isinstance(exp.entries, ColumnStore)
+        assert len(exp.entries) == 80
+        assert exp.entries[1] == {'trials.thisRepN': 0, 'trials.thisTrialN': 1,
+                                  'trials.thisN': 1, 'trials.thisIndex': 1,
+                                  'ori': 90, 'resp.rt': 0.1,
+                                  'resp.keys': ['a', 'b'],
+                                  'resp.corr': True, 'participant': 'jwp'}
+        assert df['resp.rt'].dtype == np.float64
+        assert df['resp.corr'].isnull().sum() == 41
+
+        # the pickled copy includes the orphan entry
+        loaded = tools.filetools.fromFile(exp.dataFileName + '.psydat')
+        assert loaded.entries[:80] == exp.entries[:]
+        assert loaded.entries[80] == {'orphan': 1}
+
+    def test_stream_entries(self):
+        fileName = self.tmpDir + 'stream'
+        exp = data.ExperimentHandler(
+            name='testExp',
+            extraInfo={'participant': 'jwp'},
+            savePickle=False,
+            saveWideText=True,
+            dataFileName=fileName,
+            streamEntries=True,
+            fsyncInterval=0
+        )
+        trials = data.TrialHandler(
+            trialList=[{'ori': 0}, {'ori': 90}], nReps=3,
+            method='sequential', name='trials')
+        exp.addLoop(trials)
+        for n, trial in enumerate(trials):
+            exp.addData('resp.keys', ['a', 'b'])
+            if n > 2:
+                exp.addData('resp.rt', n * 0.1)
+            exp.nextEntry()
+        exp.addData('orphan', 'a,b')
+
+        # entries are on disk as soon as nextEntry() is called
+        names, rows = data.streaming.readEntryStream(
+            fileName + '_entries.jsonl')
+        assert len(rows) == 6
+        assert 'resp.rt' in names
+        assert len(rows[0]) < len(names)
+
+        exp.saveAsWideText(fileName + '_orig.csv', delim=',')
+        exp.close()
+        assert not os.path.exists(fileName + '_entries.jsonl')
+        with io.open(fileName + '_orig.csv', 'r', encoding='utf-8-sig') as f:
+            expected = f.read()
+        with io.open(fileName + '.csv', 'r', encoding='utf-8-sig') as f:
+            assert f.read() == expected
+
+    def test_stream_recovery(self):
+        # a stream left by a crash, with a partly written last entry
+        streamFile = os.path.join(self.tmpDir, 'crashed.jsonl')
+        writer = data.streaming.EntryStreamWriter(streamFile)
+        writer.addEntry({'a': 1, 'b': 'x,y'})
+        writer.addEntry({'a': 2, 'c': None})
+        writer.close()
+        with io.open(streamFile, 'a') as f:
+            f.write(u'["3", "x')
+
+        outFile = os.path.join(self.tmpDir, 'crashed.csv')
+        data.streaming.finalizeEntryStream(streamFile, outFile)
+        with io.open(outFile, 'r', encoding='utf-8-sig') as f:
+            contents = f.read()
+        assert contents == 'a,b,c,\n1,"x,y",,\n2,,None,\n'
+
     def test_comparison_equals(self):
         e1 = data.ExperimentHandler()
         e2 = data.ExperimentHandler()
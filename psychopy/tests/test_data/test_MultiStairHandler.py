@@ -4,6 +4,7 @@
 import pytest
 import shutil
 import os
+import io
 import numpy as np
 from tempfile import mkdtemp
 
@@ -77,6 +78,117 @@ class TestMultiStairHandler(object):
         stairs.saveAsPickle(os.path.join(self.temp_dir, 'multiQuestOut'))
         exp.close()
 
+    @pytest.mark.parametrize('stairType', ['simple', 'quest'])
+    def test_checkpoint(self, stairType):
+        conditions = data.importConditions(
+            os.path.join(fixturesPath, 'multiStairConds.xlsx'))
+        kwargs = dict(stairType=stairType, conditions=conditions,
+                      method='random', nTrials=20, randomSeed=3,
+                      autoLog=False)
+        stairs = data.MultiStairHandler(**kwargs)
+        rng = np.random.RandomState(seed=self.random_seed)
+        for trialN in range(30):
+            intensity, condition = next(stairs)
+            stairs.addResponse(int(rng.rand() > condition['startVal']))
+        fileName = os.path.join(self.temp_dir, 'multi%s.npz' % stairType)
+        stairs.saveCheckpoint(fileName, fileCollisionMethod='overwrite')
+        resumed = data.MultiStairHandler(**kwargs)
+        resumed.loadCheckpoint(fileName)
+
+        # both carry on with the same trials and responses
+        for handler in (stairs, resumed):
+            rng = np.random.RandomState(seed=self.random_seed)
+            for intensity, condition in handler:
+                handler.addResponse(int(rng.rand() > condition['startVal']))
+        assert resumed.totalTrials == stairs.totalTrials
+        for stair, resumedStair in zip(stairs.staircases,
+                                       resumed.staircases):
+            assert np.allclose(resumedStair.intensities, stair.intensities)
+            assert resumedStair.data == stair.data
+
+    def test_checkpointQuestPlus(self):
+        thresholds = np.arange(-40, 0 + 1)
+        conditions = [
+            dict(label=label, startIntensity=startIntensity,
+                 intensityVals=thresholds, thresholdVals=thresholds,
+                 slopeVals=3.5, lowerAsymptoteVals=0.5, lapseRateVals=0.02,
+                 responseVals=['Correct', 'Incorrect'], stimScale='dB')
+            for label, startIntensity in [('low', -30), ('high', -10)]]
+        kwargs = dict(stairType='questplus', conditions=conditions,
+                      method='random', nTrials=8, randomSeed=3,
+                      autoLog=False)
+
+        def respond(rng, intensity):
+            return 'Correct' if rng.rand() < 0.5 + intensity / 80 else \
+                'Incorrect'
+
+        stairs = data.MultiStairHandler(**kwargs)
+        rng = np.random.RandomState(seed=self.random_seed)
+        for trialN in range(6):
+            intensity, condition = next(stairs)
+            stairs.addResponse(respond(rng, intensity))
+        fileName = os.path.join(self.temp_dir, 'multiQuestPlus.npz')
+        stairs.saveCheckpoint(fileName, fileCollisionMethod='overwrite')
+        resumed = data.MultiStairHandler(**kwargs)
+        resumed.loadCheckpoint(fileName)
+
+        for handler in (stairs, resumed):
+            rng = np.random.RandomState(seed=self.random_seed)
+            for intensity, condition in handler:
+                handler.addResponse(respond(rng, intensity))
+        assert resumed.totalTrials == stairs.totalTrials
+        for stair, resumedStair in zip(stairs.staircases,
+                                       resumed.staircases):
+            assert resumedStair.intensities == stair.intensities
+            assert resumedStair.data == stair.data
+
+    def test_saveAsExcelAndText(self):
+        from openpyxl import load_workbook
+        conditions = data.importConditions(
+            os.path.join(fixturesPath, 'multiStairConds.xlsx'))
+        stairs = data.MultiStairHandler(
+            stairType='simple', conditions=conditions, method='random',
+            nTrials=20, randomSeed=3, autoLog=False)
+        rng = np.random.RandomState(seed=self.random_seed)
+        for intensity, condition in stairs:
+            stairs.addResponse(int(rng.rand() > condition['startVal']))
+            stairs.addOtherData('rt', rng.rand())
+        for stair in stairs.staircases:
+            stair.extraInfo = {'participant': 'abc'}
+        fileName = os.path.join(self.temp_dir, 'multiStairSheets')
+        stairs.saveAsExcel(fileName, fileCollisionMethod='overwrite')
+
+        # one sheet per staircase, with a column per value
+        wb = load_workbook(fileName + '.xlsx')
+        labels = [stair.condition['label'] for stair in stairs.staircases]
+        assert wb.sheetnames == labels
+        for stair, ws in zip(stairs.staircases, wb.worksheets):
+            columns = list(ws.iter_cols(values_only=True))
+            assert [column[0] for column in columns] == [
+                'Reversal Intensities', 'Reversal Indices',
+                'All Intensities', 'All Responses', 'rt', 'extraInfo', None]
+            nTrials = len(stair.intensities)
+            assert np.allclose([float(value) for value in
+                                columns[2][1:nTrials + 1]], stair.intensities)
+            assert [int(value) for value in
+                    columns[3][1:nTrials + 1]] == stair.data
+            assert columns[5][1:3] == ('participant:', None)
+            assert columns[6][1] == 'abc'
+
+        # appending adds the sheets again
+        stairs.saveAsExcel(fileName, appendFile=True)
+        assert len(load_workbook(fileName + '.xlsx').sheetnames) == 6
+
+        stairs.saveAsText(fileName, delim=',',
+                          fileCollisionMethod='overwrite')
+        for stair in stairs.staircases:
+            with io.open(fileName + '_' + stair.condition['label'],
+                         encoding='utf-8-sig') as f:
+                lines = f.read().splitlines()
+            assert lines[4] == 'intensities=\t' + ', '.join(
+                u'%s' % intensity for intensity in stair.intensities)
+            assert "'participant':" in lines
+
     def test_QuestPlus(self):
         import sys
         if not (sys.version_info.major == 3 and sys.version_info.minor >= 6):
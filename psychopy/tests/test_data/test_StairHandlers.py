@@ -4,6 +4,8 @@ from __future__ import division, print_function
 
 from builtins import range
 from builtins import object
+import os
+import pickle
 import numpy as np
 import shutil
 import json_tricks
@@ -622,6 +624,46 @@ class TestQuestHandler(_BaseTestStairHandler):
         
         assert np.isclose(q.epsilon, epsilon, atol=1e-4)
 
+    def test_importData(self):
+        rng = np.random.RandomState(1000)
+        intensities = list(rng.normal(-0.5, 0.5, 40))
+        responses = list(rng.randint(0, 2, 40))
+        q = data.QuestHandler(-0.5, 0.5, nTrials=10, autoLog=False)
+        q.importData(intensities, responses)
+        # trial by trial, as when the staircase could stop part way
+        qLoop = data.QuestHandler(-0.5, 0.5, nTrials=10, stopInterval=0,
+                                  autoLog=False)
+        qLoop.importData(intensities, responses)
+        assert q.intensities == qLoop.intensities
+        assert q.data == qLoop.data
+        assert q.thisTrialN == qLoop.thisTrialN == 39
+        assert np.isclose(q._nextIntensity, qLoop._nextIntensity)
+        assert np.allclose(q._quest.pdf, qLoop._quest.pdf)
+
+    def test_checkpoint(self):
+        fileName = os.path.join(self.tmp_dir, 'questCheckpoint')
+        q = data.QuestHandler(-0.5, 0.5, nTrials=20, autoLog=False)
+        for trialN, response in enumerate([1, 1, 0, 1, 0, 1, 1, 0]):
+            next(q)
+            q.addResponse(response)
+        q.saveCheckpoint(fileName, fileCollisionMethod='overwrite')
+
+        resumed = data.QuestHandler(-0.5, 0.5, nTrials=20, autoLog=False)
+        resumed.loadCheckpoint(fileName + '.npz')
+        assert resumed.intensities == q.intensities
+        assert resumed.data == q.data
+        assert np.array_equal(resumed._quest.pdf, q._quest.pdf)
+        assert next(resumed) == next(q)
+
+        # a different grid: the posterior is recomputed from the trials
+        regridded = data.QuestHandler(-0.5, 0.5, nTrials=20, grain=0.02,
+                                      autoLog=False)
+        regridded.loadCheckpoint(fileName + '.npz')
+        assert np.isclose(regridded.mean(), q.mean(), atol=0.02)
+
+        with pytest.raises(ValueError):
+            data.StairHandler(0.5).loadCheckpoint(fileName + '.npz')
+
 
 class TestPsiHandler(_BaseTestStairHandler):
     def test_comparison_equals(self):
@@ -750,6 +792,81 @@ class TestPsiHandler(_BaseTestStairHandler):
         p_loaded = fromFile(path)
         assert p == p_loaded
 
+    def test_engine_options(self):
+        kwargs = dict(nTrials=10, intensRange=[0.1, 10],
+                      alphaRange=[0.1, 10], betaRange=[0.1, 3],
+                      intensPrecision=0.1, alphaPrecision=0.1,
+                      betaPrecision=0.1, delta=0.01)
+        handlers = [data.PsiHandler(dtype='float64', **kwargs),
+                    data.PsiHandler(dtype='float32', nThreads=2, **kwargs)]
+        limited = data.PsiHandler(xCandidates=[2, 4.03, 6], **kwargs)
+        for trialN, responses in enumerate([1, 1, 0, 1, 0, 1, 1, 0]):
+            intensities = [p.__next__() for p in handlers]
+            # (float32 can break near-ties in the expected entropy
+            # differently, but this run has none)
+            assert intensities[0] == intensities[1]
+            assert limited.__next__() in (2, 4, 6)
+            for p in handlers + [limited]:
+                p.addResponse(responses)
+        assert np.allclose(handlers[0].estimateLambda(),
+                           handlers[1].estimateLambda())
+
+    def test_unpickle_old_version(self):
+        p = data.PsiHandler(nTrials=10, intensRange=[0.1, 10],
+                            alphaRange=[0.1, 10], betaRange=[0.1, 3],
+                            intensPrecision=0.1, alphaPrecision=0.1,
+                            betaPrecision=0.1, delta=0.01, dtype='float64')
+        for response in [1, 1, 0]:
+            next(p)
+            p.addResponse(response)
+        psi = p._psi
+        # the attributes of a PsiObject pickled by earlier versions
+        nX, shape = len(psi.x), (1, len(psi.alpha), len(psi.beta), 1)
+        oldState = dict(
+            _TwoAFC=psi._TwoAFC, x=psi.x, alpha=psi.alpha, beta=psi.beta,
+            r=psi.r, delta=psi.delta,
+            _alpha=psi.alpha.reshape(1, -1, 1, 1),
+            _probLambda=np.exp(psi._logProbLambda).reshape(shape),
+            _probResponseGivenLambdaX=np.zeros((2,) + shape[1:3] + (nX,)),
+            _expectedEntropyX=psi._expectedEntropyX.reshape(1, 1, 1, nX),
+            nextIntensityIndex=psi.nextIntensityIndex,
+            nextIntensity=psi.nextIntensity)
+        old = data.staircase.PsiObject_.__new__(data.staircase.PsiObject_)
+        old.__dict__.update(oldState)
+        loaded = pickle.loads(pickle.dumps(old))
+
+        assert loaded.dtype == 'float64'
+        assert not hasattr(loaded, '_probResponseGivenLambdaX')
+        assert not hasattr(loaded, '_alpha')
+        assert loaded.nextIntensity == psi.nextIntensity
+        assert np.allclose(loaded.estimateLambda(), psi.estimateLambda())
+        for response in [1, 0, 1]:
+            loaded.update(response)
+            psi.update(response)
+            assert loaded.nextIntensity == psi.nextIntensity
+        assert np.allclose(loaded._logProbLambda, psi._logProbLambda)
+
+    def test_checkpoint(self):
+        fileName = os.path.join(self.tmp_dir, 'psiCheckpoint.npz')
+        kwargs = dict(nTrials=10, intensRange=[0.1, 10],
+                      alphaRange=[0.1, 10], betaRange=[0.1, 3],
+                      intensPrecision=0.1, alphaPrecision=0.1,
+                      betaPrecision=0.1, delta=0.01)
+        p = data.PsiHandler(**kwargs)
+        for trialN, response in enumerate([1, 1, 0, 1, 0, 1]):
+            next(p)
+            p.addResponse(response)
+        p.saveCheckpoint(fileName, fileCollisionMethod='overwrite')
+        resumed = data.PsiHandler(**kwargs)
+        resumed.loadCheckpoint(fileName)
+        assert np.allclose(resumed.estimateLambda(), p.estimateLambda())
+        assert next(resumed) == next(p)
+        # replaying the trials as one batch gives the same posterior
+        replayed = data.PsiHandler(**kwargs)
+        replayed._psi.applyTrials(p.intensities[:-1], p.data)
+        assert np.allclose(replayed._psi._logProbLambda,
+                           p._psi._logProbLambda)
+
 
 class TestMultiStairHandler(_BaseTestMultiStairHandler):
     """
@@ -1231,6 +1348,47 @@ def test_QuesPlusHandler_unknown_stimSelectionOptions():
                              stimSelectionOptions=stim_selection_options)
 
 
+@pytest.mark.parametrize('stimSelection', [
+    dict(stimSelectionMethod='minEntropy'),
+    dict(stimSelectionMethod='minNEntropy',
+         stimSelectionOptions=dict(N=3, maxConsecutiveReps=2,
+                                   randomSeed=7))])
+def test_QuestPlusHandler_checkpoint(stimSelection):
+    from psychopy.data.staircase import QuestPlusHandler
+
+    thresholds = np.arange(-40, 0 + 1)
+    kwargs = dict(nTrials=20, intensityVals=thresholds,
+                  thresholdVals=thresholds, slopeVals=3.5,
+                  lowerAsymptoteVals=0.5, lapseRateVals=0.02,
+                  responseVals=['Correct', 'Incorrect'], stimScale='dB',
+                  **stimSelection)
+    q = QuestPlusHandler(**kwargs)
+    responses = ['Correct', 'Correct', 'Incorrect', 'Correct', 'Incorrect',
+                 'Correct', 'Correct', 'Correct', 'Incorrect', 'Correct']
+    for response in responses[:6]:
+        next(q)
+        q.addResponse(response)
+    temp_dir = mkdtemp(prefix='psychopy-tests-testdata')
+    try:
+        fileName = os.path.join(temp_dir, 'questPlusCheckpoint.npz')
+        q.saveCheckpoint(fileName, fileCollisionMethod='overwrite')
+        resumed = QuestPlusHandler(**kwargs)
+        resumed.loadCheckpoint(fileName)
+    finally:
+        shutil.rmtree(temp_dir)
+    assert resumed.intensities == q.intensities
+    assert resumed.data == q.data
+    assert np.allclose(resumed._qp.posterior, q._qp.posterior)
+
+    # both carry on with the same trials
+    for handler in (q, resumed):
+        for response in responses[6:]:
+            next(handler)
+            handler.addResponse(response)
+    assert resumed.intensities == q.intensities
+    assert resumed.paramEstimate == q.paramEstimate
+
+
 if __name__ == '__main__':
     test_QuestPlusHandler()
     test_QuestPlusHandler_startIntensity()
@@ -158,6 +158,173 @@ class TestTrialHandler(object):
         trials.saveAsWideText(pjoin(self.temp_dir, 'testRandom.csv'), delim=',', appendFile=False)#this omits values
         utils.compareTextFiles(pjoin(self.temp_dir, 'testRandom.csv'), pjoin(fixturesPath,'corrRandom.csv'))
 
+    def test_stream_data_output(self):
+        conditions = [{'trialType': trialType} for trialType in range(3)]
+        trials = data.TrialHandler(
+            trialList=conditions, nReps=4, method='random',
+            seed=self.random_seed, autoLog=False,
+            extraInfo={'participant': 'jwp', 'session': 1},
+            streamFileName=pjoin(self.temp_dir, 'testStream.jsonl'))
+        for thisTrial in trials:
+            trials.addData('resp', 'resp%i' % thisTrial['trialType'])
+            if trials.thisN > 4:
+                # a data type first added part way through the run
+                trials.addData('rt', trials.thisN * 0.25)
+            if trials.thisN == 2:
+                # each trial is streamed when it ends
+                with io.open(pjoin(self.temp_dir, 'testStream.jsonl')) as f:
+                    assert len(f.readlines()) == 2
+
+        trials.saveAsWideText(pjoin(self.temp_dir, 'testStreamOrig.csv'),
+                              delim=',', appendFile=False)
+        trials.finalizeStream(pjoin(self.temp_dir, 'testStream.csv'),
+                              delim=',', appendFile=False)
+        assert not os.path.exists(pjoin(self.temp_dir, 'testStream.jsonl'))
+
+        # saveAsWideText orders trials by repeat, as they were run
+        with io.open(pjoin(self.temp_dir, 'testStreamOrig.csv'),
+                     encoding='utf-8-sig') as f:
+            expected = f.read()
+        with io.open(pjoin(self.temp_dir, 'testStream.csv'),
+                     encoding='utf-8-sig') as f:
+            assert f.read() == expected
+
+    def test_seed_generator(self):
+        conditions = [{'trialType': trialType} for trialType in range(5)]
+        for method in ('random', 'fullRandom'):
+            sequences = []
+            np.random.seed(0)
+            expected = np.random.random()
+            for repeat in range(2):
+                np.random.seed(0)
+                trials = data.TrialHandler(
+                    trialList=conditions, nReps=3, method=method,
+                    seed=np.random.default_rng(self.random_seed),
+                    autoLog=False)
+                sequences.append(trials.sequenceIndices)
+                # the global generator is left alone
+                assert np.random.random() == expected
+            assert np.array_equal(sequences[0], sequences[1])
+            assert sorted(sequences[0].ravel()) == sorted(list(range(5)) * 3)
+
+    @pytest.mark.parametrize('memmap', [False, True])
+    def test_ragged_data(self, memmap):
+        from psychopy.data.ragged import RaggedArray
+        conditions = [{'trialType': trialType} for trialType in range(3)]
+        trials = data.TrialHandler(
+            conditions, 4, seed=self.random_seed, autoLog=False,
+            memmapDir=self.temp_dir if memmap else None)
+        rng = np.random.RandomState(self.random_seed)
+        traces = {}
+        for trialN, trial in enumerate(trials):
+            if trialN == 10:
+                break
+            trace = rng.random_sample(rng.randint(0, 2000))
+            traces[trials.thisIndex, trials.thisRepN] = trace
+            trials.addData('trace', trace)
+            trials.addData('clicks', [1, 2, 3][:trialN % 4])
+            trials.addData('mixed', trace if trialN != 5 else 'none')
+
+        trace = trials.data['trace']
+        assert isinstance(trace, RaggedArray)
+        assert isinstance(trials.data['clicks'], RaggedArray)
+        assert trace.valueDtype == np.float64
+        if memmap:
+            assert isinstance(trace._chunks[0], np.memmap)
+        for (row, col), expected in traces.items():
+            assert np.array_equal(trace[row, col], expected)
+            assert np.array_equal(trace[row][col], expected)
+            offset = trace.offsets[row, col]
+            assert np.array_equal(
+                trace.values[offset:offset + len(expected)], expected)
+        # clicks are returned as the lists they were added as
+        clicks = np.asarray(trials.data['clicks'])
+        assert clicks.dtype == object
+        expected = ['--', '--'] + [str([1, 2, 3][:trialN % 4])
+                                   for trialN in range(10)]
+        assert sorted(map(str, clicks.ravel())) == sorted(expected)
+        # a value that isn't a vector converts to an object array
+        assert not isinstance(trials.data['mixed'], RaggedArray)
+        assert trials.data['mixed'].dtype == object
+        assert sorted(value for value in trials.data['mixed'].ravel()
+                      if isinstance(value, str)) == ['--', '--', 'none']
+
+        # saved and loaded with all the values, in memory
+        fileName = pjoin(self.temp_dir, 'ragged')
+        trials.saveAsPickle(fileName, fileCollisionMethod='overwrite')
+        loaded = fromFile(fileName + '.psydat').data['trace']
+        assert not isinstance(loaded._chunks[0], np.memmap)
+        for (row, col), expected in traces.items():
+            assert np.array_equal(loaded[row, col], expected)
+        # the wide text file is the one saved from object arrays
+        trials.saveAsWideText(fileName + '.csv', appendFile=False,
+                              fileCollisionMethod='overwrite')
+        for name in ('trace', 'clicks'):
+            trials.data._convertToObjectArray(name)
+        trials.saveAsWideText(fileName + '_objects.csv', appendFile=False,
+                              fileCollisionMethod='overwrite')
+        with io.open(fileName + '.csv', encoding='utf-8-sig') as f:
+            saved = f.read()
+        with io.open(fileName + '_objects.csv', encoding='utf-8-sig') as f:
+            assert saved == f.read()
+        assert saved.splitlines()[0] == \
+            'TrialNumber,trialType,ran,order,trace,clicks,mixed'
+
+    def test_ragged_wideText(self):
+        trials = data.TrialHandler([{'t': n} for n in range(3)], 4,
+                                   seed=self.random_seed, autoLog=False)
+        for trialN, trial in enumerate(trials):
+            if trialN == 10:
+                break
+            trials.addData('trace', np.arange(trialN % 3, dtype=float))
+            trials.addData('clicks', [1, 2, 3][:trialN % 4])
+        fileName = pjoin(self.temp_dir, 'raggedWide.csv')
+        trials.saveAsWideText(fileName, appendFile=False,
+                              fileCollisionMethod='overwrite')
+        with io.open(fileName, encoding='utf-8-sig') as f:
+            assert f.read() == (
+                'TrialNumber,t,ran,order,trace,clicks\n'
+                '1,1,1.0,0.0,[],[]\n'
+                '2,2,1.0,1.0,[0.],[1]\n'
+                '3,0,1.0,2.0,[0. 1.],[1, 2]\n'
+                '4,1,1.0,3.0,[],[1, 2, 3]\n'
+                '5,2,1.0,4.0,[0.],[]\n'
+                '6,0,1.0,5.0,[0. 1.],[1]\n'
+                '7,2,1.0,6.0,[],[1, 2]\n'
+                '8,0,1.0,7.0,[0.],[1, 2, 3]\n'
+                '9,1,1.0,8.0,[0. 1.],[]\n'
+                '10,2,1.0,9.0,[],[1]\n'
+                '11,0,1.0,10.0,--,--\n'
+                '12,1,0.0,--,--,--\n')
+
+    def test_ragged_ndarray(self):
+        from psychopy.data.ragged import RaggedArray
+        ragged = RaggedArray((2, 3))
+        objects = np.empty((2, 3), dtype=object)
+        for (row, col), _ in np.ndenumerate(objects):
+            objects[row, col] = np.array([row * 3.0 + col])
+            ragged[row, col] = objects[row, col]
+        # the attributes and methods of the object array
+        assert ragged.T.shape == (3, 2)
+        for name in ('flatten', 'ravel', 'copy'):
+            result = getattr(ragged, name)()
+            assert isinstance(result, np.ndarray)
+            assert np.array_equal(np.stack(result.ravel()),
+                                  np.stack(getattr(objects, name)().ravel()))
+        assert ragged.reshape(3, 2).shape == (3, 2)
+        assert ragged.astype(object).dtype == object
+        assert np.array_equal(ragged.mean(), objects.mean())
+        assert np.array_equal(ragged.max(), objects.max())
+        assert ragged.any() == objects.any()
+        # changes to the copy don't change the values
+        copied = ragged.copy()
+        copied[0, 0] = 'x'
+        assert np.array_equal(ragged[0, 0], [0])
+        with pytest.raises(AttributeError):
+            ragged.fill(0)
+        with pytest.raises(AttributeError):
+            ragged.notAnAttribute
+
     def test_comparison_equals(self):
         t1 = data.TrialHandler([dict(foo=1)], 2)
         t2 = data.TrialHandler([dict(foo=1)], 2)
@@ -248,6 +248,45 @@ class TestTrialHandler2(object):
         t_loaded = fromFile(path)
         assert t == t_loaded
 
+    @pytest.mark.parametrize('method', ['random', 'sequential', 'fullRandom'])
+    def test_future_and_earlier_trials(self, method):
+        t = data.TrialHandler2(self.conditions, nReps=4, method=method,
+                               seed=self.random_seed, autoLog=False)
+        assert t.getFutureTrial(1) is not None
+        assert t.getEarlierTrial(-1) is None
+        trials = []
+        repNs = []
+        for trial in t:
+            if trials:
+                assert t.getEarlierTrial(-1)['foo'] == trials[-1]['foo']
+            else:
+                assert t.getEarlierTrial(-1) is None
+            future = t.getFutureTrial(1)
+            trials.append(trial)
+            repNs.append(t.thisRepN)
+            assert t.getFutureTrial(0)['foo'] == trial['foo']
+            if len(trials) > 2:
+                assert t.getEarlierTrial(-2)['foo'] == trials[-3]['foo']
+            assert (future is None) == (t.nRemaining == 0)
+            assert t.prevIndices + [t.thisIndex] + t.remainingIndices == \
+                t._sequence[:len(t.prevIndices) + 1 +
+                            len(t.remainingIndices)]
+        assert len(trials) == 12
+        assert t.getFutureTrial(1) is None
+
+        # each condition is run once in every repeat, except for fullRandom
+        counts = np.zeros((4, 3), dtype=int)
+        for trial, repN in zip(trials, repNs):
+            if method == 'fullRandom':
+                counts[repN, trial['foo'] - 1] += 1
+            else:
+                counts[repN - 1, trial['foo'] - 1] += 1
+        assert np.all(counts == 1)
+
+    def test_unknown_method(self):
+        with pytest.raises(ValueError):
+            data.TrialHandler2(self.conditions, nReps=2, method='shuffled')
+
 
 class TestTrialHandler2Output(object):
     def setup_class(self):
@@ -180,6 +180,31 @@ class TestTrialHandlerExt(object):
         utils.compareTextFiles(pjoin(self.temp_dir, 'testRandom.csv'),
                                pjoin(fixturesPath,'corrRandom.csv'))
 
+    def test_wideText_chunks(self, monkeypatch):
+        # the wide text written a few trials at a time is the same as written
+        # in one go
+        conditions = [{'trialType': n, 'weight': n + 1} for n in range(4)]
+        trials = data.TrialHandlerExt(trialList=conditions, seed=100,
+                                      nReps=3, method='random',
+                                      extraInfo={'participant': 'abc'},
+                                      autoLog=False)
+        rng = np.random.RandomState(seed=self.random_seed)
+        for thisTrial in trials:
+            trials.addData('rand', rng.rand())
+        path = pjoin(self.temp_dir, 'testWideChunks')
+        trials.saveAsWideText(path + '.csv', delim=',', appendFile=False)
+        monkeypatch.setattr(data.trial, '_ROWS_PER_CHUNK', 7)
+        trials.saveAsWideText(path + '7.csv', delim=',', appendFile=False)
+        with io.open(path + '.csv', encoding='utf-8-sig') as f:
+            expected = f.read()
+        with io.open(path + '7.csv', encoding='utf-8-sig') as f:
+            assert f.read() == expected
+        lines = expected.splitlines()
+        assert len(lines) == 1 + 3 * 10
+        assert lines[0].startswith('participant,TrialNumber,trialType,weight')
+        assert [line.split(',')[1] for line in lines[1:]] == [
+            str(n) for n in range(1, 31)]
+
     def test_comparison_equals(self):
         t1 = data.TrialHandlerExt([dict(foo=1)], 2)
         t2 = data.TrialHandlerExt([dict(foo=1)], 2)
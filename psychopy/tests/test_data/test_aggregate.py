@@ -0,0 +1,170 @@
+"""Test aggregating the data files of many sessions"""
+
+from __future__ import division, print_function
+
+from builtins import object
+import io
+import os
+import shutil
+from tempfile import mkdtemp
+
+import numpy as np
+import pytest
+
+from psychopy import data, logging
+from psychopy.data import aggregate
+
+pytest.importorskip('pyarrow')
+logging.console.setLevel(logging.ERROR)
+
+conditions = [{'word': 'red', 'ori': 0}, {'word': 'blue', 'ori': 45.5}]
+
+
+def _runSession(fileName, participant, addCorr=False, psydat=True):
+    """Runs an experiment with one loop of 4 trials and saves its csv (and
+    psydat) file, as Builder would"""
+    exp = data.ExperimentHandler(
+        name='stroop', extraInfo={'participant': participant, 'session': '1'},
+        savePickle=False, saveWideText=False, autoLog=False)
+    trials = data.TrialHandler2(conditions, 2, seed=1, name='trials',
+                                autoLog=False)
+    exp.addLoop(trials)
+    for trial in trials:
+        exp.addData('rt', 0.5)
+        exp.addData('key', 'f')
+        if addCorr:
+            exp.addData('corr', True)
+        exp.nextEntry()
+    exp.saveAsWideText(fileName + '.csv', appendFile=False,
+                       fileCollisionMethod='overwrite')
+    if psydat:
+        exp.saveAsPickle(fileName, fileCollisionMethod='overwrite')
+    exp.abort()
+
+
+class TestAggregate(object):
+    def setup_method(self):
+        self.temp_dir = mkdtemp(prefix='psychopy-tests-testdata')
+        self.dataDir = os.path.join(self.temp_dir, 'data')
+        self.outDir = os.path.join(self.dataDir, 'aggregated')
+        os.makedirs(os.path.join(self.dataDir, 'pilot'))
+        _runSession(os.path.join(self.dataDir, 'P01_stroop'), '007')
+        _runSession(os.path.join(self.dataDir, 'P02_stroop'), '2',
+                    addCorr=True, psydat=False)
+        _runSession(os.path.join(self.dataDir, 'pilot', 'P03_stroop'), 'p03')
+
+    def teardown_method(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_aggregate(self):
+        summary = aggregate.aggregate(self.dataDir, self.outDir,
+                                      partitionBy='participant', processes=2)
+        assert summary['added'] == ['P01_stroop', 'P02_stroop',
+                                    'pilot/P03_stroop']
+        assert not summary['failed']
+        assert os.path.isfile(os.path.join(
+            self.outDir, 'participant=007', 'P01_stroop.parquet'))
+
+        df = aggregate.readAggregate(self.outDir)
+        assert len(df) == 12
+        assert list(df['sourceFile'].unique()) == [
+            'P01_stroop.psydat', 'P02_stroop.csv', 'pilot/P03_stroop.psydat']
+        # participant has text values, so '007' isn't read as 7
+        assert list(df['participant'].unique()) == ['007', '2', 'p03']
+        assert df['session'].dtype == np.int64
+        assert df['rt'].dtype == np.float64
+        assert list(df['word'][:2]) == ['red', 'blue']
+        assert np.allclose(df['ori'][:2], [0, 45.5])
+        # corr was only in one session
+        assert list(df['corr'][4:8]) == [True] * 4
+        assert df['corr'][:4].isnull().all()
+        # the repeated names of the csv file aren't renamed
+        assert 'trials.thisN' in df.columns
+        assert not [name for name in df.columns if name.endswith('.1')]
+
+        df = aggregate.readAggregate(self.outDir,
+                                     columns=['participant', 'rt'],
+                                     sourceColumn=None)
+        assert list(df.columns) == ['participant', 'rt']
+
+    def test_rerun(self):
+        aggregate.aggregate(self.dataDir, self.outDir, processes=1)
+        summary = aggregate.aggregate(self.dataDir, self.outDir, processes=1)
+        assert summary['added'] == []
+        assert len(summary['unchanged']) == 3
+
+        # a new session, one that changed and one that can't be read
+        _runSession(os.path.join(self.dataDir, 'P04_stroop'), '4')
+        _runSession(os.path.join(self.dataDir, 'P01_stroop'), '007',
+                    addCorr=True)
+        with io.open(os.path.join(self.dataDir, 'P05_stroop.psydat'),
+                     'wb') as f:
+            f.write(b'not a pickle')
+        summary = aggregate.aggregate(self.dataDir, self.outDir, processes=1)
+        assert summary['added'] == ['P04_stroop']
+        assert summary['updated'] == ['P01_stroop']
+        assert summary['unchanged'] == ['P02_stroop', 'pilot/P03_stroop']
+        assert list(summary['failed']) == ['P05_stroop']
+
+        df = aggregate.readAggregate(self.outDir)
+        assert len(df) == 16
+        assert df['corr'].notnull().sum() == 8
+
+        # partitions can only be changed by rebuilding
+        with pytest.raises(ValueError):
+            aggregate.aggregate(self.dataDir, self.outDir,
+                                partitionBy='participant', processes=1)
+        summary = aggregate.aggregate(self.dataDir, self.outDir,
+                                      partitionBy='participant',
+                                      rebuild=True, processes=1)
+        assert len(summary['added']) == 4
+        assert len(aggregate.readAggregate(self.outDir)) == 16
+
+    def test_removedSessions(self):
+        aggregate.aggregate(self.dataDir, self.outDir,
+                            partitionBy='participant', processes=1)
+        # a deleted session, and a renamed one
+        os.remove(os.path.join(self.dataDir, 'P02_stroop.csv'))
+        for ext in ('.csv', '.psydat'):
+            os.rename(os.path.join(self.dataDir, 'pilot', 'P03_stroop' + ext),
+                      os.path.join(self.dataDir, 'pilot', 'P06_stroop' + ext))
+        summary = aggregate.aggregate(self.dataDir, self.outDir,
+                                      partitionBy='participant', processes=1)
+        assert summary['removed'] == ['P02_stroop', 'pilot/P03_stroop']
+        assert summary['added'] == ['pilot/P06_stroop']
+        assert summary['unchanged'] == ['P01_stroop']
+        # the partition that only had the deleted session is gone
+        assert not os.path.exists(os.path.join(self.outDir, 'participant=2'))
+        assert os.listdir(os.path.join(self.outDir, 'participant=p03')) == [
+            'pilot__P06_stroop.parquet']
+
+        df = aggregate.readAggregate(self.outDir)
+        assert len(df) == 8
+        assert list(df['sourceFile'].unique()) == [
+            'P01_stroop.psydat', 'pilot/P06_stroop.psydat']
+        assert list(df['participant'].unique()) == ['007', 'p03']
+        # corr was only in the deleted session
+        assert 'corr' not in df.columns
+
+        # sessions only left out by the pattern are kept
+        summary = aggregate.aggregate(self.dataDir, self.outDir,
+                                      partitionBy='participant',
+                                      pattern='P01*', processes=1)
+        assert summary['removed'] == []
+        assert len(aggregate.readAggregate(self.outDir)) == 8
+
+    def test_commandLine(self, capsys):
+        status = aggregate.main([self.dataDir, self.outDir,
+                                 '--pattern', 'P0[12]*', '--no-recursive',
+                                 '-j', '1'])
+        assert status == 0
+        assert '2 sessions added' in capsys.readouterr().out
+        assert len(aggregate.readAggregate(self.outDir)) == 8
+
+
+def test_typedValue():
+    assert aggregate._typedValue('12') == 12
+    assert aggregate._typedValue('0.5') == 0.5
+    assert aggregate._typedValue('007') == '007'
+    assert aggregate._typedValue('nan') == 'nan'
+    assert aggregate._typedValue('p01') == 'p01'
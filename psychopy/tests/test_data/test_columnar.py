@@ -0,0 +1,153 @@
+"""Test saving handler data as Parquet and Arrow files and loading them"""
+
+from __future__ import division, print_function
+
+from builtins import object
+import os
+import shutil
+from tempfile import mkdtemp
+
+import numpy as np
+import pytest
+
+from psychopy import data, logging
+from psychopy.data import columnar
+
+pytest.importorskip('pyarrow')
+logging.console.setLevel(logging.ERROR)
+
+conditions = [{'ori': 0, 'word': 'left', 'contrast': 0.5},
+              {'ori': 90, 'word': 'right', 'contrast': 1}]
+
+
+class TestColumnar(object):
+    def setup_class(self):
+        self.temp_dir = mkdtemp(prefix='psychopy-tests-testdata')
+
+    def teardown_class(self):
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.parametrize('fileFormat', ['parquet', 'arrow'])
+    @pytest.mark.parametrize('cls', [data.TrialHandler, data.TrialHandlerExt,
+                                     data.TrialHandler2])
+    def test_trialHandlers(self, cls, fileFormat):
+        exp = data.ExperimentHandler(runtimeInfo={'refreshRate': 60.0},
+                                     autoLog=False)
+        trials = cls(conditions, 3, seed=1, autoLog=False,
+                     extraInfo={'participant': 'p01'})
+        exp.addLoop(trials)
+        for trialN, trial in enumerate(trials):
+            if trialN < 5:  # the last trial has no data
+                trials.addData('rt', 0.1 * trialN)
+                trials.addData('keys', ['a', 'b'] if trialN % 2 else 'c')
+        fileName = os.path.join(self.temp_dir, cls.__name__)
+        if fileFormat == 'parquet':
+            saved = trials.saveAsParquet(fileName,
+                                         fileCollisionMethod='overwrite')
+        else:
+            saved = trials.saveAsArrow(fileName,
+                                       fileCollisionMethod='overwrite')
+        assert saved == fileName + '.' + fileFormat
+
+        df = data.readColumnar(fileName + '.' + fileFormat)
+        assert len(df) == 6
+        assert df['ori'].dtype == np.int64
+        assert df['contrast'].dtype == np.float64
+        assert df['rt'].dtype == np.float64
+        assert np.isnan(df['rt'].values[-1])
+        assert np.allclose(df['rt'].values[:5], 0.1 * np.arange(5))
+        assert list(df['keys'][:2]) == ['c', "['a', 'b']"]
+        # (DataHandler stores missing values of text data as '--')
+        assert df['keys'].values[-1] in (None, '--')
+        assert df.attrs['handler'] == cls.__name__
+        assert df.attrs['extraInfo'] == {'participant': 'p01'}
+        assert df.attrs['runtimeInfo'] == {'refreshRate': 60.0}
+
+        # only some columns
+        df = data.readColumnar(fileName + '.' + fileFormat,
+                               columns=['ori', 'rt'])
+        assert list(df.columns) == ['ori', 'rt']
+
+    def test_stairHandler(self):
+        stairs = data.StairHandler(0.5, nReversals=4, nTrials=10,
+                                   extraInfo={'participant': 'p01'},
+                                   autoLog=False)
+        rng = np.random.RandomState(1)
+        for intensity in stairs:
+            stairs.addResponse(int(rng.rand() < 0.6))
+            if stairs.thisTrialN % 2:
+                stairs.addOtherData('rt', rng.rand())
+        fileName = os.path.join(self.temp_dir, 'stairs')
+        assert stairs.saveAsParquet(fileName) == fileName + '.parquet'
+        df = data.readColumnar(fileName + '.parquet')
+        assert list(df.columns) == ['trialN', 'intensity', 'response',
+                                    'reversal', 'rt']
+        assert np.allclose(df['intensity'], stairs.intensities)
+        assert list(df['response']) == stairs.data
+        assert list(np.flatnonzero(df['reversal'])) == stairs.reversalPoints
+        assert df.attrs['reversalPoints'] == stairs.reversalPoints
+
+        info = data.readColumnarInfo(fileName + '.parquet')
+        assert info['handler'] == 'StairHandler'
+        assert np.allclose(info['reversalIntensities'],
+                           stairs.reversalIntensities)
+
+    def test_experimentHandler(self):
+        exp = data.ExperimentHandler(name='exp', version='1.0',
+                                     extraInfo={'participant': 'p01'},
+                                     autoLog=False)
+        for trialN in range(4):
+            exp.addData('resp', trialN % 2 == 0)
+            if trialN:
+                exp.addData('word', 'w%i' % trialN)
+            exp.nextEntry()
+        fileName = os.path.join(self.temp_dir, 'exp')
+        assert exp.saveAsArrow(fileName) == fileName + '.arrow'
+        df = data.readColumnar(fileName + '.arrow')
+        assert list(df.columns) == ['resp', 'word', 'participant']
+        assert df['resp'].dtype == bool
+        assert list(df['word']) == [None, 'w1', 'w2', 'w3']
+        assert df.attrs['version'] == '1.0'
+
+    def test_group(self):
+        fileNames = []
+        for participant in ('p01', 'p02', 'p03'):
+            trials = data.TrialHandler2(conditions, 2, seed=1,
+                                        extraInfo={'participant': participant},
+                                        autoLog=False)
+            for trial in trials:
+                trials.addData('rt', 0.5)
+            fileName = os.path.join(self.temp_dir, 'group_' + participant)
+            trials.saveAsParquet(fileName, fileCollisionMethod='overwrite')
+            fileNames.append(fileName + '.parquet')
+        df = data.readColumnarGroup(fileNames)
+        assert len(df) == 12
+        assert list(df['participant']) == ['p01'] * 4 + ['p02'] * 4 + \
+            ['p03'] * 4
+        assert list(df['fileName'].unique()) == fileNames
+        df = data.readColumnarGroup(fileNames, columns=['rt'],
+                                    fileNameColumn=None)
+        assert list(df.columns) == ['rt']
+
+    def test_noTrials(self):
+        trials = data.TrialHandler2(conditions, 2, autoLog=False)
+        fileName = os.path.join(self.temp_dir, 'noTrials')
+        assert trials.saveAsParquet(fileName) == -1
+        assert not os.path.exists(fileName + '.parquet')
+
+
+def test_columnTypes():
+    assert columnar._columnArray([1, '', None]).type == 'int64'
+    assert columnar._columnArray([1, 0.5, '']).type == 'double'
+    # a parameter that is empty in every condition
+    emptyText = columnar._columnArray(['', ''])
+    assert emptyText.type == 'string'
+    assert emptyText.to_pylist() == ['', '']
+    assert columnar._columnArray(['a', None]).type == 'string'
+    assert columnar._columnArray([[1, 2], 'a']).to_pylist() == ['[1, 2]', 'a']
+
+
+def test_noPyarrow(monkeypatch):
+    monkeypatch.setattr(columnar, 'havePyarrow', False)
+    with pytest.raises(ImportError):
+        columnar.saveColumnar('noPyarrow', ['a'], [[1]])
@@ -0,0 +1,168 @@
+"""Test constrained and counterbalanced trial orders"""
+
+from __future__ import division, print_function
+
+import os
+import json
+import shutil
+from tempfile import mkdtemp
+
+import numpy as np
+import pytest
+
+from psychopy import data, logging
+from psychopy.data import design
+from psychopy.tools.filetools import fromFile
+
+logging.console.setLevel(logging.ERROR)
+
+conditions = data.createFactorialTrialList(
+    {'word': ['red', 'green', 'blue'], 'side': ['left', 'right']})
+
+
+def _transitions(sequence, nConds):
+    counts = np.zeros((nConds, nConds), dtype=int)
+    np.add.at(counts, (sequence[:-1], sequence[1:]), 1)
+    return counts
+
+
+def test_createFactorialTrialList():
+    assert len(conditions) == 6
+    # the first factor varies fastest
+    assert [c['word'] for c in conditions[:3]] == ['red', 'green', 'blue']
+    assert [c['side'] for c in conditions] == ['left'] * 3 + ['right'] * 3
+    assert data.createFactorialTrialList({}) == [{}]
+
+
+def test_checkSequence():
+    assert design.checkSequence([0, 1, 0, 1], noImmediateRepeats=True)
+    assert not design.checkSequence([0, 1, 1, 0], noImmediateRepeats=True)
+    assert design.checkSequence([0, 0, 1, 1, 1], maxRunLength=3)
+    # conditions 0-2 are 'left', 3-5 'right'
+    sequences = [[0, 1, 2, 3, 4, 5], [0, 1, 3, 2, 4, 5]]
+    valid = design.checkSequence(sequences, conditions,
+                                 maxRunLength={'side': 2})
+    assert list(valid) == [False, True]
+
+
+@pytest.mark.parametrize('method', ['fullRandom', 'random'])
+@pytest.mark.parametrize('nReps', [2, 100])
+def test_constrainedRandom(method, nReps):
+    # (100 repeats are built trial by trial, being too long for a random
+    # order to meet the constraints)
+    order = design.ConstrainedRandom(maxRunLength={'side': 2},
+                                     noImmediateRepeats=True, method=method)
+    sequence = order.createSequence(conditions, nReps, seed=1)
+    assert design.checkSequence(sequence, conditions, {'side': 2}, True)
+    assert list(np.bincount(sequence)) == [nReps] * 6
+    if method == 'random':
+        for repN in range(nReps):
+            assert sorted(sequence[repN * 6:(repN + 1) * 6]) == list(range(6))
+    assert order.createSequence(conditions, nReps, seed=1) == sequence
+
+    with pytest.raises(ValueError):
+        design.ConstrainedRandom(noImmediateRepeats=True).createSequence(
+            [{}], 3)
+
+
+def test_latinSquare():
+    for n in range(1, 8):
+        for balanced in (False, True):
+            square = design.latinSquare(n, balanced=balanced)
+            assert square.shape == (2 * n if balanced and n % 2 else n, n)
+            for row in square:
+                assert sorted(row) == list(range(n))
+            for column in square[:n].T:
+                assert sorted(column) == list(range(n))
+            if balanced and n > 1:
+                pairs = sum(_transitions(row, n) for row in square)
+                offDiagonal = pairs[~np.eye(n, dtype=bool)]
+                assert (offDiagonal == offDiagonal[0]).all()
+
+    orders = design.generateOrders(design.LatinSquare(), conditions, 1, 12)
+    square = design.latinSquare(6, balanced=True)
+    assert orders[0] == list(square[0])
+    assert orders[7] == list(square[1])
+
+
+@pytest.mark.parametrize('noImmediateRepeats', [False, True])
+def test_carryoverBalanced(noImmediateRepeats):
+    order = design.CarryoverBalanced(noImmediateRepeats=noImmediateRepeats)
+    nReps = 10 if noImmediateRepeats else 12
+    sequence = np.array(order.createSequence(conditions, nReps, seed=3))
+    assert list(np.bincount(sequence)) == [nReps] * 6
+    # each pair twice, but for the last to the first trial
+    pairs = _transitions(sequence, 6)
+    pairs[sequence[-1], sequence[0]] += 1
+    if noImmediateRepeats:
+        assert (pairs == 2 * (1 - np.eye(6))).all()
+    else:
+        assert (pairs == 2).all()
+    with pytest.raises(ValueError):
+        order.createSequence(conditions, 7)
+
+
+class TestTrialHandlers(object):
+    def setup_class(self):
+        self.temp_dir = mkdtemp(prefix='psychopy-tests-testdata')
+
+    def teardown_class(self):
+        shutil.rmtree(self.temp_dir)
+
+    @pytest.mark.parametrize('cls', [data.TrialHandler, data.TrialHandlerExt,
+                                     data.TrialHandler2])
+    def test_designMethod(self, cls):
+        order = design.ConstrainedRandom(maxRunLength={'side': 1})
+        trials = cls(conditions, 4, method=order, seed=2, autoLog=False)
+        sides = []
+        for trial in trials:
+            sides.append(trial['side'])
+            trials.addData('rt', 0.1)
+        assert len(sides) == 24
+        assert all(side != previous
+                   for side, previous in zip(sides[1:], sides[:-1]))
+        # the same order from the same seed
+        again = cls(conditions, 4, method=order, seed=2, autoLog=False)
+        assert [trial['side'] for trial in again] == sides
+
+        fileName = os.path.join(self.temp_dir, cls.__name__)
+        trials.saveAsPickle(fileName, fileCollisionMethod='overwrite')
+        assert fromFile(fileName + '.psydat').method.maxRunLength == \
+            {'side': 1}
+
+    def test_fixedOrder(self):
+        sequence = [5, 4, 3, 2, 1, 0, 0, 1, 2, 3, 4, 5]
+        trials = data.TrialHandler(conditions, 2,
+                                   method=design.FixedOrder(sequence),
+                                   autoLog=False)
+        assert [trials.thisIndex for trial in trials] == sequence
+        with pytest.raises(ValueError):
+            data.TrialHandler(conditions, 3,
+                              method=design.FixedOrder(sequence),
+                              autoLog=False)
+
+
+def test_generateOrders():
+    order = design.ConstrainedRandom(noImmediateRepeats=True)
+    manifestFile = os.path.join(mkdtemp(prefix='psychopy-tests-testdata'),
+                                'orders.json')
+    try:
+        orders = design.generateOrders(order, conditions, 20,
+                                       ['p01', 'p02', 'p03'], seed=1,
+                                       processes=2, manifestFile=manifestFile)
+        assert list(orders) == ['p01', 'p02', 'p03']
+        assert orders['p01'] != orders['p02']
+        # the same orders in one process
+        assert design.generateOrders(order, conditions, 20,
+                                     ['p01', 'p02', 'p03'], seed=1) == orders
+        assert design.loadOrders(manifestFile) == orders
+        # each participant's seed can be made again from the manifest
+        with open(manifestFile) as f:
+            manifest = json.load(f)
+        entry = manifest['participants'][1]
+        seed = np.random.SeedSequence(manifest['entropy'],
+                                      spawn_key=entry['spawnKey'])
+        assert order.createSequence(conditions, 20, seed=seed) == \
+            orders['p02']
+    finally:
+        shutil.rmtree(os.path.dirname(manifestFile))
@@ -88,6 +88,42 @@ def test_logistic():
     if PLOTTING:
         plotFit(modResps, thresh, 'Logistic (thresh=%.2f, params=%s)' %(fit.inverse(0.75), fit.params))
 
+def test_fitBatch():
+    #noisy copies of the data, each fitted alone and then all at once
+    rng = numpy.random.RandomState(1000)
+    noisy = responses + rng.normal(0, 0.02, (20, len(contrasts)))
+    for fitClass in [data.FitWeibull, data.FitLogistic, data.FitCumNormal,
+                     data.FitNakaRushton]:
+        guess = fitClass(contrasts, responses, expectedMin=0.5).params
+        fits = [fitClass(contrasts, yy, guess=guess, expectedMin=0.5)
+                for yy in noisy]
+        params, converged = fitClass.fitBatch(contrasts, noisy, guess=guess,
+                                              expectedMin=0.5)
+        assert converged.all()
+        assert numpy.allclose([fit.params for fit in fits], params,
+                              rtol=1e-4)
+    with raises(ValueError):
+        data.FitWeibull.fitBatch(contrasts, noisy)
+
+def test_bootstrapFit():
+    rng = numpy.random.RandomState(1000)
+    intensities = numpy.repeat(contrasts, 50)
+    trialResponses = rng.rand(len(intensities)) < numpy.repeat(responses, 50)
+    boot = data.bootstrapFit(data.FitCumNormal, intensities, trialResponses,
+                             nResamples=500, seed=1)
+    assert boot.params.shape == (500, 2)
+    assert boot.converged.mean() > 0.95
+    lower, upper = boot.thresholdCI(0.75)
+    assert lower < boot.fit.inverse(0.75) < upper
+    assert lower < thresh < upper
+    paramCI = boot.paramCI(95)
+    assert numpy.all(paramCI[0] < boot.fit.params)
+    assert numpy.all(boot.fit.params < paramCI[1])
+    # the same seed gives the same resamples
+    again = data.bootstrapFit(data.FitCumNormal, intensities,
+                              trialResponses, nResamples=500, seed=1)
+    assert numpy.allclose(again.params, boot.params, equal_nan=True)
+
 def teardown():
     if PLOTTING:
         pylab.show()
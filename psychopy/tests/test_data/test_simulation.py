@@ -0,0 +1,174 @@
+"""Test the batch simulation of staircases"""
+
+from __future__ import division, print_function
+
+from builtins import range
+from builtins import object
+import numpy as np
+import pytest
+
+from psychopy import data, logging
+from psychopy.data.simulation import StairBatch, QuestBatch, PsiBatch
+
+logging.console.setLevel(logging.ERROR)
+
+N_OBSERVERS = 8
+
+
+def _runBatch(batch, uniforms, thresholds):
+    trialN = 0
+    while not batch.finished.all():
+        p = batch.probCorrect(batch.nextIntensity, thresholds)
+        batch.addResponses(uniforms[trialN] < p)
+        trialN += 1
+    return batch.getIntensities()
+
+
+def _runHandler(handler, uniforms, thresholds, probCorrect):
+    """Runs a handler with the responses observer n would give in a batch
+    """
+    intensities = []
+    for trialN, intensity in enumerate(handler):
+        intensities.append(intensity)
+        p = probCorrect(np.array([intensity]), thresholds)[0]
+        handler.addResponse(int(uniforms[trialN] < p))
+    return intensities
+
+
+class TestBatches(object):
+    def setup(self):
+        rng = np.random.RandomState(1000)
+        self.uniforms = rng.random_sample((500, N_OBSERVERS))
+
+    @pytest.mark.parametrize('args', [
+        dict(stepType='db', stepSizes=[8, 4, 2], nUp=1, nDown=3),
+        dict(stepType='log', stepSizes=0.2, nUp=2, nDown=1, maxVal=1),
+        dict(stepType='lin', stepSizes=0.05, applyInitialRule=False),
+        dict(stepType='lin', stepSizes=[0.2, 0.1], minVal=0.15)])
+    def test_stairBatch(self, args):
+        thresholds = np.linspace(0.1, 0.4, N_OBSERVERS)
+        args = dict(args, startVal=0.5, nReversals=6, nTrials=20)
+        batch = StairBatch(N_OBSERVERS, **args)
+        intensities = _runBatch(batch, self.uniforms, thresholds)
+        reversals = batch.getReversals()
+        for n in range(N_OBSERVERS):
+            stairs = data.StairHandler(autoLog=False, **args)
+            expected = _runHandler(stairs, self.uniforms[:, n],
+                                   thresholds[n:n + 1], batch.probCorrect)
+            assert batch.nTrialsRun[n] == len(expected)
+            got = intensities[:len(expected), n]
+            assert np.allclose(got, expected, rtol=1e-12)
+            assert np.allclose(got[reversals[:len(expected), n]],
+                               stairs.reversalIntensities, rtol=1e-12)
+            assert np.isclose(batch.estimate()[n],
+                              np.mean(stairs.reversalIntensities[-6:]))
+        if 'minVal' in args:
+            # (some observers are held at minVal)
+            assert np.nanmin(intensities) == args['minVal']
+
+    @pytest.mark.parametrize('args', [
+        dict(method='quantile', nTrials=30),
+        dict(method='mean', nTrials=30, minVal=-1.2, maxVal=0),
+        dict(method='quantile', nTrials=100, stopInterval=0.3)])
+    def test_questBatch(self, args):
+        thresholds = np.linspace(-1.5, 0, N_OBSERVERS)
+        args = dict(args, startVal=-0.5, startValSd=0.5)
+        batch = QuestBatch(N_OBSERVERS, **args)
+        intensities = _runBatch(batch, self.uniforms, thresholds)
+        for n in range(N_OBSERVERS):
+            stairs = data.QuestHandler(autoLog=False, **args)
+            expected = _runHandler(stairs, self.uniforms[:, n],
+                                   thresholds[n:n + 1], batch.probCorrect)
+            assert batch.nTrialsRun[n] == len(expected)
+            assert np.allclose(intensities[:len(expected), n], expected)
+            assert np.isclose(batch.mean()[n], stairs.mean())
+            assert np.isclose(batch.sd()[n], stairs.sd())
+            assert np.isclose(batch.quantile(0.05)[n], stairs.quantile(0.05))
+
+    def test_psiBatch(self):
+        thresholds = np.linspace(2, 8, N_OBSERVERS)
+        args = dict(nTrials=20, intensRange=[0.1, 10],
+                    alphaRange=[0.1, 10], betaRange=[0.1, 3],
+                    intensPrecision=0.1, alphaPrecision=0.1,
+                    betaPrecision=0.1, delta=0.01, dtype='float64')
+        batch = PsiBatch(N_OBSERVERS, **args)
+        intensities = _runBatch(batch, self.uniforms, thresholds)
+        alphas, betas = batch.estimateLambda()
+        for n in range(N_OBSERVERS):
+            stairs = data.PsiHandler(**args)
+            expected = _runHandler(stairs, self.uniforms[:, n],
+                                   thresholds[n:n + 1], batch.probCorrect)
+            assert np.allclose(intensities[:, n], expected)
+            assert np.allclose(stairs.estimateLambda(), (alphas[n], betas[n]))
+
+    def test_psiBatchFloat32(self):
+        # with float32 arrays the products for all observers are not summed
+        # in the same order as PsiHandler's, so near-ties in the expected
+        # entropy can be broken differently. Tolerated: up to a third of the
+        # observers taking a different path, with location estimates within
+        # one step of the alpha grid of the handler's.
+        nObservers = 30
+        uniforms = np.random.RandomState(1000).random_sample(
+            (30, nObservers))
+        thresholds = np.linspace(2, 8, nObservers)
+        args = dict(nTrials=30, intensRange=[0.1, 10],
+                    alphaRange=[0.1, 10], betaRange=[0.1, 3],
+                    intensPrecision=0.1, alphaPrecision=0.1,
+                    betaPrecision=0.1, delta=0.01, dtype='float32')
+        batch = PsiBatch(nObservers, **args)
+        intensities = _runBatch(batch, uniforms, thresholds)
+        alphas = batch.estimate()
+        nDiverged = 0
+        for n in range(nObservers):
+            stairs = data.PsiHandler(**args)
+            expected = _runHandler(stairs, uniforms[:, n],
+                                   thresholds[n:n + 1], batch.probCorrect)
+            assert intensities[0, n] == expected[0]
+            nDiverged += not np.allclose(intensities[:, n], expected)
+            assert abs(stairs.estimateLambda()[0] - alphas[n]) <= 0.1
+        assert nDiverged <= nObservers // 3
+
+
+def test_simulate():
+    result = data.simulate('quest', nObservers=500, thresholds=-1.0,
+                           startVal=-0.5, startValSd=0.5, nTrials=40,
+                           seed=1, tolerance=0.2)
+    assert result.intensities.shape == (40, 500)
+    summary = result.summary()
+    assert abs(summary['bias']) < 0.02
+    assert 0 < summary['sd'] < 0.1
+    assert summary['propFinished'] == 1
+    assert summary['propConverged'] > 0.9
+    assert result.rmsError[-1] < result.rmsError[0]
+    # the same seed gives the same responses
+    again = data.simulate('quest', nObservers=500, thresholds=-1.0,
+                          startVal=-0.5, startValSd=0.5, nTrials=40, seed=1)
+    assert np.array_equal(again.estimates, result.estimates)
+
+    with pytest.raises(ValueError):
+        data.simulate('quest', nObservers=500, thresholds=[-1.0, 0.5],
+                      startVal=-0.5, startValSd=0.5, nTrials=40)
+
+
+def test_simulateProcesses():
+    thresholds = np.linspace(0.1, 0.3, 100)
+    result = data.simulate('simple', nObservers=100, thresholds=thresholds,
+                           startVal=0.5, nReversals=8, seed=2, processes=2)
+    assert len(result.estimates) == 100
+    assert np.array_equal(result.thresholds, thresholds)
+    assert result.finished.all()
+    assert result.intensities.shape[1] == 100
+
+
+def test_simulateMultiStair():
+    conditions = [{'label': 'low', 'startVal': 0.5, 'threshold': 0.1},
+                  {'label': 'high', 'startVal': 0.5, 'threshold': 0.3,
+                   'stepSizes': [8, 4]}]
+    results = data.simulateMultiStair(conditions, nObservers=200,
+                                      nTrials=30, seed=3)
+    assert list(results) == ['low', 'high']
+    assert np.all(results['low'].thresholds == 0.1)
+    assert np.all(results['high'].thresholds == 0.3)
+    assert results['low'].nTrialsRun.min() >= 30
+    for result in results.values():
+        assert abs(result.bias) < 0.1
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import shutil
 import pytest
 import numpy as np
 from psychopy.data import utils
@@ -72,6 +73,24 @@ class Test_utilsClass:
         assert selected_conditions[0] == expected_cond
         assert len(selected_conditions) == num_selected_conditions
 
+    def test_importConditions_cache(self, tmpdir):
+        fileName = str(tmpdir.join('trialTypes.csv'))
+        shutil.copy(join(fixturesPath, 'trialTypes.csv'), fileName)
+        uncached = utils.importConditions(fileName, cache=False)
+        conds = utils.importConditions(fileName)
+        assert conds == uncached
+        # a cached result is a new copy each time
+        conds[0]['text'] = 'changed'
+        conds = utils.importConditions(fileName)
+        assert conds == uncached
+        assert utils.importConditions(fileName, selection='1:3') == uncached[1:3]
+        # changing the file invalidates the cached conditions
+        with open(fileName, 'a') as f:
+            f.write('\nyellow,1,1,yellow,3,4.5')
+        conds = utils.importConditions(fileName)
+        assert len(conds) == len(uncached) + 1
+        assert conds[-1]['text'] == 'yellow'
+
     def test_isValidVariableName(self):
         assert utils.isValidVariableName('Name') == (True, '')
         assert utils.isValidVariableName('a_b_c') == (True, '')
@@ -132,6 +151,31 @@ class Test_utilsClass:
         assert len(utils.functionFromStaircase(intensities, responses, binUniq)[1]) == len(responses)
         assert len(utils.functionFromStaircase(intensities, responses, binUniq)[2]) == len([1]*bin10)
 
+    def test_functionFromStaircaseMeans(self):
+        import numpy as np
+        rng = np.random.RandomState(2)
+        intensities = rng.choice(np.linspace(0.1, 1.3, 7), 200) + 1e-3
+        responses = rng.random_sample(200) < intensities
+        order = np.argsort(intensities)
+        for bins in (10, 3, 300):
+            inten, resp, n = utils.functionFromStaircase(
+                intensities, responses, bins)
+            # the means of the old loop over bins, to the last digits
+            edges = [int(round(binN * 200 / bins))
+                     for binN in range(bins + 1)]
+            assert n == list(np.diff(edges))
+            with np.errstate(invalid='ignore'):
+                expected = [np.mean(intensities[order[start:stop]])
+                            if stop > start else np.nan
+                            for start, stop in zip(edges[:-1], edges[1:])]
+            assert np.allclose(inten, expected, rtol=1e-14, equal_nan=True)
+        inten, resp, n = utils.functionFromStaircase(intensities, responses,
+                                                     'unique')
+        assert np.allclose(inten, np.unique(np.round(intensities, 8)))
+        assert np.allclose(resp, [responses[np.round(intensities, 8) == x].mean()
+                                  for x in inten], rtol=1e-14)
+        assert sum(n) == 200
+
     def test_getDateStr(self):
         import time
         assert utils.getDateStr() == time.strftime("%Y_%b_%d_%H%M", time.localtime())
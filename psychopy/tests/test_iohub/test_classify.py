@@ -0,0 +1,125 @@
+""" Test the vectorized interest area / interest period classification of
+    psychopy.iohub.datastore.pandas.classify.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from psychopy.iohub.datastore.pandas.classify import (
+    pointsInPolygon, interestAreaIndex, interestPeriodIndex,
+    classifySamples, dwellTimeSummary)
+
+# a concave (L shaped) polygon
+L_SHAPE = [(0, 0), (4, 0), (4, 1), (1, 1), (1, 3), (0, 3)]
+AREAS = [('left', [(-4, -1), (-2, -1), (-2, 1), (-4, 1)]),
+         ('right', [(2, -1), (4, -1), (4, 1), (2, 1)])]
+
+
+def testPointsInPolygon():
+    from matplotlib.path import Path
+    rng = np.random.RandomState(1)
+    # (no points exactly on an edge, which may be classified either way)
+    points = rng.uniform(-1, 5, size=(10000, 2)) + 1e-7
+    inside = pointsInPolygon(points[:, 0], points[:, 1], L_SHAPE)
+    expected = Path(L_SHAPE).contains_points(points)
+    assert inside.dtype == bool
+    assert (inside == expected).all()
+    assert inside.any() and not inside.all()
+
+    # the shape of x is kept
+    inside = pointsInPolygon(points[:, 0].reshape(100, 100),
+                             points[:, 1].reshape(100, 100), L_SHAPE)
+    assert inside.shape == (100, 100)
+    assert (inside.ravel() == expected).all()
+
+
+def testPointsInPolygonHole():
+    shapely = pytest.importorskip('shapely.geometry')
+    square = shapely.Polygon([(0, 0), (4, 0), (4, 4), (0, 4)],
+                             [[(1, 1), (3, 1), (3, 3), (1, 3)]])
+    inside = pointsInPolygon([0.5, 2, 3.5, 5], [0.5, 2, 2, 2], square)
+    assert list(inside) == [True, False, True, False]
+
+
+def testInterestAreaIndex():
+    x = [-3, 3, 0, -3.5, 10]
+    y = [0, 0.5, 0, 2, 0]
+    assert list(interestAreaIndex(x, y, AREAS)) == [0, 1, -1, -1, -1]
+    assert list(interestAreaIndex(x, y, [])) == [-1] * 5
+
+
+def testInterestPeriodIndex():
+    # unsorted periods, with a gap between them
+    starts = [5.0, 0.0, 10.0]
+    ends = [8.0, 4.0, 12.0]
+    times = [-1, 0, 2, 4, 4.5, 5, 8, 9, 11, 13]
+    assert list(interestPeriodIndex(times, starts, ends)) == [
+        -1, 1, 1, 1, -1, 0, 0, -1, 2, -1]
+    assert list(interestPeriodIndex(times[:3], [], [])) == [-1] * 3
+
+
+def _samples():
+    """10 samples, 1 second apart: 3 in 'left', 1 in no area, 2 in
+    'right', 2 in 'left' again and 2 in no area"""
+    x = [-3, -3, -3, 0, 3, 3, -3, -3, 0, 0]
+    return pd.DataFrame(dict(time=np.arange(10.0), x_position=x,
+                             y_position=np.zeros(10)))
+
+
+PERIODS = pd.DataFrame(dict(start_time=[0.0, 4.5], end_time=[4.5, 9.0],
+                            ip_id_num=[1, 2]))
+
+
+def testClassifySamples():
+    samples = _samples()
+    result = classifySamples(samples, AREAS, periods=PERIODS)
+    assert list(result.columns) == ['time', 'x_position', 'y_position',
+                                    'ia_name', 'ip_id_num']
+    assert list(result['ia_name'].fillna('')) == [
+        'left', 'left', 'left', '', 'right', 'right', 'left', 'left', '', '']
+    assert list(result['ip_id_num']) == [1, 1, 1, 1, 1, 2, 2, 2, 2, 2]
+    # the samples are not changed
+    assert 'ia_name' not in samples.columns
+
+
+def testDwellTimeSummary():
+    samples = classifySamples(_samples(), AREAS, periods=PERIODS)
+    summary = dwellTimeSummary(samples)
+    # (samples in no area are not summarized)
+    assert list(summary.index) == [(1, 'left'), (1, 'right'),
+                                   (2, 'left'), (2, 'right')]
+    assert list(summary['sample_count']) == [3, 1, 2, 1]
+    assert list(summary['dwell_time']) == [3.0, 1.0, 2.0, 1.0]
+    assert list(summary['entry_count']) == [1, 1, 1, 1]
+    assert list(summary['first_time']) == [0.0, 4.0, 6.0, 5.0]
+    assert list(summary['last_time']) == [2.0, 4.0, 7.0, 5.0]
+
+    # 'left' entered twice, over both periods
+    summary = dwellTimeSummary(samples.drop(columns='ip_id_num'))
+    assert list(summary.index) == ['left', 'right']
+    assert list(summary['entry_count']) == [2, 1]
+    assert list(summary['dwell_time']) == [5.0, 2.0]
+
+    with pytest.raises(ValueError):
+        dwellTimeSummary(_samples())
+
+
+def testSessions():
+    # two sessions with the same sample times, and different periods
+    samples = pd.concat([_samples(), _samples()], ignore_index=True)
+    samples.index = pd.MultiIndex.from_arrays(
+        [[1] * 20, [1] * 10 + [2] * 10], names=['experiment_id', 'session_id'])
+    periods = pd.DataFrame(dict(start_time=[0.0, 0.0], end_time=[4.5, 2.5],
+                                ip_id_num=[1, 3]))
+    periods.index = pd.MultiIndex.from_arrays(
+        [[1, 1], [1, 2]], names=['experiment_id', 'session_id'])
+    result = classifySamples(samples, AREAS, periods=periods)
+    assert list(result['ip_id_num'].fillna(0)) == (
+        [1] * 5 + [0] * 5 + [3] * 3 + [0] * 7)
+
+    summary = dwellTimeSummary(result)
+    assert list(summary.index) == [(1, 1, 1, 'left'), (1, 1, 1, 'right'),
+                                   (1, 2, 3, 'left')]
+    assert list(summary['sample_count']) == [3, 1, 3]
+    # the last sample of session 1 isn't followed by the first of session 2
+    assert list(summary['dwell_time']) == [3.0, 1.0, 3.0]
@@ -0,0 +1,211 @@
+""" Test the buffering of events in chunks, and their writing by a background
+    thread, in ioHub DataStore files, and reading them back in chunks.
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+import tables
+
+from psychopy.iohub.constants import EventConstants
+from psychopy.iohub.datastore import (DataStoreFile, EventTableChunk,
+                                      DataStoreWriterThread)
+from psychopy.iohub.datastore.util import readTableChunks
+from psychopy.iohub.devices.experiment import MessageEvent
+from psychopy.iohub.devices.keyboard import (KeyboardPressEvent,
+                                             KeyboardReleaseEvent)
+
+EventConstants.addClassMappings(
+    [MessageEvent.EVENT_TYPE_ID, KeyboardPressEvent.EVENT_TYPE_ID,
+     KeyboardReleaseEvent.EVENT_TYPE_ID],
+    dict(MESSAGE=MessageEvent, KEYBOARD_PRESS=KeyboardPressEvent,
+         KEYBOARD_RELEASE=KeyboardReleaseEvent))
+
+CHUNK_DTYPE = np.dtype([('event_id', np.uint32), ('time', np.float64)])
+
+
+class _Device(object):
+    """Stands in for the device instance a table is made for"""
+
+
+def _message(event_id, text=b'msg'):
+    return [0, 0, 0, event_id, MessageEvent.EVENT_TYPE_ID, 0.0, 0.0,
+            event_id / 10.0, 0.0, 0.0, 0, 0.0, b'', text]
+
+
+def _openFile(folder, **settings):
+    allSettings = dict(flush_interval=0, event_chunk_size=4,
+                       event_chunk_max_latency=0.05)
+    allSettings.update(settings)
+    dsfile = DataStoreFile('events.hdf5', str(folder), 'a', allSettings)
+    dsfile.updateDataStoreStructure(_Device(), dict(MESSAGE=MessageEvent))
+    dsfile.createOrUpdateExperimentEntry([0, 'exp', 'title', '', '1.0', 1])
+    dsfile.createExperimentSessionEntry(dict(code='s1', name='s1',
+                                             comments='', user_variables=''))
+    return dsfile
+
+
+def _waitFor(func, timeout=10.0):
+    """Runs func in a thread, failing if it does not return in time (e.g.
+    because of a deadlock)"""
+    thread = threading.Thread(target=func)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "{} did not return".format(func)
+
+
+@pytest.fixture(params=[True, False], ids=['writerThread', 'noWriterThread'])
+def dsfile(request, tmpdir):
+    dsfile = _openFile(tmpdir, writer_thread=request.param)
+    yield dsfile
+    _waitFor(dsfile.close)
+
+
+def testEventTableChunk():
+    chunk = EventTableChunk(None, CHUNK_DTYPE, 3)
+    assert len(chunk.take()) == 0
+    assert not chunk.add([1, 0.1])
+    assert chunk.firstEventTime is not None
+    rows = chunk.take()
+    assert list(rows['event_id']) == [1]
+    assert chunk.count == 0 and chunk.firstEventTime is None
+
+    # a full chunk hands over its array and starts a new one
+    assert not chunk.add([2, 0.2])
+    assert not chunk.add([3, 0.3])
+    assert chunk.add([4, 0.4])
+    rows = chunk.take()
+    assert list(rows['event_id']) == [2, 3, 4]
+    chunk.add([5, 0.5])
+    assert list(rows['event_id']) == [2, 3, 4]
+
+
+def testWriterThread():
+    written = []
+    release = threading.Event()
+
+    class _File(object):
+        def _appendRows(self, etable, rows):
+            release.wait()
+            written.append((etable, list(rows['event_id'])))
+
+    writer = DataStoreWriterThread(_File(), queue_size=1)
+    writer.start()
+    try:
+        def rows(eventID):
+            return np.array([(eventID, 0.0)] * 2, dtype=CHUNK_DTYPE)
+        writer.put('a', rows(0))
+        # the writer holds the first chunk and the queue the second, so
+        # the third put waits for the writer
+        time.sleep(0.05)
+        writer.put('b', rows(1))
+        threading.Timer(0.1, release.set).start()
+        writer.put('c', rows(2))
+        writer.waitUntilWritten()
+        assert written == [('a', [0, 0]), ('b', [1, 1]), ('c', [2, 2])]
+        stats = writer.getStats()
+        assert stats['chunks_written'] == 3
+        assert stats['events_written'] == 6
+        assert stats['blocked_puts'] == 1
+        assert stats['blocked_time'] > 0
+        assert stats['queued_chunks'] == 0
+    finally:
+        release.set()
+        writer.stop()
+    assert not writer.is_alive()
+
+
+def testChunkedWrites(dsfile):
+    table = dsfile.TABLES[MessageEvent.IOHUB_DATA_TABLE]
+    dsfile._handleEvents([_message(i) for i in range(1, 11)])
+    # only full chunks are written
+    if dsfile._writer is not None:
+        dsfile._writer.waitUntilWritten()
+    assert table.nrows == 8
+    assert dsfile.getWriterStats()['pending_events'] == 2
+
+    dsfile._handleEvent(_message(11))
+    _waitFor(dsfile.flush)
+    assert table.nrows == 11
+    assert list(table.col('event_id')) == list(range(1, 12))
+    # tagged with the active experiment and session
+    assert set(table.col('session_id')) == {dsfile.active_session_id}
+
+
+def testLatencyFlush(dsfile):
+    table = dsfile.TABLES[MessageEvent.IOHUB_DATA_TABLE]
+    dsfile._handleEvent(_message(1))
+    dsfile.checkPendingEvents()
+    assert dsfile.getWriterStats()['pending_events'] == 1
+    time.sleep(dsfile.maxLatency * 2)
+    dsfile.checkPendingEvents()
+    assert dsfile.getWriterStats()['pending_events'] == 0
+    if dsfile._writer is not None:
+        dsfile._writer.waitUntilWritten()
+    assert table.nrows == 1
+
+
+def testNewDeviceWhileEventsPending(dsfile):
+    # registering a device's event classes at runtime, with events still
+    # buffered, must not wait for the writer thread while holding the lock
+    dsfile._handleEvents([_message(i) for i in range(1, 4)])
+    _waitFor(lambda: dsfile.updateDataStoreStructure(
+        _Device(), dict(KEYBOARD_PRESS=KeyboardPressEvent,
+                        KEYBOARD_RELEASE=KeyboardReleaseEvent)))
+    assert KeyboardPressEvent.IOHUB_DATA_TABLE in dsfile.TABLES
+    mappings = dsfile.TABLES['CLASS_TABLE_MAPPINGS'].col('class_id')
+    assert KeyboardPressEvent.EVENT_TYPE_ID in mappings
+
+    _waitFor(dsfile.flush)
+    assert dsfile.TABLES[MessageEvent.IOHUB_DATA_TABLE].nrows == 3
+
+
+@pytest.fixture(params=[True, False], ids=['indexed', 'unindexed'])
+def eventTable(request, tmpdir):
+    """A table of 1000 events from 3 sessions, interleaved"""
+    h5file = tables.open_file(str(tmpdir.join('table.hdf5')), 'w')
+    nRows = 1000
+    rows = np.empty(nRows, dtype=[('session_id', 'u1'), ('time', 'f8'),
+                                  ('event_id', 'u4')])
+    rows['session_id'] = np.arange(nRows) % 3 + 1
+    rows['time'] = np.arange(nRows) / 100.0
+    rows['event_id'] = np.arange(nRows)
+    table = h5file.create_table(h5file.root, 'events', rows)
+    if request.param:
+        table.cols.session_id.create_csindex()
+        table.cols.time.create_csindex()
+    yield table
+    h5file.close()
+
+
+@pytest.mark.parametrize('condition', [
+    '(session_id == 2)', '(session_id == 2) & (time >= 5.0)',
+    '(session_id == 9)', None])
+def testReadTableChunks(eventTable, condition):
+    if condition is None:
+        expected = eventTable.read()
+    else:
+        expected = eventTable.read_where(condition)
+    if condition and eventTable.cols.session_id.is_indexed:
+        assert eventTable.will_query_use_indexing(condition)
+    chunks = list(readTableChunks(eventTable, condition, chunk_size=64))
+    assert all(0 < len(chunk) <= 64 for chunk in chunks)
+    if len(expected):
+        assert (np.concatenate(chunks) == expected).all()
+    else:
+        assert chunks == []
+    # one chunk for all of them gives the same rows
+    whole = list(readTableChunks(eventTable, condition, chunk_size=10000))
+    assert len(whole) == (1 if len(expected) else 0)
+    if len(expected):
+        assert (whole[0] == expected).all()
+
+    frames = list(readTableChunks(eventTable, condition,
+                                  columns=['event_id', 'time'],
+                                  chunk_size=64, as_type='dataframe'))
+    assert len(frames) == len(chunks)
+    if frames:
+        assert list(frames[0].columns) == ['event_id', 'time']
+        assert sum(len(frame) for frame in frames) == len(expected)
@@ -37,6 +37,35 @@ def testGetEvents():
 
     stopHubProcess()
 
+@skip_under_travis
+def testGetEventsAsNumpy():
+    """
+    """
+    from psychopy.iohub.constants import EventConstants
+    io = startHubProcess()
+
+    exp = io.devices.experiment
+    assert exp != None
+
+    io.sendMessageEvent("Test Message 1")
+    io.sendMessageEvent("Category Test", category="TEST")
+
+    events = io.getEvents(as_type='numpy')
+    assert list(events.keys()) == [EventConstants.MESSAGE]
+
+    messages = events[EventConstants.MESSAGE]
+    assert len(messages) == 2
+    assert messages['text'][0] == b"Test Message 1"
+    assert messages['category'][1] == b"TEST"
+    assert messages['time'][0] <= messages['time'][1]
+
+    assert len(io.getEvents(as_type='numpy')) == 0
+
+    exp_events = exp.getEvents(asType='numpy')
+    assert len(exp_events[EventConstants.MESSAGE]) == 2
+
+    stopHubProcess()
+
 @skip_under_travis
 def testGlobalBufferOnlyClear():
     """
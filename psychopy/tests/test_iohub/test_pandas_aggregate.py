@@ -0,0 +1,136 @@
+""" Test reading ioHub DataStore files into pandas DataFrames with
+    psychopy.iohub.datastore.pandas.aggregate.
+"""
+import functools
+import shutil
+
+import numpy as np
+import pytest
+import tables
+
+from psychopy.iohub.constants import EventConstants
+from psychopy.iohub.datastore import DataStoreFile
+from psychopy.iohub.datastore import util
+from psychopy.iohub.datastore.pandas import aggregate
+from psychopy.iohub.devices.experiment import MessageEvent
+from psychopy.iohub.devices.keyboard import (KeyboardPressEvent,
+                                             KeyboardReleaseEvent)
+
+EventConstants.addClassMappings(
+    [MessageEvent.EVENT_TYPE_ID, KeyboardPressEvent.EVENT_TYPE_ID,
+     KeyboardReleaseEvent.EVENT_TYPE_ID],
+    dict(MESSAGE=MessageEvent, KEYBOARD_PRESS=KeyboardPressEvent,
+         KEYBOARD_RELEASE=KeyboardReleaseEvent))
+
+N_PRESSES = 10
+
+
+class _Device(object):
+    """Stands in for the device instance a table is made for"""
+
+
+def _keyEvent(eventClass, event_id, key):
+    return [0, 0, 0, event_id, eventClass.EVENT_TYPE_ID, 0.0, 0.0,
+            event_id / 10.0, 0.0, 0.0, 0, 0, 0, 0, 0, key, 0, 0, key, 0.0, 0]
+
+
+@pytest.fixture
+def hubFile(tmpdir):
+    """A file with a session of key presses and releases, condition
+    variables and an empty MESSAGE table"""
+    dsfile = DataStoreFile('events.hdf5', str(tmpdir), 'a',
+                           dict(flush_interval=0, writer_thread=False))
+    dsfile.updateDataStoreStructure(
+        _Device(), dict(MESSAGE=MessageEvent,
+                        KEYBOARD_PRESS=KeyboardPressEvent,
+                        KEYBOARD_RELEASE=KeyboardReleaseEvent))
+    dsfile.createOrUpdateExperimentEntry([0, 'exp', 'title', '', '1.0', 1])
+    dsfile.createExperimentSessionEntry(dict(code='s1', name='s1',
+                                             comments='', user_variables=''))
+    expID, sessionID = dsfile.active_experiment_id, dsfile.active_session_id
+    dsfile.initConditionVariableTable(expID, sessionID,
+                                      [('trial', 'i4'), ('cond', 'S8')])
+    for trial in range(3):
+        dsfile.extendConditionVariableTable(expID, sessionID,
+                                            [trial, b'c%d' % trial])
+    events = []
+    for n in range(N_PRESSES):
+        key = chr(ord('a') + n).encode('utf-8')
+        events.append(_keyEvent(KeyboardPressEvent, n * 2 + 1, key))
+        events.append(_keyEvent(KeyboardReleaseEvent, n * 2 + 2, key))
+    dsfile._handleEvents(events)
+    dsfile.close()
+    return str(tmpdir.join('events.hdf5'))
+
+
+@pytest.fixture(params=[100000, 3], ids=['oneChunk', 'smallChunks'])
+def chunkSize(request, monkeypatch):
+    monkeypatch.setattr(aggregate, 'readTableChunks', functools.partial(
+        util.readTableChunks, chunk_size=request.param))
+    return request.param
+
+
+def testReadDataStoreFile(hubFile, chunkSize):
+    data = aggregate.readDataStoreFile(hubFile)
+    # the MESSAGE table has no rows, so there is no MESSAGE DataFrame
+    assert sorted(data.keys()) == [
+        'KEYBOARD_PRESS', 'KEYBOARD_RELEASE', 'condition_variables',
+        'experiment_meta_data', 'session_meta_data']
+
+    presses = data['KEYBOARD_PRESS']
+    assert list(presses.columns) == list(KeyboardPressEvent.NUMPY_DTYPE.names)
+    assert len(presses) == N_PRESSES
+    assert list(presses['event_id']) == list(range(1, N_PRESSES * 2, 2))
+    assert set(presses['type']) == {'KEYBOARD_PRESS'}
+    assert list(presses['key']) == [chr(ord('a') + n)
+                                    for n in range(N_PRESSES)]
+    assert presses['event_id'].dtype == np.uint32
+    assert presses['time'].dtype == np.float64
+    assert presses['key'].dtype == object
+    assert len(data['KEYBOARD_RELEASE']) == N_PRESSES
+
+    cvs = data['condition_variables']
+    assert list(cvs.columns) == ['experiment_id', 'session_id', 'trial',
+                                 'cond']
+    assert list(cvs['cond']) == ['c0', 'c1', 'c2']
+    assert cvs['trial'].dtype == np.int32
+
+    sessions = data['session_meta_data']
+    assert len(sessions) == 1
+    assert sessions['code'][0] == 's1'
+
+
+def testReadDataStoreFileEventTypes(hubFile, chunkSize):
+    data = aggregate.readDataStoreFile(hubFile,
+                                       event_types=['KEYBOARD_RELEASE'])
+    assert 'KEYBOARD_PRESS' not in data
+    releases = data['KEYBOARD_RELEASE']
+    assert list(releases['event_id']) == list(range(2, N_PRESSES * 2 + 1, 2))
+
+    data = aggregate.readDataStoreFile(hubFile, event_types=['MESSAGE'])
+    assert sorted(data.keys()) == [
+        'condition_variables', 'experiment_meta_data', 'session_meta_data']
+
+
+def testReadEmptyTable(hubFile):
+    with tables.open_file(hubFile, 'r') as h5file:
+        table = h5file.get_node('/data_collection/events/experiment/'
+                                'MessageEvent')
+        df = aggregate._readTable(table)
+    assert len(df) == 0
+    assert list(df.columns) == list(MessageEvent.NUMPY_DTYPE.names)
+    assert df['time'].dtype == np.float64
+    assert df['text'].dtype == object
+
+
+def testAggregateDataView(hubFile):
+    hubFile2 = hubFile.replace('events.hdf5', 'events2.hdf5')
+    shutil.copy(hubFile, hubFile2)
+    view = aggregate.ioHubAggregateDataView([hubFile, hubFile2], processes=1)
+    assert view.event_types == ['KEYBOARD_PRESS', 'KEYBOARD_RELEASE']
+    presses = view.KEYBOARD_PRESS
+    assert len(presses) == N_PRESSES * 2
+    assert set(presses['session_code']) == {'s1'}
+    assert set(presses['experiment_code']) == {'exp'}
+    assert list(presses['file'].unique()) == ['events.hdf5', 'events2.hdf5']
+    assert len(view.condition_variables) == 6
@@ -0,0 +1,58 @@
+""" Test the shared memory event ring buffer used to pass device events
+    from the ioHub Server to the experiment process.
+"""
+import pytest
+import numpy as np
+from psychopy.iohub.util.sharedmem import (SharedEventRingBuffer,
+                                           SHARED_MEMORY_AVAILABLE)
+
+pytestmark = pytest.mark.skipif(not SHARED_MEMORY_AVAILABLE,
+                                reason="multiprocessing.shared_memory "
+                                       "requires Python 3.8+")
+
+EVENT_DTYPE = np.dtype([('event_id', np.uint32), ('time', np.float64),
+                        ('text', '|S8')])
+
+
+def testWriteRead():
+    ring = SharedEventRingBuffer.create(EVENT_DTYPE, 8)
+    try:
+        reader = SharedEventRingBuffer(ring._shm, EVENT_DTYPE)
+        assert reader.capacity == 8
+        assert len(reader) == 0
+        assert len(reader.read()) == 0
+
+        for i in range(3):
+            assert ring._handleEvent([i, i / 10.0, 'e%d' % i])
+        assert len(reader) == 3
+
+        events = reader.read(clear=False)
+        assert list(events['event_id']) == [0, 1, 2]
+        assert len(reader) == 3
+
+        events = reader.read()
+        assert list(events['text']) == [b'e0', b'e1', b'e2']
+        assert len(reader) == 0
+    finally:
+        ring.close()
+
+
+def testWrapAroundAndOverflow():
+    ring = SharedEventRingBuffer.create(EVENT_DTYPE, 4)
+    try:
+        for i in range(3):
+            ring._handleEvent([i, float(i), ''])
+        assert len(ring.read()) == 3
+
+        # wraps around the end of the buffer
+        for i in range(3, 9):
+            ring._handleEvent([i, float(i), ''])
+        assert ring.getDroppedCount() == 2
+        assert list(ring.read()['event_id']) == [3, 4, 5, 6]
+
+        ring._handleEvent([9, 9.0, ''])
+        ring.clear()
+        assert len(ring) == 0
+        assert len(ring.read()) == 0
+    finally:
+        ring.close()
@@ -141,8 +141,8 @@ def openOutputFile(fileName=None, append=False, fileCollisionMethod='rename',
         Defaults to `rename`.
     encoding : string, optional
         The encoding to use when writing the file. This parameter will be
-        ignored if `append` is `False` and `fileName` ends with `.psydat`
-        or `.npy` (i.e. if a binary file is to be written).
+        ignored if `append` is `False` and `fileName` ends with `.psydat`,
+        `.npy` or `.npz` (i.e. if a binary file is to be written).
         Defaults to ``'utf-8'``.
 
     :Returns:
@@ -158,7 +158,7 @@ def openOutputFile(fileName=None, append=False, fileCollisionMethod='rename',
     if append:
         mode = 'a'
     else:
-        if fileName.endswith(('.psydat', '.npy')):
+        if fileName.endswith(('.psydat', '.npy', '.npz')):
             mode = 'wb'
         else:
             mode = 'w'
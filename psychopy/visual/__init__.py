@@ -32,7 +32,7 @@ from psychopy.visual.backends import gamma
 # absolute essentials (nearly all experiments will need these)
 from .basevisual import BaseVisualStim
 # non-private helpers
-from .helpers import pointInPolygon, polygonsOverlap
+from .helpers import pointInPolygon, polygonsOverlap, SpatialIndex
 from .image import ImageStim
 from .text import TextStim
 from .form import Form
@@ -92,6 +92,9 @@ from psychopy.visual.pie import Pie
 # stimuli derived from Polygon
 from psychopy.visual.circle import Circle
 
+# groups of stimuli drawn together
+from psychopy.visual.shapebatch import ShapeBatch
+
 from psychopy.visual.textbox import TextBox
 
 # rift support 
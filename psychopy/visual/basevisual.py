@@ -43,7 +43,8 @@ from psychopy.tools.attributetools import (attributeSetter, logAttrib,
 from psychopy.tools.monitorunittools import (cm2pix, deg2pix, pix2cm,
                                              pix2deg, convertToPix)
 from psychopy.visual.helpers import (pointInPolygon, polygonsOverlap,
-                                     setColor, findImageFile)
+                                     setColor, findImageFile, _PolygonTable,
+                                     _cachedPolygonTable)
 from psychopy.tools.typetools import float_uint8
 from psychopy.tools.arraytools import makeRadialMatrix
 from psychopy.tools.colorspacetools import dkl2rgb, lms2rgb  # pylint: disable=W0611
@@ -650,6 +651,8 @@ class ContainerMixin(object):
             + one arg (list, tuple or array) containing two vals (x,y)
             + an object with a getPos() method that returns x,y, such
                 as a :class:`~psychopy.event.Mouse`.
+            + many points, as an N x 2 array (or as arrays of x and y
+                values), giving an array of N bools
 
         Returns `True` if the point is within the area defined either by its
         `border` attribute (if one defined), or its `vertices` attribute if
@@ -661,6 +664,9 @@ class ContainerMixin(object):
         stimulus is determined purely by the size, position (pos), and
         orientation (ori) settings (and by the vertices for shape stimuli).
 
+        To find which of many stimuli contain a point, a
+        :class:`~psychopy.visual.SpatialIndex` of them is faster.
+
         See Coder demos: shapeContains.py
         See Coder demos: shapeContains.py
         """
@@ -675,10 +681,12 @@ class ContainerMixin(object):
         elif hasattr(x, 'getPos'):
             xy = x.getPos()
             units = x.units
-        elif type(x) in [list, tuple, numpy.ndarray]:
-            xy = numpy.array(x)
+        elif type(x) in [list, tuple, numpy.ndarray] and y is None:
+            xy = numpy.array(x, dtype=float)
         else:
-            xy = numpy.array((x, y))
+            # (x and y can be arrays of the coordinates of many points)
+            xy = numpy.stack([numpy.asarray(x, dtype=float),
+                              numpy.asarray(y, dtype=float)], axis=-1)
         # try to work out what units x,y has
         if units is None:
             if hasattr(xy, 'units'):
@@ -687,21 +695,32 @@ class ContainerMixin(object):
                 units = self.units
         if units != 'pix':
             xy = convertToPix(xy, pos=(0, 0), units=units, win=self.win)
-        # ourself in pixels
+
+        return pointInPolygon(xy, None, poly=self._containsTable())
+
+    def _containsTable(self):
+        """The area that .contains() tests, in pixels, ready for testing
+        points (kept until the vertices change)
+        """
         if hasattr(self, 'border'):
-            poly = self._borderPix  # e.g., outline vertices
+            # e.g., outline vertices
+            return _cachedPolygonTable(self, self._borderPix, '_borderTable')
         elif hasattr(self, 'boundingBox'):
             if abs(self.ori) > 0.1:
                 raise RuntimeError("TextStim.contains() doesn't currently "
                                    "support rotated text.")
             w, h = self.boundingBox  # e.g., outline vertices
             x, y = self.posPix
-            poly = numpy.array([[x+w/2, y-h/2], [x-w/2, y-h/2],
-                                [x-w/2, y+h/2], [x+w/2, y+h/2]])
-        else:
-            poly = self.verticesPix  # e.g., tessellated vertices
-
-        return pointInPolygon(xy[0], xy[1], poly=poly)
+            key = (x, y, w, h)
+            cached = self.__dict__.get('_boundingBoxTable')
+            if cached is None or cached[0] != key:
+                poly = numpy.array([[x+w/2, y-h/2], [x-w/2, y-h/2],
+                                    [x-w/2, y+h/2], [x+w/2, y+h/2]])
+                cached = (key, _PolygonTable(poly))
+                self.__dict__['_boundingBoxTable'] = cached
+            return cached[1]
+        # e.g., tessellated vertices
+        return _cachedPolygonTable(self, self.verticesPix, '_verticesPixTable')
 
     def overlaps(self, polygon):
         """Returns `True` if this stimulus intersects another one.
@@ -23,6 +23,7 @@ from psychopy import logging, colors
 from psychopy.tools.arraytools import val2array
 from psychopy.tools.attributetools import setAttribute
 from psychopy.tools.filetools import pathToString
+from psychopy.tools.monitorunittools import convertToPix
 
 import numpy as np
 
@@ -42,6 +43,128 @@ except Exception:
     haveMatplotlib = False
 
 
+# the most point/edge pairs tested at once by the pure numpy ray casting
+_MAX_RAY_PAIRS = 2 ** 20
+# whether matplotlib Path can be used, by matplotlib version
+_mplPathVersions = {}
+
+
+def _useMplPath():
+    """Returns True if matplotlib has Path.contains_points (version > 1.2)
+    """
+    if not haveMatplotlib:
+        return False
+    version = matplotlib.__version__
+    try:
+        return _mplPathVersions[version]
+    except KeyError:
+        usePath = parse_version(version) > parse_version('1.2')
+        _mplPathVersions[version] = usePath
+        return usePath
+
+
+class _PolygonTable(object):
+    """The vertices of a polygon with what is needed to test many points
+    against it at once: its bounding box, a matplotlib Path and an edge
+    table for ray casting (both made when first needed).
+    """
+    __slots__ = ('vertices', 'bounds', '_path', '_edges')
+
+    def __init__(self, vertices):
+        self.vertices = vertices  # (kept to tell if the vertices change)
+        poly = np.asarray(vertices, dtype=float).reshape((-1, 2))
+        if len(poly):
+            self.bounds = np.concatenate([poly.min(axis=0), poly.max(axis=0)])
+        else:
+            self.bounds = np.array([np.inf, np.inf, -np.inf, -np.inf])
+        self._path = None
+        self._edges = None
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def contains(self, points):
+        """Returns a bool array of whether each of `points` (N x 2 array, in
+        the units of the vertices) is inside the polygon
+        """
+        result = np.zeros(len(points), dtype=bool)
+        if len(self.vertices) < 3:
+            return result
+        xMin, yMin, xMax, yMax = self.bounds
+        inBounds = ((points[:, 0] >= xMin) & (points[:, 0] <= xMax) &
+                    (points[:, 1] >= yMin) & (points[:, 1] <= yMax))
+        candidates = points[inBounds]
+        if not len(candidates):
+            return result
+        if _useMplPath():
+            if self._path is None:
+                self._path = mplPath(self.vertices)
+            result[inBounds] = self._path.contains_points(candidates)
+            return result
+        elif haveMatplotlib:
+            try:
+                result[inBounds] = nxutils.points_inside_poly(
+                    candidates, self.vertices)
+                return result
+            except Exception:
+                pass
+        result[inBounds] = self._rayCast(candidates)
+        return result
+
+    def _rayCast(self, points):
+        """Numpy version of the pure python ray casting test: the number of
+        edges crossed by a (horizontal) ray from each point is odd inside
+        """
+        # adapted from http://local.wasp.uwa.edu.au/~pbourke/geometry/insidepoly/
+        # via http://www.ariel.com.au/a/python-point-int-poly.html
+        if self._edges is None:
+            p2 = np.asarray(self.vertices, dtype=float)
+            p1 = np.roll(p2, 1, axis=0)
+            dy = p2[:, 1] - p1[:, 1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                slope = np.where(dy != 0, (p2[:, 0] - p1[:, 0]) / dy, 0.0)
+            self._edges = (np.minimum(p1[:, 1], p2[:, 1]),
+                           np.maximum(p1[:, 1], p2[:, 1]),
+                           np.maximum(p1[:, 0], p2[:, 0]),
+                           p1[:, 0], p1[:, 1], slope, p1[:, 0] == p2[:, 0])
+        yMin, yMax, xMax, x1, y1, slope, vertical = self._edges
+        inside = np.zeros(len(points), dtype=bool)
+        chunk = max(1, _MAX_RAY_PAIRS // len(x1))
+        for start in range(0, len(points), chunk):
+            x = points[start:start + chunk, 0:1]
+            y = points[start:start + chunk, 1:2]
+            xInts = (y - y1) * slope + x1
+            crossed = ((y > yMin) & (y <= yMax) & (x <= xMax) &
+                       (vertical | (x <= xInts)))
+            inside[start:start + chunk] = crossed.sum(axis=1) % 2 == 1
+        return inside
+
+
+def _cachedPolygonTable(obj, vertices, cacheName):
+    """Returns the _PolygonTable of `vertices`, a vertex array of `obj`, kept
+    as obj.<cacheName> until obj has new vertices (stimuli make new vertex
+    arrays when they update them, after setting _needVertexUpdate).
+    """
+    objDict = getattr(obj, '__dict__', {})
+    table = objDict.get(cacheName)
+    if table is None or table.vertices is not vertices:
+        table = _PolygonTable(vertices)
+        objDict[cacheName] = table
+    return table
+
+
+def _pointsArray(x, y=None):
+    """Returns the point(s) (`x`, `y`), or the point(s) in `x` if `y` is
+    None, as an N x 2 float array, and whether it was a single point
+    """
+    if y is None:
+        points = np.asarray(x, dtype=float)
+    else:
+        points = np.stack([np.asarray(x, dtype=float),
+                           np.asarray(y, dtype=float)], axis=-1)
+    return points.reshape((-1, 2)), points.ndim < 2
+
+
 def pointInPolygon(x, y, poly):
     """Determine if a point is inside a polygon; returns True if inside.
 
@@ -49,42 +172,31 @@ def pointInPolygon(x, y, poly):
     as (x,y) pairs. If given an object, such as a `ShapeStim`, will try to
     use its vertices and position as the polygon.
 
+    Many points can be tested at once, either as arrays of `x` and `y`
+    values or as an N x 2 array of points in `x` (with `y` as None), and
+    then an array of bools is returned. The polygon of an object is kept,
+    ready for testing, until its vertices change.
+
     Same as the `.contains()` method elsewhere.
     """
-    try:  # do this using try:...except rather than hasattr() for speed
-        poly = poly.verticesPix  # we want to access this only once
-    except Exception:
-        pass
-    nVert = len(poly)
-    if nVert < 3:
+    if isinstance(poly, _PolygonTable):
+        table = poly
+    else:
+        try:  # do this using try:...except rather than hasattr() for speed
+            # we want to access this only once
+            table = _cachedPolygonTable(poly, poly.verticesPix,
+                                        '_verticesPixTable')
+        except AttributeError:
+            table = _PolygonTable(poly)
+    points, single = _pointsArray(x, y)
+    if len(table) < 3:
         msg = 'pointInPolygon expects a polygon with 3 or more vertices'
         logging.warning(msg)
-        return False
-
-    # faster if have matplotlib tools:
-    if haveMatplotlib:
-        if parse_version(matplotlib.__version__) > parse_version('1.2'):
-            return mplPath(poly).contains_point([x, y])
-        else:
-            try:
-                return bool(nxutils.pnpoly(x, y, poly))
-            except Exception:
-                pass
-
-    # fall through to pure python:
-    # adapted from http://local.wasp.uwa.edu.au/~pbourke/geometry/insidepoly/
-    # via http://www.ariel.com.au/a/python-point-int-poly.html
-
-    inside = False
-    # trace (horizontal?) rays, flip inside status if cross an edge:
-    p1x, p1y = poly[-1]
-    for p2x, p2y in poly:
-        if y > min(p1y, p2y) and y <= max(p1y, p2y) and x <= max(p1x, p2x):
-            if p1y != p2y:
-                xints = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-            if p1x == p2x or x <= xints:
-                inside = not inside
-        p1x, p1y = p2x, p2y
+        inside = np.zeros(len(points), dtype=bool)
+    else:
+        inside = table.contains(points)
+    if single:
+        return bool(inside[0])
     return inside
 
 
@@ -149,14 +261,179 @@ def polygonsOverlap(poly1, poly2):
             except Exception:
                 pass
 
-    # fall through to pure python:
-    for p1 in poly1_vert_pix:
-        if pointInPolygon(p1[0], p1[1], poly2_vert_pix):
-            return True
-    for p2 in poly2_vert_pix:
-        if pointInPolygon(p2[0], p2[1], poly1_vert_pix):
-            return True
-    return False
+    # fall through to numpy:
+    if pointInPolygon(poly1_vert_pix, None, poly2_vert_pix).any():
+        return True
+    return bool(pointInPolygon(poly2_vert_pix, None, poly1_vert_pix).any())
+
+
+class SpatialIndex(object):
+    """An index of where many stimuli are, to find which of them contain a
+    point (e.g. a mouse click, touch or gaze sample) with one query, rather
+    than calling the `.contains()` method of each.
+
+    The bounding boxes of the stimuli are kept in a grid of square cells,
+    so only the few stimuli near a point are tested against their exact
+    shape (the same area as their `.contains()` method, in pixels). Stimuli
+    that move or change shape are found and indexed again before each
+    query (or only when :meth:`update` is called, with `autoUpdate=False`).
+
+    Example::
+
+        index = visual.SpatialIndex(win, [button1, button2, picture])
+        clicked = index.stimuliAt(mouse)  # e.g. [button2]
+        hits = index.contains(gazeSamples)  # nSamples x 3 bools
+
+    :Parameters:
+
+        win : the :class:`~psychopy.visual.Window` of the stimuli
+
+        stimuli : the stimuli to index (more can be added with :meth:`add`)
+
+        units : the units of the points to test (by default, those of
+            `win`)
+
+        cellSize : the width of the cells of the grid, in pixels (by
+            default, the mean width or height of the stimuli)
+
+        autoUpdate : whether to check for stimuli that changed before each
+            query
+    """
+    # stimuli in more cells than this are tested for every point
+    _MAX_CELLS = 256
+
+    def __init__(self, win, stimuli=(), units=None, cellSize=None,
+                 autoUpdate=True):
+        self.win = win
+        self.units = units
+        self.cellSize = cellSize
+        self.autoUpdate = autoUpdate
+        self._stimuli = []
+        self._tables = []
+        self._grid = None
+        self._gridCellSize = None
+        self._everywhere = []  # stimuli tested for every point
+        for stim in stimuli:
+            self.add(stim)
+
+    @property
+    def stimuli(self):
+        """The stimuli in the index, in the order they were added (a tuple)
+        """
+        return tuple(self._stimuli)
+
+    def __len__(self):
+        return len(self._stimuli)
+
+    def add(self, stim):
+        """Adds a stimulus to the index.
+        """
+        if not hasattr(stim, '_containsTable'):
+            raise TypeError('SpatialIndex can only hold stimuli with a '
+                            '.contains() method, not %s'
+                            % type(stim).__name__)
+        self._stimuli.append(stim)
+        self._tables.append(None)
+        self._grid = None
+
+    def remove(self, stim):
+        """Removes a stimulus from the index.
+        """
+        for stimN, member in enumerate(self._stimuli):
+            if member is stim:
+                del self._stimuli[stimN]
+                del self._tables[stimN]
+                self._grid = None
+                return
+        raise ValueError('%s is not in the SpatialIndex' % stim.name)
+
+    def update(self):
+        """Indexes again the stimuli that moved or changed shape since the
+        last update.
+        """
+        for stimN, stim in enumerate(self._stimuli):
+            table = stim._containsTable()
+            if table is not self._tables[stimN]:
+                self._tables[stimN] = table
+                self._grid = None
+        if self._grid is None:
+            self._buildGrid()
+
+    def _buildGrid(self):
+        """Puts each stimulus in the cells of the grid its bounding box
+        covers
+        """
+        # (stimuli that can't contain points, e.g. lines, have no bounds)
+        bounds = np.array([table.bounds for table in self._tables
+                           if table is not None and len(table) >= 3])
+        cellSize = self.cellSize
+        if cellSize is None:
+            if len(bounds):
+                cellSize = np.mean(np.maximum(bounds[:, 2] - bounds[:, 0],
+                                              bounds[:, 3] - bounds[:, 1]))
+            cellSize = max(cellSize or 1.0, 1.0)
+        self._gridCellSize = cellSize
+        self._grid = {}
+        self._everywhere = []
+        for stimN, table in enumerate(self._tables):
+            if table is None or len(table) < 3:
+                continue
+            xMin, yMin, xMax, yMax = np.floor(table.bounds / cellSize)
+            if (xMax - xMin + 1) * (yMax - yMin + 1) > self._MAX_CELLS:
+                self._everywhere.append(stimN)
+                continue
+            for cellX in range(int(xMin), int(xMax) + 1):
+                for cellY in range(int(yMin), int(yMax) + 1):
+                    self._grid.setdefault((cellX, cellY), []).append(stimN)
+
+    def contains(self, x, y=None, units=None):
+        """Returns which stimuli contain the point(s) x,y, as an array of
+        bools (one per stimulus, in the order of :attr:`stimuli`), or an
+        N x nStimuli array of bools for N points.
+
+        Accepts the same points as the `.contains()` method of stimuli
+        (including an object with a getPos() method, such as a
+        :class:`~psychopy.event.Mouse`), and also N x 2 arrays of points.
+        """
+        if hasattr(x, 'getPos'):
+            units = x.units
+            x = x.getPos()
+        points, single = _pointsArray(x, y)
+        if units is None:
+            units = self.units or self.win.units
+        if units != 'pix':
+            points = convertToPix(points, pos=(0, 0), units=units,
+                                  win=self.win)
+        if self.autoUpdate or self._grid is None:
+            self.update()
+
+        inside = np.zeros((len(points), len(self._stimuli)), dtype=bool)
+        # group the points by their cell, to test each stimulus once
+        cells = np.floor(points / self._gridCellSize).astype(np.int64)
+        pointsInCell = {}
+        for pointN, cell in enumerate(map(tuple, cells.tolist())):
+            pointsInCell.setdefault(cell, []).append(pointN)
+        for cell, pointNs in pointsInCell.items():
+            stimNs = self._grid.get(cell, []) + self._everywhere
+            if not stimNs:
+                continue
+            cellPoints = points[pointNs]
+            for stimN in stimNs:
+                inside[pointNs, stimN] = \
+                    self._tables[stimN].contains(cellPoints)
+        if single:
+            return inside[0]
+        return inside
+
+    def stimuliAt(self, x, y=None, units=None):
+        """Returns a list of the stimuli that contain the point x,y (in the
+        order of :attr:`stimuli`).
+        """
+        inside = self.contains(x, y, units=units)
+        if inside.ndim > 1:
+            raise ValueError('SpatialIndex.stimuliAt() takes a single point '
+                             '(use .contains() for many)')
+        return [self._stimuli[stimN] for stimN in np.flatnonzero(inside)]
 
 
 def setTexIfNoShaders(obj):
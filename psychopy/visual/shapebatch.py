@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Draw many shape stimuli (ShapeStim, Rect, Circle, Polygon, Line...) with
+a few OpenGL calls."""
+
+# Part of the PsychoPy library
+# Copyright (C) 2002-2018 Jonathan Peirce (C) 2019-2021 Open Science Tools Ltd.
+# Distributed under the terms of the GNU General Public License (GPL)
+
+from __future__ import absolute_import, print_function
+
+from builtins import object, range
+import ctypes
+
+import pyglet
+pyglet.options['debug_gl'] = False
+GL = pyglet.gl
+
+import numpy
+
+from psychopy import logging
+import psychopy.tools.gltools as gt
+from psychopy.visual.basevisual import MinimalStim, WindowMixin
+from psychopy.visual.shape import BaseShapeStim
+
+# each vertex in the buffer is x, y (pixels), r, g, b, a
+_ROW_FLOATS = 6
+_ROW_BYTES = _ROW_FLOATS * ctypes.sizeof(GL.GLfloat)
+# upload the changed rows in one span when more members than this changed
+_MAX_SPANS = 16
+
+
+def _colorKey(color):
+    """Returns a value that changes whenever the rendered color would (so
+    the color is only rendered again when it has changed)"""
+    rgb = color.rgb
+    alpha = color.alpha
+    if isinstance(alpha, numpy.ndarray):
+        alpha = alpha.tobytes()
+    return (color.valid, None if rgb is None else numpy.asarray(rgb).tobytes(),
+            color.contrast, alpha)
+
+
+def _fanTriangles(vertices):
+    """Returns the vertices of the triangles filling a convex polygon, as
+    drawn by GL_POLYGON"""
+    nVerts = len(vertices)
+    indices = numpy.zeros((nVerts - 2, 3), dtype=int)
+    indices[:, 1] = numpy.arange(1, nVerts - 1)
+    indices[:, 2] = indices[:, 1] + 1
+    return vertices[indices.ravel()]
+
+
+def _lineSegments(vertices, closed):
+    """Returns the pairs of vertices of the segments of a line loop (or
+    strip, if not closed), to draw as GL_LINES"""
+    nVerts = len(vertices)
+    if nVerts < 2:
+        return vertices[:0]
+    starts = numpy.arange(nVerts if closed else nVerts - 1)
+    return vertices[numpy.stack([starts, (starts + 1) % nVerts],
+                                axis=1).ravel()]
+
+
+class _MemberState(object):
+    """What was last uploaded for a member of a ShapeBatch, to find out
+    which members have changed"""
+    __slots__ = ['verticesPix', 'borderPix', 'closed', 'fillKey', 'lineKey',
+                 'fillRGBA', 'lineRGBA', 'lineWidth', 'interpolate',
+                 'fillVerts', 'lineVerts', 'fillStart', 'lineStart']
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+
+    @property
+    def fillCount(self):
+        return 0 if self.fillRGBA is None else len(self.fillVerts)
+
+    @property
+    def lineCount(self):
+        return 0 if self.lineRGBA is None else len(self.lineVerts)
+
+    def refresh(self, shape):
+        """Updates the state from the shape and returns True if it changed
+        """
+        verts = shape.verticesPix  # (updates the vertices if needed)
+        border = shape._borderPix if hasattr(shape, 'border') else verts
+        closed = bool(shape.closeShape)
+        fillKey = _colorKey(shape._fillColor)
+        lineKey = _colorKey(shape._borderColor)
+        lineWidth = shape.lineWidth
+        interpolate = bool(shape.interpolate)
+        changed = False
+        if verts is not self.verticesPix or border is not self.borderPix or \
+                closed != self.closed:
+            self.verticesPix, self.borderPix, self.closed = \
+                verts, border, closed
+            if len(verts) < 3 or \
+                    (hasattr(shape, '_tesselVertices') and not closed):
+                self.fillVerts = verts[:0]
+            elif hasattr(shape, '_tesselVertices'):
+                self.fillVerts = verts  # (ShapeStim tessellated these)
+            else:
+                self.fillVerts = _fanTriangles(verts)
+            self.lineVerts = _lineSegments(border, closed)
+            changed = True
+        if fillKey != self.fillKey:
+            self.fillKey = fillKey
+            self.fillRGBA = shape._fillColor.render('rgba1') \
+                if shape._fillColor != None else None
+            changed = True
+        if lineKey != self.lineKey or lineWidth != self.lineWidth:
+            self.lineKey, self.lineWidth = lineKey, lineWidth
+            self.lineRGBA = shape._borderColor.render('rgba1') \
+                if shape._borderColor != None and lineWidth else None
+            changed = True
+        if interpolate != self.interpolate:
+            self.interpolate = interpolate
+            changed = True
+        return changed
+
+
+class ShapeBatch(MinimalStim, WindowMixin):
+    """Draws many shape stimuli (:class:`~psychopy.visual.ShapeStim`,
+    Rect, Circle, Polygon, Line etc.) at once.
+
+    The vertices (in pixels) and colors of all the shapes are kept in one
+    vertex buffer on the graphics card, and all the fills are then drawn in
+    one call, as are all the outlines (or one call for each run of shapes
+    with the same `lineWidth` and `interpolate`). On each draw only the
+    shapes that changed (e.g. in pos, ori, size, vertices or color) are
+    uploaded again, so displays of hundreds of shapes don't spend most of
+    the frame on OpenGL calls.
+
+    Set the attributes of the shapes as usual and draw the batch (or set
+    its `autoDraw`) instead of drawing the shapes themselves::
+
+        items = [visual.Rect(win, size=0.05, pos=pos) for pos in positions]
+        batch = visual.ShapeBatch(win, items)
+        items[3].fillColor = 'red'
+        batch.draw()  # only items[3] is uploaded again
+        win.flip()
+
+    All the fills are drawn before all the outlines, so where shapes
+    overlap the outline of a shape is also drawn over the fill of later
+    shapes. Fills of shapes that aren't ShapeStims (e.g. BaseShapeStim)
+    are drawn as convex polygons, as their own draw() does.
+    """
+
+    def __init__(self, win, shapes=(), depth=0, name=None, autoLog=None,
+                 autoDraw=False):
+        """
+        :Parameters:
+
+            win : the :class:`~psychopy.visual.Window` the shapes are in
+
+            shapes : shape stimuli to draw (more can be added with
+                :meth:`add`)
+        """
+        # what local vars are defined (these are the init params) for use by
+        # __repr__
+        self._initParams = dir()
+        self._initParams.remove('self')
+        super(ShapeBatch, self).__init__(name=name, autoLog=False)
+        self.win = win
+        self.depth = depth
+        self._shapes = []
+        self._states = []
+        self._shapeIds = set()
+        self._data = numpy.zeros((0, _ROW_FLOATS), dtype=numpy.float32)
+        self._vbo = None
+        self._vao = None
+        self._fillRuns = []  # (start, count, interpolate)
+        self._lineRuns = []  # (start, count, lineWidth, interpolate)
+        self._needLayout = True
+        for shape in shapes:
+            self.add(shape)
+        self.autoDraw = autoDraw
+
+        # set autoLog now that params have been initialised
+        wantLog = autoLog is None and self.win.autoLog
+        self.__dict__['autoLog'] = autoLog or wantLog
+        if self.autoLog:
+            logging.exp("Created %s = %s" % (self.name, str(self)))
+
+    @property
+    def shapes(self):
+        """The shapes in the batch, in the order they are drawn (a tuple)
+        """
+        return tuple(self._shapes)
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def __iter__(self):
+        return iter(self.shapes)
+
+    def __contains__(self, shape):
+        return id(shape) in self._shapeIds
+
+    def add(self, shape):
+        """Adds a shape to the end of the batch (it is drawn last).
+        """
+        if not isinstance(shape, BaseShapeStim):
+            raise TypeError('ShapeBatch can only hold shape stimuli '
+                            '(BaseShapeStim and its subclasses), not %s'
+                            % type(shape).__name__)
+        if shape in self:
+            return
+        if shape.autoDraw:
+            logging.warning('%s is set to autoDraw, so will also be drawn '
+                            'apart from %s' % (shape.name, self.name))
+        self._shapes.append(shape)
+        self._states.append(_MemberState())
+        self._shapeIds.add(id(shape))
+        self._needLayout = True
+
+    def remove(self, shape):
+        """Removes a shape from the batch.
+        """
+        for memberN, member in enumerate(self._shapes):
+            if member is shape:
+                del self._shapes[memberN]
+                del self._states[memberN]
+                self._shapeIds.discard(id(shape))
+                self._needLayout = True
+                return
+        raise ValueError('%s is not in %s' % (shape.name, self.name))
+
+    def clear(self):
+        """Removes all the shapes from the batch.
+        """
+        self._shapes = []
+        self._states = []
+        self._shapeIds = set()
+        self._needLayout = True
+
+    def _updateData(self):
+        """Brings the vertex data up to date with the shapes and returns the
+        spans of rows that changed, as (start, stop), or None if the whole
+        buffer needs to be created again.
+        """
+        spans = []
+        anyChanged = False
+        for shape, state in zip(self._shapes, self._states):
+            oldCounts = (state.fillCount, state.lineCount)
+            if not state.refresh(shape):
+                continue
+            anyChanged = True
+            if self._needLayout or \
+                    oldCounts != (state.fillCount, state.lineCount):
+                self._needLayout = True
+                continue
+            for start, verts, rgba in (
+                    (state.fillStart, state.fillVerts, state.fillRGBA),
+                    (state.lineStart, state.lineVerts, state.lineRGBA)):
+                if rgba is not None and len(verts):
+                    self._data[start:start + len(verts), :2] = verts
+                    self._data[start:start + len(verts), 2:] = rgba
+                    spans.append((start, start + len(verts)))
+        if self._needLayout:
+            self._layout()
+            return None
+        if anyChanged:  # (interpolate or lineWidth may have changed)
+            self._fillRuns, self._lineRuns = self._runs()
+        return spans
+
+    def _layout(self):
+        """Places the vertices of all the members in the data (fills first,
+        then lines, each in the order of the members)
+        """
+        fillCounts = [state.fillCount for state in self._states]
+        lineCounts = [state.lineCount for state in self._states]
+        nFill = sum(fillCounts)
+        data = numpy.zeros((nFill + sum(lineCounts), _ROW_FLOATS),
+                           dtype=numpy.float32)
+        fillStarts = numpy.cumsum([0] + fillCounts)
+        lineStarts = nFill + numpy.cumsum([0] + lineCounts)
+        for memberN, state in enumerate(self._states):
+            state.fillStart = int(fillStarts[memberN])
+            state.lineStart = int(lineStarts[memberN])
+            for start, count, verts, rgba in (
+                    (state.fillStart, fillCounts[memberN], state.fillVerts,
+                     state.fillRGBA),
+                    (state.lineStart, lineCounts[memberN], state.lineVerts,
+                     state.lineRGBA)):
+                if count:
+                    data[start:start + count, :2] = verts
+                    data[start:start + count, 2:] = rgba
+        self._data = data
+        self._fillRuns, self._lineRuns = self._runs()
+        self._needLayout = False
+
+    def _runs(self):
+        """Returns the draw calls for the fills and lines: runs of members
+        that are drawn with the same settings"""
+        fillRuns = []
+        lineRuns = []
+        for state in self._states:
+            for runs, start, count, key in (
+                    (fillRuns, state.fillStart, state.fillCount,
+                     (state.interpolate,)),
+                    (lineRuns, state.lineStart, state.lineCount,
+                     (state.lineWidth, state.interpolate))):
+                if not count:
+                    continue
+                if runs and runs[-1][2:] == key and \
+                        runs[-1][0] + runs[-1][1] == start:
+                    runs[-1] = (runs[-1][0], runs[-1][1] + count) + key
+                else:
+                    runs.append((start, count) + key)
+        return fillRuns, lineRuns
+
+    def _updateBuffers(self):
+        """Uploads the vertex data of the members that changed (or all of
+        it, if the number of vertices changed)"""
+        spans = self._updateData()
+        if spans is None or self._vbo is None:
+            if self._vbo is not None:
+                gt.deleteVAO(self._vao)
+                gt.deleteVBO(self._vbo)
+                self._vbo = self._vao = None
+            if len(self._data):
+                self._vbo = gt.createVBO(self._data,
+                                         usage=GL.GL_DYNAMIC_DRAW)
+                self._vao = gt.createVAO(
+                    {GL.GL_VERTEX_ARRAY: (self._vbo, 2, 0),
+                     GL.GL_COLOR_ARRAY: (self._vbo, 4, 2)},
+                    legacy=True)
+            return
+        if not spans:
+            return
+        spans.sort()
+        if len(spans) > _MAX_SPANS:
+            spans = [(spans[0][0], max(stop for start, stop in spans))]
+        gt.bindVBO(self._vbo)
+        for start, stop in spans:
+            rows = self._data[start:stop]
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, start * _ROW_BYTES,
+                               rows.nbytes,
+                               rows.ctypes.data_as(
+                                   ctypes.POINTER(GL.GLfloat)))
+        gt.unbindVBO(self._vbo)
+
+    def draw(self, win=None):
+        """Draws all the shapes in the batch.
+        """
+        if win is None:
+            win = self.win
+        self._selectWindow(win)
+        self._updateBuffers()
+        if self._vao is None:
+            return  # nothing to draw
+
+        GL.glPushMatrix()  # push before drawing, pop after
+        win.setScale('pix')
+        if win._haveShaders:
+            GL.glUseProgram(win._progSignedFrag)
+        # load Null textures into multitexteureARB - or they modulate glColor
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+        for start, count, interpolate in self._fillRuns:
+            self._setInterpolate(interpolate)
+            gt.drawVAO(self._vao, GL.GL_TRIANGLES, start, count)
+        for start, count, lineWidth, interpolate in self._lineRuns:
+            self._setInterpolate(interpolate)
+            GL.glLineWidth(lineWidth)
+            gt.drawVAO(self._vao, GL.GL_LINES, start, count)
+
+        if win._haveShaders:
+            GL.glUseProgram(0)
+        GL.glPopMatrix()
+
+    @staticmethod
+    def _setInterpolate(interpolate):
+        if interpolate:
+            GL.glEnable(GL.GL_LINE_SMOOTH)
+            GL.glEnable(GL.GL_MULTISAMPLE)
+        else:
+            GL.glDisable(GL.GL_LINE_SMOOTH)
+            GL.glDisable(GL.GL_MULTISAMPLE)
@@ -26,6 +26,8 @@ GL = pyglet.gl
 
 import psychopy  # so we can get the __path__
 from psychopy import logging
+from psychopy.exceptions import MissingFontError
+import psychopy.tools.gltools as gt
 
 # tools must only be imported *after* event or MovieStim breaks on win32
 # (JWP has no idea why!)
@@ -104,6 +106,7 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
                  flipHoriz=False,
                  flipVert=False,
                  languageStyle='LTR',
+                 renderMode='label',
                  name=None,
                  autoLog=None):
         """
@@ -141,6 +144,21 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
                 in their isolated form. May also be applied in other scripts,
                 such as Farsi or Urdu, that use Arabic-style alphabets.
 
+        **renderMode**
+            How the text is rendered:
+
+            - ``'label'`` is the default, rendering the text with a pyglet
+                Label (or a pygame surface), which is made again each time
+                the text changes.
+            - ``'atlas'`` draws the glyphs from the font atlases shared with
+                :class:`~psychopy.visual.TextBox2`, as quads in a vertex
+                buffer that is reused, so changing the text only updates the
+                vertex data. This is much quicker for text that changes
+                every frame (e.g. RSVP or countdowns) and doesn't leak
+                memory, but the fonts are found by the TextBox2 font manager
+                (so font names may differ) and text is laid out by PsychoPy
+                rather than pyglet.
+
         :Parameters:
 
         """
@@ -179,7 +197,21 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
         self.__dict__['flipHoriz'] = flipHoriz
         self.__dict__['flipVert'] = flipVert
         self.__dict__['languageStyle'] = languageStyle
+        if renderMode not in ('label', 'atlas'):
+            raise ValueError("TextStim renderMode should be 'label' or "
+                             "'atlas', not {}".format(repr(renderMode)))
+        self.__dict__['renderMode'] = renderMode
         self._pygletTextObj = None
+        # for renderMode='atlas': the font, the quads of the glyphs as rows
+        # of x, y (pix), u, v (with room to spare for longer texts) and the
+        # vertex buffer they are uploaded to
+        self._glFont = None
+        self._glyphData = numpy.zeros((0, 4), dtype=numpy.float32)
+        self._nGlyphVerts = 0
+        self._glyphsChanged = False
+        self._glyphBox = (0, 0)
+        self._glyphVBO = None
+        self._glyphVAO = None
         self.__dict__['pos'] = numpy.array(pos, float)
         # deprecated attributes
         if alignVert:
@@ -236,6 +268,7 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
         if GL:  # because of pytest fail otherwise
             try:
                 GL.glDeleteLists(self._listID, 1)
+                self._deleteGlyphBuffer()
             except (ImportError, ModuleNotFoundError, TypeError):
                 pass  # if pyglet no longer exists
 
@@ -275,7 +308,18 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
         be a string specifying the name of the font (in system resources).
         """
         self.__dict__['font'] = None  # until we find one
-        if self.win.winType in ["pyglet", "glfw"]:
+        if self.renderMode == 'atlas':
+            from psychopy.visual.textbox2 import allFonts
+            if not font:
+                font = str(allFonts.getDefaultSansFont().family)
+            self._glFont = allFonts.getFont(font,
+                                            size=int(round(self._heightPix)),
+                                            bold=self.bold, italic=self.italic)
+            if not self._glFont:
+                raise MissingFontError("Couldn't find font {} (or a similar "
+                                       "one)".format(repr(font)))
+            self.__dict__['font'] = font
+        elif self.win.winType in ["pyglet", "glfw"]:
             self._font = pyglet.font.load(font, int(self._heightPix),
                                           dpi=72, italic=self.italic,
                                           bold=self.bold)
@@ -361,7 +405,9 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
 
             self.__dict__['text'] = text
 
-        if self.useShaders:
+        if self.renderMode == 'atlas':
+            self._setTextAtlas()
+        elif self.useShaders:
             self._setTextShaders(text)
         else:
             self._setTextNoShaders(text)
@@ -416,6 +462,140 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
         self._needSetText = False
         self._needUpdate = True
 
+    def _setTextAtlas(self):
+        """Lays out the glyphs of the text (for renderMode='atlas'), writing
+        their quads into the vertex data kept from the last text. Only if
+        the text needs more room than that is a new vertex buffer made.
+        """
+        from psychopy.visual.textbox2.textbox2 import _wrapLines, wordBreaks
+        font = self._glFont
+        # glyphs are sized in pix of the font, scaled to the letter height
+        scale = self._heightPix / font.size
+        boxWidth = self._wrapWidthPix / scale
+
+        codes = numpy.frombuffer((self.text or '').encode('utf-32-le'),
+                                 dtype=numpy.uint32).copy()
+        nChars = len(codes)
+        isNewline = codes == ord('\n')
+        isBreak = numpy.isin(codes, [ord(c) for c in wordBreaks if c != '\n'])
+        codes[isNewline] = ord(' ')
+        offsetX, offsetY, width, height, advanceX, advanceY, u0, v0, u1, v1 = \
+            font.getGlyphMetrics(codes).T
+        advanceX = numpy.where(isNewline, 0, advanceX)
+        cumAdvance = numpy.concatenate([[0], numpy.cumsum(advanceX)])
+        lines = _wrapLines(cumAdvance, offsetX, isNewline, isBreak, boxWidth)
+        lineStarts = numpy.array(lines['starts'], dtype=int)
+        lineWidths = numpy.array(lines['widths'])
+        nLines = len(lineStarts)
+        lineNs = numpy.searchsorted(lineStarts, numpy.arange(nChars),
+                                    side='right') - 1
+
+        # lines are aligned within the wrap width, the box of which is
+        # placed (and the text block's height) by the anchors
+        if self.alignText == 'right':
+            lineX = boxWidth - lineWidths
+        elif self.alignText in ('center', 'centre'):
+            lineX = (boxWidth - lineWidths) / 2.0
+        else:
+            lineX = numpy.zeros(nLines)
+        if self.anchorHoriz == 'right':
+            boxX = -boxWidth
+        elif self.anchorHoriz in ('center', 'centre'):
+            boxX = -boxWidth / 2.0
+        else:
+            boxX = 0.0
+        blockHeight = (nLines - 1) * font.height
+        if self.anchorVert == 'top':
+            boxY = -font.ascender
+        elif self.anchorVert == 'bottom':
+            boxY = blockHeight - font.descender
+        elif self.anchorVert == 'baseline':
+            boxY = 0.0
+        else:
+            boxY = (blockHeight - font.ascender - font.descender) / 2.0
+
+        penX = (boxX + lineX[lineNs] + numpy.array(lines['bases'])[lineNs]
+                + cumAdvance[:-1] - cumAdvance[lineStarts[lineNs]])
+        penY = boxY - lineNs * font.height
+        left = penX + offsetX
+        # (alpha atlases hold glyphs rendered at 3x the width)
+        if font.atlas.format == 'alpha':
+            width = width / 3.0
+        right = left + numpy.where(isNewline, 0, width)
+        top = penY + offsetY
+        bottom = top - height
+
+        nVerts = nChars * 4
+        if nVerts > len(self._glyphData):
+            self._glyphData = numpy.zeros(
+                (max(nVerts, 2 * len(self._glyphData), 64), 4),
+                dtype=numpy.float32)
+        quads = self._glyphData[:nVerts].reshape((nChars, 4, 4))
+        quads[:, :2, 0] = left[:, None] * scale
+        quads[:, 2:, 0] = right[:, None] * scale
+        quads[:, ::3, 1] = top[:, None] * scale
+        quads[:, 1:3, 1] = bottom[:, None] * scale
+        quads[:, :2, 2] = u0[:, None]
+        quads[:, 2:, 2] = u1[:, None]
+        quads[:, ::3, 3] = v0[:, None]
+        quads[:, 1:3, 3] = v1[:, None]
+        self._nGlyphVerts = nVerts
+        self._glyphsChanged = True
+
+        self.width = boxWidth * scale
+        self._fontHeightPix = (blockHeight + font.ascender
+                               - font.descender) * scale
+        self._glyphBox = (lineWidths.max(initial=0) * scale,
+                          self._fontHeightPix)
+        self._needUpdate = True
+
+    def _updateGlyphBuffer(self):
+        """Uploads the quads of the glyphs to the vertex buffer, which is
+        only made again if the vertex data has grown
+        """
+        if not self._glyphsChanged:
+            return
+        if (self._glyphVBO is None
+                or self._glyphVBO.shape[0] != len(self._glyphData)):
+            self._deleteGlyphBuffer()
+            self._glyphVBO = gt.createVBO(self._glyphData,
+                                          usage=GL.GL_DYNAMIC_DRAW)
+            self._glyphVAO = gt.createVAO(
+                {GL.GL_VERTEX_ARRAY: (self._glyphVBO, 2, 0),
+                 GL.GL_TEXTURE_COORD_ARRAY: (self._glyphVBO, 2, 2)},
+                legacy=True)
+        else:
+            rows = self._glyphData[:self._nGlyphVerts]
+            gt.bindVBO(self._glyphVBO)
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, rows.nbytes,
+                               rows.ctypes.data_as(
+                                   ctypes.POINTER(GL.GLfloat)))
+            gt.unbindVBO(self._glyphVBO)
+        self._glyphsChanged = False
+
+    def _deleteGlyphBuffer(self):
+        if self._glyphVBO is not None:
+            gt.deleteVAO(self._glyphVAO)
+            gt.deleteVBO(self._glyphVBO)
+            self._glyphVBO = self._glyphVAO = None
+
+    def _drawGlyphs(self):
+        """Draws the quads of the glyphs (for renderMode='atlas') with the
+        font's atlas as the texture
+        """
+        self._updateGlyphBuffer()
+        # unbind the mask texture regardless
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._glFont.textureID)
+        if self._nGlyphVerts:
+            gt.drawVAO(self._glyphVAO, GL.GL_QUADS, 0, self._nGlyphVerts)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glDisable(GL.GL_TEXTURE_2D)
+
     def _updateListShaders(self):
         """Only used with pygame text - pyglet handles all from the draw()
         """
@@ -725,6 +905,9 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
         self.__dict__['fontFiles'] += fontFiles
         for thisFont in fontFiles:
             pyglet.font.add_file(thisFont)
+        if self.renderMode == 'atlas' and fontFiles:
+            from psychopy.visual.textbox2 import allFonts
+            allFonts.addFontFiles(fontFiles)
 
     @attributeSetter
     def wrapWidth(self, wrapWidth):
@@ -756,6 +939,8 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
         NOTE: currently always returns the size in pixels
         (this will change to return in stimulus units)
         """
+        if self.renderMode == 'atlas':
+            return self._glyphBox
         if hasattr(self._pygletTextObj, 'content_width'):
             w, h = (self._pygletTextObj.content_width,
                     self._pygletTextObj.content_height)
@@ -780,6 +965,8 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
         return self.__dict__['posPix']
 
     def updateOpacity(self):
+        if self.renderMode == 'atlas':
+            return  # opacity is applied when drawing
         self._setTextShaders(value=self.text)
 
     def draw(self, win=None):
@@ -823,13 +1010,19 @@ class TextStim(BaseVisualStim, ColorMixin, ContainerMixin):
                 GL.glGetUniformLocation(self.win._progSignedTexFont, b"rgb"),
                 *self._foreColor.render('rgb1'))
 
+        elif self.renderMode == 'atlas':  # the atlas only has alpha
+            GL.glColor4f(*self._foreColor.render('rgba1'))
         else:  # color is set in texture, so set glColor to white
             GL.glColor4f(1, 1, 1, 1)
 
         # should text have a depth or just on top?
         GL.glDisable(GL.GL_DEPTH_TEST)
         # update list if necss and then call it
-        if win.winType in ["pyglet", "glfw"]:
+        if self.renderMode == 'atlas':
+            if self._needSetText:
+                self.setText(log=False)
+            self._drawGlyphs()
+        elif win.winType in ["pyglet", "glfw"]:
             if self._needSetText:
                 self.setText()
 
@@ -17,6 +17,11 @@
 import re
 import sys, os
 import math
+import json
+import atexit
+import hashlib
+import uuid
+import weakref
 import numpy as np
 import ctypes
 import freetype as ft
@@ -72,6 +77,73 @@ _weightMap = {
 supportedExtensions = ['ttf', 'otf', 'ttc', 'dfont']
 
 
+# the columns of GLFont.getGlyphMetrics()
+GLYPH_METRICS = ('offsetX', 'offsetY', 'width', 'height',
+                 'advanceX', 'advanceY', 'u0', 'v0', 'u1', 'v1')
+
+# the folder where the font index and the glyph atlases of GLFonts are
+# cached between runs (None for 'cache/fonts' in the user prefs folder, or
+# False not to cache fonts at all)
+fontCacheDir = None
+_FONT_CACHE_VERSION = 1
+# digests of the font files opened this session, by (path, stamp)
+_fontDigests = {}
+# GLFonts with glyphs that aren't in the cache yet (saved on exit)
+_unsavedFonts = weakref.WeakSet()
+
+
+def _fontCachePath(fileName):
+    """Returns the path of fileName in the font cache (or None if fonts
+    aren't cached)"""
+    if fontCacheDir is False:
+        return None
+    if fontCacheDir is None:
+        return os.path.join(prefs.paths['userPrefsDir'], 'cache', 'fonts',
+                            fileName)
+    return os.path.join(fontCacheDir, fileName)
+
+
+def _fileStamp(fileName):
+    stat = os.stat(fileName)
+    return stat.st_mtime, stat.st_size
+
+
+def _fileDigest(fileName):
+    key = (os.path.abspath(fileName), _fileStamp(fileName))
+    if key not in _fontDigests:
+        digest = hashlib.sha1()
+        with open(fileName, 'rb') as f:
+            for block in iter(lambda: f.read(65536), b''):
+                digest.update(block)
+        _fontDigests[key] = digest.hexdigest()
+    return _fontDigests[key]
+
+
+def _writeFontCache(cachePath, write):
+    """Writes a file of the font cache with write(fileObj), going through a
+    temporary file so a partly written cache file is never read"""
+    try:
+        if not os.path.isdir(os.path.dirname(cachePath)):
+            os.makedirs(os.path.dirname(cachePath))
+        tmpPath = cachePath + '.%i.tmp' % os.getpid()
+        with open(tmpPath, 'wb') as f:
+            write(f)
+        if os.path.isfile(cachePath):
+            os.remove(cachePath)
+        os.rename(tmpPath, cachePath)
+    except (IOError, OSError) as err:
+        logging.debug(u"Could not write font cache {}: {}".format(
+            cachePath, err))
+        return False
+    return True
+
+
+@atexit.register
+def _saveUnsavedFonts():
+    for glFont in list(_unsavedFonts):
+        glFont.saveToCache()
+
+
 def unicode(s, fmt='utf-8'):
     """Force to unicode if bytes"""
     if type(s) == bytes:
@@ -360,6 +432,14 @@ class GLFont:
         self.height = metrics.height / self.scale
         self.linegap = self.height - self.ascender + self.descender
         self.format = self.atlas.format
+        # the metrics of the glyphs as rows of one array (see
+        # getGlyphMetrics), with the row of each character code
+        self._metrics = np.zeros((256, len(GLYPH_METRICS)), dtype=np.float64)
+        self._nMetrics = 0
+        self._metricRows = np.full(256, -1, dtype=np.int64)
+        # how many of the glyphs are stored in the font cache
+        self._nCached = 0
+        self._loadFromCache()
 
     def __getitem__(self, charcode):
         """
@@ -369,6 +449,120 @@ class GLFont:
             self.fetch('%c' % charcode)
         return self.glyphs[charcode]
 
+    def getGlyphMetrics(self, charcodes):
+        """Returns the metrics of the glyphs of many characters at once.
+
+        Parameters:
+        -----------
+
+        charcodes: str or array of ints
+            The characters (or their unicode code points) to look up.
+            Glyphs that haven't been made yet are fetched first.
+
+        Return
+        ------
+            An array with a row per character and the columns in
+            GLYPH_METRICS (offset, size and advance in pixels, then the
+            texture coordinates)
+        """
+        if isinstance(charcodes, str):
+            codes = np.frombuffer(charcodes.encode('utf-32-le'),
+                                  dtype=np.uint32)
+        else:
+            codes = np.asarray(charcodes, dtype=np.uint32)
+        if not len(codes):
+            return self._metrics[:0].copy()
+        self._growMetricRows(int(codes.max()))
+        rows = self._metricRows[codes]
+        missing = rows < 0
+        if missing.any():
+            for code in np.unique(codes[missing]):
+                self[unichr(code)]  # fetches the glyph
+            rows = self._metricRows[codes]
+        return self._metrics[rows]
+
+    def _growMetricRows(self, code):
+        """Makes sure the rows of the characters up to code can be stored
+        """
+        nRows = len(self._metricRows)
+        if code >= nRows:
+            newRows = np.full(max(code + 1, nRows * 2), -1, dtype=np.int64)
+            newRows[:nRows] = self._metricRows
+            self._metricRows = newRows
+
+    def _addGlyphMetrics(self, glyph):
+        """Stores the metrics of a new glyph for getGlyphMetrics
+        """
+        if self._nMetrics == len(self._metrics):
+            self._metrics = np.concatenate(
+                [self._metrics, np.zeros_like(self._metrics)])
+        self._metrics[self._nMetrics] = (
+            tuple(glyph.offset) + tuple(glyph.size) + tuple(glyph.advance)
+            + tuple(glyph.texcoords))
+        code = ord(glyph.charcode)
+        self._growMetricRows(code)
+        self._metricRows[code] = self._nMetrics
+        self._nMetrics += 1
+
+    def _cachePath(self):
+        """Returns the path (without extension) of this font's atlas in the
+        font cache, named by the digest of the font file, the size and the
+        atlas format (or None if fonts aren't cached)
+        """
+        try:
+            digest = _fileDigest(self.filename)
+        except (IOError, OSError):
+            return None
+        return _fontCachePath("{}_{}_{}_{}x{}".format(
+            digest[:16], self.size, self.format,
+            self.atlas.width, self.atlas.height))
+
+    def _loadFromCache(self):
+        """Restores the glyphs cached by earlier runs, memory-mapping the
+        cached atlas (copy-on-write, so new glyphs can still be added to it)
+        so that only missing glyphs need to be rasterised
+        """
+        cachePath = self._cachePath()
+        if cachePath is None:
+            return
+        try:
+            with np.load(cachePath + '.npz') as cached:
+                if int(cached['version']) != _FONT_CACHE_VERSION:
+                    return
+                codes = cached['codes']
+                metrics = cached['metrics']
+                nodes = cached['nodes']
+                used = int(cached['used'])
+                atlasName = str(cached['atlas'])
+            data = np.load(os.path.join(os.path.dirname(cachePath),
+                                        atlasName), mmap_mode='c')
+        except Exception:
+            return  # not cached yet, or the cache can't be read
+        if (data.shape != self.atlas.data.shape
+                or data.dtype != self.atlas.data.dtype
+                or metrics.shape != (len(codes), len(GLYPH_METRICS))):
+            return
+        self.atlas.data = data
+        self.atlas.nodes = [tuple(node) for node in nodes.tolist()]
+        self.atlas.used = used
+        for code, row in zip(codes.tolist(), metrics.tolist()):
+            row = [int(v) if v == int(v) else v for v in row[:4]] + row[4:]
+            glyph = TextureGlyph(unichr(code), tuple(row[2:4]),
+                                 tuple(row[0:2]), tuple(row[4:6]),
+                                 tuple(row[6:]))
+            self.glyphs[glyph.charcode] = glyph
+        nGlyphs = len(codes)
+        self._metrics = np.zeros((max(256, 2 * nGlyphs), len(GLYPH_METRICS)),
+                                 dtype=np.float64)
+        self._metrics[:nGlyphs] = metrics
+        self._nMetrics = self._nCached = nGlyphs
+        if nGlyphs:
+            self._growMetricRows(int(codes.max()))
+            self._metricRows[codes] = np.arange(nGlyphs)
+        self._dirty = True  # the atlas needs uploading
+        logging.debug("Loaded {} cached glyphs for Texture Font {}"
+                      .format(nGlyphs, self.name))
+
     def __str__(self):
         """Returns a string rep of the font, such as 'Arial_24_bold' """
         return "{}_{}".format(self.info, self.size)
@@ -407,6 +601,7 @@ class GLFont:
         self.fetch(charcodes, face=face)
         logging.debug("Preloading of glyph set for Texture Font {} complete"
                       .format(self.name))
+        self.saveToCache()
 
     def fetch(self, charcodes='', face=None):
         """
@@ -483,6 +678,8 @@ class GLFont:
             texcoords = (u0, v0, u1, v1)
             glyph = TextureGlyph(charcode, size, offset, advance, texcoords)
             self.glyphs[charcode] = glyph
+            self._addGlyphMetrics(glyph)
+            _unsavedFonts.add(self)
 
             # Generate kerning
             # for g in self.glyphs.values():
@@ -500,18 +697,50 @@ class GLFont:
                      .format(len(charcodes), nBlanks, len(charcodes) - nBlanks))
 
     def saveToCache(self):
-        """Store the current font texture as an image file.
-
-        As yet we aren't storing the offset, advance and texcoords as needed to
-        retrieve the necessary chars, but it's a start!
-            (see  TextureGlyph(charcode, size, offset, advance, texcoords) )
+        """Stores the atlas and the metrics of its glyphs in the font cache,
+        so that later runs using this font at this size don't need to
+        rasterise these glyphs again.
 
+        This is done after preloading glyphs and, for fonts with glyphs that
+        aren't cached yet, when Python exits.
         """
-        from PIL import Image
-        im = Image.fromarray(self.atlas.data)
-        fname = "{}/.psychopy3/{}_{}_texture.png".format(
-            os.path.expanduser("~"), self.name, self.size)
-        im.save(fname)
+        _unsavedFonts.discard(self)
+        nGlyphs = self._nMetrics
+        if nGlyphs == self._nCached:
+            return
+        cachePath = self._cachePath()
+        if cachePath is None:
+            return
+        # the atlas gets a new name each time (named in the .npz file) so
+        # that a process reading the cache never pairs the glyphs with
+        # another process's atlas
+        atlasName = "{}.{}.npy".format(os.path.basename(cachePath),
+                                       uuid.uuid4().hex[:8])
+        atlasPath = os.path.join(os.path.dirname(cachePath), atlasName)
+        atlasData = np.asarray(self.atlas.data)
+        if not _writeFontCache(atlasPath, lambda f: np.save(f, atlasData)):
+            return
+        hasRow = self._metricRows >= 0
+        codes = np.zeros(nGlyphs, dtype=np.uint32)
+        codes[self._metricRows[hasRow]] = np.flatnonzero(hasRow)
+        saved = _writeFontCache(cachePath + '.npz', lambda f: np.savez(
+            f, version=_FONT_CACHE_VERSION, atlas=atlasName, codes=codes,
+            metrics=self._metrics[:nGlyphs],
+            nodes=np.array(self.atlas.nodes, dtype=np.int64).reshape(-1, 3),
+            used=self.atlas.used))
+        if saved:
+            self._nCached = nGlyphs
+            # remove the atlases saved before (unless still in use elsewhere)
+            oldPaths = [path for path in
+                        glob.glob(glob.escape(cachePath) + '.*.npy')
+                        if os.path.basename(path) != atlasName]
+        else:
+            oldPaths = [atlasPath]
+        for oldPath in oldPaths:
+            try:
+                os.remove(oldPath)
+            except OSError:
+                pass
 
     def upload(self):
         """Upload the font data into graphics card memory.
@@ -637,6 +866,10 @@ class FontManager(object):
     _glFonts = {}
     fontStyles = []
     _fontInfos = {}  # JWP: dict of name:FontInfo objects
+    # the info of the font files by absolute path, cached between runs so
+    # the font files don't all need opening again (loaded when needed)
+    _fontIndex = None
+    _fontIndexChanged = False
 
     def __init__(self, monospaceOnly=False):
         self.addFontDirectory(prefs.paths['resources'])
@@ -779,23 +1012,25 @@ class FontManager(object):
         the script, so any extra font paths need to be added each time the
         script starts.
         """
+        fi_list = self._addFontFile(fontPath, monospaceOnly)
+        self._saveFontIndex()
+        return fi_list
+
+    def _addFontFile(self, fontPath, monospaceOnly=False):
         fi_list = set()
         if os.path.isfile(fontPath) and os.path.exists(fontPath):
-            try:
-                face = ft.Face(str(fontPath))
-            except Exception:
-                logging.warning("Font Manager failed to load file {}"
-                                .format(fontPath))
+            entry = self._fontIndexEntry(fontPath)
+            if 'error' in entry:
+                logging.warning(entry['error'])
                 return
-            if face.family_name is None:
-                logging.warning("{} doesn't have valid font family name"
-                                .format(fontPath))
-                return
-            if monospaceOnly:
-                if face.is_fixed_width:
-                    fi_list.add(self._createFontInfo(fontPath, face))
-            else:
-                fi_list.add(self._createFontInfo(fontPath, face))
+            if monospaceOnly and not entry['info']['monospace']:
+                return fi_list
+            fi = FontInfo.fromdict(entry['info'], fontPath)
+            styleName = entry['styleName']
+            if styleName is not None:
+                styleName = styleName.encode('latin-1')
+            fi_list.add(self._addFontInfo(
+                fi, entry['familyName'].encode('latin-1'), styleName))
         return fi_list
 
     def addFontFiles(self, fontPaths, monospaceOnly=False):
@@ -814,8 +1049,9 @@ class FontManager(object):
 
         fi_list = []
         for fp in fontPaths:
-            self.addFontFile(fp, monospaceOnly)
+            self._addFontFile(fp, monospaceOnly)
         self.fontStyles.sort()
+        self._saveFontIndex()
 
         return fi_list
 
@@ -875,6 +1111,13 @@ class FontManager(object):
         del self.fontStyles[:]
         fonts_found = findFontFiles()
         self.addFontFiles(fonts_found, monospaceOnly)
+        # forget the font files that have gone
+        if self._fontIndex:
+            for path in list(self._fontIndex):
+                if not os.path.isfile(path):
+                    del self._fontIndex[path]
+                    FontManager._fontIndexChanged = True
+            self._saveFontIndex()
 
     def booleansFromStyleName(self, style):
         """
@@ -900,20 +1143,76 @@ class FontManager(object):
 
     def _createFontInfo(self, fp, fface):
         """"""
-        fns = (fface.family_name, fface.style_name)
+        return self._addFontInfo(FontInfo(fp, fface), fface.family_name,
+                                 fface.style_name)
+
+    def _addFontInfo(self, fi, familyName, styleName):
+        """Adds the FontInfo of a font with the family and style names (as
+        bytes, as given by freetype) to the font search space"""
+        fns = (familyName, styleName)
         if fns in self.fontStyles:
             pass
         else:
-            self.fontStyles.append(
-                (fface.family_name, fface.style_name))
+            self.fontStyles.append(fns)
 
         styles_for_font_dict = FontManager._fontInfos.setdefault(
-            fface.family_name, {})
-        fonts_for_style = styles_for_font_dict.setdefault(fface.style_name, [])
-        fi = FontInfo(fp, fface)
+            familyName, {})
+        fonts_for_style = styles_for_font_dict.setdefault(styleName, [])
         fonts_for_style.append(fi)
         return fi
 
+    def _fontIndexEntry(self, fontPath):
+        """Returns the cached info of a font file, opening the file only if
+        it hasn't been indexed or has changed since"""
+        if FontManager._fontIndex is None:
+            FontManager._fontIndex = {}
+            cachePath = _fontCachePath('fontIndex.json')
+            try:
+                with open(cachePath, 'r') as f:
+                    index = json.load(f)
+                if index.get('version') == _FONT_CACHE_VERSION:
+                    FontManager._fontIndex = index['fonts']
+            except Exception:
+                pass  # no index yet, or it can't be read
+        absPath = os.path.abspath(fontPath)
+        stamp = list(_fileStamp(fontPath))
+        entry = self._fontIndex.get(absPath)
+        if entry is not None and entry['stamp'] == stamp:
+            return entry
+        entry = {'stamp': stamp}
+        try:
+            face = ft.Face(str(fontPath))
+        except Exception:
+            entry['error'] = ("Font Manager failed to load file {}"
+                              .format(fontPath))
+        else:
+            if face.family_name is None:
+                entry['error'] = ("{} doesn't have valid font family name"
+                                  .format(fontPath))
+            else:
+                # (the names are kept as bytes, which latin-1 round-trips)
+                entry['familyName'] = face.family_name.decode('latin-1')
+                entry['styleName'] = face.style_name
+                if face.style_name is not None:
+                    entry['styleName'] = face.style_name.decode('latin-1')
+                entry['info'] = FontInfo(fontPath, face).asdict()
+                del entry['info']['path']
+        self._fontIndex[absPath] = entry
+        FontManager._fontIndexChanged = True
+        return entry
+
+    def _saveFontIndex(self):
+        """Writes the font index to the font cache if it has changed"""
+        if not self._fontIndexChanged:
+            return
+        cachePath = _fontCachePath('fontIndex.json')
+        if cachePath is None:
+            return
+        index = json.dumps({'version': _FONT_CACHE_VERSION,
+                            'fonts': self._fontIndex})
+        if _writeFontCache(cachePath, lambda f: f.write(index.encode('utf-8'))):
+            FontManager._fontIndexChanged = False
+
     def __del__(self):
         self.font_store = None
         if self._glFonts:
@@ -940,6 +1239,16 @@ class FontInfo(object):
         self.charmap_id = face.charmap.index
         self.label = "%s_%s" % (face.family_name, face.style_name)
 
+    @classmethod
+    def fromdict(cls, d, fp):
+        """Makes the FontInfo of the font file fp from the dict of its
+        attributes (see asdict), without opening the file
+        """
+        fi = cls.__new__(cls)
+        fi.__dict__.update(d)
+        fi.path = fp
+        return fi
+
     def __str__(self):
         """Generate a string identifier for this font name_style
         """
@@ -16,6 +16,8 @@ some more added:
     - adds additional options to use <b>bold<\b> and <i>italic<\i> tags in text
 
 """
+import bisect
+
 import numpy as np
 from pyglet import gl
 
@@ -70,6 +72,103 @@ END_OF_THIS_LINE = 983349843
 
 # If text is ". " we don't want to start next line with single space?
 
+def _wrapLines(cumAdvance, offsetX, isNewline, isBreak, lineMax,
+               lastLines=None, edit=None):
+    """Finds where the lines of a text start, given the cumulative advance
+    (in pix, with a leading 0) and x offset of its glyphs, which are
+    newlines or word breaks, and the maximum width of a line (pix).
+
+    A line ends at a newline or, once the pen has passed lineMax at a char
+    of a word that follows a word break on the same line, before that word.
+    The first char at which the pen passes lineMax is found with
+    searchsorted, so this loops once per line rather than per char.
+
+    Returns a dict of lists with, for each line, the index of its first
+    char ('starts'), the x of the pen there ('bases'), the first char at
+    which it could wrap ('checks'), its number of chars ('lengths') and its
+    width ('widths', pix).
+
+    With the lines of the last layout (`lastLines`) and the edit made to
+    the text since (index, nRemoved, nInserted), the lines before the edit
+    are kept, and the lines after it are too once a line starts as it did
+    before.
+    """
+    nChars = len(isNewline)
+    index = np.arange(nChars)
+    lastBreak = np.maximum.accumulate(np.where(isBreak, index, -1)) \
+        if nChars else index
+    lastNewline = np.maximum.accumulate(np.where(isNewline, index, -1)) \
+        if nChars else index
+    # lines can only wrap at chars of words after a break since the newline
+    canWrap = ~isNewline & ~isBreak & (lastBreak > lastNewline)
+    nextWrap = np.append(np.minimum.accumulate(
+        np.where(canWrap, index, nChars)[::-1])[::-1], nChars)
+    nextNewline = np.append(np.minimum.accumulate(
+        np.where(isNewline, index, nChars)[::-1])[::-1], nChars)
+
+    lines = {'starts': [], 'bases': [], 'checks': [], 'lengths': [],
+             'widths': []}
+    start, base, check = 0, 0.0, 0
+    resumeFrom = None
+    if lastLines is not None:
+        editIndex, nRemoved, nInserted = edit
+        # the last line that was laid out without the edited chars
+        lineN = bisect.bisect_right(lastLines['checks'], editIndex) - 1
+        for key in lines:
+            lines[key] = lastLines[key][:lineN]
+        start = lastLines['starts'][lineN]
+        base = lastLines['bases'][lineN]
+        check = lastLines['checks'][lineN]
+        # lines starting after the edit, by their new (start, check)
+        shift = nInserted - nRemoved
+        resumeFrom = {}
+        for oldN in range(lineN + 1, len(lastLines['starts'])):
+            if lastLines['starts'][oldN] >= editIndex + nRemoved:
+                resumeFrom[(lastLines['starts'][oldN] + shift,
+                            lastLines['checks'][oldN] + shift)] = oldN
+
+    while True:
+        if resumeFrom:
+            oldN = resumeFrom.get((start, check))
+            if oldN is not None and lastLines['bases'][oldN] == base:
+                # the rest is laid out as before
+                for key in ('bases', 'lengths', 'widths'):
+                    lines[key].extend(lastLines[key][oldN:])
+                lines['starts'].extend(
+                    n + shift for n in lastLines['starts'][oldN:])
+                lines['checks'].extend(
+                    n + shift for n in lastLines['checks'][oldN:])
+                return lines
+        lines['starts'].append(start)
+        lines['bases'].append(base)
+        lines['checks'].append(check)
+        # (item() gives python numbers, which are faster one at a time)
+        newline = nextNewline.item(check)
+        lineStartX = cumAdvance.item(start)
+        # the first char after which the pen has reached lineMax
+        atMax = int(cumAdvance.searchsorted(lineMax - base + lineStartX)) - 1
+        wrapAt = nextWrap.item(min(max(atMax, check), nChars))
+        if wrapAt < newline:
+            # move the current word to the next line
+            wordStart = lastBreak.item(wrapAt) + 1
+            lineBreakPt = (base + cumAdvance.item(wordStart) - lineStartX
+                           + offsetX.item(wordStart))
+            lines['lengths'].append(wordStart - start)
+            lines['widths'].append(lineBreakPt)
+            start, base, check = (wordStart, -offsetX.item(wordStart),
+                                  wrapAt + 1)
+        elif newline < nChars:
+            lines['lengths'].append(newline + 1 - start)
+            lines['widths'].append(
+                base + cumAdvance.item(newline + 1) - lineStartX)
+            start, base, check = newline + 1, 0.0, newline + 1
+        else:
+            lines['lengths'].append(nChars - start)
+            lines['widths'].append(
+                base + cumAdvance.item(nChars) - lineStartX)
+            return lines
+
+
 class TextBox2(BaseVisualStim, ContainerMixin, ColorMixin):
     def __init__(self, win, text, font,
                  pos=(0, 0), units=None, letterHeight=None,
@@ -208,6 +307,7 @@ class TextBox2(BaseVisualStim, ContainerMixin, ColorMixin):
                 lineWidth=1, lineColor=None, fillColor=fillColor, opacity=0.1,
                 autoLog=False)
         # then layout the text (setting text triggers _layout())
+        self._lineBreaks = None  # where the lines start (see _wrapLines)
         self.startText = text
         self._text = ''
         self.text = text if text is not None else ""
@@ -364,9 +464,10 @@ class TextBox2(BaseVisualStim, ContainerMixin, ColorMixin):
         if len(self._styles) and self.caret.index <= len(self._styles):
             cstyle = self._styles[self.caret.index-1]
         self._styles.insert(self.caret.index, cstyle)
+        edit = (self.caret.index, 0, len(char))
         self.caret.index += 1
         self._text = txt
-        self._layout()
+        self._layout(edit)
 
     def deleteCaretLeft(self):
         if self.caret.index > 0:
@@ -376,7 +477,7 @@ class TextBox2(BaseVisualStim, ContainerMixin, ColorMixin):
             self._styles = self._styles[:ci-1]+self._styles[ci:]
             self.caret.index -= 1
             self._text = txt
-            self._layout()
+            self._layout(edit=(ci - 1, 1, 0))
 
     def deleteCaretRight(self):
         ci = self.caret.index
@@ -385,14 +486,21 @@ class TextBox2(BaseVisualStim, ContainerMixin, ColorMixin):
             txt = txt[:ci] + txt[ci+1:]
             self._styles = self._styles[:ci]+self._styles[ci+1:]
             self._text = txt
-            self._layout()
+            self._layout(edit=(ci, 1, 0))
         
-    def _layout(self):
+    def _layout(self, edit=None):
         """Layout the text, calculating the vertex locations
+
+        The metrics of all the glyphs are looked up at once and the
+        vertices calculated as arrays; only finding where lines wrap loops,
+        once per line. `edit` is (index, nRemoved, nInserted) if the text
+        has only changed there since the last layout, so the line breaks
+        before the edit, and after it once they match the last layout
+        again, are kept.
         """
         def getLineWidthFromPix(pixVal):
             return pixVal / self._pixelScaling + self.padding * 2
-        
+
         rgb = self._foreColor.rgba
         font = self.glFont
 
@@ -400,19 +508,10 @@ class TextBox2(BaseVisualStim, ContainerMixin, ColorMixin):
         # then we convert them to the requested units for self._vertices
         # then they are converted back during rendering using standard BaseStim
         visible_text = self._text
-        vertices = np.zeros((len(visible_text) * 4, 2), dtype=np.float32)
+        nChars = len(visible_text)
         self._charIndices = np.zeros((len(visible_text)), dtype=int)
-        self._colors = np.zeros((len(visible_text) * 4, 4), dtype=np.double)
-        self._texcoords = np.zeros((len(visible_text) * 4, 2), dtype=np.double)
         self._glIndices = np.zeros((len(visible_text) * 4), dtype=int)
 
-        # the following are used internally for layout
-        self._lineNs = np.zeros(len(visible_text), dtype=int)
-        self._lineTops = []  # just length of nLines
-        self._lineBottoms = []
-        self._lineLenChars = []  #
-        self._lineWidths = []  # width in stim units of each line
-
         self._lineHeight = font.height * self.lineSpacing
 
         if np.isnan(self._requestedSize[0]):
@@ -420,128 +519,100 @@ class TextBox2(BaseVisualStim, ContainerMixin, ColorMixin):
         else:
             lineMax = (self._requestedSize[0] - self.padding) * self._pixelScaling
 
-        current = [0, 0]
-        fakeItalic = 0.0
-        fakeBold = 0.0
         # for some reason glyphs too wide when using alpha channel only
         if font.atlas.format == 'alpha':
             alphaCorrection = 1 / 3.0
         else:
             alphaCorrection = 1
 
-        wordLen = 0
-        charsThisLine = 0
-        wordsThisLine = 0
-        lineN = 0
-
-        for i, charcode in enumerate(self._text):
-            printable = True  # unless we decide otherwise
-            # handle formatting codes
-            if self._styles[i] == NONE:
-                fakeItalic = 0.0
-                fakeBold = 0.0
-            elif self._styles[i] == ITALIC:
-                fakeItalic = 0.1 * font.size
-            elif self._styles[i] == ITALIC:
-                fakeBold = 0.3 * font.size
-
-            # handle newline
-            if charcode == '\n':
-                printable = False
-
-            # handle printable characters
-            if printable:
-                if showWhiteSpace and charcode == " ":
-                    glyph = font[u"·"]
-                else:
-                    glyph = font[charcode]
-                xBotL = current[0] + glyph.offset[0] - fakeItalic - fakeBold / 2
-                xTopL = current[0] + glyph.offset[0] - fakeBold / 2
-                yTop = current[1] + glyph.offset[1]
-                xBotR = xBotL + glyph.size[0] * alphaCorrection + fakeBold
-                xTopR = xTopL + glyph.size[0] * alphaCorrection + fakeBold
-                yBot = yTop - glyph.size[1]
-                u0 = glyph.texcoords[0]
-                v0 = glyph.texcoords[1]
-                u1 = glyph.texcoords[2]
-                v1 = glyph.texcoords[3]
-            else:
-                glyph = font[u"·"]
-                x = current[0] + glyph.offset[0]
-                yTop = current[1] + glyph.offset[1]
-                yBot = yTop - glyph.size[1]
-                xBotL = x
-                xTopL = x
-                xBotR = x
-                xTopR = x
-                u0 = glyph.texcoords[0]
-                v0 = glyph.texcoords[1]
-                u1 = glyph.texcoords[2]
-                v1 = glyph.texcoords[3]
-
-            theseVertices = [[xTopL, yTop], [xBotL, yBot],
-                             [xBotR, yBot], [xTopR, yTop]]
-            texcoords = [[u0, v0], [u0, v1],
-                         [u1, v1], [u1, v0]]
-
-            vertices[i * 4:i * 4 + 4] = theseVertices
-            self._texcoords[i * 4:i * 4 + 4] = texcoords
-            self._colors[i*4 : i*4+4, :4] = rgb
-            self._lineNs[i] = lineN
-            current[0] = current[0] + glyph.advance[0] + fakeBold / 2
-            current[1] = current[1] + glyph.advance[1]
-
-            # are we wrapping the line?
-            if charcode == "\n":
-                lineWPix = current[0]
-                current[0] = 0
-                current[1] -= self._lineHeight
-                lineN += 1
-                charsThisLine += 1
-                self._lineLenChars.append(charsThisLine)
-                self._lineWidths.append(getLineWidthFromPix(lineWPix))
-                charsThisLine = 0
-                wordsThisLine = 0
-            elif charcode in wordBreaks:
-                wordLen = 0
-                charsThisLine += 1
-                wordsThisLine += 1
-            elif printable:
-                wordLen += 1
-                charsThisLine += 1
-
-            # end line with auto-wrap on space
-            if current[0] >= lineMax and wordLen > 0 and wordsThisLine:
-                # move the current word to next line
-                lineBreakPt = vertices[(i - wordLen + 1) * 4, 0]
-                wordWidth = current[0] - lineBreakPt
-                # shift all chars of the word left by wordStartX
-                vertices[(i - wordLen + 1) * 4: (i + 1) * 4, 0] -= lineBreakPt
-                vertices[(i - wordLen + 1) * 4: (i + 1) * 4, 1] -= self._lineHeight
-                # update line values
-                self._lineNs[i - wordLen + 1: i + 1] += 1
-                self._lineLenChars.append(charsThisLine - wordLen)
-                self._lineWidths.append(getLineWidthFromPix(lineBreakPt))
-                lineN += 1
-                # and set current to correct location
-                current[0] = wordWidth
-                current[1] -= self._lineHeight
-                charsThisLine = wordLen
-
-            # have we stored the top/bottom of this line yet
-            if lineN + 1 > len(self._lineTops):
-                self._lineBottoms.append(current[1] + font.descender)
-                self._lineTops.append(current[1] + self._lineHeight
-                                      + font.descender/2)
-            
-        # finally add length of this (unfinished) line
-        self._lineWidths.append(getLineWidthFromPix(current[0]))
-        self._lineLenChars.append(charsThisLine)
+        codes = np.frombuffer(visible_text.encode('utf-32-le'),
+                              dtype=np.uint32).copy()
+        isNewline = codes == ord('\n')
+        isBreak = np.isin(codes, [ord(c) for c in wordBreaks if c != '\n'])
+        # newlines are laid out as a (zero width) middle dot
+        codes[isNewline] = ord(u"·")
+        if showWhiteSpace:
+            codes[codes == ord(" ")] = ord(u"·")
+        offsetX, offsetY, width, height, advanceX, advanceY, u0, v0, u1, v1 = \
+            font.getGlyphMetrics(codes).T
+        cumAdvance = np.concatenate([[0], np.cumsum(advanceX)])
+
+        # find the lines, continuing from the last layout if we can
+        layoutKey = (font, lineMax, showWhiteSpace)
+        lastLines = self._lineBreaks
+        if (edit is not None and lastLines is not None
+                and lastLines['key'] == layoutKey
+                and lastLines['nChars'] + edit[2] - edit[1] == nChars):
+            lines = _wrapLines(cumAdvance, offsetX, isNewline, isBreak,
+                               lineMax, lastLines, edit)
+        else:
+            lines = _wrapLines(cumAdvance, offsetX, isNewline, isBreak,
+                               lineMax)
+        lines['key'] = layoutKey
+        lines['nChars'] = nChars
+        self._lineBreaks = lines
+        lineStarts = np.array(lines['starts'], dtype=int)
+        nLines = len(lineStarts)
+
+        # (an empty line has the start of the line after it)
+        self._lineNs = np.searchsorted(lineStarts, np.arange(nChars),
+                                       side='right') - 1
+        penX = (np.array(lines['bases'])[self._lineNs] + cumAdvance[:-1]
+                - cumAdvance[lineStarts[self._lineNs]])
+        penY = (np.cumsum(advanceY) - advanceY
+                - self._lineNs * self._lineHeight)
+
+        # italic chars are slanted (others keep the slant of the char before)
+        fakeItalic = np.zeros(nChars)
+        if any(self._styles):
+            styles = np.array(self._styles, dtype=int)
+            setsSlant = (styles == NONE) | (styles == ITALIC)
+            lastSet = np.maximum.accumulate(
+                np.where(setsSlant, np.arange(nChars), -1))
+            fakeItalic[(lastSet >= 0)
+                       & (styles[np.maximum(lastSet, 0)] == ITALIC)
+                       & ~isNewline] = 0.1 * font.size
+
+        xTopL = penX + offsetX
+        xBotL = xTopL - fakeItalic
+        glyphWidth = np.where(isNewline, 0, width * alphaCorrection)
+        yTop = penY + offsetY
+        yBot = yTop - height
+        vertices = np.empty((nChars, 4, 2), dtype=np.float32)
+        vertices[:, 0, 0] = xTopL
+        vertices[:, 0, 1] = yTop
+        vertices[:, 1, 0] = xBotL
+        vertices[:, 1, 1] = yBot
+        vertices[:, 2, 0] = xBotL + glyphWidth
+        vertices[:, 2, 1] = yBot
+        vertices[:, 3, 0] = xTopL + glyphWidth
+        vertices[:, 3, 1] = yTop
+        self._texcoords = np.empty((nChars, 4, 2), dtype=np.double)
+        self._texcoords[:, :2, 0] = u0[:, None]
+        self._texcoords[:, 2:, 0] = u1[:, None]
+        self._texcoords[:, ::3, 1] = v0[:, None]
+        self._texcoords[:, 1:3, 1] = v1[:, None]
+        self._texcoords = self._texcoords.reshape((-1, 2))
+        self._colors = np.repeat(np.array(rgb, dtype=np.double, ndmin=2),
+                                 nChars * 4, axis=0)
+
+        # the top/bottom of each line
+        if nChars:
+            lineY = (np.concatenate([[0], np.cumsum(advanceY)])[lineStarts]
+                     - np.arange(nLines) * self._lineHeight)
+            self._lineBottoms = (lineY + font.descender).tolist()
+            self._lineTops = (lineY + self._lineHeight
+                              + font.descender / 2).tolist()
+        else:
+            self._lineBottoms = []
+            self._lineTops = []
+        self._lineLenChars = list(lines['lengths'])
+        self._lineWidths = [getLineWidthFromPix(w) for w in lines['widths']]
+        lineN = nLines - 1
 
         # convert the vertices to stimulus units
-        self._rawVerts = vertices / self._pixelScaling
+        self._rawVerts = vertices.reshape((-1, 2)) / self._pixelScaling
 
-        # thisW = current[0] - glyph.advance[0] + glyph.size[0] * alphaCorrection
         # calculate final self.size and tightBox
         if np.isnan(self._requestedSize[0]):
             self.size[0] = max(self._lineWidths) + self.padding*2
@@ -655,6 +726,10 @@ class TextBox2(BaseVisualStim, ContainerMixin, ColorMixin):
         else:
             return self.box.contains(x, y, units)
 
+    def _containsTable(self):
+        # the area that .contains() tests (without tight)
+        return self.box._containsTable()
+
     def overlaps(self, polygon, tight=False):
         """Returns `True` if this stimulus intersects another one.
 